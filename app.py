@@ -11,14 +11,24 @@ from routes.auth_routes import auth_bp
 from routes.area_config_routes import area_config_bp
 from routes.monitor_routes import monitor_bp
 from routes.alert_routes import alert_bp  # NEW: Import the alerts blueprint
+from routes.image_tiles import image_tiles_bp
+from routes.mosaic_routes import mosaic_bp
+from routes.notification_routes import notification_bp
+from routes.spatial_routes import spatial_bp
+from routes.metrics_routes import metrics_bp
 
 # Import FirebaseService to initialize it at app startup
 from services.firebase_service import FirebaseService
+from services.image_capture_service import ImageCaptureService
+from services.tile_state_index import TileStateIndex
+from utils.metrics import Metrics
 
 # --- App Initialization ---
 app = Flask(__name__)
 app.config.update(CONFIG_SETTINGS)  # Load config from the dictionary
 CORS(app)  # Enable CORS for all routes
+ImageCaptureService.TILE_GRID_MODE = app.config.get('TILE_GRID_MODE', 'area')  # Fixed for the process lifetime
+Metrics.configure(app.config)
 
 # Create image storage directory if it doesn't exist
 os.makedirs(app.config['IMAGE_STORAGE_DIRECTORY'], exist_ok=True)
@@ -28,6 +38,11 @@ app.register_blueprint(auth_bp)
 app.register_blueprint(area_config_bp)
 app.register_blueprint(monitor_bp)
 app.register_blueprint(alert_bp)  # NEW: Register the alerts blueprint
+app.register_blueprint(image_tiles_bp)
+app.register_blueprint(mosaic_bp)
+app.register_blueprint(notification_bp)
+app.register_blueprint(spatial_bp)
+app.register_blueprint(metrics_bp)
 
 
 # --- Health Check ---
@@ -47,6 +62,9 @@ if __name__ == '__main__':
         db.create_all()  # Create database tables if they don't exist
         print("Database tables created/checked.")
 
+        if app.config.get('TILE_STATE_INDEX_WARM_ON_STARTUP', True):
+            TileStateIndex.warm_all()  # Serve latest-tile state from memory from the first request
+
         # Initialize Firebase Admin SDK after app context is available
         FirebaseService.initialize_firebase()
 
@@ -10,12 +10,86 @@ CONFIG_SETTINGS = {
     'JWT_SECRET_KEY': 'your-super-secret-key-that-is-at-least-256-bits-long-and-base64-encoded', # Matches 'jwt.secret'
     'JWT_ACCESS_TOKEN_EXPIRES_DAYS': 1, # Example: 1 day for access token
     'JWT_REFRESH_TOKEN_EXPIRES_DAYS': 30, # Example: 30 days for refresh token
+    'BCRYPT_LOG_ROUNDS': 12, # bcrypt cost factor; existing hashes are upgraded/downgraded on the next login
+    'AUTH_HASH_MAX_WORKERS': 2, # Password hashes computed at once
+    'AUTH_HASH_MAX_QUEUE': 32, # Hashes allowed to wait for a worker; beyond that register/login return 429
+    'AUTH_PRINCIPAL_CACHE_TTL_SECONDS': 60, # Reuse a verified user for this long instead of querying it per request (0 disables)
+    'AUTH_PRINCIPAL_CACHE_MAX_ENTRIES': 10000, # Users kept in the verified-user cache
+    'AUTH_TRUST_TOKEN_CLAIMS': False, # Trust signed token claims without any user lookup (deleted users/changed passwords stay valid until expiry)
+    'AUTH_TRUSTED_TOKEN_MAX_SECONDS': 900, # With AUTH_TRUST_TOKEN_CLAIMS, access tokens live at most this long; refresh re-checks the user
     'SCHEDULING_CRON_EXPRESSION': '0 */5 * * * ?', # Every 5 minutes for testing, '0 0 0 */15 * ?' for 15 days
     'SERVER_PORT': 3300,
 
+    # --- Scheduler ---
+    'SCHEDULER_MAX_WORKERS': 2, # Areas monitored concurrently
+    'SCHEDULER_MAX_QUEUE_SIZE': 100, # Pending area jobs before new ones are rejected
+    'AREA_STAGGER_WINDOW_SECONDS': 120, # Spread each sweep's area start times over this window
+
+    # --- Tile Download Engine ---
+    'CAPTURE_MAX_WORKERS': 8, # Concurrent tile downloads per area
+    'CAPTURE_PER_HOST_CONCURRENCY': 8, # Max in-flight requests to a single host, across all areas running at once
+    'CAPTURE_RATE_LIMIT_PER_SEC': 40, # Process-wide token bucket refill rate, keep under the Static Maps quota (0 disables)
+    'CAPTURE_RATE_LIMIT_BURST': 10, # Token bucket capacity
+    'CAPTURE_MAX_RETRIES': 3, # Retries for connection errors, timeouts, 429 and 5xx
+    'CAPTURE_BACKOFF_BASE_SECONDS': 0.5, # Jittered exponential backoff base
+    'CAPTURE_BACKOFF_MAX_SECONDS': 10.0,
+    'CAPTURE_HTTP_TIMEOUT_SECONDS': 20.0,
+    'CAPTURE_MIN_REFETCH_SECONDS': 0, # Reuse a cached tile younger than this without any request (AreaConfig.min_refetch_seconds overrides)
+    'CAPTURE_DB_BATCH_SIZE': 200, # Captured tile rows per bulk insert
+    'CAPTURE_DB_FLUSH_SECONDS': 5.0, # Flush a partial batch after this long
+
+    # --- Image Comparison ---
+    'COMPARISON_MAX_WORKERS': None, # Worker processes for image comparison (None = CPU count - 1, 1 = serial)
+    'COMPARISON_CHUNK_SIZE': 16, # Tile pairs handed to a worker at a time
+    'COMPARISON_DB_BATCH_SIZE': 200, # Tile updates/alert details per commit
+    'COMPARISON_PREFILTER_ENABLED': True, # Skip byte-identical pairs (and perceptual matches, see below) before OpenCV
+    'COMPARISON_DHASH_MAX_DISTANCE': None, # dHash Hamming cut-off for "near-identical"; None disables the gate. Tune from the logged tier rates
+    'COMPARISON_KERNEL': 'legacy', # 'legacy' (colour diff + contour areas) or 'fast' (grayscale, connected components, reused buffers)
+    'COMPARISON_DECODE_REDUCTION': 1, # Fast kernel only: decode at 1/2, 1/4 or 1/8 resolution (1 = full)
+    'COMPARISON_PIXEL_THRESHOLD': 30, # Blurred grey-level difference for a pixel to count as changed (per-area override on AreaConfig)
+    'COMPARISON_MIN_REGION_AREA': 100, # Changed regions of this many pixels or fewer are ignored as noise (per-area override)
+    'COMPARISON_CHANGE_PERCENT_THRESHOLD': 0.1, # A tile is changed above this percentage of changed area (per-area override)
+    'COMPARISON_ENGINE': 'pairwise', # 'pairwise' (per pair, in the worker pool) or 'batch' (stacked arrays, in-process), for scheduled and manual comparisons
+    'COMPARISON_BATCH_SIZE': 256, # Pairs per stack in the batch engine
+    'COMPARISON_BATCH_MEMMAP': False, # Back batch stacks with a temporary file instead of RAM
+    'PIPELINE_MAX_PENDING_COMPARISONS': 64, # Outstanding comparisons before the pipeline stops taking new downloads
+    'IMAGE_CACHE_BUDGET_MB': 256, # Decoded image cache size per process
+    'IMAGE_CACHE_NPY_SIDECAR': None, # Also keep decoded arrays as memory-mapped .npy files next to the images (None = only when comparisons run on the worker pool)
+    'TILE_STATE_INDEX_WARM_ON_STARTUP': True, # Load every area's latest/previous capture state into memory at startup
+    'TILE_GRID_MODE': 'area', # 'area' (a grid per AreaConfig) or 'global' (one world grid; overlapping areas share captures and comparisons). Switching starts tile history afresh
+    'TILE_SHARE_WINDOW_SECONDS': 300, # Global grid: a cell captured by another area this recently is reused without a request
+    'COMPARISON_MEMO_SIZE': 10000, # Comparison results kept per process by image pair, so a shared cell is compared once
+
+    # --- Retention ---
+    'RETENTION_ENABLED': False, # Run the retention job in the background
+    'RETENTION_INTERVAL_MINUTES': 60,
+    'RETENTION_KEEP_ALL_DAYS': 7, # Keep every capture this recent
+    'RETENTION_KEEP_DAILY_DAYS': 90, # Then one capture per tile per day up to this age (None = forever); older only if part of an alert
+    'RETENTION_MAX_ROWS_PER_RUN': 5000, # Rows archived/deleted per run, bounds the IO of each pass
+    'RETENTION_ARCHIVE_IMAGE_SIZE': None, # e.g. '200x200' to downsample images as they are archived; None keeps them as captured
+    'RETENTION_BLOB_GRACE_SECONDS': 3600, # Blobs a capture stored or reused this recently are never reclaimed; covers captures still committing
+
+    # --- Mosaics ---
+    'MOSAIC_TILE_SIZE': 256, # Pixel size of each z/x/y mosaic tile
+    'MOSAIC_AUTO_BUILD': False, # Update an area's mosaic after every monitoring run
+    'MOSAIC_CACHE_MAX_AGE_SECONDS': 300, # Cache-Control max-age for served mosaic tiles
+
+    # --- Metrics ---
+    'METRICS_ENABLED': True, # Time hot stages and count downloads/comparisons/notifications per area, served at /metrics
+    'METRICS_AUTH_TOKEN': None, # Bearer token /metrics requires; None leaves it open, like the health check
+    'METRICS_TRACE_DIRECTORY': None, # Also write each pipeline run's per-stage trace here as JSON
+
     # --- Firebase Configuration ---
     'FIREBASE_SERVICE_ACCOUNT_KEY_PATH': 'path/to/bhuprahari06_firebase_service_account.json', # IMPORTANT: Update this path!
-    'FCM_DEFAULT_DEVICE_TOKEN': 'YOUR_FCM_DEVICE_TOKEN_HERE' # For testing, provide a token from a real device
+    'FCM_DEFAULT_DEVICE_TOKEN': 'YOUR_FCM_DEVICE_TOKEN_HERE', # Used only for areas with no registered device tokens
+
+    # --- Notification Outbox ---
+    'NOTIFICATION_DISPATCH_INTERVAL_SECONDS': 10, # How often the dispatcher sends due notifications
+    'NOTIFICATION_DISPATCH_BATCH_SIZE': 100, # Outbox rows per dispatcher pass
+    'NOTIFICATION_COALESCE_SECONDS': 60, # Sessions of one area within this window share a notification
+    'NOTIFICATION_MAX_ATTEMPTS': 5, # Send attempts before a notification is marked FAILED
+    'NOTIFICATION_BACKOFF_BASE_SECONDS': 30, # Jittered exponential backoff between attempts
+    'NOTIFICATION_BACKOFF_MAX_SECONDS': 1800
 }
 
 
@@ -1,3 +1,5 @@
+import hashlib
+import json
 from datetime import datetime
 from extensions import db, bcrypt # Import db and bcrypt from extensions
 
@@ -10,12 +12,17 @@ class User(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     last_update = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
-    def set_password(self, password):
-        self.password_hash = bcrypt.generate_password_hash(password).decode('utf-8')
+    def set_password(self, password, log_rounds=None):
+        # The auth routes hash through PasswordHashingService instead, which bounds concurrent hashes
+        self.password_hash = bcrypt.generate_password_hash(password, log_rounds).decode('utf-8')
 
     def check_password(self, password):
         return bcrypt.check_password_hash(self.password_hash, password)
 
+    def password_version(self):
+        # Carried in issued tokens; changes whenever the password does, which revokes older tokens
+        return hashlib.sha256(self.password_hash.encode('utf-8')).hexdigest()[:12]
+
     def to_dict(self):
         return {
             'id': self.id,
@@ -35,6 +42,11 @@ class AreaConfig(db.Model):
     south_km = db.Column(db.Float, nullable=False)
     east_km = db.Column(db.Float, nullable=False)
     west_km = db.Column(db.Float, nullable=False)
+    min_refetch_seconds = db.Column(db.Integer, nullable=True) # Overrides CAPTURE_MIN_REFETCH_SECONDS for this area
+    monitor_interval_minutes = db.Column(db.Integer, nullable=True) # None = run on every scheduler sweep
+    change_pixel_threshold = db.Column(db.Integer, nullable=True) # Overrides COMPARISON_PIXEL_THRESHOLD
+    change_min_region_area = db.Column(db.Float, nullable=True) # Overrides COMPARISON_MIN_REGION_AREA
+    change_percent_threshold = db.Column(db.Float, nullable=True) # Overrides COMPARISON_CHANGE_PERCENT_THRESHOLD
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
     def to_dict(self):
@@ -47,6 +59,11 @@ class AreaConfig(db.Model):
             'southKm': self.south_km,
             'eastKm': self.east_km,
             'westKm': self.west_km,
+            'minRefetchSeconds': self.min_refetch_seconds,
+            'monitorIntervalMinutes': self.monitor_interval_minutes,
+            'changePixelThreshold': self.change_pixel_threshold,
+            'changeMinRegionArea': self.change_min_region_area,
+            'changePercentThreshold': self.change_percent_threshold,
             'createdAt': self.created_at.isoformat()
         }
 
@@ -62,10 +79,15 @@ class ImageTile(db.Model):
     status = db.Column(db.String(50), nullable=False) # e.g., 'INITIAL', 'CAPTURED', 'COMPARED', 'CHANGED', 'NO_CHANGE', 'ERROR'
     last_comparison_time = db.Column(db.DateTime, nullable=True)
     change_detected = db.Column(db.Boolean, nullable=True)
+    content_hash = db.Column(db.String(40), nullable=True) # SHA-1 of the downloaded image bytes
+    last_seen_time = db.Column(db.DateTime, nullable=True) # Last capture that returned this same content
+    needs_comparison = db.Column(db.Boolean, nullable=False, default=True) # New capture not yet compared
 
     __table_args__ = (
         db.Index('idx_area_config_unique_key', 'area_config_id', 'unique_key'),
         db.Index('idx_unique_key_capture_time', 'unique_key', 'capture_time'), # To fetch latest efficiently
+        db.Index('idx_area_key_capture_time', 'area_config_id', 'unique_key', 'capture_time'), # Latest captures per key within an area
+        db.Index('idx_area_needs_comparison', 'area_config_id', 'needs_comparison'), # Dirty tiles of an area
     )
 
     def to_dict(self):
@@ -79,7 +101,9 @@ class ImageTile(db.Model):
             'imagePath': self.image_path,
             'status': self.status,
             'lastComparisonTime': self.last_comparison_time.isoformat() if self.last_comparison_time else None,
-            'changeDetected': self.change_detected
+            'changeDetected': self.change_detected,
+            'contentHash': self.content_hash,
+            'lastSeenTime': self.last_seen_time.isoformat() if self.last_seen_time else None
         }
 
 # --- New Models for Alert System ---
@@ -93,6 +117,8 @@ class AlertSession(db.Model):
     total_changes_detected = db.Column(db.Integer, default=0)
     notification_sent = db.Column(db.Boolean, default=False)
 
+    details = db.relationship('AlertDetail', backref='alert_session', order_by='AlertDetail.id')
+
     def to_dict(self):
         return {
             'id': self.id,
@@ -114,13 +140,74 @@ class AlertDetail(db.Model):
     change_log = db.Column(db.JSON, nullable=True) # JSON type for comparison result
     alert_time = db.Column(db.DateTime, default=datetime.utcnow)
 
+    image_tile = db.relationship('ImageTile', backref='alert_details')
+
     def to_dict(self):
+        change_log = self.change_log
+        if isinstance(change_log, str):
+            change_log = json.loads(change_log)  # Rows written before change_log was stored as native JSON
         return {
             'id': self.id,
             'alertSessionId': self.alert_session_id,
             'imageTileId': self.image_tile_id,
             'previousImagePath': self.previous_image_path,
             'currentImagePath': self.current_image_path,
-            'changeLog': self.change_log,
+            'changeLog': change_log,
             'alertTime': self.alert_time.isoformat()
         }
+
+# --- Notification outbox ---
+class DeviceToken(db.Model):
+    __tablename__ = 'device_tokens'
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    token = db.Column(db.String(255), unique=True, nullable=False) # FCM registration token
+    area_config_id = db.Column(db.Integer, db.ForeignKey('area_configs.id'), nullable=True) # None = alerts for every area
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    last_update = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'userId': self.user_id,
+            'token': self.token,
+            'areaConfigId': self.area_config_id,
+            'createdAt': self.created_at.isoformat(),
+            'lastUpdate': self.last_update.isoformat()
+        }
+
+class NotificationOutbox(db.Model):
+    __tablename__ = 'notification_outbox'
+    id = db.Column(db.Integer, primary_key=True)
+    area_config_id = db.Column(db.Integer, db.ForeignKey('area_configs.id'), nullable=False)
+    alert_session_ids = db.Column(db.JSON, nullable=False) # Sessions coalesced into this notification
+    changes_count = db.Column(db.Integer, nullable=False, default=0)
+    status = db.Column(db.String(50), nullable=False, default='PENDING') # 'PENDING', 'SENDING', 'SENT', 'FAILED'
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    delivered_count = db.Column(db.Integer, nullable=False, default=0) # Devices reached so far
+    retry_tokens = db.Column(db.JSON, nullable=True) # Tokens still owed a delivery after a partial failure
+    next_attempt_time = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    last_error = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    sent_time = db.Column(db.DateTime, nullable=True)
+
+    __table_args__ = (
+        db.Index('idx_outbox_status_next_attempt', 'status', 'next_attempt_time'), # Due notifications
+        db.Index('idx_outbox_area_status', 'area_config_id', 'status'), # Coalescing lookups
+    )
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'areaConfigId': self.area_config_id,
+            'alertSessionIds': self.alert_session_ids,
+            'changesCount': self.changes_count,
+            'status': self.status,
+            'attempts': self.attempts,
+            'deliveredCount': self.delivered_count,
+            'pendingTokenCount': len(self.retry_tokens) if self.retry_tokens is not None else None,
+            'nextAttemptTime': self.next_attempt_time.isoformat(),
+            'lastError': self.last_error,
+            'createdAt': self.created_at.isoformat(),
+            'sentTime': self.sent_time.isoformat() if self.sent_time else None
+        }
@@ -1,48 +1,200 @@
+import re
+import threading
 from apscheduler.schedulers.background import BackgroundScheduler
 from apscheduler.triggers.cron import CronTrigger
-from datetime import datetime
+from datetime import datetime, timedelta
 # No need to import current_app here if we pass app_instance
 
 from extensions import db  # Import db from extensions
 from entities.models import AreaConfig, ImageTile
+from services.monitoring_pipeline import MonitoringPipeline
 from services.image_capture_service import ImageCaptureService
 from services.image_comparison_service import ImageComparisonService
+from services.area_job_queue import AreaJobQueue
+from services.mosaic_service import MosaicService
+from services.retention_service import RetentionService
+from services.notification_outbox_service import NotificationOutboxService
+from utils.metrics import Metrics
 
 scheduler = BackgroundScheduler()
+area_job_queue = None  # Created in start_my_schedule
+last_dispatch_times = {}  # area_config_id -> when its last run was enqueued
+
+QUARTZ_DAY_NAMES = {'1': 'sun', '2': 'mon', '3': 'tue', '4': 'wed', '5': 'thu', '6': 'fri', '7': 'sat'}
+QUARTZ_DAY_NAME = re.compile(r'(?<![a-z])(sun|mon|tue|wed|thu|fri|sat)', re.IGNORECASE)
+QUARTZ_UNSUPPORTED_DAY_SYNTAX = re.compile(r'[LW#]', re.IGNORECASE)  # Last day, nearest weekday, Nth weekday
+
+
+def cron_trigger_from_expression(cron_expression):
+    """
+    Builds an APScheduler CronTrigger from either a standard 5-field crontab or a Quartz
+    expression ("sec min hour day month day-of-week [year]", as used by the old Spring Boot
+    backend). Quartz's '?' becomes '*' and its 1=SUN day numbers become day names. Quartz's 'L',
+    'W' and '#' day fields have no CronTrigger equivalent and raise ValueError.
+    """
+    fields = cron_expression.split()
+    if len(fields) == 5:
+        return CronTrigger.from_crontab(cron_expression)
+    if len(fields) not in (6, 7):
+        raise ValueError(f"Unsupported cron expression: {cron_expression}")
+
+    fields = ['*' if field == '?' else field for field in fields]
+    second, minute, hour, day, month, day_of_week = fields[:6]
+    for name, field in (('day-of-month', day), ('day-of-week', day_of_week)):
+        if QUARTZ_UNSUPPORTED_DAY_SYNTAX.search(QUARTZ_DAY_NAME.sub('', field)):  # 'WED' is not a 'W'
+            raise ValueError(f"Unsupported cron expression: {cron_expression} "
+                             f"(Quartz 'L', 'W' and '#' are not supported in the {name} field)")
+    if day_of_week != '*':
+        day_of_week = re.sub(r'\d', lambda match: QUARTZ_DAY_NAMES.get(match.group(0), match.group(0)), day_of_week)
+    return CronTrigger(second=second, minute=minute, hour=hour, day=day, month=month, day_of_week=day_of_week,
+                       year=fields[6] if len(fields) == 7 else None)
+
+
+# --- Per-area job ---
+def run_area_monitoring(app_instance, area_config_id):
+    with app_instance.app_context():  # Each worker thread gets its own app context and DB session
+        config = db.session.query(AreaConfig).get(area_config_id)
+        if not config:
+            print(f"AreaConfig {area_config_id} no longer exists, skipping.")
+            return
+        print(f"Processing AreaConfig: {config.name} (ID: {config.id})")
+        # Capture and comparison overlap in one streaming pass over the area
+        MonitoringPipeline.run_for_area(config, app_instance.config)
+        if app_instance.config.get('MOSAIC_AUTO_BUILD'):
+            try:
+                MosaicService.build_for_area(config, app_instance.config)
+            except Exception as e:
+                print(f"Error building mosaic for AreaConfig {config.id}: {e}")
+
+
+# --- Manually triggered jobs (routes/monitor_routes.py), queued so they never overlap a scheduled run ---
+def run_area_capture(app_instance, area_config_id):
+    with app_instance.app_context():
+        config = db.session.get(AreaConfig, area_config_id)
+        if config:
+            ImageCaptureService.capture_images_for_area(config, app_instance.config)
+
+
+def run_area_comparison(app_instance, area_config_id):
+    with app_instance.app_context():
+        if db.session.get(AreaConfig, area_config_id):
+            ImageComparisonService.run_comparison_for_area(area_config_id, app_instance.config)
 
 
 # --- Scheduled Task ---
 # Now accepts app_instance as an argument
 def scheduled_image_monitoring(app_instance):
-    with app_instance.app_context():  # Use the passed app_instance's context
-        print("--- Starting scheduled image monitoring task ---")
+    """
+    Sweep run on every cron fire: enqueues each due area onto the job queue, spreading their
+    start times across AREA_STAGGER_WINDOW_SECONDS. Areas with monitor_interval_minutes only
+    become due once that interval has passed since their last dispatch.
+    """
+    with app_instance.app_context(), Metrics.stage('scheduler_sweep'):  # Use the passed app_instance's context
+        print("--- Starting scheduled image monitoring sweep ---")
         # Use db.session.query for database operations within the app context
-        area_configs = db.session.query(AreaConfig).all()
+        area_configs = db.session.query(AreaConfig).order_by(AreaConfig.id).all()
         if not area_configs:
             print("No area configurations found to monitor.")
             return
 
+        now = datetime.utcnow()
+        stagger_window = float(app_instance.config.get('AREA_STAGGER_WINDOW_SECONDS', 0))
+        # A run may start up to one stagger window late, so allow that much slack on intervals
+        slack = timedelta(seconds=stagger_window)
+
+        due_configs = []
         for config in area_configs:
-            print(f"Processing AreaConfig: {config.name} (ID: {config.id})")
-            try:
-                # Pass app_instance.config to the service methods
-                ImageCaptureService.capture_images_for_area(config, app_instance.config)
-                ImageComparisonService.run_comparison_for_area(config.id, app_instance.config)
-            except Exception as e:
-                print(f"Error processing AreaConfig {config.id}: {e}")
-        print("--- Scheduled image monitoring task finished ---")
+            last_dispatch = last_dispatch_times.get(config.id)
+            if config.monitor_interval_minutes and last_dispatch is not None and \
+                    now - last_dispatch < timedelta(minutes=config.monitor_interval_minutes) - slack:
+                continue
+            due_configs.append(config)
+
+        enqueued = 0
+        for index, config in enumerate(due_configs):
+            delay_seconds = stagger_window * index / len(due_configs)
+            if area_job_queue.enqueue(config.id, delay_seconds=delay_seconds):
+                last_dispatch_times[config.id] = now
+                enqueued += 1
+            else:
+                print(f"AreaConfig {config.id} is still queued or running (or the queue is full), not enqueued.")
+        print(f"--- Enqueued {enqueued} of {len(due_configs)} due areas ({len(area_configs)} total); "
+              f"queue: {area_job_queue.metrics()} ---")
+
+
+def scheduled_tile_retention(app_instance):
+    with app_instance.app_context():
+        RetentionService.run(app_instance.config)
+
+
+def start_tile_retention(app_instance):
+    """
+    Starts a retention pass in the background for POST /retention/run. Returns False, without
+    starting anything, while a scheduled or manual pass is still running.
+    """
+    if not RetentionService.run_lock.acquire(blocking=False):
+        return False
+
+    def run_pass():
+        try:
+            with app_instance.app_context():
+                RetentionService.run_pass(app_instance.config)
+        except Exception as e:
+            print(f"Error in manual retention pass: {e}")
+        finally:
+            RetentionService.run_lock.release()
+
+    threading.Thread(target=run_pass, name='tile-retention', daemon=True).start()
+    return True
+
+
+def scheduled_notification_dispatch(app_instance):
+    with app_instance.app_context():
+        NotificationOutboxService.dispatch_due(app_instance.config)
 
 
 def start_my_schedule(app_instance):  # Accept app_instance as an argument
+    global area_job_queue
+    # Parsed first so a bad SCHEDULING_CRON_EXPRESSION fails startup before any worker starts
     cron_expression = app_instance.config['SCHEDULING_CRON_EXPRESSION']
+    monitoring_trigger = cron_trigger_from_expression(cron_expression)
+
+    area_job_queue = AreaJobQueue(
+        handler=lambda area_config_id: run_area_monitoring(app_instance, area_config_id),
+        max_workers=int(app_instance.config.get('SCHEDULER_MAX_WORKERS', 2)),
+        max_queue_size=int(app_instance.config.get('SCHEDULER_MAX_QUEUE_SIZE', 100))
+    )
+    area_job_queue.start()
 
     scheduler.add_job(
         scheduled_image_monitoring,
-        'cron',
-        minute='*/5',  # This runs every 5th minute (0, 5, 10, etc.)
+        monitoring_trigger,
         args=[app_instance],  # Pass the app_instance as an argument to the job function
         id='image_monitoring_job',
-        replace_existing=True
+        replace_existing=True,
+        max_instances=1,
+        coalesce=True
+    )
+    if app_instance.config.get('RETENTION_ENABLED'):
+        scheduler.add_job(
+            scheduled_tile_retention,
+            'interval',
+            minutes=int(app_instance.config.get('RETENTION_INTERVAL_MINUTES', 60)),
+            args=[app_instance],
+            id='tile_retention_job',
+            replace_existing=True,
+            max_instances=1,
+            coalesce=True
+        )
+    scheduler.add_job(
+        scheduled_notification_dispatch,
+        'interval',
+        seconds=int(app_instance.config.get('NOTIFICATION_DISPATCH_INTERVAL_SECONDS', 10)),
+        args=[app_instance],
+        id='notification_dispatch_job',
+        replace_existing=True,
+        max_instances=1,
+        coalesce=True
     )
     scheduler.start()
     print(f"Scheduler started with cron: {cron_expression}")
@@ -1,7 +1,10 @@
-from flask import Blueprint, jsonify
-from entities.models import AlertSession, AlertDetail, ImageTile, AreaConfig
+from flask import Blueprint, request, jsonify
+from sqlalchemy import or_, and_
+from sqlalchemy.orm import selectinload
+from entities.models import AlertSession, AlertDetail, AreaConfig
 from extensions import db  # Import db from extensions
 from utils.jwt_utils import jwt_required
+from utils.pagination import encode_cursor, decode_cursor, is_paginated, parse_limit
 
 alert_bp = Blueprint('alerts', __name__, url_prefix='/api/alerts')
 
@@ -10,10 +13,42 @@ alert_bp = Blueprint('alerts', __name__, url_prefix='/api/alerts')
 @jwt_required
 def get_alert_sessions():
     """
-    Retrieves a list of all alert sessions.
+    Retrieves alert sessions, newest first. With limit or cursor the response is a page,
+    {sessions, nextCursor}; without either it is the original bare array of every match.
+    Query parameters: limit (default 50, max 500), cursor, area_config_id, status.
     """
-    sessions = db.session.query(AlertSession).order_by(AlertSession.start_time.desc()).all()
-    return jsonify([session.to_dict() for session in sessions]), 200
+    args = request.args
+    try:
+        limit = parse_limit(args, default=50, maximum=500)
+        after = decode_cursor(args['cursor']) if args.get('cursor') else None
+        area_config_id = int(args['area_config_id']) if args.get('area_config_id') else None
+    except ValueError as e:
+        return jsonify({'message': str(e)}), 400
+
+    query = db.session.query(AlertSession)
+    if area_config_id is not None:
+        query = query.filter(AlertSession.area_config_id == area_config_id)
+    if args.get('status'):
+        query = query.filter(AlertSession.status == args['status'])
+    if after is not None:
+        after_time, after_id = after
+        query = query.filter(or_(AlertSession.start_time < after_time,
+                                 and_(AlertSession.start_time == after_time, AlertSession.id < after_id)))
+
+    query = query.order_by(AlertSession.start_time.desc(), AlertSession.id.desc())
+    if not is_paginated(args):
+        return jsonify([session.to_dict() for session in query.all()]), 200
+
+    sessions = query.limit(limit + 1).all()
+    next_cursor = None
+    if len(sessions) > limit:
+        sessions = sessions[:limit]
+        next_cursor = encode_cursor(sessions[-1].start_time, sessions[-1].id)
+
+    return jsonify({
+        'sessions': [session.to_dict() for session in sessions],
+        'nextCursor': next_cursor
+    }), 200
 
 
 @alert_bp.route('/sessions/<int:session_id>/details', methods=['GET'])
@@ -21,20 +56,19 @@ def get_alert_sessions():
 def get_alert_session_details(session_id):
     """
     Retrieves details for a specific alert session, including associated image tiles.
+    The details and their tiles are eager-loaded, so this is two queries however many
+    tiles changed.
     """
-    session = db.session.query(AlertSession).get(session_id)
+    session = db.session.query(AlertSession).options(
+        selectinload(AlertSession.details).joinedload(AlertDetail.image_tile)
+    ).filter(AlertSession.id == session_id).first()
     if not session:
         return jsonify({'message': 'Alert session not found'}), 404
 
-    details = db.session.query(AlertDetail).filter_by(alert_session_id=session_id).all()
-
-    # Optionally, fetch associated image tile info and previous/current image paths
     detailed_alerts = []
-    for detail in details:
-        current_tile = db.session.query(ImageTile).get(detail.image_tile_id)
-
+    for detail in session.details:
         alert_dict = detail.to_dict()
-        alert_dict['current_tile_info'] = current_tile.to_dict() if current_tile else None
+        alert_dict['current_tile_info'] = detail.image_tile.to_dict() if detail.image_tile else None
 
         # We already store previous_image_path and current_image_path in AlertDetail
         # You might want to ensure these paths are accessible from the frontend if needed
@@ -46,4 +80,3 @@ def get_alert_session_details(session_id):
     session_dict['alert_details'] = detailed_alerts
 
     return jsonify(session_dict), 200
-
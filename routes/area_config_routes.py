@@ -17,7 +17,12 @@ def create_area_config():
             north_km=data['northKm'],
             south_km=data['southKm'],
             east_km=data['eastKm'],
-            west_km=data['westKm']
+            west_km=data['westKm'],
+            min_refetch_seconds=data.get('minRefetchSeconds'),
+            monitor_interval_minutes=data.get('monitorIntervalMinutes'),
+            change_pixel_threshold=data.get('changePixelThreshold'),
+            change_min_region_area=data.get('changeMinRegionArea'),
+            change_percent_threshold=data.get('changePercentThreshold')
         )
         db.session.add(new_config)
         db.session.commit()
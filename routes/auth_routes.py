@@ -1,11 +1,17 @@
 from flask import Blueprint, request, jsonify, current_app  # Import current_app
 from entities.models import User
-from utils.jwt_utils import generate_jwt_token
+from utils.jwt_utils import generate_jwt_token, decode_jwt_token, verify_token_user
 from extensions import db  # Import db and bcrypt from extensions
+from services.password_hashing_service import PasswordHashingService, HashingBusyError
 
 auth_bp = Blueprint('auth', __name__, url_prefix='/api/auth')
 
 
+def hashing_busy_response(error):
+    return jsonify({'message': 'Too many concurrent sign-ins, please retry shortly'}), 429, \
+        {'Retry-After': str(error.retry_after)}
+
+
 @auth_bp.route('/register', methods=['POST'])
 def register():
     data = request.get_json()
@@ -19,8 +25,11 @@ def register():
     if db.session.query(User).filter_by(email=email).first():  # Use db.session.query
         return jsonify({'message': 'User with this email already exists'}), 409
 
-    new_user = User(email=email, profile=profile)
-    new_user.set_password(password)
+    try:
+        password_hash = PasswordHashingService.hash_password(password, current_app.config)
+    except HashingBusyError as e:
+        return hashing_busy_response(e)
+    new_user = User(email=email, profile=profile, password_hash=password_hash)
 
     db.session.add(new_user)
     db.session.commit()
@@ -36,12 +45,19 @@ def login():
 
     user = db.session.query(User).filter_by(email=email).first()  # Use db.session.query
 
-    if not user or not user.check_password(password):
-        return jsonify({'message': 'Invalid credentials'}), 401
+    try:
+        if not user or not PasswordHashingService.check_password(user.password_hash, password, current_app.config):
+            return jsonify({'message': 'Invalid credentials'}), 401
+        if PasswordHashingService.needs_rehash(user.password_hash, current_app.config):
+            # BCRYPT_LOG_ROUNDS changed since this hash was made; the password is known right now
+            user.password_hash = PasswordHashingService.hash_password(password, current_app.config)
+            db.session.commit()
+    except HashingBusyError as e:
+        return hashing_busy_response(e)
 
     # Pass current_app.config to generate_jwt_token
-    access_token = generate_jwt_token(user.id, 'access', current_app.config)
-    refresh_token = generate_jwt_token(user.id, 'refresh', current_app.config)
+    access_token = generate_jwt_token(user.id, 'access', current_app.config, user.password_version())
+    refresh_token = generate_jwt_token(user.id, 'refresh', current_app.config, user.password_version())
 
     return jsonify({
         'message': 'Login successful',
@@ -49,3 +65,26 @@ def login():
         'refresh_token': refresh_token,
         'user': user.to_dict()
     }), 200
+
+
+@auth_bp.route('/refresh', methods=['POST'])
+def refresh():
+    """New access token for a refresh token, without repeating the password check of /login."""
+    data = request.get_json(silent=True) or {}
+    token = data.get('refresh_token')
+    if not token:
+        return jsonify({'message': 'refresh_token is required'}), 400
+
+    payload = decode_jwt_token(token, current_app.config)
+    if 'error' in payload:
+        return jsonify({'message': payload['error']}), 401
+    if payload.get('type') != 'refresh':
+        return jsonify({'message': 'A refresh token is required'}), 401
+
+    # Always checked against the database: a refresh is rare and must see a changed password or deleted user
+    user, error = verify_token_user(payload, current_app.config, from_database=True)
+    if error:
+        return jsonify({'message': error}), 401
+
+    access_token = generate_jwt_token(user.id, 'access', current_app.config, user.password_version)
+    return jsonify({'message': 'Token refreshed', 'access_token': access_token}), 200
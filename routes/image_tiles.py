@@ -1,13 +1,112 @@
 # Endpoint to get image tiles for a specific area (for ViewChangesPage)
-from flask import jsonify, current_app
+import json
 
+from flask import Blueprint, request, jsonify, Response, stream_with_context
+
+from extensions import db
 from entities.models import ImageTile
+from services.retention_service import RetentionService
+from services.tile_query_service import TileQueryService
+from services.tile_state_index import TileStateIndex
 from utils.jwt_utils import jwt_required
+from utils.pagination import encode_cursor, decode_cursor, is_paginated, parse_limit, parse_datetime_arg, parse_bool_arg
+
+image_tiles_bp = Blueprint('image_tiles', __name__, url_prefix='/api/image-tiles')
+
+
+def area_image_tiles_response(area_config_id):
+    """
+    Lists an area's image tiles, newest first. Shared by /api/image-tiles/area/<id> and
+    /api/monitor/image-tiles/area/<id>. With limit or cursor the response is a page,
+    {tiles, nextCursor}; without either it is the original bare array of every match.
+
+    Query parameters:
+      limit        page size (default 100, max 1000)
+      cursor       nextCursor from the previous page (keyset on captureTime, id)
+      latest_only  only the newest capture of each tile
+      changed_only only captures where a change was detected
+      since/until  captureTime range, ISO 8601 (since inclusive, until exclusive)
+      fields       comma-separated subset of the tile fields, e.g. fields=id,uniqueKey,imagePath
+      format       'ndjson' streams every matching row (no paging) for bulk export
+    """
+    args = request.args
+    try:
+        fields = [field for field in args.get('fields', '').split(',') if field] or list(TileQueryService.TILE_FIELDS)
+        unknown_fields = [field for field in fields if field not in TileQueryService.TILE_FIELDS]
+        if unknown_fields:
+            raise ValueError(f"Unknown fields: {', '.join(unknown_fields)}")
+        filters = {
+            'latest_only': parse_bool_arg(args, 'latest_only'),
+            'changed_only': parse_bool_arg(args, 'changed_only'),
+            'since': parse_datetime_arg(args, 'since'),
+            'until': parse_datetime_arg(args, 'until'),
+        }
+        after = decode_cursor(args['cursor']) if args.get('cursor') else None
+        limit = parse_limit(args)
+    except ValueError as e:
+        return jsonify({'message': str(e)}), 400
+
+    stmt = TileQueryService.tile_listing_select(area_config_id, fields, after=after, **filters)
+
+    if args.get('format') == 'ndjson':
+        def generate():
+            # Server-side cursor: rows are fetched in chunks, so memory stays flat however long the history is
+            result = db.session.execute(stmt.execution_options(stream_results=True, yield_per=1000))
+            for row in result:
+                yield json.dumps(TileQueryService.serialize_tile_row(row, fields)) + '\n'
+
+        return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+    if not is_paginated(args):
+        return jsonify([TileQueryService.serialize_tile_row(row, fields) for row in db.session.execute(stmt)]), 200
 
-@current_app.route('/api/image-tiles/area/<int:area_config_id>', methods=['GET'])
+    rows = db.session.execute(stmt.limit(limit + 1)).all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1].captureTime, rows[-1].id)
+
+    return jsonify({
+        'tiles': [TileQueryService.serialize_tile_row(row, fields) for row in rows],
+        'nextCursor': next_cursor
+    }), 200
+
+
+@image_tiles_bp.route('/area/<int:area_config_id>', methods=['GET'])
 @jwt_required  # Protect this route
 def get_area_image_tiles(area_config_id):
-    # This will return ALL image tiles for the area.
-    # The frontend or a separate query might filter for just changed ones or latest.
-    tiles = ImageTile.query.filter_by(area_config_id=area_config_id).order_by(ImageTile.capture_time.desc()).all()
-    return jsonify([tile.to_dict() for tile in tiles]), 200
+    return area_image_tiles_response(area_config_id)
+
+
+@image_tiles_bp.route('/area/<int:area_config_id>/latest', methods=['GET'])
+@jwt_required
+def get_area_latest_tiles(area_config_id):
+    """Latest capture of every grid cell, served from the in-memory tile state index. ?changed_only=true filters."""
+    tile_state = TileStateIndex.for_area_id(area_config_id)
+    if tile_state is None:
+        return jsonify({'message': 'AreaConfig not found'}), 404
+    return jsonify({'tiles': tile_state.latest_tiles(changed_only=parse_bool_arg(request.args, 'changed_only'))}), 200
+
+
+@image_tiles_bp.route('/area/<int:area_config_id>/summary', methods=['GET'])
+@jwt_required
+def get_area_tile_summary(area_config_id):
+    """Cell counts (captured, comparable, changed, pending comparison) from the in-memory index."""
+    tile_state = TileStateIndex.for_area_id(area_config_id)
+    if tile_state is None:
+        return jsonify({'message': 'AreaConfig not found'}), 404
+    return jsonify(tile_state.summary()), 200
+
+
+@image_tiles_bp.route('/<int:tile_id>/image', methods=['GET'])
+@jwt_required
+def get_image_tile_image(tile_id):
+    """The tile's PNG, whether it is still in blob storage or has been moved to an archive chunk."""
+    tile = db.session.get(ImageTile, tile_id)
+    if not tile:
+        return jsonify({'message': 'Image tile not found'}), 404
+    try:
+        content = RetentionService.read_image_bytes(tile.image_path)
+    except (OSError, KeyError) as e:
+        return jsonify({'message': f'Image not available: {e}'}), 404
+    return Response(content, mimetype='image/png')
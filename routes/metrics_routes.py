@@ -0,0 +1,19 @@
+import hmac
+
+from flask import Blueprint, Response, request, jsonify, current_app
+from utils.metrics import Metrics
+
+metrics_bp = Blueprint('metrics', __name__)
+
+
+@metrics_bp.route('/metrics', methods=['GET'])
+def get_metrics():
+    """Prometheus text exposition. Scrapers send METRICS_AUTH_TOKEN as a bearer token when it is set."""
+    if not Metrics.enabled:
+        return jsonify({'message': 'Metrics are disabled'}), 404
+    expected_token = current_app.config.get('METRICS_AUTH_TOKEN')
+    if expected_token:
+        auth_header = request.headers.get('Authorization', '')
+        if not hmac.compare_digest(auth_header, f'Bearer {expected_token}'):
+            return jsonify({'message': 'Metrics token is missing or invalid'}), 401
+    return Response(Metrics.render(), mimetype='text/plain; version=0.0.4'), 200
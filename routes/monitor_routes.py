@@ -1,9 +1,13 @@
 from flask import Blueprint, jsonify, current_app  # Import current_app
-from entities.models import AreaConfig, ImageTile
+from entities.models import AreaConfig
 from utils.jwt_utils import jwt_required
 from services.image_capture_service import ImageCaptureService
 from services.image_comparison_service import ImageComparisonService
+from services.comparison_executor import ComparisonExecutor
+from services.monitoring_pipeline import MonitoringPipeline
+from services.retention_service import RetentionService
 from extensions import db  # Import db from extensions
+from routes.image_tiles import area_image_tiles_response
 
 monitor_bp = Blueprint('monitor', __name__, url_prefix='/api/monitor')
 
@@ -15,6 +19,16 @@ def trigger_image_capture(area_config_id):
     if not config:
         return jsonify({'message': 'AreaConfig not found'}), 404
 
+    import mschedule  # Local import: the queue only exists once the scheduler has been started
+    if mschedule.area_job_queue is not None:
+        # Queued like scheduled runs, so a manual capture never overlaps one for the same area
+        app_instance = current_app._get_current_object()
+        if not mschedule.area_job_queue.enqueue(
+                area_config_id, handler=lambda area_id: mschedule.run_area_capture(app_instance, area_id)):
+            return jsonify({'message': f'AreaConfig ID {area_config_id} is already queued or running '
+                                       f'(or the queue is full)'}), 409
+        return jsonify({'message': f'Image capture queued for AreaConfig ID: {area_config_id}'}), 202
+
     # Pass current_app.config to the service method
     ImageCaptureService.capture_images_for_area(config, current_app.config)
     return jsonify({'message': f'Image capture triggered for AreaConfig ID: {area_config_id}'}), 200
@@ -27,6 +41,15 @@ def trigger_image_comparison(area_config_id):
     if not config:
         return jsonify({'message': 'AreaConfig not found'}), 404
 
+    import mschedule  # Local import: the queue only exists once the scheduler has been started
+    if mschedule.area_job_queue is not None:
+        app_instance = current_app._get_current_object()
+        if not mschedule.area_job_queue.enqueue(
+                area_config_id, handler=lambda area_id: mschedule.run_area_comparison(app_instance, area_id)):
+            return jsonify({'message': f'AreaConfig ID {area_config_id} is already queued or running '
+                                       f'(or the queue is full)'}), 409
+        return jsonify({'message': f'Image comparison queued for AreaConfig ID: {area_config_id}'}), 202
+
     # Pass current_app.config to the service method
     ImageComparisonService.run_comparison_for_area(config.id, current_app.config)
     return jsonify({'message': f'Image comparison triggered for AreaConfig ID: {area_config_id}'}), 200
@@ -35,6 +58,56 @@ def trigger_image_comparison(area_config_id):
 @monitor_bp.route('/image-tiles/area/<int:area_config_id>', methods=['GET'])
 @jwt_required
 def get_area_image_tiles(area_config_id):
-    tiles = db.session.query(ImageTile).filter_by(area_config_id=area_config_id).order_by(
-        ImageTile.capture_time.desc()).all()
-    return jsonify([tile.to_dict() for tile in tiles]), 200
+    return area_image_tiles_response(area_config_id)
+
+
+@monitor_bp.route('/scheduler/metrics', methods=['GET'])
+@jwt_required
+def get_scheduler_metrics():
+    import mschedule  # Local import: the queue only exists once the scheduler has been started
+    if mschedule.area_job_queue is None:
+        return jsonify({'message': 'Scheduler is not running in this process'}), 404
+    return jsonify(mschedule.area_job_queue.metrics()), 200
+
+
+@monitor_bp.route('/pipeline/timings', methods=['GET'])
+@jwt_required
+def get_pipeline_timings():
+    return jsonify({str(area_id): timings for area_id, timings in MonitoringPipeline.last_run_timings.items()}), 200
+
+
+@monitor_bp.route('/sharing', methods=['GET'])
+@jwt_required
+def get_tile_sharing():
+    """How much capture and comparison work the last run of each area got from other runs."""
+    areas = {}
+    for area_id, timings in MonitoringPipeline.last_run_timings.items():
+        download = timings.get('download', {})
+        areas[str(area_id)] = {
+            'tilesPlanned': timings.get('tilesPlanned', 0),
+            'requests': download.get('cacheMisses', 0) + download.get('cacheRevalidated', 0),
+            'reusedCaptures': download.get('cacheHits', 0),
+            'sharedInFlight': download.get('sharedInFlight', 0),
+            'tilesCompared': timings.get('tilesCompared', 0),
+            'comparisonsReused': timings.get('comparisonsReused', 0),
+        }
+    return jsonify({
+        'tileGridMode': ImageCaptureService.TILE_GRID_MODE,
+        'comparisonMemo': ComparisonExecutor.memo_stats(),
+        'areas': areas,
+    }), 200
+
+
+@monitor_bp.route('/retention/run', methods=['POST'])
+@jwt_required
+def trigger_tile_retention():
+    import mschedule  # Local import: mschedule imports the services this module does
+    if not mschedule.start_tile_retention(current_app._get_current_object()):
+        return jsonify({'message': 'A retention pass is already running'}), 409
+    return jsonify({'message': 'Retention pass started; see /retention/last-run for its stats'}), 202
+
+
+@monitor_bp.route('/retention/last-run', methods=['GET'])
+@jwt_required
+def get_tile_retention_last_run():
+    return jsonify(RetentionService.last_run_stats), 200
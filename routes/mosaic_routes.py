@@ -0,0 +1,50 @@
+import os
+
+from flask import Blueprint, request, jsonify, send_file, current_app
+
+from entities.models import AreaConfig
+from extensions import db  # Import db from extensions
+from services.mosaic_service import MosaicService
+from utils.jwt_utils import jwt_required
+from utils.pagination import parse_bool_arg
+
+mosaic_bp = Blueprint('mosaics', __name__, url_prefix='/api/mosaics')
+
+
+@mosaic_bp.route('/area/<int:area_config_id>', methods=['GET'])
+@jwt_required
+def get_mosaic_info(area_config_id):
+    """Pyramid metadata for an area: zoom range, grid shape, bbox, layers and build time."""
+    manifest = MosaicService.load_manifest(area_config_id, current_app.config)
+    if manifest is None:
+        return jsonify({'message': 'Mosaic has not been built for this area'}), 404
+    manifest.pop('cells', None)
+    return jsonify(manifest), 200
+
+
+@mosaic_bp.route('/area/<int:area_config_id>/build', methods=['POST'])
+@jwt_required
+def build_mosaic(area_config_id):
+    """Incrementally (or with ?full=true, completely) rebuilds an area's pyramid."""
+    config = db.session.query(AreaConfig).get(area_config_id)
+    if not config:
+        return jsonify({'message': 'AreaConfig not found'}), 404
+    stats = MosaicService.build_for_area(config, current_app.config, full=parse_bool_arg(request.args, 'full'))
+    return jsonify(stats), 200
+
+
+@mosaic_bp.route('/area/<int:area_config_id>/<layer>/<int:z>/<int:x>/<int:y>.png', methods=['GET'])
+@jwt_required
+def get_mosaic_tile(area_config_id, layer, z, x, y):
+    if layer not in MosaicService.LAYERS:
+        return jsonify({'message': f"Unknown layer: {layer}"}), 400
+    path = MosaicService.tile_path(area_config_id, layer, z, x, y, current_app.config)
+    if not os.path.exists(path):
+        return jsonify({'message': 'Tile not found'}), 404
+
+    # ETag/Last-Modified come from the file, so unchanged tiles revalidate with a 304
+    response = send_file(os.path.abspath(path), mimetype='image/png', conditional=True, etag=True,
+                         max_age=int(current_app.config.get('MOSAIC_CACHE_MAX_AGE_SECONDS', 300)))
+    response.cache_control.public = False
+    response.cache_control.private = True  # Tiles sit behind auth
+    return response
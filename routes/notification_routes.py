@@ -0,0 +1,76 @@
+from flask import Blueprint, request, jsonify, current_app
+from entities.models import AreaConfig, DeviceToken, NotificationOutbox
+from extensions import db  # Import db from extensions
+from utils.jwt_utils import jwt_required
+from services.notification_outbox_service import NotificationOutboxService
+
+notification_bp = Blueprint('notification', __name__, url_prefix='/api/notifications')
+
+
+@notification_bp.route('/device-tokens', methods=['POST'])
+@jwt_required
+def register_device_token():
+    data = request.get_json() or {}
+    token = data.get('token')
+    area_config_id = data.get('areaConfigId')
+    if not token:
+        return jsonify({'message': 'token is required'}), 400
+    if area_config_id is not None and not db.session.get(AreaConfig, area_config_id):
+        return jsonify({'message': 'AreaConfig not found'}), 404
+
+    # A token belongs to one device; registering it again moves it to the caller and area
+    device_token = db.session.query(DeviceToken).filter_by(token=token).first()
+    status = 200
+    if device_token is None:
+        device_token = DeviceToken(token=token)
+        db.session.add(device_token)
+        status = 201
+    device_token.user_id = request.current_user.id
+    device_token.area_config_id = area_config_id
+    db.session.commit()
+    return jsonify(device_token.to_dict()), status
+
+
+@notification_bp.route('/device-tokens', methods=['GET'])
+@jwt_required
+def get_device_tokens():
+    tokens = db.session.query(DeviceToken).filter_by(user_id=request.current_user.id).order_by(DeviceToken.id).all()
+    return jsonify([token.to_dict() for token in tokens]), 200
+
+
+@notification_bp.route('/device-tokens', methods=['DELETE'])
+@jwt_required
+def delete_device_token():
+    token = (request.get_json() or {}).get('token')
+    if not token:
+        return jsonify({'message': 'token is required'}), 400
+    deleted = db.session.query(DeviceToken).filter_by(token=token, user_id=request.current_user.id).delete()
+    db.session.commit()
+    if not deleted:
+        return jsonify({'message': 'Device token not found'}), 404
+    return jsonify({'message': 'Device token removed'}), 200
+
+
+@notification_bp.route('/outbox', methods=['GET'])
+@jwt_required
+def get_notification_outbox():
+    query = db.session.query(NotificationOutbox)
+    if request.args.get('status'):
+        query = query.filter(NotificationOutbox.status == request.args['status'])
+    if request.args.get('area_config_id', type=int) is not None:
+        query = query.filter(NotificationOutbox.area_config_id == request.args.get('area_config_id', type=int))
+    limit = min(max(request.args.get('limit', 50, type=int), 1), 500)
+    notifications = query.order_by(NotificationOutbox.id.desc()).limit(limit).all()
+    return jsonify({
+        'notifications': [notification.to_dict() for notification in notifications],
+        'lastDispatch': NotificationOutboxService.last_dispatch_stats
+    }), 200
+
+
+@notification_bp.route('/outbox/dispatch', methods=['POST'])
+@jwt_required
+def dispatch_notification_outbox():
+    stats = NotificationOutboxService.dispatch_due(current_app.config)
+    if stats is None:
+        return jsonify({'message': 'Firebase is not initialized; notifications stay queued'}), 503
+    return jsonify(stats), 200
@@ -0,0 +1,65 @@
+from flask import Blueprint, request, jsonify
+from utils.jwt_utils import jwt_required
+from utils.pagination import parse_limit, parse_datetime_arg, parse_bool_arg
+from services.spatial_index import SpatialIndex
+
+spatial_bp = Blueprint('spatial', __name__, url_prefix='/api/spatial')
+
+
+def parse_location(args):
+    """(min_lat, min_lon, max_lat, max_lon) from ?lat=&lon= or ?bbox=minLon,minLat,maxLon,maxLat."""
+    if args.get('bbox'):
+        try:
+            min_lon, min_lat, max_lon, max_lat = (float(part) for part in args['bbox'].split(','))
+        except ValueError:
+            raise ValueError('bbox must be minLon,minLat,maxLon,maxLat')
+        if min_lat > max_lat or min_lon > max_lon:
+            raise ValueError('bbox minimums must not exceed its maximums')
+        return min_lat, min_lon, max_lat, max_lon
+    try:
+        lat, lon = float(args['lat']), float(args['lon'])
+    except (KeyError, ValueError):
+        raise ValueError('Either lat and lon or bbox is required')
+    return lat, lon, lat, lon
+
+
+@spatial_bp.route('/areas', methods=['GET'])
+@jwt_required
+def get_areas_at_location():
+    try:
+        location = parse_location(request.args)
+    except ValueError as e:
+        return jsonify({'message': str(e)}), 400
+    return jsonify({'areas': SpatialIndex.areas_in_bbox(*location)}), 200
+
+
+@spatial_bp.route('/areas/overlaps', methods=['GET'])
+@jwt_required
+def get_area_overlaps():
+    return jsonify({'overlaps': SpatialIndex.overlapping_areas()}), 200
+
+
+def tiles_at_location_response(changed_only):
+    args = request.args
+    try:
+        location = parse_location(args)
+        limit = parse_limit(args, default=1000, maximum=10000)
+        captured_since = parse_datetime_arg(args, 'since')
+    except ValueError as e:
+        return jsonify({'message': str(e)}), 400
+    tiles, truncated = SpatialIndex.tiles_in_bbox(*location, area_config_id=args.get('area_config_id', type=int),
+                                                  changed_only=changed_only, captured_since=captured_since,
+                                                  limit=limit)
+    return jsonify({'tiles': tiles, 'truncated': truncated}), 200
+
+
+@spatial_bp.route('/tiles', methods=['GET'])
+@jwt_required
+def get_tiles_at_location():
+    return tiles_at_location_response(parse_bool_arg(request.args, 'changed_only'))
+
+
+@spatial_bp.route('/changes', methods=['GET'])
+@jwt_required
+def get_changes_at_location():
+    return tiles_at_location_response(True)
@@ -0,0 +1,24 @@
+# Dedups existing captured_images/<area_id> directories into content-addressed blob storage.
+# Usage, from the repository root: python3 -m scripts.compact_tile_storage [area_config_id ...]   (no ids = every area)
+# Restart the server afterwards: its in-memory tile state index still points at the removed rows.
+import sys
+
+from app import app
+from extensions import db
+from entities.models import AreaConfig
+from services.tile_storage_service import TileStorageService
+
+
+def main(area_config_ids):
+    db.init_app(app)
+    with app.app_context():
+        if not area_config_ids:
+            area_config_ids = [config.id for config in db.session.query(AreaConfig).all()]
+        for area_config_id in area_config_ids:
+            print(f"Compacting tile storage for AreaConfig ID: {area_config_id}")
+            stats = TileStorageService.compact_area(area_config_id, app.config)
+            print(f"Finished AreaConfig ID {area_config_id}: {stats}")
+
+
+if __name__ == '__main__':
+    main([int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,70 @@
+# Adds the columns and indexes that newer versions of the models expect to an existing database.
+# Usage, from the repository root: python3 -m scripts.upgrade_schema [--dry-run]
+# db.create_all() creates missing tables but never alters existing ones, so run this once after
+# upgrading, before starting the server. It only adds what is missing and can be run again safely.
+import sys
+
+from sqlalchemy import inspect, text
+
+from extensions import db
+import entities.models  # noqa: F401  Registers every table on db.metadata
+
+# Values for existing rows of NOT NULL columns: rows from before dirty-tile tracking were
+# compared by every run, so none of them is waiting for a comparison
+UPGRADE_DEFAULTS = {
+    ('image_tiles', 'needs_comparison'): '0',
+}
+
+
+def upgrade_statements(connection):
+    """ALTER TABLE / CREATE INDEX statements that bring the existing tables up to the models."""
+    inspector = inspect(connection)
+    existing_tables = set(inspector.get_table_names())
+    statements = []
+    for table in db.metadata.sorted_tables:
+        if table.name not in existing_tables:
+            continue  # db.create_all() creates new tables whole
+        existing_columns = {column['name'] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing_columns:
+                continue
+            column_type = column.type.compile(dialect=connection.dialect)
+            statement = f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}"
+            if column.nullable:
+                statement += " NULL"
+            else:
+                statement += f" NOT NULL DEFAULT {UPGRADE_DEFAULTS[(table.name, column.name)]}"
+            statements.append(statement)
+        existing_indexes = {index['name'] for index in inspector.get_indexes(table.name)}
+        for index in sorted(table.indexes, key=lambda index: index.name):
+            if index.name not in existing_indexes:
+                columns = ', '.join(column.name for column in index.columns)
+                statements.append(f"CREATE INDEX {index.name} ON {table.name} ({columns})")
+    return statements
+
+
+def upgrade(engine, dry_run=False):
+    """Applies upgrade_statements in one transaction. Returns the statements."""
+    with engine.begin() as connection:
+        statements = upgrade_statements(connection)
+        for statement in statements:
+            print(statement)
+            if not dry_run:
+                connection.execute(text(statement))
+    return statements
+
+
+def main(dry_run):
+    from app import app  # Imported here so upgrade() can be used without the app's services
+
+    db.init_app(app)
+    with app.app_context():
+        statements = upgrade(db.engine, dry_run)
+        if dry_run:
+            return
+        db.create_all()  # Tables added since, e.g. device_tokens and notification_outbox
+        print(f"Applied {len(statements)} schema change(s)." if statements else "Schema is up to date.")
+
+
+if __name__ == '__main__':
+    main('--dry-run' in sys.argv[1:])
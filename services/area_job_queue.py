@@ -0,0 +1,141 @@
+import heapq
+import itertools
+import threading
+import time
+
+
+class AreaJobQueue:
+    """
+    In-process delay queue that runs one monitoring job per area on a bounded worker pool.
+
+    Jobs carry a not-before time, so a sweep can stagger its areas instead of starting them
+    all at once. An area that is already queued or running is never enqueued again, which
+    rules out overlapping runs of the same area; that holds for manually triggered jobs too,
+    which pass their own handler to enqueue(). Queue depth and lag (how late a job started
+    relative to its not-before time) are exposed through metrics().
+    """
+
+    def __init__(self, handler, max_workers=2, max_queue_size=100):
+        self.handler = handler  # Called as handler(area_config_id) on a worker thread
+        self.max_workers = max_workers
+        self.max_queue_size = max_queue_size
+        self._heap = []  # (not_before, sequence, area_config_id, handler or None for the default)
+        self._sequence = itertools.count()
+        self._condition = threading.Condition()
+        self._queued = set()
+        self._running = {}  # area_config_id -> start time
+        self._workers = []
+        self._stopping = False
+
+        self.enqueued = 0
+        self.completed = 0
+        self.failed = 0
+        self.skipped_overlap = 0
+        self.rejected_full = 0
+        self.last_lag_seconds = 0.0
+        self.max_lag_seconds = 0.0
+        self._total_lag_seconds = 0.0
+        self.last_duration_seconds = {}
+
+    def start(self):
+        with self._condition:
+            if self._workers:
+                return
+            self._stopping = False
+            for index in range(self.max_workers):
+                worker = threading.Thread(target=self._worker_loop, name=f'area-job-worker-{index}', daemon=True)
+                worker.start()
+                self._workers.append(worker)
+
+    def stop(self, wait=True):
+        with self._condition:
+            self._stopping = True
+            self._condition.notify_all()
+        if wait:
+            for worker in self._workers:
+                worker.join()
+        self._workers = []
+
+    def enqueue(self, area_config_id, delay_seconds=0.0, handler=None):
+        """
+        Queues a run for the area, of handler(area_config_id) if given instead of the queue's
+        handler. Returns False if the area is already queued/running or the queue is full.
+        """
+        with self._condition:
+            if area_config_id in self._queued or area_config_id in self._running:
+                self.skipped_overlap += 1
+                return False
+            if len(self._heap) >= self.max_queue_size:
+                self.rejected_full += 1
+                return False
+            heapq.heappush(self._heap, (time.time() + max(0.0, delay_seconds), next(self._sequence), area_config_id,
+                                        handler))
+            self._queued.add(area_config_id)
+            self.enqueued += 1
+            self._condition.notify()
+            return True
+
+    def _next_job(self):
+        with self._condition:
+            while not self._stopping:
+                if not self._heap:
+                    self._condition.wait()
+                    continue
+                not_before = self._heap[0][0]
+                wait_seconds = not_before - time.time()
+                if wait_seconds > 0:
+                    self._condition.wait(timeout=wait_seconds)
+                    continue
+                not_before, _, area_config_id, handler = heapq.heappop(self._heap)
+                self._queued.discard(area_config_id)
+                started = time.time()
+                self._running[area_config_id] = started
+
+                lag = started - not_before
+                self.last_lag_seconds = lag
+                self.max_lag_seconds = max(self.max_lag_seconds, lag)
+                self._total_lag_seconds += lag
+                return area_config_id, handler or self.handler
+            return None, None
+
+    def _worker_loop(self):
+        while True:
+            area_config_id, handler = self._next_job()
+            if area_config_id is None:
+                return
+            succeeded = True
+            try:
+                handler(area_config_id)
+            except Exception as e:
+                succeeded = False
+                print(f"Monitoring job for AreaConfig {area_config_id} failed: {e}")
+            finally:
+                with self._condition:
+                    started = self._running.pop(area_config_id, None)
+                    if started is not None:
+                        self.last_duration_seconds[area_config_id] = round(time.time() - started, 3)
+                    if succeeded:
+                        self.completed += 1
+                    else:
+                        self.failed += 1
+
+    def metrics(self):
+        with self._condition:
+            now = time.time()
+            started_jobs = self.completed + self.failed + len(self._running)
+            return {
+                'queueDepth': len(self._heap),
+                'dueNow': sum(1 for not_before, *_ in self._heap if not_before <= now),
+                'running': {str(area_id): round(now - started, 3) for area_id, started in self._running.items()},
+                'workers': self.max_workers,
+                'enqueued': self.enqueued,
+                'completed': self.completed,
+                'failed': self.failed,
+                'skippedOverlap': self.skipped_overlap,
+                'rejectedFull': self.rejected_full,
+                'lastLagSeconds': round(self.last_lag_seconds, 3),
+                'maxLagSeconds': round(self.max_lag_seconds, 3),
+                'avgLagSeconds': round(self._total_lag_seconds / started_jobs, 3) if started_jobs else 0.0,
+                'lastDurationSeconds': {str(area_id): duration for area_id, duration in
+                                        self.last_duration_seconds.items()},
+            }
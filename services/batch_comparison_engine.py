@@ -0,0 +1,130 @@
+import tempfile
+
+import cv2
+import numpy as np
+
+from utils.metrics import Metrics
+
+# Rows of padding above and below each image in the blur stack; half the 5x5 Gaussian kernel
+BLUR_PADDING = 2
+
+
+class BatchComparisonEngine:
+    """
+    Compares many (previous_path, latest_path) pairs at once on stacked NumPy arrays.
+
+    A batch of N decoded pairs is copied into two contiguous (N, H, W[, 3]) stacks, and
+    absdiff, the grayscale conversion, the Gaussian blur and the threshold each run as a
+    single OpenCV call over the whole batch. For the blur the images sit in an
+    (N, H + 4, W) stack whose two padding rows above and below every image hold that
+    image's own BORDER_REFLECT_101 rows, so blurring the whole stack as one tall image gives
+    exactly the per-image result. Changed-pixel counts come from one vectorised count;
+    contour (legacy kernel) or connected-component (fast kernel) analysis then runs only on
+    the images with enough changed pixels to matter, and the rest are decided without it.
+    Change decisions and percentages are identical to the per-pair kernels.
+
+    Selected with COMPARISON_ENGINE = 'batch'; batches hold COMPARISON_BATCH_SIZE pairs and
+    are memory-mapped from a temporary file when COMPARISON_BATCH_MEMMAP is set.
+    """
+
+    @staticmethod
+    def _allocate(shape, use_memmap):
+        if use_memmap:
+            return np.memmap(tempfile.TemporaryFile(), dtype=np.uint8, mode='w+', shape=shape)
+        return np.empty(shape, dtype=np.uint8)
+
+    @staticmethod
+    def compare_pairs(pairs, app_config):
+        """Returns one comparison result per (previous_path, latest_path) pair, in input order."""
+        batch_size = max(1, int(app_config.get('COMPARISON_BATCH_SIZE', 256)))
+        results = []
+        for start in range(0, len(pairs), batch_size):
+            results.extend(BatchComparisonEngine._compare_batch(pairs[start:start + batch_size], app_config))
+        return results
+
+    @staticmethod
+    def _compare_batch(pairs, app_config):
+        # Imported here: the comparison service itself hands work to this engine
+        from services.image_comparison_service import ImageComparisonService
+
+        fast = app_config.get('COMPARISON_KERNEL', 'legacy') == 'fast'
+        pixel_threshold, min_region_area, change_percent_threshold = \
+            ImageComparisonService.comparison_thresholds(app_config)
+        if fast:
+            min_region_area = ImageComparisonService.fast_min_region_area(app_config)
+        max_distance = app_config.get('COMPARISON_DHASH_MAX_DISTANCE')
+        use_perceptual_hash = app_config.get('COMPARISON_PREFILTER_ENABLED', True) and \
+            max_distance is not None and max_distance >= 0
+
+        results = [None] * len(pairs)
+        loaded = []  # (index, img1, img2) of the pairs that need the full comparison
+        for index, (image1_path, image2_path) in enumerate(pairs):
+            img1 = ImageComparisonService._decode_for_kernel(image1_path, app_config)
+            img2 = ImageComparisonService._decode_for_kernel(image2_path, app_config)
+            if img1 is None or img2 is None:
+                results[index] = {"changed": False, "change_percent": 0.0, "error": True, "tier": "full",
+                                  "message": "Comparison failed: Failed to load one or both images. "
+                                             "Check paths and file integrity."}
+                continue
+            if use_perceptual_hash:
+                perceptual_result = ImageComparisonService.perceptual_hash_result(img1, img2, max_distance)
+                if perceptual_result is not None:
+                    results[index] = perceptual_result
+                    continue
+            loaded.append((index, img1, img2))
+        if not loaded:
+            return results
+
+        use_memmap = bool(app_config.get('COMPARISON_BATCH_MEMMAP', False))
+        count = len(loaded)
+        image_shape = loaded[0][1].shape
+        height, width = image_shape[:2]
+
+        # --- Whole-batch diff and grayscale ---
+        with Metrics.stage('diff'):
+            previous_stack = BatchComparisonEngine._allocate((count,) + image_shape, use_memmap)
+            latest_stack = BatchComparisonEngine._allocate((count,) + image_shape, use_memmap)
+            for row, (_, img1, img2) in enumerate(loaded):
+                previous_stack[row] = img1
+                latest_stack[row] = img2
+            flat_shape = (count * height,) + image_shape[1:]  # OpenCV sees the batch as one tall image
+            diff = cv2.absdiff(previous_stack.reshape(flat_shape), latest_stack.reshape(flat_shape))
+            del previous_stack, latest_stack
+            if not fast:
+                diff = cv2.cvtColor(diff, cv2.COLOR_BGR2GRAY)
+
+            # --- Blur on a row-padded stack, so no image bleeds into its neighbours ---
+            padded_height = height + 2 * BLUR_PADDING
+            padded = BatchComparisonEngine._allocate((count, padded_height, width), use_memmap)
+            body = slice(BLUR_PADDING, BLUR_PADDING + height)
+            padded[:, body] = diff.reshape(count, height, width)
+            del diff
+            for offset in range(1, BLUR_PADDING + 1):
+                padded[:, BLUR_PADDING - offset] = padded[:, BLUR_PADDING + offset]  # Reflect-101 above
+                padded[:, BLUR_PADDING + height - 1 + offset] = padded[:, BLUR_PADDING + height - 1 - offset]  # Below
+            flat_padded = padded.reshape(count * padded_height, width)
+            blurred = cv2.GaussianBlur(flat_padded, (5, 5), 0)
+            _, thresh = cv2.threshold(blurred, pixel_threshold, 255, cv2.THRESH_BINARY)
+            thresh = thresh.reshape(count, padded_height, width)[:, body]
+            del padded, flat_padded, blurred
+
+        # --- Region analysis only where enough pixels changed ---
+        with Metrics.stage('contour'):
+            changed_pixels = np.count_nonzero(thresh.reshape(count, -1), axis=1)
+            # Legacy contours can enclose unchanged holes, so only an empty mask is certain to score 0
+            candidate_floor = min_region_area if fast else 0
+            image_area = height * width
+            for row, (index, _, _) in enumerate(loaded):
+                if changed_pixels[row] <= candidate_floor:
+                    total_change_area = 0
+                else:
+                    mask = np.ascontiguousarray(thresh[row])
+                    total_change_area = ImageComparisonService.component_change_area(mask, min_region_area) if fast \
+                        else ImageComparisonService.contour_change_area(mask, min_region_area)
+                results[index] = ImageComparisonService.change_result(total_change_area, image_area,
+                                                                      change_percent_threshold)
+                results[index]['tier'] = 'full'
+
+        print(f"Batch comparison: {len(pairs)} pairs, {count} stacked, "
+              f"{int((changed_pixels > candidate_floor).sum())} needed region analysis")
+        return results
@@ -0,0 +1,250 @@
+import atexit
+import multiprocessing
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future, ProcessPoolExecutor
+from functools import partial
+
+from utils.metrics import Metrics
+
+_MP_CONTEXT = None  # Resolved by _mp_context() when the first pool is created
+
+
+def _mp_context():
+    """
+    Workers come from a fork server rather than fork(): the app process runs request, scheduler and
+    download threads, and a child forked from it could inherit locks (SQLAlchemy pool, logging, the
+    tile state index) held at that moment. The server preloads only this module, never the app or db.
+    Platforms without a fork server (Windows) spawn fresh interpreters instead, which is equally safe.
+    """
+    global _MP_CONTEXT
+    if _MP_CONTEXT is None:
+        try:
+            context = multiprocessing.get_context('forkserver')
+            context.set_forkserver_preload(['numpy', __name__])
+        except ValueError:
+            context = multiprocessing.get_context('spawn')
+        _MP_CONTEXT = context
+    return _MP_CONTEXT
+
+
+# Only the config keys the image work needs are shipped to worker processes.
+WORKER_CONFIG_KEYS = ('Maps_IMAGE_SIZE', 'IMAGE_CACHE_BUDGET_MB', 'IMAGE_CACHE_NPY_SIDECAR',
+                      'COMPARISON_PREFILTER_ENABLED', 'COMPARISON_DHASH_MAX_DISTANCE',
+                      'COMPARISON_KERNEL', 'COMPARISON_DECODE_REDUCTION', 'COMPARISON_PIXEL_THRESHOLD',
+                      'COMPARISON_MIN_REGION_AREA', 'COMPARISON_CHANGE_PERCENT_THRESHOLD', 'METRICS_ENABLED')
+
+
+def _worker_config(app_config):
+    """The WORKER_CONFIG_KEYS of app_config, with IMAGE_CACHE_NPY_SIDECAR = None resolved."""
+    worker_config = {key: app_config[key] for key in WORKER_CONFIG_KEYS if key in app_config}
+    if worker_config.get('IMAGE_CACHE_NPY_SIDECAR') is None:
+        # Each pool worker has its own decoded image cache; sidecars let the worker that gets a
+        # capture next cycle map the array another worker decoded instead of decoding it again
+        worker_config['IMAGE_CACHE_NPY_SIDECAR'] = ComparisonExecutor.worker_count(app_config) > 1
+    return worker_config
+
+
+def _compare_pair(pair, app_config):
+    # Imported here so worker processes only pull in the comparison code when they need it
+    from services.image_comparison_service import ImageComparisonService
+    from services.decoded_image_cache import DecodedImageCache
+    previous_path, latest_path = pair
+    Metrics.enabled = app_config.get('METRICS_ENABLED', True)
+    with Metrics.collect_stages() as stages:
+        if app_config.get('COMPARISON_PREFILTER_ENABLED', True):
+            result = ImageComparisonService.compare_images_tiered(previous_path, latest_path, app_config)
+        else:
+            result = ImageComparisonService.compare_with_kernel(previous_path, latest_path, app_config)
+    # Cache counters and stage timings live in the worker, so they travel back with every result
+    return result, os.getpid(), DecodedImageCache.instance(app_config).stats(), stages
+
+
+class PairFuture(Future):
+    """What submit_pair returns; reused is True when the result came from (or joins) an earlier identical comparison."""
+
+    def __init__(self, reused, area_config_id=''):
+        super().__init__()
+        self.reused = reused
+        self.area_config_id = area_config_id  # Labels the stage timings recorded by result_of
+
+
+def _mirror(source, target):
+    if not target.set_running_or_notify_cancel():
+        return  # The caller gave up on it; the shared comparison itself carries on
+    if source.exception() is not None:
+        target.set_exception(source.exception())
+    else:
+        target.set_result(source.result())
+
+
+class ComparisonExecutor:
+    """
+    Fans (previous_path, latest_path) pairs out to a process pool.
+
+    Workers only run the pure image comparison and return plain result dicts; all DB work
+    stays in the calling process. With COMPARISON_MAX_WORKERS <= 1 the pairs are compared
+    serially in-process, which produces the same results as the pool.
+    The pool is created lazily and kept for the life of the process so worker start-up is
+    paid once rather than on every monitoring run.
+
+    Results are memoized by (previous_path, latest_path, worker config), up to
+    COMPARISON_MEMO_SIZE pairs: image paths are content-addressed blobs, so on the global tile
+    grid a cell shared by several areas is compared once and the result handed to each of
+    them. Failed comparisons are not kept.
+    """
+
+    _pool = None
+    _pool_workers = None
+    _pool_lock = threading.Lock()
+    _cache_stats_by_pid = {}
+    _memo = OrderedDict()  # memo key -> Future of the (result, pid, cache_stats) output
+    _memo_lock = threading.Lock()
+    _memo_hits = 0
+    _memo_misses = 0
+
+    @classmethod
+    def _get_pool(cls, max_workers):
+        with cls._pool_lock:
+            if cls._pool is None or cls._pool_workers != max_workers:
+                if cls._pool is not None:
+                    cls._pool.shutdown(wait=True)
+                cls._pool = ProcessPoolExecutor(max_workers=max_workers, mp_context=_mp_context())
+                cls._pool_workers = max_workers
+            return cls._pool
+
+    @classmethod
+    def shutdown(cls):
+        with cls._pool_lock:
+            if cls._pool is not None:
+                cls._pool.shutdown(wait=True)
+                cls._pool = None
+                cls._pool_workers = None
+
+    @staticmethod
+    def worker_count(app_config):
+        configured = app_config.get('COMPARISON_MAX_WORKERS')
+        if configured is None:
+            return max(1, (os.cpu_count() or 2) - 1)  # Leave a core for the Flask workers
+        return int(configured)
+
+    @classmethod
+    def _memo_claim(cls, pair, worker_config, app_config):
+        """
+        (future, owned) for a pair: the memoized comparison if there is one, else a new Future
+        registered in its place, which the caller (owned=True) must complete.
+        """
+        memo_size = int(app_config.get('COMPARISON_MEMO_SIZE', 10000))
+        future = Future()
+        if memo_size <= 0:
+            return future, True
+        key = (pair[0], pair[1], tuple(sorted(worker_config.items())))
+        with cls._memo_lock:
+            memoized = cls._memo.get(key)
+            if memoized is not None:
+                cls._memo.move_to_end(key)
+                cls._memo_hits += 1
+                return memoized, False
+            cls._memo_misses += 1
+            cls._memo[key] = future
+            while len(cls._memo) > memo_size:
+                cls._memo.popitem(last=False)
+        future.add_done_callback(partial(cls._forget_failed, key))
+        return future, True
+
+    @classmethod
+    def _forget_failed(cls, key, future):
+        if future.exception() is None and not future.result()[0].get('error'):
+            return
+        with cls._memo_lock:
+            if cls._memo.get(key) is future:
+                del cls._memo[key]  # Retried on the next run rather than served from here
+
+    @classmethod
+    def compare_pairs(cls, pairs, app_config, area_config_id=''):
+        """Returns one comparison result per (previous_path, latest_path) pair, in input order."""
+        if not pairs:
+            return []
+        worker_config = _worker_config(app_config)
+        compare = partial(_compare_pair, app_config=worker_config)
+
+        futures, owned = [], []  # owned: (future, pair) this call computes
+        for pair in pairs:
+            future, is_owner = cls._memo_claim(pair, worker_config, app_config)
+            futures.append(future)
+            if is_owner:
+                owned.append((future, pair))
+
+        try:
+            max_workers = cls.worker_count(app_config)
+            if max_workers <= 1 or len(owned) <= 1:
+                outputs = [compare(pair) for _, pair in owned]
+            else:
+                chunk_size = int(app_config.get('COMPARISON_CHUNK_SIZE', 16))
+                outputs = cls._get_pool(max_workers).map(compare, [pair for _, pair in owned],
+                                                         chunksize=max(1, chunk_size))
+            for (future, _), output in zip(owned, outputs):
+                future.set_result(output)
+                Metrics.record_stages(output[3], area_config_id)  # Memo hits did no work of their own
+        except BaseException as e:
+            for future, _ in owned:
+                if not future.done():
+                    future.set_exception(e)  # Don't leave other callers waiting on it
+            raise
+
+        return [cls._unpack(future.result()) for future in futures]
+
+    @classmethod
+    def submit_pair(cls, pair, app_config, area_config_id=''):
+        """
+        Submits a single pair and returns a PairFuture; pass it to result_of() to get the comparison
+        result. Used by the streaming pipeline to start comparing while downloads continue.
+        Every call gets its own future, so cancelling one never cancels a comparison another
+        caller is sharing.
+        """
+        worker_config = _worker_config(app_config)
+        source, owned = cls._memo_claim(pair, worker_config, app_config)
+        if owned:
+            max_workers = cls.worker_count(app_config)
+            if max_workers <= 1:
+                try:
+                    source.set_result(_compare_pair(pair, worker_config))
+                except Exception as e:
+                    source.set_exception(e)
+            else:
+                pool_future = cls._get_pool(max_workers).submit(_compare_pair, pair, worker_config)
+                pool_future.add_done_callback(partial(_mirror, target=source))
+        future = PairFuture(reused=not owned, area_config_id=area_config_id)
+        source.add_done_callback(partial(_mirror, target=future))
+        return future
+
+    @classmethod
+    def _unpack(cls, output):
+        result, pid, cache_stats, _ = output
+        cls._cache_stats_by_pid[pid] = cache_stats
+        return result
+
+    @classmethod
+    def result_of(cls, future):
+        output = future.result()
+        if not future.reused:
+            Metrics.record_stages(output[3], future.area_config_id)
+        return cls._unpack(output)
+
+    @classmethod
+    def memo_stats(cls):
+        with cls._memo_lock:
+            return {'entries': len(cls._memo), 'hits': cls._memo_hits, 'misses': cls._memo_misses}
+
+    @classmethod
+    def cache_stats(cls):
+        """Decoded image cache counters summed over every process that has run comparisons."""
+        totals = {}
+        for cache_stats in cls._cache_stats_by_pid.values():
+            for name, value in cache_stats.items():
+                totals[name] = totals.get(name, 0) + value
+        return totals
+
+
+atexit.register(ComparisonExecutor.shutdown)
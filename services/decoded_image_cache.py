@@ -0,0 +1,143 @@
+import os
+import threading
+from collections import OrderedDict
+
+import cv2
+import numpy as np
+
+from utils.metrics import Metrics
+
+
+class DecodedImageCache:
+    """
+    LRU cache of decoded, resized tile images, bounded by a memory budget.
+
+    Entries are keyed by image path, file mtime, target size and colour mode, so a file that
+    is rewritten is never served stale. In steady state the "latest" image of one cycle is
+    the "previous" image of the next, so each capture is decoded once over its lifetime, but
+    only within one process: every comparison worker holds its own cache, and a pair landing
+    on another worker next cycle is decoded again there. With IMAGE_CACHE_NPY_SIDECAR enabled
+    (by default whenever the worker pool is used, see comparison_executor._worker_config) the
+    decoded array is also written next to the image as a .npy file and memory-mapped on later
+    loads, which lets the cache survive restarts and be shared between worker processes.
+    Returned arrays are read-only.
+    """
+
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    def __init__(self, budget_mb=256, sidecar_enabled=False):
+        self.budget_bytes = int(budget_mb * 1024 * 1024)
+        self.sidecar_enabled = sidecar_enabled
+        self._entries = OrderedDict()
+        self._current_bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.sidecar_hits = 0
+
+    @classmethod
+    def instance(cls, app_config):
+        """Per-process cache configured from app_config."""
+        with cls._instance_lock:
+            if cls._instance is None:
+                cls._instance = cls(budget_mb=float(app_config.get('IMAGE_CACHE_BUDGET_MB', 256)),
+                                    sidecar_enabled=bool(app_config.get('IMAGE_CACHE_NPY_SIDECAR', False)))
+            return cls._instance
+
+    # cv2.imread flags per (reduction, grayscale); IMREAD_REDUCED_* decodes at 1/n resolution
+    READ_FLAGS = {
+        (1, False): cv2.IMREAD_COLOR, (1, True): cv2.IMREAD_GRAYSCALE,
+        (2, False): cv2.IMREAD_REDUCED_COLOR_2, (2, True): cv2.IMREAD_REDUCED_GRAYSCALE_2,
+        (4, False): cv2.IMREAD_REDUCED_COLOR_4, (4, True): cv2.IMREAD_REDUCED_GRAYSCALE_4,
+        (8, False): cv2.IMREAD_REDUCED_COLOR_8, (8, True): cv2.IMREAD_REDUCED_GRAYSCALE_8,
+    }
+
+    @staticmethod
+    def sidecar_path(image_path, target_size, grayscale, reduction=1):
+        mode = 'gray' if grayscale else 'bgr'
+        if reduction > 1:
+            mode = f"{mode}_r{reduction}"
+        return f"{image_path}.{target_size[0]}x{target_size[1]}.{mode}.npy"
+
+    def get(self, image_path, target_size, grayscale=False, reduction=1):
+        """
+        Returns the decoded image at target_size, or None if it cannot be read. With
+        reduction 2, 4 or 8 the file is decoded at that fraction of its resolution first.
+        """
+        try:
+            mtime_ns = os.stat(image_path).st_mtime_ns
+        except OSError:
+            return None
+        key = (image_path, mtime_ns, tuple(target_size), grayscale, reduction)
+
+        with self._lock:
+            image = self._entries.get(key)
+            if image is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return image
+            self.misses += 1
+
+        image = self._load(image_path, mtime_ns, target_size, grayscale, reduction)
+        if image is None:
+            return None
+        self._put(key, image)
+        return image
+
+    def _load(self, image_path, mtime_ns, target_size, grayscale, reduction):
+        sidecar = self.sidecar_path(image_path, target_size, grayscale, reduction) if self.sidecar_enabled else None
+        if sidecar is not None:
+            try:
+                if os.stat(sidecar).st_mtime_ns >= mtime_ns:
+                    image = np.load(sidecar, mmap_mode='r')
+                    with self._lock:
+                        self.sidecar_hits += 1
+                    return image
+            except (OSError, ValueError):
+                pass  # Missing or unreadable sidecar, decode the image instead
+
+        with Metrics.stage('imread'):
+            image = cv2.imread(image_path, self.READ_FLAGS[(reduction, grayscale)])
+        if image is None:
+            return None
+        if (image.shape[1], image.shape[0]) != tuple(target_size):  # Captures usually already match
+            with Metrics.stage('resize'):
+                image = cv2.resize(image, tuple(target_size))
+        image.setflags(write=False)
+
+        if sidecar is not None:
+            try:
+                temp_path = f"{sidecar}.{os.getpid()}.tmp"
+                with open(temp_path, 'wb') as f:
+                    np.save(f, image)
+                os.replace(temp_path, sidecar)  # Atomic so concurrent workers never see a partial file
+            except OSError as e:
+                print(f"Could not write decoded image sidecar {sidecar}: {e}")
+        return image
+
+    def _put(self, key, image):
+        size = image.nbytes
+        if size > self.budget_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                return
+            self._entries[key] = image
+            self._current_bytes += size
+            while self._current_bytes > self.budget_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._current_bytes -= evicted.nbytes
+                self.evictions += 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'sidecarHits': self.sidecar_hits,
+                'entries': len(self._entries),
+                'bytes': self._current_bytes,
+            }
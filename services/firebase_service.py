@@ -57,3 +57,38 @@ class FirebaseService:
             print(f"Error sending Firebase notification: {e}")
             return False
 
+
+    @staticmethod
+    def send_multicast(tokens, title, body, data_payload=None):
+        """
+        Sends one notification to up to 500 device tokens. Returns a list of
+        (token, success, error_code) in token order; error_code is None on success.
+        """
+        if not FirebaseService._initialized:
+            raise RuntimeError("Firebase Admin SDK not initialized.")
+
+        message = messaging.MulticastMessage(
+            notification=messaging.Notification(
+                title=title,
+                body=body,
+            ),
+            data=data_payload,
+            tokens=list(tokens),
+        )
+        batch_response = messaging.send_each_for_multicast(message)
+        results = []
+        for token, response in zip(tokens, batch_response.responses):
+            if response.success:
+                results.append((token, True, None))
+            else:
+                results.append((token, False, FirebaseService.error_code(response.exception)))
+        return results
+
+    @staticmethod
+    def error_code(exception):
+        """FCM error code for a send exception, e.g. 'UNREGISTERED' or 'UNAVAILABLE'."""
+        if isinstance(exception, messaging.UnregisteredError):
+            return 'UNREGISTERED'
+        if isinstance(exception, messaging.SenderIdMismatchError):
+            return 'SENDER_ID_MISMATCH'
+        return getattr(exception, 'code', None) or 'UNKNOWN'
@@ -1,50 +1,42 @@
-import os
 import requests
 from datetime import datetime
-from math import ceil
+from functools import lru_cache
 from extensions import db  # Import db from extensions
-from entities.models import ImageTile  # Import ImageTile model
+from entities.models import AreaConfig, ImageTile  # Import models
 from utils.geo_utils import GeoUtils  # Import GeoUtils
+from services.tile_download_service import TileDownloadService
+from services.image_tile_writer import ImageTileWriter
+from services.tile_storage_service import TileStorageService
+from services.tile_response_cache import TileResponseCache
 
 
 class ImageCaptureService:
     TILE_SIZE_METERS = 236.0  # Changed from 50.0 to 100.0 to match zoom=20's ~116m coverage more practically
+    TILE_GRID_MODE = 'area'  # From TILE_GRID_MODE at startup: 'area' (per-area grids) or 'global' (shared world grid)
 
     @staticmethod
-    # Accept app_config as an argument
-    def download_and_save_image(area_config_id, lat, lon, unique_key, app_config):
-        image_url = (
+    def build_image_url(lat, lon, app_config):
+        return (
             f"{app_config['Maps_STATIC_URL']}?"  # Use app_config
             f"center={lat},{lon}&zoom={app_config['Maps_IMAGE_ZOOM']}&"  # Use app_config
             f"size={app_config['Maps_IMAGE_SIZE']}&maptype=satellite&key={app_config['Maps_API_KEY']}"  # Use app_config
         )
-        current_timestamp = datetime.utcnow()
-        file_name = f"{unique_key}_{current_timestamp.strftime('%Y%m%d%H%M%S')}.png"
 
-        area_image_dir = os.path.join(app_config['IMAGE_STORAGE_DIRECTORY'], str(area_config_id))  # Use app_config
-        os.makedirs(area_image_dir, exist_ok=True)
-        file_path = os.path.join(area_image_dir, file_name)
+    @staticmethod
+    # Accept app_config as an argument
+    def download_and_save_image(area_config_id, lat, lon, unique_key, app_config):
+        image_url = ImageCaptureService.build_image_url(lat, lon, app_config)
+        current_timestamp = datetime.utcnow()
 
         try:
-            response = requests.get(image_url, stream=True)
+            response = requests.get(image_url)
             response.raise_for_status()  # Raise HTTPError for bad responses (4xx or 5xx)
 
-            with open(file_path, 'wb') as f:
-                for chunk in response.iter_content(chunk_size=8192):
-                    f.write(chunk)
+            content_hash, file_path = TileStorageService.store_blob(response.content, app_config)
             print(f"Image saved: {file_path}")
 
-            new_tile = ImageTile(
-                area_config_id=area_config_id,
-                unique_key=unique_key,
-                latitude=lat,
-                longitude=lon,
-                capture_time=current_timestamp,
-                image_path=file_path,
-                status='CAPTURED'
-            )
-            db.session.add(new_tile)
-            db.session.commit()
+            ImageCaptureService.save_tile_record(area_config_id, unique_key, lat, lon, current_timestamp, file_path,
+                                                 content_hash)
             return True
         except requests.exceptions.RequestException as e:
             print(f"Error downloading image from {image_url}: {e}")
@@ -55,36 +47,127 @@ class ImageCaptureService:
             return False
 
     @staticmethod
-    # Accept app_config as an argument
-    def capture_images_for_area(area_config, app_config):
-        print(f"Starting image capture for AreaConfig ID: {area_config.id}, Name: {area_config.name}")
-
-        bbox = GeoUtils.calculate_bounding_box(
-            area_config.center_lat, area_config.center_lon,
-            area_config.north_km, area_config.south_km,
-            area_config.east_km, area_config.west_km
+    def save_tile_record(area_config_id, unique_key, lat, lon, capture_time, file_path, content_hash=None):
+        new_tile = ImageTile(
+            area_config_id=area_config_id,
+            unique_key=unique_key,
+            latitude=lat,
+            longitude=lon,
+            capture_time=capture_time,
+            image_path=file_path,
+            content_hash=content_hash,
+            last_seen_time=capture_time,
+            needs_comparison=True,
+            status='CAPTURED'
         )
+        db.session.add(new_tile)
+        db.session.commit()
+
+        from services.tile_state_index import TileStateIndex  # Imported here: the index builds on this service
+        area_config = db.session.get(AreaConfig, area_config_id)
+        if area_config is not None:
+            TileStateIndex.refresh_keys(area_config, [unique_key])
+
+    @staticmethod
+    def min_refetch_seconds(area_config, app_config):
+        if area_config.min_refetch_seconds is not None:
+            seconds = area_config.min_refetch_seconds
+        else:
+            seconds = app_config.get('CAPTURE_MIN_REFETCH_SECONDS', 0)
+        if ImageCaptureService.TILE_GRID_MODE == 'global':
+            # A world cell another area captured this recently is the same image; reuse it
+            seconds = max(seconds or 0, app_config.get('TILE_SHARE_WINDOW_SECONDS', 300))
+        return seconds
+
+    @staticmethod
+    def area_tile_grid(area_config):
+        return GeoUtils.area_tile_grid(area_config, ImageCaptureService.TILE_SIZE_METERS,
+                                       ImageCaptureService.TILE_GRID_MODE)
+
+    @staticmethod
+    @lru_cache(maxsize=256)
+    def _unique_keys(area_config_id, center_lat, center_lon, north_km, south_km, east_km, west_km, mode='area'):
+        if mode == 'global':
+            # World cells are named by position alone, so overlapping areas share keys
+            grid = GeoUtils.world_tile_grid(center_lat, center_lon, north_km, south_km, east_km, west_km,
+                                            ImageCaptureService.TILE_SIZE_METERS)
+            return tuple(f"g_{row}_{col}" for row, col in zip(grid['globalRow'].tolist(), grid['globalCol'].tolist()))
+        grid = GeoUtils.tile_grid(center_lat, center_lon, north_km, south_km, east_km, west_km,
+                                  ImageCaptureService.TILE_SIZE_METERS)
+        return tuple(f"{area_config_id}_{lat:.6f}_{lon:.6f}".replace('.', '_')
+                     for lat, lon in zip(grid['centerLats'].tolist(), grid['centerLons'].tolist()))
+
+    @staticmethod
+    def area_unique_keys(area_config):
+        """unique_key per grid cell, in grid order. Memoised with the grid itself."""
+        return ImageCaptureService._unique_keys(area_config.id, area_config.center_lat, area_config.center_lon,
+                                                area_config.north_km, area_config.south_km,
+                                                area_config.east_km, area_config.west_km,
+                                                ImageCaptureService.TILE_GRID_MODE)
+
+    @staticmethod
+    def plan_tile_jobs(area_config, app_config):
+        """
+        Builds one download job per grid cell of the area. Each job carries everything the
+        download engine and the DB stage need: position, unique_key and URL.
+        """
+        grid = ImageCaptureService.area_tile_grid(area_config)
+        unique_keys = ImageCaptureService.area_unique_keys(area_config)
 
         lat_diff_meters = (area_config.north_km + area_config.south_km) * 1000
         lon_diff_meters = (area_config.east_km + area_config.west_km) * 1000
+        print(
+            f"Area spans approx {lat_diff_meters}m (lat) x {lon_diff_meters}m (lon). Will generate {grid['rows']}x{grid['cols']} tiles.")
 
-        num_lat_tiles = ceil(lat_diff_meters / ImageCaptureService.TILE_SIZE_METERS)
-        num_lon_tiles = ceil(lon_diff_meters / ImageCaptureService.TILE_SIZE_METERS)
+        return [{
+            'area_config_id': area_config.id,
+            'unique_key': unique_key,
+            'lat': lat,
+            'lon': lon,
+            'url': ImageCaptureService.build_image_url(lat, lon, app_config),
+        } for unique_key, lat, lon in zip(unique_keys, grid['centerLats'].tolist(), grid['centerLons'].tolist())]
 
-        print(
-            f"Area spans approx {lat_diff_meters}m (lat) x {lon_diff_meters}m (lon). Will generate {int(num_lat_tiles)}x{int(num_lon_tiles)} tiles.")
+    @staticmethod
+    # Accept app_config as an argument
+    def capture_images_for_area(area_config, app_config):
+        print(f"Starting image capture for AreaConfig ID: {area_config.id}, Name: {area_config.name}")
 
-        for i in range(int(num_lat_tiles)):
-            for j in range(int(num_lon_tiles)):
-                current_lat = bbox['minLat'] + GeoUtils.meters_to_latitude_degrees(
-                    i * ImageCaptureService.TILE_SIZE_METERS + ImageCaptureService.TILE_SIZE_METERS / 2.0)
-                current_lon = bbox['minLon'] + GeoUtils.meters_to_longitude_degrees(
-                    j * ImageCaptureService.TILE_SIZE_METERS + ImageCaptureService.TILE_SIZE_METERS / 2.0, current_lat)
+        from services.tile_state_index import TileStateIndex  # Imported here: the index builds on this service
 
-                unique_key = f"{area_config.id}_{current_lat:.6f}_{current_lon:.6f}".replace('.', '_')
+        jobs = ImageCaptureService.plan_tile_jobs(area_config, app_config)
 
-                # Pass app_config to download_and_save_image
-                ImageCaptureService.download_and_save_image(area_config.id, current_lat, current_lon, unique_key,
-                                                            app_config)
+        # Content hash of each key's latest capture, so unchanged downloads only bump last_seen_time
+        tile_state = TileStateIndex.for_area(area_config)
+        captured_keys = []
+        seen_keys = {}
+
+        # HTTP fetches and blob writes run concurrently; DB writes stay on this thread and are batched.
+        downloader = TileDownloadService(app_config, response_cache=TileResponseCache.instance(app_config),
+                                         min_refetch_seconds=ImageCaptureService.min_refetch_seconds(area_config,
+                                                                                                     app_config))
+        writer = ImageTileWriter(app_config, area_config.id)
+        try:
+            for result in downloader.iter_downloads(jobs):
+                if not result['ok']:
+                    print(f"Error downloading image for unique key {result['unique_key']}: {result['error']}")
+                    continue
+                latest_id, latest_hash, _ = tile_state.latest(result['unique_key']) or (None, None, None)
+                if latest_hash is not None and latest_hash == result['content_hash']:
+                    writer.touch(latest_id, result['capture_time'])
+                    seen_keys[result['unique_key']] = result['capture_time']
+                    continue
+                writer.add(area_config.id, result['unique_key'], result['lat'], result['lon'],
+                           result['capture_time'], result['file_path'], result['content_hash'])
+                captured_keys.append(result['unique_key'])
+            writer.commit()  # One commit per area
+            TileStateIndex.refresh_keys(area_config, captured_keys)
+            for unique_key, seen_time in seen_keys.items():
+                tile_state.record_seen(unique_key, seen_time)
+        except Exception as e:
+            print(f"Error saving captured tiles for AreaConfig {area_config.id}: {e}")
+        finally:
+            downloader.close()
 
+        print(f"Download stats for AreaConfig ID {area_config.id}: {downloader.stats.summary()}")
+        print(f"DB write stats for AreaConfig ID {area_config.id}: {writer.stats()}")
         print(f"Finished image capture for AreaConfig ID: {area_config.id}")
@@ -1,63 +1,339 @@
+import threading
+
 import cv2
 import numpy as np
-import json  # Import json for storing change_log
 from datetime import datetime
 # No removed current_app import as config is passed directly
 
 from extensions import db  # Import db from extensions
-from entities.models import ImageTile, AlertSession, AlertDetail  # Import new models
-from services.firebase_service import FirebaseService  # Import FirebaseService
+from entities.models import AreaConfig, ImageTile, AlertSession, AlertDetail  # Import new models
+from services.notification_outbox_service import NotificationOutboxService
+from services.comparison_executor import ComparisonExecutor
+from services.batch_comparison_engine import BatchComparisonEngine
+from services.tile_query_service import TileQueryService
+from services.decoded_image_cache import DecodedImageCache
+from services.tile_state_index import TileStateIndex
+from utils.metrics import Metrics, COMPARISONS, CHANGES_DETECTED
+
+
+# Per-thread scratch buffers for the fast kernel, keyed by image shape
+_kernel_buffers = threading.local()
 
 
 class ImageComparisonService:
+    # AreaConfig column -> config key it overrides for that area's comparisons
+    AREA_THRESHOLD_OVERRIDES = {
+        'change_pixel_threshold': 'COMPARISON_PIXEL_THRESHOLD',
+        'change_min_region_area': 'COMPARISON_MIN_REGION_AREA',
+        'change_percent_threshold': 'COMPARISON_CHANGE_PERCENT_THRESHOLD',
+    }
+
+    @staticmethod
+    def area_comparison_config(area_config, app_config):
+        """app_config with the area's own comparison thresholds, where set, layered on top."""
+        comparison_config = dict(app_config)
+        for column, key in ImageComparisonService.AREA_THRESHOLD_OVERRIDES.items():
+            value = getattr(area_config, column, None)
+            if value is not None:
+                comparison_config[key] = value
+        return comparison_config
+
+    @staticmethod
+    def comparison_thresholds(app_config):
+        """(pixel threshold, min changed-region area in px, change percent threshold)."""
+        return (int(app_config.get('COMPARISON_PIXEL_THRESHOLD', 30)),
+                float(app_config.get('COMPARISON_MIN_REGION_AREA', 100)),
+                float(app_config.get('COMPARISON_CHANGE_PERCENT_THRESHOLD', 0.1)))
+
+    @staticmethod
+    def _target_size(app_config):
+        return (int(app_config['Maps_IMAGE_SIZE'].split('x')[0]),
+                int(app_config['Maps_IMAGE_SIZE'].split('x')[1]))
+
     @staticmethod
     # Accept app_config as an argument
     def compare_images(image1_path, image2_path, app_config):
         try:
-            img1 = cv2.imread(image1_path)
-            img2 = cv2.imread(image2_path)
+            # Use app_config for image size
+            target_size = ImageComparisonService._target_size(app_config)
+            pixel_threshold, min_contour_area_threshold, change_percent_threshold = \
+                ImageComparisonService.comparison_thresholds(app_config)
+
+            # Decoded, resized images come from the cache so each capture is decoded once
+            image_cache = DecodedImageCache.instance(app_config)
+            img1 = image_cache.get(image1_path, target_size)
+            img2 = image_cache.get(image2_path, target_size)
 
             if img1 is None or img2 is None:
                 raise ValueError("Failed to load one or both images. Check paths and file integrity.")
 
-            # Use app_config for image size
-            target_size = (int(app_config['Maps_IMAGE_SIZE'].split('x')[0]),
-                           int(app_config['Maps_IMAGE_SIZE'].split('x')[1]))
-            img1 = cv2.resize(img1, target_size)
-            img2 = cv2.resize(img2, target_size)
+            with Metrics.stage('diff'):
+                thresh = ImageComparisonService.threshold_mask(img1, img2, pixel_threshold)
+            with Metrics.stage('contour'):
+                total_change_area = ImageComparisonService.contour_change_area(thresh, min_contour_area_threshold)
+            return ImageComparisonService.change_result(total_change_area, thresh.shape[0] * thresh.shape[1],
+                                                        change_percent_threshold)
+        except Exception as e:
+            print(f"Error in image comparison: {e}")
+            return {"changed": False, "change_percent": 0.0, "message": f"Comparison failed: {str(e)}", "error": True}
 
-            diff = cv2.absdiff(img1, img2)
-            gray = cv2.cvtColor(diff, cv2.COLOR_BGR2GRAY)
-            blurred = cv2.GaussianBlur(gray, (5, 5), 0)
-            _, thresh = cv2.threshold(blurred, 30, 255, cv2.THRESH_BINARY)  # Adjust threshold if needed
+    @staticmethod
+    def contour_change_area(thresh, min_contour_area_threshold):
+        """Legacy changed area: summed area of the external contours above the size threshold."""
+        contours, _ = cv2.findContours(thresh, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
 
-            contours, _ = cv2.findContours(thresh, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+        total_change_area = 0
 
-            total_change_area = 0
-            min_contour_area_threshold = 100  # Filter out very small noisy changes
+        for cnt in contours:
+            area = cv2.contourArea(cnt)
+            if area > min_contour_area_threshold:  # Filter out very small noisy changes
+                total_change_area += area
+        return total_change_area
 
-            for cnt in contours:
-                area = cv2.contourArea(cnt)
-                if area > min_contour_area_threshold:
-                    total_change_area += area
+    @staticmethod
+    def component_change_area(thresh, min_region_area, labels=None):
+        """Fast-kernel changed area: pixel count of the connected regions above the size threshold."""
+        if cv2.countNonZero(thresh) <= min_region_area:
+            return 0  # No region can be big enough; skips labelling for unchanged tiles
+        # Grana labelling: its cost doesn't grow with the region count the way a contour loop does
+        _, _, stats, _ = cv2.connectedComponentsWithStatsWithAlgorithm(thresh, 8, cv2.CV_32S, cv2.CCL_GRANA,
+                                                                       labels=labels)
+        areas = stats[1:, cv2.CC_STAT_AREA]  # Label 0 is the unchanged background
+        return int(areas[areas > min_region_area].sum())
 
-            image_area = thresh.shape[0] * thresh.shape[1]
-            change_percent = (total_change_area / image_area) * 100 if image_area > 0 else 0
+    @staticmethod
+    def change_result(total_change_area, image_area, change_percent_threshold):
+        change_percent = (total_change_area / image_area) * 100 if image_area > 0 else 0
+        return {
+            "changed": change_percent > change_percent_threshold,  # Threshold for considering a change
+            "change_percent": round(change_percent, 2),
+            "message": "Comparison successful."
+        }
 
-            return {
-                "changed": change_percent > 0.1,  # Threshold for considering a change
-                "change_percent": round(change_percent, 2),
-                "message": "Comparison successful."
+    @staticmethod
+    def fast_min_region_area(app_config):
+        """COMPARISON_MIN_REGION_AREA scaled to the fast kernel's decode resolution."""
+        reduction = int(app_config.get('COMPARISON_DECODE_REDUCTION', 1))
+        return ImageComparisonService.comparison_thresholds(app_config)[1] / (reduction * reduction)
+
+    @staticmethod
+    def _decode_for_kernel(image_path, app_config):
+        """Decodes an image the way the configured kernel reads it (fast: grayscale, optionally reduced)."""
+        target_size = ImageComparisonService._target_size(app_config)
+        image_cache = DecodedImageCache.instance(app_config)
+        if app_config.get('COMPARISON_KERNEL', 'legacy') != 'fast':
+            return image_cache.get(image_path, target_size)
+        reduction = int(app_config.get('COMPARISON_DECODE_REDUCTION', 1))
+        return image_cache.get(image_path, (target_size[0] // reduction, target_size[1] // reduction),
+                               grayscale=True, reduction=reduction)
+
+    @staticmethod
+    def _buffers(shape):
+        buffers_by_shape = getattr(_kernel_buffers, 'by_shape', None)
+        if buffers_by_shape is None:
+            buffers_by_shape = _kernel_buffers.by_shape = {}
+        buffers = buffers_by_shape.get(shape)
+        if buffers is None:
+            buffers = buffers_by_shape[shape] = {
+                'diff': np.empty(shape, dtype=np.uint8),
+                'blurred': np.empty(shape, dtype=np.uint8),
+                'thresh': np.empty(shape, dtype=np.uint8),
+                'labels': np.empty(shape, dtype=np.int32),
             }
+        return buffers
+
+    @staticmethod
+    def compare_images_fast(image1_path, image2_path, app_config):
+        """
+        Cheaper variant of compare_images with the same result shape. Images are decoded
+        straight to grayscale (at 1/COMPARISON_DECODE_REDUCTION resolution), the diff, blur
+        and threshold run in reusable per-thread buffers, and the changed area is the pixel
+        count of the connected components above the minimum region size, taken from
+        connectedComponentsWithStats in one pass. Because the diff is of gray levels and
+        areas are pixel counts rather than contour polygons, percentages can differ slightly
+        from compare_images.
+        """
+        try:
+            pixel_threshold, _, change_percent_threshold = ImageComparisonService.comparison_thresholds(app_config)
+            min_region_area = ImageComparisonService.fast_min_region_area(app_config)
+
+            img1 = ImageComparisonService._decode_for_kernel(image1_path, app_config)
+            img2 = ImageComparisonService._decode_for_kernel(image2_path, app_config)
+            if img1 is None or img2 is None:
+                raise ValueError("Failed to load one or both images. Check paths and file integrity.")
+
+            buffers = ImageComparisonService._buffers(img1.shape)
+            with Metrics.stage('diff'):
+                cv2.absdiff(img1, img2, dst=buffers['diff'])
+                cv2.GaussianBlur(buffers['diff'], (5, 5), 0, dst=buffers['blurred'])
+                cv2.threshold(buffers['blurred'], pixel_threshold, 255, cv2.THRESH_BINARY, dst=buffers['thresh'])
+            with Metrics.stage('contour'):  # Connected components: the fast kernel's region pass
+                total_change_area = ImageComparisonService.component_change_area(buffers['thresh'], min_region_area,
+                                                                                 buffers['labels'])
+            return ImageComparisonService.change_result(total_change_area, img1.shape[0] * img1.shape[1],
+                                                        change_percent_threshold)
         except Exception as e:
             print(f"Error in image comparison: {e}")
             return {"changed": False, "change_percent": 0.0, "message": f"Comparison failed: {str(e)}", "error": True}
 
     @staticmethod
-    # Accept app_config as an argument
-    def run_comparison_for_area(area_config_id, app_config):
-        print(f"Starting image comparison for AreaConfig ID: {area_config_id}")
+    def compare_with_kernel(image1_path, image2_path, app_config):
+        """Runs the kernel selected by COMPARISON_KERNEL ('legacy' or 'fast')."""
+        if app_config.get('COMPARISON_KERNEL', 'legacy') == 'fast':
+            return ImageComparisonService.compare_images_fast(image1_path, image2_path, app_config)
+        return ImageComparisonService.compare_images(image1_path, image2_path, app_config)
 
+    @staticmethod
+    def threshold_mask(img1, img2, pixel_threshold=30):
+        """Binary (0/255) mask of the pixels compare_images counts as different."""
+        diff = cv2.absdiff(img1, img2)
+        gray = cv2.cvtColor(diff, cv2.COLOR_BGR2GRAY)
+        blurred = cv2.GaussianBlur(gray, (5, 5), 0)
+        _, thresh = cv2.threshold(blurred, pixel_threshold, 255, cv2.THRESH_BINARY)
+        return thresh
+
+    @staticmethod
+    def difference_hash(image, hash_size=8):
+        """64-bit dHash: sign of horizontal gradients on a (hash_size+1)x(hash_size) thumbnail."""
+        gray = image if image.ndim == 2 else cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+        small = cv2.resize(gray, (hash_size + 1, hash_size), interpolation=cv2.INTER_AREA)
+        bits = small[:, 1:] > small[:, :-1]
+        return int.from_bytes(np.packbits(bits).tobytes(), 'big')
+
+    @staticmethod
+    def perceptual_hash_result(img1, img2, max_distance):
+        """The 'perceptual_hash' tier result if the images' dHashes are within max_distance, else None."""
+        with Metrics.stage('dhash'):
+            distance = bin(ImageComparisonService.difference_hash(img1) ^
+                           ImageComparisonService.difference_hash(img2)).count('1')
+        if distance <= max_distance:
+            return {"changed": False, "change_percent": 0.0, "tier": "perceptual_hash",
+                    "message": f"Skipped: perceptual hash distance {distance}."}
+        return None
+
+    @staticmethod
+    def compare_images_tiered(image1_path, image2_path, app_config):
+        """
+        Runs the perceptual-hash gate before the full OpenCV pipeline. Pairs whose dHash
+        Hamming distance is within COMPARISON_DHASH_MAX_DISTANCE are reported unchanged
+        without contour analysis. The byte-identical gate runs earlier, in the parent,
+        because it only needs the content hashes stored on ImageTile.
+        Every result carries a 'tier' naming the stage that decided it.
+        """
+        max_distance = app_config.get('COMPARISON_DHASH_MAX_DISTANCE')
+        if max_distance is not None and max_distance >= 0:
+            # Decoded the way the kernel reads them, so the cache serves the kernel too
+            img1 = ImageComparisonService._decode_for_kernel(image1_path, app_config)
+            img2 = ImageComparisonService._decode_for_kernel(image2_path, app_config)
+            if img1 is not None and img2 is not None:
+                perceptual_result = ImageComparisonService.perceptual_hash_result(img1, img2, max_distance)
+                if perceptual_result is not None:
+                    return perceptual_result
+
+        comparison_result = ImageComparisonService.compare_with_kernel(image1_path, image2_path, app_config)
+        comparison_result['tier'] = 'full'
+        return comparison_result
+
+    @staticmethod
+    def compare_tile_pairs(tile_pairs, app_config, area_config_id=''):
+        """
+        Compares (latest_tile, previous_tile) pairs and returns one result per pair, in order.
+        Byte-identical pairs are decided here; the rest go to the ComparisonExecutor.
+        area_config_id only labels the stage metrics.
+        """
+        prefilter_enabled = app_config.get('COMPARISON_PREFILTER_ENABLED', True)
+        comparison_results = [None] * len(tile_pairs)
+        pending_indexes = []
+        for index, (latest_tile, previous_tile) in enumerate(tile_pairs):
+            # Tier 1: byte-identical downloads never need to be decoded
+            if prefilter_enabled and latest_tile.content_hash and \
+                    latest_tile.content_hash == previous_tile.content_hash:
+                comparison_results[index] = {"changed": False, "change_percent": 0.0, "tier": "content_hash",
+                                             "message": "Skipped: identical content hash."}
+            else:
+                pending_indexes.append(index)
+
+        # Image work runs in worker processes, or stacked in-process with the batch engine;
+        # results come back in input order.
+        pending_pairs = [(tile_pairs[index][1].image_path, tile_pairs[index][0].image_path)
+                         for index in pending_indexes]
+        if app_config.get('COMPARISON_ENGINE', 'pairwise') == 'batch':
+            with Metrics.collect_stages() as stages:
+                pending_results = BatchComparisonEngine.compare_pairs(pending_pairs, app_config)
+            Metrics.record_stages(stages, area_config_id)
+        else:
+            pending_results = ComparisonExecutor.compare_pairs(pending_pairs, app_config, area_config_id)
+        for index, comparison_result in zip(pending_indexes, pending_results):
+            comparison_results[index] = comparison_result
+
+        tier_counts = {}
+        for comparison_result in comparison_results:
+            tier = comparison_result.get('tier', 'full')
+            tier_counts[tier] = tier_counts.get(tier, 0) + 1
+        if tile_pairs:
+            skip_rates = {tier: round(count / len(tile_pairs), 3) for tier, count in tier_counts.items()}
+            print(f"Comparison tiers: counts={tier_counts}, rates={skip_rates}")
+        return comparison_results
+
+    @staticmethod
+    def apply_comparison_result(alert_session, latest_tile, previous_tile, comparison_result):
+        """
+        Records a comparison result on the latest tile and logs an AlertDetail when a change
+        was detected. Only adds to the session; the caller owns the commit. Returns True on change.
+        """
+        latest_tile.last_comparison_time = datetime.utcnow()
+        latest_tile.needs_comparison = bool(comparison_result.get('error'))  # Failed comparisons are retried
+        latest_tile.change_detected = comparison_result['changed']
+        latest_tile.status = 'CHANGED' if comparison_result['changed'] else 'NO_CHANGE'
+
+        db.session.add(latest_tile)  # Update the existing latest_tile object
+        COMPARISONS.inc(area=latest_tile.area_config_id, tier=comparison_result.get('tier', 'full'))
+
+        if not comparison_result['changed']:
+            return False
+        CHANGES_DETECTED.inc(area=latest_tile.area_config_id)
+
+        print(
+            f"ALERT: Change detected for tile {latest_tile.unique_key} (Area: {alert_session.area_config_id})! Change: {comparison_result['change_percent']}%")
+
+        # --- Log Alert Detail ---
+        alert_detail = AlertDetail(
+            alert_session_id=alert_session.id,
+            image_tile_id=latest_tile.id,
+            previous_image_path=previous_tile.image_path,
+            current_image_path=latest_tile.image_path,
+            change_log=comparison_result,  # Stored as native JSON
+            alert_time=datetime.utcnow()
+        )
+        db.session.add(alert_detail)
+        return True
+
+    @staticmethod
+    def clear_superseded_dirty_flags(area_config_id, unique_keys, latest_tile_ids):
+        """
+        Clears needs_comparison on older captures of the given keys. Those rows were never the
+        newest capture when a comparison ran, so they will never be compared on their own.
+        The latest rows are left for the caller to update through the ORM.
+        """
+        if not unique_keys:
+            return
+        db.session.query(ImageTile).filter(
+            ImageTile.area_config_id == area_config_id,
+            ImageTile.needs_comparison.is_(True),
+            ImageTile.unique_key.in_(unique_keys),
+            ImageTile.id.notin_(latest_tile_ids)
+        ).update({'needs_comparison': False}, synchronize_session=False)
+
+    @staticmethod
+    def dirty_unique_keys(area_config_id):
+        """unique_keys with a capture that has not been compared yet (served by idx_area_needs_comparison)."""
+        return [row[0] for row in db.session.query(ImageTile.unique_key).filter(
+            ImageTile.area_config_id == area_config_id,
+            ImageTile.needs_comparison.is_(True)).distinct()]
+
+    @staticmethod
+    def start_alert_session(area_config_id, commit=True):
+        """With commit=False the session is only flushed, and commits or rolls back with the caller's results."""
         # --- Alert Session Management ---
         alert_session = AlertSession(
             area_config_id=area_config_id,
@@ -65,65 +341,101 @@ class ImageComparisonService:
             start_time=datetime.utcnow()
         )
         db.session.add(alert_session)
-        db.session.commit()  # Commit to get alert_session.id
+        if commit:
+            db.session.commit()  # Commit to get alert_session.id
+        else:
+            db.session.flush()  # Flush to get alert_session.id
+        return alert_session
+
+    @staticmethod
+    def finalize_alert_session(alert_session, total_changes_in_session, session_status, app_config):
+        # --- Finalize Alert Session ---
+        alert_session.end_time = datetime.utcnow()
+        alert_session.total_changes_detected = total_changes_in_session
+        alert_session.status = session_status
+        db.session.add(alert_session)  # Add back to session in case of rollback above
+        db.session.commit()
+
+        # --- Queue the alert notification; the outbox dispatcher sends it ---
+        try:
+            NotificationOutboxService.enqueue(alert_session, app_config)
+        except Exception as e:
+            db.session.rollback()
+            print(f"Error queueing notification for AlertSession {alert_session.id}: {e}")
+
+    @staticmethod
+    # Accept app_config as an argument
+    def run_comparison_for_area(area_config_id, app_config):
+        print(f"Starting image comparison for AreaConfig ID: {area_config_id}")
+
+        # Only keys with a capture that arrived since their last comparison are processed. The
+        # needs_comparison column is authoritative (rows may be written outside this process);
+        # the in-memory index adds keys it already knows about, and keys it still holds as dirty
+        # after another process compared them are only cleared from it
+        tile_state = TileStateIndex.for_area_id(area_config_id)
+        area_config = db.session.get(AreaConfig, area_config_id)
+        if area_config is not None:
+            app_config = ImageComparisonService.area_comparison_config(area_config, app_config)
+        dirty_keys = set(ImageComparisonService.dirty_unique_keys(area_config_id))
+        if tile_state is not None:
+            dirty_keys.update(tile_state.dirty_keys())
+        dirty_keys = sorted(dirty_keys)
+        if not dirty_keys:
+            print(f"No new captures to compare for AreaConfig ID: {area_config_id}")
+            return
+
+        alert_session = ImageComparisonService.start_alert_session(area_config_id)
 
         total_changes_in_session = 0
         session_status = 'COMPLETED_NO_CHANGES'  # Default status
 
         try:
-            tiles = db.session.query(ImageTile).filter_by(area_config_id=area_config_id).order_by(
-                ImageTile.capture_time.desc()).all()
-
-            tiles_by_unique_key = {}
-            for tile in tiles:
-                if tile.unique_key not in tiles_by_unique_key:
-                    tiles_by_unique_key[tile.unique_key] = []
-                tiles_by_unique_key[tile.unique_key].append(tile)
+            # Only the two newest captures per dirty unique_key are loaded, not the area's whole history
+            tiles_by_unique_key = TileQueryService.latest_captures_by_key(area_config_id, depth=2,
+                                                                          unique_keys=dirty_keys)
+            ImageComparisonService.clear_superseded_dirty_flags(
+                area_config_id, dirty_keys, [tile_list[0].id for tile_list in tiles_by_unique_key.values()])
 
+            tile_pairs = []  # (latest_tile, previous_tile)
+            pair_keys = []  # unique_key of each pair, readable after the commit expires the tiles
+            stale_keys = []  # Dirty only in the index: the latest capture was already compared
             for unique_key, tile_list in tiles_by_unique_key.items():
-                if len(tile_list) >= 2:
-                    latest_tile = tile_list[0]  # Most recent capture
-                    previous_tile = tile_list[1]  # Second most recent capture
-
-                    print(
-                        f"Comparing uniqueKey: {unique_key}, Latest: {latest_tile.image_path}, Previous: {previous_tile.image_path}")
-
-                    # Pass app_config to compare_images
-                    comparison_result = ImageComparisonService.compare_images(previous_tile.image_path,
-                                                                              latest_tile.image_path, app_config)
-
-                    latest_tile.last_comparison_time = datetime.utcnow()
-                    latest_tile.change_detected = comparison_result['changed']
-                    latest_tile.status = 'CHANGED' if comparison_result['changed'] else 'NO_CHANGE'
-
-                    db.session.add(latest_tile)  # Update the existing latest_tile object
-
-                    if comparison_result['changed']:
-                        total_changes_in_session += 1
-                        session_status = 'COMPLETED_CHANGES_DETECTED'
-                        print(
-                            f"ALERT: Change detected for tile {unique_key} (Area: {area_config_id})! Change: {comparison_result['change_percent']}%")
-
-                        # --- Log Alert Detail ---
-                        alert_detail = AlertDetail(
-                            alert_session_id=alert_session.id,
-                            image_tile_id=latest_tile.id,
-                            previous_image_path=previous_tile.image_path,
-                            current_image_path=latest_tile.image_path,
-                            change_log=json.dumps(comparison_result),  # Store as JSON string
-                            alert_time=datetime.utcnow()
-                        )
-                        db.session.add(alert_detail)
-                        # --- End Log Alert Detail ---
-
+                if not tile_list[0].needs_comparison:
+                    stale_keys.append(unique_key)
+                elif len(tile_list) >= 2:
+                    tile_pairs.append((tile_list[0], tile_list[1]))  # Most recent, second most recent
+                    pair_keys.append(unique_key)
                 elif len(tile_list) == 1:
                     print(f"Only one image found for unique key {unique_key}. Cannot perform comparison.")
                     tile_list[0].status = 'CAPTURED'  # Or INITIAL
+                    tile_list[0].needs_comparison = False  # Becomes dirty again with its next capture
                     db.session.add(tile_list[0])
-                else:
-                    print(f"No images found for unique key {unique_key}.")
 
-                db.session.commit()  # Commit after each tile update/alert detail log for atomicity
+            comparison_results = ImageComparisonService.compare_tile_pairs(tile_pairs, app_config, area_config_id)
+
+            db_batch_size = int(app_config.get('COMPARISON_DB_BATCH_SIZE', 200))
+            for index, ((latest_tile, previous_tile), comparison_result) in enumerate(
+                    zip(tile_pairs, comparison_results), start=1):
+                if ImageComparisonService.apply_comparison_result(alert_session, latest_tile, previous_tile,
+                                                                  comparison_result):
+                    total_changes_in_session += 1
+                    session_status = 'COMPLETED_CHANGES_DETECTED'
+                if index % db_batch_size == 0:
+                    db.session.flush()  # Apply tile updates and alert details in batches
+            with Metrics.stage('db_commit', area_config_id):
+                db.session.commit()  # Flushing instead of committing per batch keeps the loaded tiles from expiring
+            if tile_state:
+                tile_state.clear_dirty(dirty_keys)  # Including keys with no captures left to compare
+                TileStateIndex.refresh_keys(area_config, stale_keys)  # The other process's results
+                comparison_by_key = dict(zip(pair_keys, comparison_results))
+                for unique_key in set(tiles_by_unique_key) - set(stale_keys):
+                    comparison_result = comparison_by_key.get(unique_key)
+                    if comparison_result is None:  # Single capture, marked as compared above
+                        tile_state.record_comparison(unique_key, False)
+                    else:
+                        tile_state.record_comparison(unique_key, comparison_result['changed'],
+                                                     needs_comparison=bool(comparison_result.get('error')))
+            print(f"Decoded image cache stats for AreaConfig ID {area_config_id}: {ComparisonExecutor.cache_stats()}")
 
         except Exception as e:
             session_status = 'COMPLETED_ERROR'
@@ -131,31 +443,7 @@ class ImageComparisonService:
             db.session.rollback()  # Rollback any pending changes on error
 
         finally:
-            # --- Finalize Alert Session ---
-            alert_session.end_time = datetime.utcnow()
-            alert_session.total_changes_detected = total_changes_in_session
-            alert_session.status = session_status
-            db.session.add(alert_session)  # Add back to session in case of rollback above
-            db.session.commit()
-
-            # --- Trigger Firebase Notification ---
-            FirebaseService.initialize_firebase()  # Ensure Firebase is initialized
-            if total_changes_in_session > 0:
-                title = f"Land Change Alert for {area_config_id}"
-                body = f"Detected {total_changes_in_session} changes in area {area_config_id}."
-                data_payload = {
-                    "area_config_id": str(area_config_id),
-                    "alert_session_id": str(alert_session.id),
-                    "changes_count": str(total_changes_in_session)
-                }
-                # app_config contains FCM_DEFAULT_DEVICE_TOKEN
-                fcm_token = app_config.get('FCM_DEFAULT_DEVICE_TOKEN')
-                if fcm_token:
-                    FirebaseService.send_notification(title, body, device_token=fcm_token, data_payload=data_payload)
-                else:
-                    print("Warning: FCM_DEFAULT_DEVICE_TOKEN not set in config, notification not sent.")
-            else:
-                print(f"No changes detected for area {area_config_id}. No notification sent.")
+            ImageComparisonService.finalize_alert_session(alert_session, total_changes_in_session, session_status,
+                                                          app_config)
 
         print(f"Finished image comparison for AreaConfig ID: {area_config_id}")
-
@@ -0,0 +1,114 @@
+import time
+
+from sqlalchemy import case
+
+from extensions import db  # Import db from extensions
+from entities.models import ImageTile
+from utils.metrics import Metrics
+
+
+class ImageTileWriter:
+    """
+    Collects ImageTile rows for one area and writes them with bulk inserts.
+
+    Rows are flushed to the database when the batch reaches CAPTURE_DB_BATCH_SIZE or when
+    CAPTURE_DB_FLUSH_SECONDS have passed since the last flush. Each batch runs inside a
+    SAVEPOINT; if the bulk insert fails the batch is retried row by row so one bad row only
+    costs itself. Nothing is committed until commit() is called, which gives every area a
+    single commit boundary: either all of its captured tiles become visible or none do.
+    Captures whose content matches the key's latest row are not inserted; touch() records
+    them and they are applied as one bulk last_seen_time update per flush. The unique_keys of
+    rows the fallback could not insert are kept in failed_keys.
+    """
+
+    def __init__(self, app_config, area_config_id=''):
+        self.area_config_id = area_config_id  # Metrics label only
+        self.batch_size = int(app_config.get('CAPTURE_DB_BATCH_SIZE', 200))
+        self.flush_seconds = float(app_config.get('CAPTURE_DB_FLUSH_SECONDS', 5.0))
+        self._pending = []
+        self._touched = {}  # tile id -> last_seen_time
+        self._last_flush = time.monotonic()
+        self.rows_written = 0
+        self.rows_failed = 0
+        self.batches_flushed = 0
+        self.fallback_batches = 0
+        self.rows_touched = 0
+        self.failed_keys = set()
+
+    def add(self, area_config_id, unique_key, lat, lon, capture_time, image_path, content_hash=None, status='CAPTURED'):
+        self._pending.append({
+            'area_config_id': area_config_id,
+            'unique_key': unique_key,
+            'latitude': lat,
+            'longitude': lon,
+            'capture_time': capture_time,
+            'image_path': image_path,
+            'content_hash': content_hash,
+            'last_seen_time': capture_time,
+            'needs_comparison': True,
+            'status': status,
+        })
+        self._maybe_flush()
+
+    def touch(self, tile_id, seen_time):
+        self._touched[tile_id] = seen_time
+        self._maybe_flush()
+
+    def _maybe_flush(self):
+        pending = len(self._pending) + len(self._touched)
+        if pending >= self.batch_size or time.monotonic() - self._last_flush >= self.flush_seconds:
+            self.flush()
+
+    def flush(self):
+        rows, self._pending = self._pending, []
+        touched, self._touched = self._touched, {}
+        self._last_flush = time.monotonic()
+        if touched:
+            self._apply_touches(touched)
+        if not rows:
+            return
+        try:
+            with Metrics.stage('db_flush', self.area_config_id), db.session.begin_nested():
+                db.session.bulk_insert_mappings(ImageTile, rows)
+            self.rows_written += len(rows)
+            self.batches_flushed += 1
+        except Exception as e:
+            print(f"Bulk insert of {len(rows)} image tiles failed, falling back to per-row inserts: {e}")
+            self.fallback_batches += 1
+            self._insert_rows_individually(rows)
+
+    def _apply_touches(self, touched):
+        # One UPDATE per flush, each row getting its own seen time through CASE id WHEN ... THEN ...
+        db.session.query(ImageTile).filter(ImageTile.id.in_(list(touched))).update(
+            {'last_seen_time': case(touched, value=ImageTile.id)}, synchronize_session=False)
+        self.rows_touched += len(touched)
+
+    def _insert_rows_individually(self, rows):
+        for row in rows:
+            try:
+                with db.session.begin_nested():
+                    db.session.add(ImageTile(**row))
+                self.rows_written += 1
+            except Exception as e:
+                print(f"Error saving image tile {row['unique_key']}: {e}")
+                self.rows_failed += 1
+                self.failed_keys.add(row['unique_key'])
+
+    def commit(self):
+        """Flushes any pending rows and commits the area's transaction."""
+        try:
+            self.flush()
+            with Metrics.stage('db_commit', self.area_config_id):
+                db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+
+    def stats(self):
+        return {
+            'rowsWritten': self.rows_written,
+            'rowsFailed': self.rows_failed,
+            'rowsTouched': self.rows_touched,
+            'batchesFlushed': self.batches_flushed,
+            'fallbackBatches': self.fallback_batches,
+        }
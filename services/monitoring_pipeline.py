@@ -0,0 +1,244 @@
+import time
+from datetime import datetime
+from concurrent.futures import wait, FIRST_COMPLETED
+
+from sqlalchemy import inspect
+
+from extensions import db  # Import db from extensions
+from entities.models import AlertSession, ImageTile
+from services.image_capture_service import ImageCaptureService
+from services.image_comparison_service import ImageComparisonService
+from services.batch_comparison_engine import BatchComparisonEngine
+from services.comparison_executor import ComparisonExecutor
+from services.image_tile_writer import ImageTileWriter
+from services.tile_download_service import TileDownloadService
+from services.tile_query_service import TileQueryService
+from services.tile_response_cache import TileResponseCache
+from services.tile_state_index import TileStateIndex
+from utils.metrics import Metrics, COMPARISONS, PIPELINE_RUN_SECONDS
+
+
+class MonitoringPipeline:
+    """
+    Capture and comparison for one area as a streaming pipeline.
+
+    download (thread pool) -> DB writer (this thread) -> compare (process pool) -> apply
+
+    Each tile is handed to the comparison pool as soon as its download finishes, with the
+    previous capture taken from the in-memory TileStateIndex, so the area's history is
+    never read from the database. Bounded windows between the stages
+    provide backpressure: the downloader keeps at most a few batches in flight, and when
+    PIPELINE_MAX_PENDING_COMPARISONS comparisons are outstanding the pipeline stops
+    consuming downloads until one finishes. Once the captures are committed, keys still
+    waiting for a comparison from earlier runs (e.g. after a failed comparison) are compared
+    too. With COMPARISON_ENGINE = 'batch' pairs are instead collected and compared in-process
+    by the BatchComparisonEngine, COMPARISON_BATCH_SIZE at a time, as the downloads arrive.
+    The AlertSession is only created when the first change is found; runs without
+    changes, and runs that fail first, still record one when they finish.
+    Stage timings of the last run per area are kept in last_run_timings, with the run's
+    hot-stage trace (see utils.metrics) under 'stages'.
+    """
+
+    last_run_timings = {}  # area_config_id -> timings dict of the most recent run
+
+    @staticmethod
+    def run_for_area(area_config, app_config):
+        print(f"Starting monitoring pipeline for AreaConfig ID: {area_config.id}, Name: {area_config.name}")
+        run_started = time.monotonic()
+        Metrics.start_trace(area_config.id)
+        timings = {'downloadWaitSeconds': 0.0, 'dbWriteSeconds': 0.0, 'compareWaitSeconds': 0.0,
+                   'applySeconds': 0.0}
+
+        stage_started = time.monotonic()
+        jobs = ImageCaptureService.plan_tile_jobs(area_config, app_config)
+        # Each key's latest capture comes from the in-memory index: (id, content_hash, image_path)
+        tile_state = TileStateIndex.for_area(area_config)
+        timings['planSeconds'] = round(time.monotonic() - stage_started, 3)
+
+        alert_session = None  # Created with the first detected change, or when the run finishes
+        session_started = datetime.utcnow()
+        total_changes_in_session = 0
+        session_status = 'COMPLETED_NO_CHANGES'  # Default status
+
+        comparison_config = ImageComparisonService.area_comparison_config(area_config, app_config)
+        max_pending_comparisons = int(app_config.get('PIPELINE_MAX_PENDING_COMPARISONS', 64))
+        pending_comparisons = {}  # future -> unique_key
+        comparison_results = {}  # unique_key -> result
+        captured_keys = []  # Keys with a new capture row this run
+        comparisons_reused = 0  # Pairs another run (e.g. an overlapping area) already compared
+        seen_keys = {}  # unique_key -> seen time, for re-captures identical to the latest row
+        use_batch_engine = app_config.get('COMPARISON_ENGINE', 'pairwise') == 'batch'
+        batch_size = max(1, int(app_config.get('COMPARISON_BATCH_SIZE', 256)))
+        batch_pairs = []  # (unique_key, (previous_path, latest_path)) waiting for the batch engine
+
+        def collect(futures):
+            for future in futures:
+                comparison_results[pending_comparisons.pop(future)] = ComparisonExecutor.result_of(future)
+
+        def compare_batch():
+            if not batch_pairs:
+                return
+            with Metrics.collect_stages() as stages:
+                results = BatchComparisonEngine.compare_pairs([pair for _, pair in batch_pairs], comparison_config)
+            Metrics.record_stages(stages, area_config.id)
+            comparison_results.update(zip([unique_key for unique_key, _ in batch_pairs], results))
+            batch_pairs.clear()
+
+        def submit(unique_key, pair):
+            nonlocal comparisons_reused
+            if use_batch_engine:
+                batch_pairs.append((unique_key, pair))
+                if len(batch_pairs) >= batch_size:
+                    compare_batch()
+                return
+            if len(pending_comparisons) >= max_pending_comparisons:
+                done, _ = wait(list(pending_comparisons), return_when=FIRST_COMPLETED)
+                collect(done)
+            future = ComparisonExecutor.submit_pair(pair, comparison_config, area_config.id)
+            pending_comparisons[future] = unique_key
+            comparisons_reused += future.reused
+
+        downloader = TileDownloadService(app_config, response_cache=TileResponseCache.instance(app_config),
+                                         min_refetch_seconds=ImageCaptureService.min_refetch_seconds(area_config,
+                                                                                                     app_config))
+        writer = ImageTileWriter(app_config, area_config.id)
+        try:
+            downloads = downloader.iter_downloads(jobs)
+            while True:
+                stage_started = time.monotonic()
+                result = next(downloads, None)
+                timings['downloadWaitSeconds'] += time.monotonic() - stage_started
+                if result is None:
+                    break
+                if not result['ok']:
+                    print(f"Error downloading image for unique key {result['unique_key']}: {result['error']}")
+                    continue
+
+                unique_key = result['unique_key']
+                previous_id, previous_hash, previous_path = tile_state.latest(unique_key) or (None, None, None)
+
+                stage_started = time.monotonic()
+                if previous_id is not None and previous_hash == result['content_hash']:
+                    writer.touch(previous_id, result['capture_time'])  # Unchanged, nothing to compare
+                    COMPARISONS.inc(area=area_config.id, tier='content_hash')
+                    seen_keys[unique_key] = result['capture_time']
+                    timings['dbWriteSeconds'] += time.monotonic() - stage_started
+                    continue
+                writer.add(area_config.id, unique_key, result['lat'], result['lon'],
+                           result['capture_time'], result['file_path'], result['content_hash'])
+                captured_keys.append(unique_key)
+                timings['dbWriteSeconds'] += time.monotonic() - stage_started
+
+                if previous_id is None:
+                    continue  # First capture of this key, nothing to compare against yet
+
+                stage_started = time.monotonic()
+                submit(unique_key, (previous_path, result['file_path']))
+                timings['compareWaitSeconds'] += time.monotonic() - stage_started
+
+            stage_started = time.monotonic()
+            writer.commit()  # One commit per area for the captured rows
+            TileStateIndex.refresh_keys(area_config, captured_keys)
+            for unique_key, seen_time in seen_keys.items():
+                tile_state.record_seen(unique_key, seen_time)
+            timings['dbWriteSeconds'] += time.monotonic() - stage_started
+
+            # --- Keys left dirty by earlier runs, whose capture this run didn't replace ---
+            stage_started = time.monotonic()
+            submitted_keys = set(pending_comparisons.values()) | set(comparison_results) | {
+                unique_key for unique_key, _ in batch_pairs}
+            retry_keys = (set(tile_state.dirty_keys()) |
+                          set(ImageComparisonService.dirty_unique_keys(area_config.id))) - submitted_keys
+            if retry_keys:
+                first_captures = {}  # unique_key -> tile id
+                retry_tiles = TileQueryService.latest_captures_by_key(area_config.id, depth=2,
+                                                                      unique_keys=list(retry_keys))
+                # Dirty only in the index (compared by another process, or no captures left): reload them
+                stale_keys = [unique_key for unique_key in retry_keys
+                              if unique_key not in retry_tiles or not retry_tiles[unique_key][0].needs_comparison]
+                tile_state.clear_dirty(stale_keys)
+                TileStateIndex.refresh_keys(area_config, stale_keys)
+                for unique_key, tile_list in retry_tiles.items():
+                    if not tile_list[0].needs_comparison:
+                        continue
+                    if len(tile_list) < 2:
+                        first_captures[unique_key] = tile_list[0].id
+                        continue
+                    submit(unique_key, (tile_list[1].image_path, tile_list[0].image_path))
+                if first_captures:
+                    # Nothing to compare against; the key becomes dirty again with its next capture
+                    db.session.query(ImageTile).filter(ImageTile.id.in_(list(first_captures.values()))).update(
+                        {'needs_comparison': False}, synchronize_session=False)
+                    db.session.commit()
+                    for unique_key in first_captures:
+                        tile_state.record_comparison(unique_key, False)
+
+            compare_batch()
+            collect(list(pending_comparisons))
+            # A row the writer's fallback dropped leaves the key's previous capture as its latest
+            for unique_key in writer.failed_keys:
+                comparison_results.pop(unique_key, None)
+            timings['compareWaitSeconds'] += time.monotonic() - stage_started
+
+            # --- Apply results: only the keys that were compared are loaded ---
+            stage_started = time.monotonic()
+            if comparison_results:
+                tiles_by_key = TileQueryService.latest_captures_by_key(area_config.id, depth=2,
+                                                                       unique_keys=list(comparison_results))
+                ImageComparisonService.clear_superseded_dirty_flags(
+                    area_config.id, list(tiles_by_key), [tile_list[0].id for tile_list in tiles_by_key.values()])
+                db_batch_size = int(app_config.get('COMPARISON_DB_BATCH_SIZE', 200))
+                for index, (unique_key, comparison_result) in enumerate(comparison_results.items(), start=1):
+                    tile_list = tiles_by_key.get(unique_key, [])
+                    if len(tile_list) < 2:
+                        continue
+                    if comparison_result['changed'] and alert_session is None:
+                        alert_session = ImageComparisonService.start_alert_session(area_config.id, commit=False)
+                    if ImageComparisonService.apply_comparison_result(alert_session, tile_list[0], tile_list[1],
+                                                                      comparison_result):
+                        total_changes_in_session += 1
+                        session_status = 'COMPLETED_CHANGES_DETECTED'
+                    if index % db_batch_size == 0:
+                        db.session.flush()
+                with Metrics.stage('db_commit', area_config.id):
+                    db.session.commit()
+                for unique_key, tile_list in tiles_by_key.items():
+                    if len(tile_list) >= 2:
+                        comparison_result = comparison_results[unique_key]
+                        tile_state.record_comparison(unique_key, comparison_result['changed'],
+                                                     needs_comparison=bool(comparison_result.get('error')))
+            timings['applySeconds'] += time.monotonic() - stage_started
+
+        except Exception as e:
+            session_status = 'COMPLETED_ERROR'
+            print(f"Error in monitoring pipeline for AreaConfig {area_config.id}: {e}")
+            db.session.rollback()
+            for future in pending_comparisons:
+                future.cancel()
+
+        finally:
+            downloader.close()
+            if alert_session is not None and inspect(alert_session).transient:
+                alert_session = None  # Rolled back with the results it would have held
+            if alert_session is None:  # Every run is recorded, as COMPLETED_NO_CHANGES or COMPLETED_ERROR
+                alert_session = AlertSession(area_config_id=area_config.id, status='IN_PROGRESS',
+                                             start_time=session_started)
+            ImageComparisonService.finalize_alert_session(alert_session, total_changes_in_session,
+                                                          session_status, app_config)
+
+        timings = {name: round(value, 3) for name, value in timings.items()}
+        timings.update(
+            totalSeconds=round(time.monotonic() - run_started, 3),
+            tilesPlanned=len(jobs),
+            tilesCompared=len(comparison_results),
+            comparisonsReused=comparisons_reused,
+            changesDetected=total_changes_in_session,
+            download=downloader.stats.summary(),
+            dbWrites=writer.stats(),
+        )
+        PIPELINE_RUN_SECONDS.observe(timings['totalSeconds'], area=area_config.id)
+        timings['stages'] = Metrics.finish_trace(area_config.id, timings)
+        MonitoringPipeline.last_run_timings[area_config.id] = timings
+        print(f"Pipeline timings for AreaConfig ID {area_config.id}: {timings}")
+        print(f"Finished monitoring pipeline for AreaConfig ID: {area_config.id}")
+        return timings
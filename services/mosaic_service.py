@@ -0,0 +1,269 @@
+import json
+import os
+import shutil
+import threading
+from datetime import datetime
+from math import ceil, log2
+
+import cv2
+import numpy as np
+
+from services.decoded_image_cache import DecodedImageCache
+from services.image_capture_service import ImageCaptureService
+from services.image_comparison_service import ImageComparisonService
+from services.tile_state_index import TileStateIndex
+
+
+class MosaicService:
+    """
+    Multi-resolution z/x/y tile pyramids of an area's latest captures.
+
+    The deepest level (maxZoom) has one tile per grid cell from ImageCaptureService.area_tile_grid,
+    with x = column and y counted from the northern row, so y grows southwards as in web maps.
+    On the shared world grid, whose columns are cut per row, x comes from each cell's
+    longitude relative to the area's western edge. Each level above halves the
+    resolution by merging 2x2 children, up to a single tile at z = 0. Two layers are built:
+
+      imagery  the latest capture of each cell (BGRA, transparent where there is no capture;
+               merges are alpha-weighted, so missing children never darken their neighbours)
+      changes  a heatmap of the compare_images threshold mask for cells whose latest
+               comparison detected a change. Alpha is the changed-pixel density, so parent
+               tiles average it, and colour comes from a JET colormap of the same density.
+
+    Files live under IMAGE_STORAGE_DIRECTORY/mosaics/<area_id>/<layer>/<z>/<x>/<y>.png, next to
+    a manifest.json recording what each cell was built from. Builds are incremental: only
+    cells whose latest capture, previous capture or change flag moved are re-rendered, and
+    only their ancestors are re-merged.
+    """
+
+    LAYERS = ('imagery', 'changes')
+    MOSAIC_DIRECTORY_NAME = 'mosaics'
+
+    _area_locks = {}
+    _area_locks_guard = threading.Lock()
+
+    @staticmethod
+    def area_directory(area_config_id, app_config):
+        return os.path.join(app_config['IMAGE_STORAGE_DIRECTORY'], MosaicService.MOSAIC_DIRECTORY_NAME,
+                            str(area_config_id))
+
+    @staticmethod
+    def tile_path(area_config_id, layer, z, x, y, app_config):
+        return os.path.join(MosaicService.area_directory(area_config_id, app_config), layer, str(z), str(x),
+                            f"{y}.png")
+
+    @staticmethod
+    def manifest_path(area_config_id, app_config):
+        return os.path.join(MosaicService.area_directory(area_config_id, app_config), 'manifest.json')
+
+    @staticmethod
+    def load_manifest(area_config_id, app_config):
+        try:
+            with open(MosaicService.manifest_path(area_config_id, app_config)) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    @staticmethod
+    def _save_manifest(area_config_id, manifest, app_config):
+        path = MosaicService.manifest_path(area_config_id, app_config)
+        temp_path = f"{path}.tmp"
+        with open(temp_path, 'w') as f:
+            json.dump(manifest, f)
+        os.replace(temp_path, path)
+
+    @staticmethod
+    def max_zoom(rows, cols):
+        return max(0, int(ceil(log2(max(rows, cols, 1)))))
+
+    @staticmethod
+    def _area_lock(area_config_id):
+        with MosaicService._area_locks_guard:
+            return MosaicService._area_locks.setdefault(area_config_id, threading.Lock())
+
+    # --- Tile files ---
+
+    @staticmethod
+    def _write_tile(path, image):
+        """Atomic PNG write, so a tile being served is never half-written. None removes the tile."""
+        if image is None:
+            if os.path.exists(path):
+                os.remove(path)
+            return
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        ok, encoded = cv2.imencode('.png', image)
+        if not ok:
+            raise ValueError(f"Failed to encode mosaic tile {path}")
+        temp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(temp_path, 'wb') as f:
+            f.write(encoded.tobytes())
+        os.replace(temp_path, path)
+
+    @staticmethod
+    def _read_tile(path):
+        if not os.path.exists(path):
+            return None
+        return cv2.imread(path, cv2.IMREAD_UNCHANGED)
+
+    @staticmethod
+    def _colorize(density):
+        """BGRA heatmap from a 0-255 density map; fully transparent where nothing changed."""
+        heatmap = cv2.cvtColor(cv2.applyColorMap(density, cv2.COLORMAP_JET), cv2.COLOR_BGR2BGRA)
+        heatmap[:, :, 3] = density
+        return heatmap
+
+    # --- Rendering ---
+
+    @staticmethod
+    def _render_cell(cell, tile_px, app_config):
+        """
+        Returns {layer: BGRA image or None} for one grid cell (a TileStateIndex cell) at the
+        deepest level. app_config carries the area's comparison thresholds.
+        """
+        pixel_threshold = ImageComparisonService.comparison_thresholds(app_config)[0]
+        target_size = (int(app_config['Maps_IMAGE_SIZE'].split('x')[0]),
+                       int(app_config['Maps_IMAGE_SIZE'].split('x')[1]))
+        image_cache = DecodedImageCache.instance(app_config)
+
+        latest_image = image_cache.get(cell['latestPath'], target_size)
+        if latest_image is None:
+            return {'imagery': None, 'changes': None}
+        imagery = cv2.cvtColor(cv2.resize(latest_image, (tile_px, tile_px), interpolation=cv2.INTER_AREA),
+                               cv2.COLOR_BGR2BGRA)
+
+        changes = None
+        if cell['changeDetected'] and cell['previousPath']:
+            previous_image = image_cache.get(cell['previousPath'], target_size)
+            if previous_image is not None:
+                mask = ImageComparisonService.threshold_mask(previous_image, latest_image, pixel_threshold)
+                density = cv2.resize(mask, (tile_px, tile_px), interpolation=cv2.INTER_AREA)
+                if density.any():
+                    changes = MosaicService._colorize(density)
+        return {'imagery': imagery, 'changes': changes}
+
+    @staticmethod
+    def _merge_children(area_config_id, layer, z, x, y, tile_px, app_config):
+        """Builds tile (z, x, y) from its four children at z + 1. Returns None if they are all empty."""
+        canvas = np.zeros((tile_px * 2, tile_px * 2, 4), dtype=np.uint8)
+        found = False
+        for dx in (0, 1):
+            for dy in (0, 1):
+                child = MosaicService._read_tile(
+                    MosaicService.tile_path(area_config_id, layer, z + 1, x * 2 + dx, y * 2 + dy, app_config))
+                if child is None:
+                    continue
+                found = True
+                canvas[dy * tile_px:(dy + 1) * tile_px, dx * tile_px:(dx + 1) * tile_px] = child
+
+        if not found:
+            return None
+        if layer == 'changes':
+            density = cv2.resize(canvas[:, :, 3], (tile_px, tile_px), interpolation=cv2.INTER_AREA)
+            return MosaicService._colorize(density) if density.any() else None
+        # Average colour over the pixels that are present only: weight by alpha, then divide it back out
+        alpha = canvas[:, :, 3:].astype(np.float32) / 255.0
+        weighted = cv2.resize(canvas[:, :, :3].astype(np.float32) * alpha, (tile_px, tile_px),
+                              interpolation=cv2.INTER_AREA)
+        coverage = cv2.resize(alpha[:, :, 0], (tile_px, tile_px), interpolation=cv2.INTER_AREA)
+        merged = np.zeros((tile_px, tile_px, 4), dtype=np.uint8)
+        present = coverage > 0
+        merged[present, :3] = np.clip(weighted[present] / coverage[present, None] + 0.5, 0, 255).astype(np.uint8)
+        merged[:, :, 3] = np.clip(coverage * 255.0 + 0.5, 0, 255).astype(np.uint8)
+        return merged
+
+    # --- Builds ---
+
+    @staticmethod
+    def build_for_area(area_config, app_config, full=False):
+        """
+        Brings the area's pyramid up to date with its latest captures. A change of grid
+        geometry or tile size, or full=True, rebuilds from scratch. Returns build stats.
+        """
+        with MosaicService._area_lock(area_config.id):
+            return MosaicService._build(area_config, app_config, full)
+
+    @staticmethod
+    def _build(area_config, app_config, full):
+        started = datetime.utcnow()
+        tile_px = int(app_config.get('MOSAIC_TILE_SIZE', 256))
+        grid = ImageCaptureService.area_tile_grid(area_config)
+        rows, cols = grid['rows'], grid['cols']
+        if 'globalCol' in grid:
+            # World-grid columns are cut at each row's own latitude, so neither globalCol nor the
+            # per-row colIndex lines up across rows; place each cell by its centre longitude
+            west = grid['bounds'][:, 1].min()
+            cell_width = float(np.median(grid['bounds'][:, 3] - grid['bounds'][:, 1]))
+            col_positions = np.floor((grid['centerLons'] - west) / cell_width).astype(np.int64)
+            cols = int(col_positions.max()) + 1
+        else:
+            col_positions = grid['colIndex']
+        max_zoom = MosaicService.max_zoom(rows, cols)
+
+        manifest = MosaicService.load_manifest(area_config.id, app_config)
+        if full or manifest is None or (manifest['rows'], manifest['cols'], manifest['tileSize']) != (
+                rows, cols, tile_px):
+            shutil.rmtree(MosaicService.area_directory(area_config.id, app_config), ignore_errors=True)
+            manifest = {'cells': {}}
+        os.makedirs(MosaicService.area_directory(area_config.id, app_config), exist_ok=True)
+
+        # unique_key -> (x, y) at max_zoom; row 0 is southernmost
+        cell_positions = {unique_key: (col, rows - 1 - row) for unique_key, row, col in zip(
+            ImageCaptureService.area_unique_keys(area_config), grid['rowIndex'].tolist(), col_positions.tolist())}
+        tile_state = TileStateIndex.for_area(area_config)
+        comparison_config = ImageComparisonService.area_comparison_config(area_config, app_config)
+
+        built_cells = manifest['cells']
+        current_cells = {}
+        dirty = set()  # (x, y) at max_zoom
+        stats = {'cellsRendered': 0, 'cellsRemoved': 0, 'parentTilesMerged': 0}
+
+        for unique_key, (x, y) in cell_positions.items():
+            cell = tile_state.cell(unique_key)
+            if not cell['latestId']:
+                continue
+            signature = [cell['latestId'], cell['previousId'], cell['changeDetected']]
+            current_cells[unique_key] = signature
+            if built_cells.get(unique_key) == signature:
+                continue
+
+            for layer, image in MosaicService._render_cell(cell, tile_px, comparison_config).items():
+                MosaicService._write_tile(MosaicService.tile_path(area_config.id, layer, max_zoom, x, y, app_config),
+                                          image)
+            dirty.add((x, y))
+            stats['cellsRendered'] += 1
+
+        for unique_key in set(built_cells) - set(current_cells):
+            if unique_key not in cell_positions:
+                continue
+            x, y = cell_positions[unique_key]
+            for layer in MosaicService.LAYERS:
+                MosaicService._write_tile(MosaicService.tile_path(area_config.id, layer, max_zoom, x, y, app_config),
+                                          None)
+            dirty.add((x, y))
+            stats['cellsRemoved'] += 1
+
+        # Re-merge only the ancestors of cells that changed, one level at a time
+        for z in range(max_zoom - 1, -1, -1):
+            dirty = {(x // 2, y // 2) for x, y in dirty}
+            for x, y in dirty:
+                for layer in MosaicService.LAYERS:
+                    MosaicService._write_tile(
+                        MosaicService.tile_path(area_config.id, layer, z, x, y, app_config),
+                        MosaicService._merge_children(area_config.id, layer, z, x, y, tile_px, app_config))
+                stats['parentTilesMerged'] += 1
+
+        MosaicService._save_manifest(area_config.id, {
+            'areaConfigId': area_config.id,
+            'rows': rows,
+            'cols': cols,
+            'tileSize': tile_px,
+            'maxZoom': max_zoom,
+            'bbox': grid['bbox'],
+            'layers': list(MosaicService.LAYERS),
+            'builtAt': datetime.utcnow().isoformat(),
+            'cells': current_cells,
+        }, app_config)
+
+        stats['buildSeconds'] = round((datetime.utcnow() - started).total_seconds(), 3)
+        print(f"Mosaic build for AreaConfig ID {area_config.id}: {stats}")
+        return stats
@@ -0,0 +1,220 @@
+import random
+from datetime import datetime, timedelta
+
+from sqlalchemy import or_
+
+from extensions import db  # Import db from extensions
+from entities.models import AlertSession, DeviceToken, NotificationOutbox
+from services.firebase_service import FirebaseService
+from utils.metrics import Metrics, NOTIFICATION_DELIVERIES
+
+
+class NotificationOutboxService:
+    """
+    Alert notifications go through the notification_outbox table instead of being sent
+    inline at the end of a monitoring run.
+
+    finalize_alert_session enqueues a row per area with changes; another session for the same
+    area within NOTIFICATION_COALESCE_SECONDS is folded into the still-unsent row. The
+    dispatcher (a scheduler job every NOTIFICATION_DISPATCH_INTERVAL_SECONDS) sends due rows to
+    every DeviceToken subscribed to the area, 500 tokens per FCM multicast. Tokens FCM reports as
+    unregistered are deleted; tokens that failed transiently are retried with exponential
+    backoff, up to NOTIFICATION_MAX_ATTEMPTS attempts.
+
+    dispatch_due takes the sender as an argument, so a local stub can stand in for Firebase.
+    """
+
+    MULTICAST_BATCH_SIZE = 500  # FCM limit per multicast
+    INVALID_TOKEN_ERRORS = {'UNREGISTERED', 'SENDER_ID_MISMATCH'}
+    RETRYABLE_ERRORS = {'UNAVAILABLE', 'INTERNAL', 'RESOURCE_EXHAUSTED', 'DEADLINE_EXCEEDED', 'UNKNOWN'}
+    CLAIM_TIMEOUT_SECONDS = 300  # A row claimed by a dispatcher that died becomes due again after this
+
+    last_dispatch_stats = {}
+
+    @staticmethod
+    def enqueue(alert_session, app_config):
+        """Queues (or coalesces) the notification for a finished alert session with changes."""
+        area_config_id = alert_session.area_config_id
+        if not alert_session.total_changes_detected:
+            print(f"No changes detected for area {area_config_id}. No notification queued.")
+            return None
+
+        now = datetime.utcnow()
+        coalesce_window = timedelta(seconds=float(app_config.get('NOTIFICATION_COALESCE_SECONDS', 60)))
+        notification = db.session.query(NotificationOutbox).filter(
+            NotificationOutbox.area_config_id == area_config_id,
+            NotificationOutbox.status == 'PENDING',
+            NotificationOutbox.attempts == 0,
+            NotificationOutbox.created_at >= now - coalesce_window
+        ).order_by(NotificationOutbox.id.desc()).first()
+
+        if notification is not None:
+            # Reassigned rather than appended so the JSON column is marked dirty
+            notification.alert_session_ids = notification.alert_session_ids + [alert_session.id]
+            notification.changes_count += alert_session.total_changes_detected
+        else:
+            notification = NotificationOutbox(
+                area_config_id=area_config_id,
+                alert_session_ids=[alert_session.id],
+                changes_count=alert_session.total_changes_detected,
+                status='PENDING',
+                attempts=0,
+                delivered_count=0,
+                next_attempt_time=now + coalesce_window,  # Held back so later sessions can join it
+                created_at=now
+            )
+            db.session.add(notification)
+        db.session.commit()
+        print(f"Queued notification {notification.id} for area {area_config_id} "
+              f"({len(notification.alert_session_ids)} session(s), {notification.changes_count} changes).")
+        return notification
+
+    @staticmethod
+    def recipients(area_config_id, app_config):
+        tokens = [row[0] for row in db.session.query(DeviceToken.token).filter(
+            or_(DeviceToken.area_config_id == area_config_id, DeviceToken.area_config_id.is_(None))
+        ).order_by(DeviceToken.id).distinct()]
+        if not tokens and app_config.get('FCM_DEFAULT_DEVICE_TOKEN'):
+            tokens = [app_config['FCM_DEFAULT_DEVICE_TOKEN']]  # Deployments without registered devices
+        return tokens
+
+    @staticmethod
+    def message_for(notification):
+        area_config_id = notification.area_config_id
+        session_ids = notification.alert_session_ids
+        title = f"Land Change Alert for {area_config_id}"
+        body = f"Detected {notification.changes_count} changes in area {area_config_id}."
+        if len(session_ids) > 1:
+            body = f"Detected {notification.changes_count} changes in area {area_config_id} " \
+                   f"across {len(session_ids)} monitoring runs."
+        data_payload = {
+            "area_config_id": str(area_config_id),
+            "alert_session_id": str(session_ids[-1]),
+            "alert_session_ids": ",".join(str(session_id) for session_id in session_ids),
+            "changes_count": str(notification.changes_count)
+        }
+        return title, body, data_payload
+
+    @staticmethod
+    def backoff_seconds(attempts, app_config):
+        base = float(app_config.get('NOTIFICATION_BACKOFF_BASE_SECONDS', 30))
+        cap = float(app_config.get('NOTIFICATION_BACKOFF_MAX_SECONDS', 1800))
+        return random.uniform(0.5, 1.0) * min(cap, base * 2 ** (attempts - 1))
+
+    @staticmethod
+    def _claim(notification, now):
+        """Marks a due row SENDING; False if another dispatcher got to it first."""
+        claimed = db.session.query(NotificationOutbox).filter(
+            NotificationOutbox.id == notification.id,
+            NotificationOutbox.status == notification.status,
+            NotificationOutbox.next_attempt_time == notification.next_attempt_time
+        ).update({'status': 'SENDING',
+                  'next_attempt_time': now + timedelta(seconds=NotificationOutboxService.CLAIM_TIMEOUT_SECONDS)},
+                 synchronize_session=False)
+        db.session.commit()
+        return claimed == 1
+
+    @staticmethod
+    def _send(notification, tokens, sender):
+        """Sends to tokens in multicast batches. Returns (delivered, invalid, retry, errors)."""
+        title, body, data_payload = NotificationOutboxService.message_for(notification)
+        delivered, invalid, retry, errors = 0, [], [], {}
+        batch_size = NotificationOutboxService.MULTICAST_BATCH_SIZE
+        for start in range(0, len(tokens), batch_size):
+            batch = tokens[start:start + batch_size]
+            try:
+                with Metrics.stage('notification_send', notification.area_config_id):
+                    results = sender(batch, title, body, data_payload)
+            except Exception as e:
+                print(f"Error sending notification {notification.id}: {e}")
+                results = [(token, False, 'UNAVAILABLE') for token in batch]
+            for token, success, error_code in results:
+                if success:
+                    delivered += 1
+                    continue
+                errors[error_code] = errors.get(error_code, 0) + 1
+                if error_code in NotificationOutboxService.INVALID_TOKEN_ERRORS:
+                    invalid.append(token)
+                elif error_code in NotificationOutboxService.RETRYABLE_ERRORS:
+                    retry.append(token)
+        area = notification.area_config_id
+        NOTIFICATION_DELIVERIES.inc(delivered, area=area, outcome='delivered')
+        NOTIFICATION_DELIVERIES.inc(len(invalid), area=area, outcome='invalid_token')
+        NOTIFICATION_DELIVERIES.inc(len(retry), area=area, outcome='retry')
+        NOTIFICATION_DELIVERIES.inc(sum(errors.values()) - len(invalid) - len(retry), area=area, outcome='failed')
+        return delivered, invalid, retry, errors
+
+    @staticmethod
+    def dispatch_one(notification, app_config, sender, now):
+        tokens = notification.retry_tokens
+        if tokens is None:
+            tokens = NotificationOutboxService.recipients(notification.area_config_id, app_config)
+        if not tokens:
+            notification.status = 'FAILED'
+            notification.last_error = 'No device tokens subscribed to this area'
+            db.session.commit()
+            return 'FAILED', 0, 0
+
+        delivered, invalid, retry, errors = NotificationOutboxService._send(notification, tokens, sender)
+        if invalid:
+            db.session.query(DeviceToken).filter(DeviceToken.token.in_(invalid)).delete(synchronize_session=False)
+
+        notification.attempts += 1
+        notification.delivered_count += delivered
+        notification.last_error = ", ".join(f"{code}: {count}" for code, count in errors.items()) or None
+        max_attempts = int(app_config.get('NOTIFICATION_MAX_ATTEMPTS', 5))
+        if retry and notification.attempts < max_attempts:
+            notification.status = 'PENDING'
+            notification.retry_tokens = retry
+            notification.next_attempt_time = now + timedelta(
+                seconds=NotificationOutboxService.backoff_seconds(notification.attempts, app_config))
+        else:
+            # Delivered to at least one device, now or on an earlier attempt, counts as sent
+            notification.status = 'SENT' if notification.delivered_count else 'FAILED'
+            notification.retry_tokens = None
+            notification.sent_time = now if notification.status == 'SENT' else None
+            if notification.status == 'SENT':
+                db.session.query(AlertSession).filter(
+                    AlertSession.id.in_(notification.alert_session_ids)
+                ).update({'notification_sent': True}, synchronize_session=False)
+        db.session.commit()
+        return notification.status, delivered, len(invalid)
+
+    @staticmethod
+    def dispatch_due(app_config, sender=None):
+        """
+        Sends every due outbox row. `sender(tokens, title, body, data_payload)` returns
+        [(token, success, error_code)]; it defaults to FirebaseService.send_multicast.
+        """
+        if sender is None:
+            if not FirebaseService.initialize_firebase():
+                return None  # Rows stay queued until Firebase is configured
+            sender = FirebaseService.send_multicast
+
+        now = datetime.utcnow()
+        batch_size = int(app_config.get('NOTIFICATION_DISPATCH_BATCH_SIZE', 100))
+        due = db.session.query(NotificationOutbox).filter(
+            NotificationOutbox.status.in_(['PENDING', 'SENDING']),
+            NotificationOutbox.next_attempt_time <= now
+        ).order_by(NotificationOutbox.next_attempt_time).limit(batch_size).all()
+
+        stats = {'notifications': 0, 'sent': 0, 'retrying': 0, 'failed': 0, 'deliveries': 0, 'tokensPruned': 0}
+        for notification in due:
+            if not NotificationOutboxService._claim(notification, now):
+                continue
+            try:
+                status, delivered, pruned = NotificationOutboxService.dispatch_one(notification, app_config,
+                                                                                   sender, now)
+            except Exception as e:
+                db.session.rollback()
+                print(f"Error dispatching notification {notification.id}: {e}")
+                continue  # Stays SENDING and becomes due again after the claim timeout
+            stats['notifications'] += 1
+            stats['deliveries'] += delivered
+            stats['tokensPruned'] += pruned
+            stats[{'SENT': 'sent', 'PENDING': 'retrying', 'FAILED': 'failed'}[status]] += 1
+
+        if stats['notifications']:
+            print(f"Notification dispatch: {stats}")
+        NotificationOutboxService.last_dispatch_stats = dict(stats, time=now.isoformat())
+        return stats
@@ -0,0 +1,99 @@
+import math
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from extensions import bcrypt  # Import bcrypt from extensions
+
+
+class HashingBusyError(Exception):
+    """Raised when the hashing queue is full; retry_after is a suggested wait in seconds."""
+
+    def __init__(self, retry_after):
+        super().__init__(f"Password hashing queue is full, retry after {retry_after}s")
+        self.retry_after = retry_after
+
+
+class PasswordHashingService:
+    """
+    Admission control for bcrypt: at most AUTH_HASH_MAX_WORKERS hashes run at once, on a small
+    dedicated thread pool, and AUTH_HASH_MAX_QUEUE more may wait for it.
+
+    The request thread still blocks while its hash waits and runs; what the pool bounds is how
+    many hashes compete for the CPU at once. Beyond that capacity HashingBusyError is raised
+    straight away, so a login storm is turned away with 429s instead of tying up every worker
+    thread behind a growing queue. The cost factor is BCRYPT_LOG_ROUNDS; hashes made with
+    another cost are replaced on the next successful login.
+    """
+
+    _pool = None
+    _pool_workers = None
+    _lock = threading.Lock()
+    _in_flight = 0
+    _average_seconds = 0.25  # Running average of one hash, for Retry-After
+    _completed = 0
+    _rejected = 0
+
+    @classmethod
+    def _get_pool(cls, max_workers):
+        # Called with _lock held
+        if cls._pool is None or cls._pool_workers != max_workers:
+            if cls._pool is not None:
+                cls._pool.shutdown(wait=False)
+            cls._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='bcrypt')
+            cls._pool_workers = max_workers
+        return cls._pool
+
+    @staticmethod
+    def log_rounds(app_config):
+        return int(app_config.get('BCRYPT_LOG_ROUNDS', 12))
+
+    @classmethod
+    def _run(cls, function, app_config, *args):
+        max_workers = max(1, int(app_config.get('AUTH_HASH_MAX_WORKERS', 2)))
+        capacity = max_workers + int(app_config.get('AUTH_HASH_MAX_QUEUE', 32))
+        with cls._lock:
+            if cls._in_flight >= capacity:
+                cls._rejected += 1
+                # Time for the work already admitted to drain through the pool
+                raise HashingBusyError(max(1, math.ceil(cls._in_flight * cls._average_seconds / max_workers)))
+            cls._in_flight += 1
+            pool = cls._get_pool(max_workers)
+
+        def timed():
+            started = time.monotonic()
+            result = function(*args)
+            elapsed = time.monotonic() - started
+            with cls._lock:
+                cls._average_seconds = 0.9 * cls._average_seconds + 0.1 * elapsed
+                cls._completed += 1
+            return result
+
+        try:
+            return pool.submit(timed).result()  # Blocks this thread through the queue wait and the hash
+        finally:
+            with cls._lock:
+                cls._in_flight -= 1
+
+    @staticmethod
+    def hash_password(password, app_config):
+        rounds = PasswordHashingService.log_rounds(app_config)
+        return PasswordHashingService._run(
+            lambda: bcrypt.generate_password_hash(password, rounds).decode('utf-8'), app_config)
+
+    @staticmethod
+    def check_password(password_hash, password, app_config):
+        return PasswordHashingService._run(bcrypt.check_password_hash, app_config, password_hash, password)
+
+    @staticmethod
+    def needs_rehash(password_hash, app_config):
+        """True if the hash was made with a different cost than BCRYPT_LOG_ROUNDS ("$2b$<cost>$...")."""
+        parts = password_hash.split('$')
+        return len(parts) < 4 or not parts[2].isdigit() or \
+            int(parts[2]) != PasswordHashingService.log_rounds(app_config)
+
+    @classmethod
+    def stats(cls):
+        with cls._lock:
+            return {'inFlight': cls._in_flight, 'completed': cls._completed, 'rejected': cls._rejected,
+                    'averageHashMs': round(cls._average_seconds * 1000, 1)}
@@ -0,0 +1,342 @@
+import os
+import threading
+import time
+import zipfile
+from datetime import datetime, timedelta
+
+import cv2
+import numpy as np
+from sqlalchemy import select, or_, and_, not_
+
+from extensions import db  # Import db from extensions
+from entities.models import AreaConfig, ImageTile, AlertDetail
+from services.tile_query_service import TileQueryService
+from services.tile_storage_service import TileStorageService
+from services.tile_state_index import TileStateIndex
+
+
+class RetentionService:
+    """
+    Retention for captured tile images.
+
+    Captures older than RETENTION_KEEP_ALL_DAYS are thinned per unique_key:
+      - the latest two captures of every key are always kept (they feed comparisons);
+      - captures referenced by an AlertDetail are always kept;
+      - up to RETENTION_KEEP_DAILY_DAYS old, the first capture of each day is kept;
+      - everything else is deleted.
+
+    Kept old captures are moved out of blob storage into per-area archive chunks,
+    IMAGE_STORAGE_DIRECTORY/archives/<area_id>/<run time>.zip, written once and never
+    modified. Their rows are repointed to "<chunk>.zip#<member>"; the zip central directory
+    is the index for random access (see read_image_bytes). Images can be downsampled on the
+    way in with RETENTION_ARCHIVE_IMAGE_SIZE. A blob file is removed only once no ImageTile
+    row references it any more; AlertDetail paths that still point at it are repointed to
+    its archived copy first.
+
+    Each run handles at most RETENTION_MAX_ROWS_PER_RUN rows, oldest first, so a large
+    backlog is worked off over several runs with bounded IO. Rows an earlier run already
+    settled (archived and still inside the daily window, or archived for an alert) are
+    filtered out in SQL, and protected, alerted and archived-day lookups are made per page
+    of the walk, so a run's cost follows the unsettled rows rather than the whole history.
+    """
+
+    ARCHIVE_DIRECTORY_NAME = 'archives'
+    ARCHIVE_SEPARATOR = '.zip#'
+
+    last_run_stats = {}  # Most recent run: totals plus per-area stats
+    run_lock = threading.Lock()  # Held for the duration of a pass, scheduled or manual
+
+    @staticmethod
+    def is_archived(image_path):
+        return RetentionService.ARCHIVE_SEPARATOR in image_path
+
+    @staticmethod
+    def read_image_bytes(image_path):
+        """Image bytes for a live blob/file path or an archived "<chunk>.zip#<member>" path."""
+        if RetentionService.is_archived(image_path):
+            archive_path, member = image_path.split('#', 1)
+            with zipfile.ZipFile(archive_path) as archive:
+                return archive.read(member)
+        with open(image_path, 'rb') as f:
+            return f.read()
+
+    @staticmethod
+    def _archive_entry(image_path, target_size):
+        """Bytes to store for one image, downsampled and re-encoded if target_size is set."""
+        with open(image_path, 'rb') as f:
+            content = f.read()
+        if target_size is None:
+            return content
+        image = cv2.imdecode(np.frombuffer(content, dtype=np.uint8), cv2.IMREAD_COLOR)
+        if image is None:
+            return content
+        ok, encoded = cv2.imencode('.png', cv2.resize(image, target_size, interpolation=cv2.INTER_AREA))
+        return encoded.tobytes() if ok else content
+
+    @staticmethod
+    def _write_chunk(area_config_id, image_paths, app_config):
+        """
+        Packs the given live image files into a new archive chunk. Returns
+        ({image_path: archived_path}, bytes written). Files that can't be read are left out.
+        """
+        archive_size = app_config.get('RETENTION_ARCHIVE_IMAGE_SIZE')
+        target_size = tuple(int(part) for part in archive_size.split('x')) if archive_size else None
+
+        directory = os.path.join(app_config['IMAGE_STORAGE_DIRECTORY'], RetentionService.ARCHIVE_DIRECTORY_NAME,
+                                 str(area_config_id))
+        os.makedirs(directory, exist_ok=True)
+        archive_path = os.path.join(directory, f"{datetime.utcnow().strftime('%Y%m%dT%H%M%S%f')}.zip")
+        temp_path = f"{archive_path}.tmp"
+
+        archived = {}
+        with zipfile.ZipFile(temp_path, 'w', compression=zipfile.ZIP_STORED) as archive:  # PNGs are already compressed
+            for image_path in image_paths:
+                member = os.path.basename(image_path)
+                if member in archive.NameToInfo:
+                    member = f"{len(archived)}_{member}"  # Legacy file names can repeat across directories
+                try:
+                    archive.writestr(member, RetentionService._archive_entry(image_path, target_size))
+                except OSError as e:
+                    print(f"Could not archive {image_path}: {e}")
+                    continue
+                archived[image_path] = f"{archive_path}#{member}"
+
+        if not archived:
+            os.remove(temp_path)
+            return {}, 0
+        os.replace(temp_path, archive_path)  # Readers only ever see complete chunks
+        return archived, os.path.getsize(archive_path)
+
+    @staticmethod
+    def _archived_clause():
+        return ImageTile.image_path.contains(RetentionService.ARCHIVE_SEPARATOR)
+
+    @staticmethod
+    def _old_pages(area_config_id, before, keep_daily_before, page_size=500):
+        """
+        Unsettled rows captured before `before`, oldest first, in keyset pages. Archived rows
+        stay settled until they leave the daily window, or for good if an alert shows them.
+        """
+        archived = RetentionService._archived_clause()
+        settled = archived
+        if keep_daily_before is not None:
+            settled = and_(archived, or_(ImageTile.capture_time >= keep_daily_before,
+                                         ImageTile.id.in_(select(AlertDetail.image_tile_id))))
+        after = None
+        while True:
+            query = db.session.query(ImageTile.id, ImageTile.unique_key, ImageTile.capture_time,
+                                     ImageTile.image_path, ImageTile.content_hash).filter(
+                ImageTile.area_config_id == area_config_id, ImageTile.capture_time < before, not_(settled))
+            if after is not None:
+                query = query.filter(or_(ImageTile.capture_time > after[0],
+                                         and_(ImageTile.capture_time == after[0], ImageTile.id > after[1])))
+            page = query.order_by(ImageTile.capture_time, ImageTile.id).limit(page_size).all()
+            if page:
+                yield page
+            if len(page) < page_size:
+                return
+            after = (page[-1].capture_time, page[-1].id)
+
+    @staticmethod
+    def _archived_days(area_config_id, unique_keys, start, end):
+        """(unique_key, date) of days between start and end whose kept capture an earlier run archived."""
+        day_start = datetime.combine(start.date(), datetime.min.time())
+        return {(unique_key, capture_time.date()) for unique_key, capture_time in db.session.query(
+            ImageTile.unique_key, ImageTile.capture_time).filter(
+            ImageTile.area_config_id == area_config_id, RetentionService._archived_clause(),
+            ImageTile.unique_key.in_(unique_keys),
+            ImageTile.capture_time >= day_start, ImageTile.capture_time <= end)}
+
+    @staticmethod
+    def _existing_archive_paths(area_config_id, content_hashes):
+        """content_hash -> archived path for images of this area that already have an archived copy."""
+        existing = {}
+        content_hashes = list(content_hashes)
+        for start in range(0, len(content_hashes), 500):
+            for content_hash, image_path in db.session.query(ImageTile.content_hash, ImageTile.image_path).filter(
+                    ImageTile.area_config_id == area_config_id,
+                    ImageTile.content_hash.in_(content_hashes[start:start + 500]),
+                    ImageTile.image_path.contains(RetentionService.ARCHIVE_SEPARATOR)):
+                existing[content_hash] = image_path
+        return existing
+
+    @staticmethod
+    def _plan(area_config_id, app_config, row_limit, now):
+        """Chooses (rows_to_archive, rows_to_delete), oldest first, up to row_limit rows in total."""
+        keep_all_before = now - timedelta(days=float(app_config.get('RETENTION_KEEP_ALL_DAYS', 7)))
+        keep_daily_days = app_config.get('RETENTION_KEEP_DAILY_DAYS')
+        keep_daily_before = now - timedelta(days=float(keep_daily_days)) if keep_daily_days is not None else None
+
+        to_archive, to_delete = [], []
+        protected_ids = set()  # Latest two captures of every key seen so far
+        checked_keys = set()
+        kept_days = set()  # (unique_key, date) that already have their daily capture
+        for page in RetentionService._old_pages(area_config_id, keep_all_before, keep_daily_before):
+            page_keys = {row.unique_key for row in page}
+            new_keys = list(page_keys - checked_keys)
+            if new_keys:
+                protected_ids.update(TileQueryService.latest_capture_ids(area_config_id, depth=2,
+                                                                         unique_keys=new_keys))
+                checked_keys.update(new_keys)
+            alerted_ids = {row[0] for row in db.session.query(AlertDetail.image_tile_id).filter(
+                AlertDetail.image_tile_id.in_([row.id for row in page]))}
+            kept_days.update(RetentionService._archived_days(area_config_id, list(page_keys),
+                                                             page[0].capture_time, page[-1].capture_time))
+
+            for row in page:
+                day = (row.unique_key, row.capture_time.date())
+                first_of_day = day not in kept_days
+                kept_days.add(day)
+                if row.id in protected_ids:
+                    continue
+                in_daily_window = keep_daily_before is None or row.capture_time >= keep_daily_before
+                if row.id in alerted_ids or (first_of_day and in_daily_window):
+                    if not RetentionService.is_archived(row.image_path):
+                        to_archive.append(row)
+                else:
+                    to_delete.append(row)
+                if len(to_archive) + len(to_delete) >= row_limit:
+                    return to_archive, to_delete
+        return to_archive, to_delete
+
+    @staticmethod
+    def run_for_area(area_config_id, app_config, row_limit, now=None):
+        now = now or datetime.utcnow()
+        stats = {'rowsArchived': 0, 'rowsDeleted': 0, 'filesArchived': 0, 'filesDeleted': 0,
+                 'archiveBytesWritten': 0, 'bytesReclaimed': 0}
+        to_archive, to_delete = RetentionService._plan(area_config_id, app_config, row_limit, now)
+        if not to_archive and not to_delete:
+            return stats
+
+        live_paths = {row.image_path for row in to_archive} | {
+            row.image_path for row in to_delete if not RetentionService.is_archived(row.image_path)}
+        alert_paths = set()
+        path_list = list(live_paths)
+        for start in range(0, len(path_list), 500):
+            chunk = path_list[start:start + 500]
+            for previous_path, current_path in db.session.query(
+                    AlertDetail.previous_image_path, AlertDetail.current_image_path).filter(
+                    or_(AlertDetail.previous_image_path.in_(chunk), AlertDetail.current_image_path.in_(chunk))):
+                alert_paths.update((previous_path, current_path))
+
+        # --- Archive: kept rows' images and any image an alert still shows ---
+        # Content that an earlier run already archived is reused instead of being packed again
+        hash_by_path = {row.image_path: row.content_hash for row in to_archive + to_delete if row.content_hash}
+        existing = RetentionService._existing_archive_paths(area_config_id, set(hash_by_path.values()))
+        archived = {path: existing[hash_by_path[path]] for path in live_paths
+                    if hash_by_path.get(path) in existing}
+        archive_paths = sorted(({row.image_path for row in to_archive} | (live_paths & alert_paths)) - set(archived))
+        new_archived, stats['archiveBytesWritten'] = RetentionService._write_chunk(area_config_id, archive_paths,
+                                                                                   app_config)
+        archived.update(new_archived)
+        stats['filesArchived'] = len(new_archived)
+
+        try:
+            updates = [{'id': row.id, 'image_path': archived[row.image_path]}
+                       for row in to_archive if row.image_path in archived]
+            db.session.bulk_update_mappings(ImageTile, updates)
+            stats['rowsArchived'] = len(updates)
+
+            delete_ids = [row.id for row in to_delete]
+            for start in range(0, len(delete_ids), 500):
+                db.session.query(ImageTile).filter(ImageTile.id.in_(delete_ids[start:start + 500])).delete(
+                    synchronize_session=False)
+            stats['rowsDeleted'] = len(delete_ids)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            # Nothing committed points into the new chunk, so it would only be an orphan
+            for chunk_path in {path.split('#', 1)[0] for path in new_archived.values()}:
+                TileStorageService._remove_file(chunk_path)
+            raise
+        TileStateIndex.invalidate(area_config_id)  # Archived paths and deleted rows aren't in the index yet
+
+        # --- Reclaim blobs nothing points at any more (blobs can be shared across areas) ---
+        still_referenced = set()
+        for start in range(0, len(path_list), 500):
+            still_referenced.update(row[0] for row in db.session.query(ImageTile.image_path).filter(
+                ImageTile.image_path.in_(path_list[start:start + 500])).distinct())
+        orphaned = [path for path in path_list if path not in still_referenced]
+        removable = []
+        for path in orphaned:
+            if path in alert_paths:
+                if path not in archived:
+                    continue  # Couldn't archive it, so the alert keeps the live file
+                db.session.query(AlertDetail).filter(AlertDetail.previous_image_path == path).update(
+                    {'previous_image_path': archived[path]}, synchronize_session=False)
+                db.session.query(AlertDetail).filter(AlertDetail.current_image_path == path).update(
+                    {'current_image_path': archived[path]}, synchronize_session=False)
+            removable.append(path)
+        db.session.commit()
+
+        # Content that is some key's latest capture can be pointed at again by the next capture
+        removable_hashes = list({hash_by_path[path] for path in removable if path in hash_by_path})
+        latest_hashes = set()
+        for start in range(0, len(removable_hashes), 500):
+            latest_hashes |= TileQueryService.latest_capture_hashes(removable_hashes[start:start + 500])
+        removable = [path for path in removable if hash_by_path.get(path) not in latest_hashes]
+
+        # Only delete once nothing committed points at the files. A capture reusing a blob
+        # records the reuse under blob_lock before its row commits, so blobs written or reused
+        # within the grace period are left for a later run, and references are checked again
+        # under the lock in case a row committed since the check above.
+        grace_cutoff = time.time() - float(app_config.get('RETENTION_BLOB_GRACE_SECONDS', 3600))
+        for start in range(0, len(removable), 500):
+            chunk = removable[start:start + 500]
+            with TileStorageService.blob_lock:
+                db.session.commit()  # Ends the transaction, so the check sees rows committed since
+                referenced = {row[0] for row in db.session.query(ImageTile.image_path).filter(
+                    ImageTile.image_path.in_(chunk)).distinct()}
+                for path in chunk:
+                    if (path in referenced or not os.path.exists(path)
+                            or TileStorageService.used_since(path, grace_cutoff)):
+                        continue
+                    stats['bytesReclaimed'] += TileStorageService._remove_file(path)
+                    stats['filesDeleted'] += 1
+        return stats
+
+    @staticmethod
+    def run(app_config, now=None):
+        """One retention pass, unless another is already running in this process (then None)."""
+        if not RetentionService.run_lock.acquire(blocking=False):
+            print("A retention pass is already running, skipped.")
+            return None
+        try:
+            return RetentionService.run_pass(app_config, now)
+        finally:
+            RetentionService.run_lock.release()
+
+    @staticmethod
+    def run_pass(app_config, now=None):
+        """
+        One retention pass over every area, sharing RETENTION_MAX_ROWS_PER_RUN between them.
+        The caller holds run_lock.
+        """
+        started = datetime.utcnow()
+        row_budget = int(app_config.get('RETENTION_MAX_ROWS_PER_RUN', 5000))
+        totals = {'rowsArchived': 0, 'rowsDeleted': 0, 'filesArchived': 0, 'filesDeleted': 0,
+                  'archiveBytesWritten': 0, 'bytesReclaimed': 0}
+        per_area = {}
+        for (area_config_id,) in db.session.query(AreaConfig.id).order_by(AreaConfig.id).all():
+            if row_budget <= 0:
+                break
+            try:
+                stats = RetentionService.run_for_area(area_config_id, app_config, row_budget, now)
+            except Exception as e:
+                db.session.rollback()
+                print(f"Error applying retention to AreaConfig {area_config_id}: {e}")
+                continue
+            row_budget -= stats['rowsArchived'] + stats['rowsDeleted']
+            per_area[area_config_id] = stats
+            for name, value in stats.items():
+                totals[name] += value
+
+        totals['netBytesReclaimed'] = totals['bytesReclaimed'] - totals['archiveBytesWritten']
+        RetentionService.last_run_stats = {
+            'startTime': started.isoformat(),
+            'durationSeconds': round((datetime.utcnow() - started).total_seconds(), 3),
+            'totals': totals,
+            'areas': per_area,
+        }
+        print(f"Retention run finished: {totals}")
+        return RetentionService.last_run_stats
@@ -0,0 +1,227 @@
+import threading
+from math import cos, radians
+
+import numpy as np
+from sqlalchemy import event
+from sqlalchemy.orm import Session, object_session
+
+from extensions import db  # Import db from extensions
+from entities.models import AreaConfig
+from services.image_capture_service import ImageCaptureService
+from services.tile_state_index import TileStateIndex
+from utils.geo_utils import GeoUtils
+
+DEGREE_METERS = GeoUtils.EARTH_RADIUS_METERS * (np.pi / 180.0)  # Metres per degree of latitude
+
+
+class AreaGrid:
+    """
+    The tile grid of one area reduced to what cell lookups need. Rows are evenly spaced in
+    latitude from the grid origin and each row's columns evenly spaced in longitude at the
+    row's centre latitude (GeoUtils.tile_grid and world_tile_grid alike), so the cells under
+    a point or box are found arithmetically, in time proportional to the answer.
+    """
+
+    __slots__ = ('area_config_id', 'rows', 'cols', 'lat0', 'lon0', 'first_row', 'row_first_cols', 'lat_step',
+                 'lon_scale', 'tile_size', 'cell_lookup', 'bounds')
+
+    def __init__(self, area_config, tile_size_meters):
+        grid = ImageCaptureService.area_tile_grid(area_config)
+        origin = grid['origin']
+        self.area_config_id = area_config.id
+        self.rows, self.cols = grid['rows'], grid['cols']
+        self.lat0, self.lon0 = origin['lat'], origin['lon']
+        self.first_row = origin['firstRow']
+        self.row_first_cols = grid['rowFirstCols']  # Column, counted from lon0, where each row starts
+        self.tile_size = tile_size_meters
+        self.lat_step = tile_size_meters / DEGREE_METERS
+        row_lats = self.lat0 + (self.first_row + np.arange(self.rows) + 0.5) * self.lat_step
+        self.lon_scale = DEGREE_METERS * np.cos(np.radians(row_lats))  # Metres per degree of longitude, per row
+        # (row, col) within the area -> position in area_unique_keys, -1 where a shorter row has no cell
+        self.cell_lookup = np.full((self.rows, self.cols), -1, dtype=np.int64)
+        self.cell_lookup[grid['rowIndex'], grid['colIndex']] = np.arange(len(grid['rowIndex']))
+        bounds = grid['bounds']
+        # [minLat, minLon, maxLat, maxLon] of everything the grid covers
+        self.bounds = (bounds[:, 0].min(), bounds[:, 1].min(), bounds[:, 2].max(), bounds[:, 3].max()) \
+            if len(bounds) else (0.0, 0.0, -1.0, -1.0)
+
+    def cells_in_bbox(self, min_lat, min_lon, max_lat, max_lon):
+        """Positions in area_unique_keys of the cells touching the box, row by row."""
+        if not self.rows or not self.cols:
+            return np.empty(0, dtype=np.int64)
+        first_row = max(0, int(np.floor((min_lat - self.lat0) / self.lat_step)) - self.first_row)
+        last_row = min(self.rows - 1, int(np.floor((max_lat - self.lat0) / self.lat_step)) - self.first_row)
+        if first_row > last_row:
+            return np.empty(0, dtype=np.int64)
+
+        rows = np.arange(first_row, last_row + 1)
+        scale = self.lon_scale[rows] / self.tile_size
+        first_cols = np.floor((min_lon - self.lon0) * scale).astype(np.int64) - self.row_first_cols[rows]
+        last_cols = np.floor((max_lon - self.lon0) * scale).astype(np.int64) - self.row_first_cols[rows]
+        hit = (last_cols >= 0) & (first_cols < self.cols)
+        rows = rows[hit]
+        first_cols = np.clip(first_cols[hit], 0, self.cols - 1)
+        last_cols = np.clip(last_cols[hit], 0, self.cols - 1)
+        counts = last_cols - first_cols + 1
+        if not counts.sum():
+            return np.empty(0, dtype=np.int64)
+
+        # Each row's column range [first_col, last_col] expanded without a Python loop
+        offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        cells = self.cell_lookup[np.repeat(rows, counts), np.repeat(first_cols, counts) + offsets]
+        return cells[cells >= 0]
+
+
+class SpatialIndex:
+    """
+    In-memory spatial index over every AreaConfig and its tile grid.
+
+    Area bounding boxes (GeoUtils.calculate_bounding_box) sit in one NumPy array, so finding
+    the areas under a point or box is a single vectorised comparison; the cells of each of
+    those areas come from AreaGrid arithmetic, and tile state (latest capture, change flag)
+    is read from TileStateIndex, which the capture and comparison paths already keep current.
+    The index is rebuilt lazily after any AreaConfig insert, update or delete is committed,
+    and swapped in as one snapshot so readers never see half of a rebuild.
+    """
+
+    _lock = threading.Lock()
+    _dirty = True
+    _snapshot = None
+
+    @staticmethod
+    def mark_dirty():
+        SpatialIndex._dirty = True
+
+    @staticmethod
+    def _build():
+        area_configs = db.session.query(AreaConfig).order_by(AreaConfig.id).all()
+        areas, area_bounds, grid_bounds = {}, [], []
+        for area_config in area_configs:
+            bbox = GeoUtils.calculate_bounding_box(area_config.center_lat, area_config.center_lon,
+                                                   area_config.north_km, area_config.south_km,
+                                                   area_config.east_km, area_config.west_km)
+            grid = AreaGrid(area_config, ImageCaptureService.TILE_SIZE_METERS)
+            areas[area_config.id] = (area_config.name, grid, ImageCaptureService.area_unique_keys(area_config))
+            area_bounds.append((bbox['minLat'], bbox['minLon'], bbox['maxLat'], bbox['maxLon']))
+            grid_bounds.append(grid.bounds)
+        return {
+            'areaIds': np.array([area_config.id for area_config in area_configs], dtype=np.int64),
+            'areaBounds': np.array(area_bounds, dtype=np.float64).reshape(-1, 4),  # Configured extents
+            'gridBounds': np.array(grid_bounds, dtype=np.float64).reshape(-1, 4),  # Grids can reach past them
+            'areas': areas,  # area_config_id -> (name, AreaGrid, unique_keys)
+        }
+
+    @staticmethod
+    def snapshot():
+        """The current index, rebuilt first if an AreaConfig changed; call inside an app context."""
+        if SpatialIndex._dirty:
+            with SpatialIndex._lock:
+                if SpatialIndex._dirty:
+                    SpatialIndex._dirty = False  # First: a change committed mid-rebuild marks it dirty again
+                    SpatialIndex._snapshot = SpatialIndex._build()
+        return SpatialIndex._snapshot
+
+    @staticmethod
+    def _intersecting(bounds, min_lat, min_lon, max_lat, max_lon):
+        mask = (bounds[:, 0] <= max_lat) & (bounds[:, 2] >= min_lat) & \
+               (bounds[:, 1] <= max_lon) & (bounds[:, 3] >= min_lon)
+        return np.flatnonzero(mask).tolist()
+
+    @staticmethod
+    def areas_in_bbox(min_lat, min_lon, max_lat, max_lon):
+        """Areas whose configured extent touches the box, with their bounding boxes."""
+        index = SpatialIndex.snapshot()
+        positions = SpatialIndex._intersecting(index['areaBounds'], min_lat, min_lon, max_lat, max_lon)
+        areas = []
+        for position in positions:
+            area_id = int(index['areaIds'][position])
+            areas.append({
+                'id': area_id,
+                'name': index['areas'][area_id][0],
+                'bbox': dict(zip(('minLat', 'minLon', 'maxLat', 'maxLon'), index['areaBounds'][position].tolist())),
+            })
+        return areas
+
+    @staticmethod
+    def tiles_in_bbox(min_lat, min_lon, max_lat, max_lon, area_config_id=None, changed_only=False,
+                      captured_since=None, limit=1000):
+        """
+        Latest capture of every captured cell touching the box, across all areas (or one),
+        as (tiles, truncated). Cells that were never captured are left out.
+        """
+        index = SpatialIndex.snapshot()
+        positions = SpatialIndex._intersecting(index['gridBounds'], min_lat, min_lon, max_lat, max_lon)
+        tiles = []
+        for position in positions:
+            area_id = int(index['areaIds'][position])
+            if area_config_id is not None and area_id != area_config_id:
+                continue
+            _, grid, unique_keys = index['areas'][area_id]
+            cells = grid.cells_in_bbox(min_lat, min_lon, max_lat, max_lon)
+            if not len(cells):
+                continue
+            tile_state = TileStateIndex.loaded(area_id)
+            if tile_state is None or tile_state.unique_keys is not unique_keys:
+                tile_state = TileStateIndex.for_area_id(area_id)  # Not in memory yet, or built for an older grid
+            if tile_state is None:
+                continue
+            tiles.extend(tile_state.tiles_at(cells, changed_only=changed_only, captured_since=captured_since,
+                                             limit=limit + 1 - len(tiles)))
+            if len(tiles) > limit:
+                return tiles[:limit], True
+        return tiles, False
+
+    @staticmethod
+    def overlapping_areas():
+        """
+        Pairs of areas whose extents overlap, with the overlap's size and how many grid cells
+        of each area lie in it. sharedTiles counts cells centred on the same point in both areas
+        (the part of the unique_key after the area id): those are the same Static Maps request,
+        which the tile response cache revalidates instead of downloading twice.
+        """
+        index = SpatialIndex.snapshot()
+        bounds, area_ids = index['areaBounds'], index['areaIds']
+        overlap_min = np.maximum(bounds[:, np.newaxis, :2], bounds[np.newaxis, :, :2])
+        overlap_max = np.minimum(bounds[:, np.newaxis, 2:], bounds[np.newaxis, :, 2:])
+        overlaps = np.all(overlap_min < overlap_max, axis=2)
+        first, second = np.nonzero(np.triu(overlaps, k=1))
+
+        pairs = []
+        for i, j in zip(first.tolist(), second.tolist()):
+            min_lat, min_lon = overlap_min[i, j].tolist()
+            max_lat, max_lon = overlap_max[i, j].tolist()
+            area_id, other_id = int(area_ids[i]), int(area_ids[j])
+            _, grid, keys = index['areas'][area_id]
+            _, other_grid, other_keys = index['areas'][other_id]
+            cells = grid.cells_in_bbox(min_lat, min_lon, max_lat, max_lon)
+            other_cells = other_grid.cells_in_bbox(min_lat, min_lon, max_lat, max_lon)
+            height_km = (max_lat - min_lat) * DEGREE_METERS / 1000
+            width_km = (max_lon - min_lon) * DEGREE_METERS * cos(radians((min_lat + max_lat) / 2)) / 1000
+            pairs.append({
+                'areaConfigIds': [area_id, other_id],
+                'bbox': {'minLat': min_lat, 'minLon': min_lon, 'maxLat': max_lat, 'maxLon': max_lon},
+                'overlapKm2': round(height_km * width_km, 4),
+                'tilesInOverlap': {str(area_id): len(cells), str(other_id): len(other_cells)},
+                'sharedTiles': len({keys[cell].split('_', 1)[1] for cell in cells.tolist()} &
+                                   {other_keys[cell].split('_', 1)[1] for cell in other_cells.tolist()}),
+            })
+        return pairs
+
+
+# --- Keep the index in step with AreaConfig changes ---
+@event.listens_for(AreaConfig, 'after_insert')
+@event.listens_for(AreaConfig, 'after_update')
+@event.listens_for(AreaConfig, 'after_delete')
+def _area_config_changed(mapper, connection, target):
+    object_session(target).info['spatial_index_dirty'] = True
+
+
+@event.listens_for(Session, 'after_commit')
+def _rebuild_after_area_commit(session):
+    if session.info.pop('spatial_index_dirty', False):
+        SpatialIndex.mark_dirty()
+
+
+@event.listens_for(Session, 'after_rollback')
+def _forget_rolled_back_areas(session):
+    session.info.pop('spatial_index_dirty', None)
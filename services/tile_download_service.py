@@ -0,0 +1,339 @@
+import itertools
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from datetime import datetime
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from services.tile_storage_service import TileStorageService
+from services.tile_response_cache import TileResponseCache
+from utils.metrics import Metrics, TILE_DOWNLOADS, DOWNLOAD_BYTES
+
+
+class TokenBucket:
+    """Thread-safe token bucket used to stay inside the Static Maps request quota."""
+
+    def __init__(self, rate_per_sec, burst):
+        self.rate_per_sec = float(rate_per_sec or 0)
+        self.capacity = max(1.0, float(burst or 1))
+        self._tokens = self.capacity
+        self._last_refill = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        if self.rate_per_sec <= 0:
+            return  # Rate limiting disabled
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._last_refill) * self.rate_per_sec)
+                self._last_refill = now
+                if self._tokens >= 1.0:
+                    self._tokens -= 1.0
+                    return
+                wait_seconds = (1.0 - self._tokens) / self.rate_per_sec
+            time.sleep(wait_seconds)
+
+
+class DownloadStats:
+    """Collects throughput numbers for one download run."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.started_at = time.monotonic()
+        self.finished_at = None
+        self.tiles_ok = 0
+        self.tiles_failed = 0
+        self.bytes_downloaded = 0
+        self.retries = 0
+        self.latencies = []
+        self.cache_hits = 0  # Fresh enough to skip the request entirely
+        self.cache_revalidated = 0  # Conditional request answered with 304
+        self.cache_misses = 0  # Full body downloaded
+        self.shared_in_flight = 0  # Cache hits that waited for another run's request for the same tile
+        self.bytes_saved = 0
+
+    def record(self, ok, num_bytes=0, latency=None, retries=0, cache_outcome=None, bytes_saved=0):
+        with self._lock:
+            if ok:
+                self.tiles_ok += 1
+                self.bytes_downloaded += num_bytes
+            else:
+                self.tiles_failed += 1
+            self.retries += retries
+            if latency is not None:
+                self.latencies.append(latency)
+            if cache_outcome in ('hit', 'shared'):
+                self.cache_hits += 1
+                self.shared_in_flight += cache_outcome == 'shared'
+            elif cache_outcome == 'revalidated':
+                self.cache_revalidated += 1
+            elif cache_outcome == 'miss':
+                self.cache_misses += 1
+            self.bytes_saved += bytes_saved
+
+    def finish(self):
+        self.finished_at = time.monotonic()
+
+    @staticmethod
+    def _percentile(sorted_values, percent):
+        if not sorted_values:
+            return 0.0
+        index = min(len(sorted_values) - 1, int(round(percent / 100.0 * (len(sorted_values) - 1))))
+        return sorted_values[index]
+
+    def summary(self):
+        with self._lock:
+            elapsed = (self.finished_at or time.monotonic()) - self.started_at
+            latencies = sorted(self.latencies)
+            return {
+                'tilesOk': self.tiles_ok,
+                'tilesFailed': self.tiles_failed,
+                'retries': self.retries,
+                'bytesDownloaded': self.bytes_downloaded,
+                'elapsedSeconds': round(elapsed, 3),
+                'tilesPerSec': round(self.tiles_ok / elapsed, 2) if elapsed > 0 else 0.0,
+                'bytesPerSec': round(self.bytes_downloaded / elapsed, 2) if elapsed > 0 else 0.0,
+                'p50LatencyMs': round(self._percentile(latencies, 50) * 1000, 1),
+                'p99LatencyMs': round(self._percentile(latencies, 99) * 1000, 1),
+                'cacheHits': self.cache_hits,
+                'cacheRevalidated': self.cache_revalidated,
+                'cacheMisses': self.cache_misses,
+                'sharedInFlight': self.shared_in_flight,
+                'bytesSaved': self.bytes_saved,
+            }
+
+
+class TileDownloadService:
+    """
+    Bounded-concurrency tile downloader.
+
+    HTTP fetches and file writes run on a thread pool sharing one pooled requests.Session.
+    Results are yielded back to the caller as they complete so that all DB work can stay
+    on the calling thread (Flask-SQLAlchemy sessions are not shared across threads).
+    The Static Maps URL comes from app_config, so the engine can be pointed at a local
+    stub HTTP server for testing.
+
+    With a TileResponseCache, tiles fetched less than min_refetch_seconds ago are served
+    from the cache without a request, and older ones are revalidated with If-None-Match /
+    If-Modified-Since so an unchanged tile costs a 304 instead of a full PNG. While
+    min_refetch_seconds is set, a URL already being fetched by any downloader in the process
+    (another area's run covering the same world-grid tile) is waited for rather than requested
+    again.
+
+    A downloader is built per area run, but the rate limiter and per-host semaphores are
+    process-wide (keyed by their settings), so areas running concurrently share one
+    CAPTURE_RATE_LIMIT_PER_SEC and CAPTURE_PER_HOST_CONCURRENCY instead of each getting its own.
+    """
+
+    RETRYABLE_STATUS_CODES = (429, 500, 502, 503, 504)
+
+    _in_flight = {}  # Response cache key -> threading.Event, shared by every downloader in the process
+    _in_flight_lock = threading.Lock()
+    _rate_limiters = {}  # (rate_per_sec, burst) -> TokenBucket, shared by every downloader in the process
+    _host_semaphores = {}  # (host, per_host_limit) -> BoundedSemaphore, likewise
+    _shared_lock = threading.Lock()
+
+    def __init__(self, app_config, response_cache=None, min_refetch_seconds=0):
+        self.app_config = app_config
+        self.response_cache = response_cache
+        self.min_refetch_seconds = float(min_refetch_seconds or 0)
+        self.max_workers = int(app_config.get('CAPTURE_MAX_WORKERS', 8))
+        self.per_host_limit = int(app_config.get('CAPTURE_PER_HOST_CONCURRENCY', self.max_workers))
+        self.max_retries = int(app_config.get('CAPTURE_MAX_RETRIES', 3))
+        self.backoff_base = float(app_config.get('CAPTURE_BACKOFF_BASE_SECONDS', 0.5))
+        self.backoff_max = float(app_config.get('CAPTURE_BACKOFF_MAX_SECONDS', 10.0))
+        self.timeout = float(app_config.get('CAPTURE_HTTP_TIMEOUT_SECONDS', 20.0))
+        self.rate_limiter = TileDownloadService._shared_rate_limiter(
+            app_config.get('CAPTURE_RATE_LIMIT_PER_SEC', 0), app_config.get('CAPTURE_RATE_LIMIT_BURST', 1))
+        self.stats = DownloadStats()
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=max(self.max_workers, self.per_host_limit))
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def close(self):
+        self.session.close()
+        if self.response_cache is not None:
+            self.response_cache.save()
+
+    @staticmethod
+    def _shared_rate_limiter(rate_per_sec, burst):
+        key = (float(rate_per_sec or 0), float(burst or 1))
+        with TileDownloadService._shared_lock:
+            if key not in TileDownloadService._rate_limiters:
+                TileDownloadService._rate_limiters[key] = TokenBucket(*key)
+            return TileDownloadService._rate_limiters[key]
+
+    def _host_semaphore(self, url):
+        key = (urlsplit(url).netloc, self.per_host_limit)
+        with TileDownloadService._shared_lock:
+            if key not in TileDownloadService._host_semaphores:
+                TileDownloadService._host_semaphores[key] = threading.BoundedSemaphore(self.per_host_limit)
+            return TileDownloadService._host_semaphores[key]
+
+    def _backoff_delay(self, attempt, retry_after=None):
+        if retry_after is not None:
+            return min(self.backoff_max, retry_after)
+        delay = min(self.backoff_max, self.backoff_base * (2 ** attempt))
+        return random.uniform(delay / 2.0, delay)  # Jitter so retries don't arrive in lockstep
+
+    @staticmethod
+    def _retry_after_seconds(response):
+        value = response.headers.get('Retry-After')
+        try:
+            return float(value) if value is not None else None
+        except ValueError:
+            return None
+
+    def fetch(self, url, headers=None):
+        """
+        Fetches a URL with rate limiting, per-host concurrency limiting and jittered retries.
+        Returns (response, latency_seconds, retries); a 304 counts as success. Raises
+        requests.exceptions.RequestException once all retries are exhausted.
+        """
+        semaphore = self._host_semaphore(url)
+        attempt = 0
+        while True:
+            retry_after = None
+            self.rate_limiter.acquire()
+            try:
+                with semaphore:
+                    started = time.monotonic()
+                    response = self.session.get(url, headers=headers, timeout=self.timeout)
+                    latency = time.monotonic() - started
+                if response.status_code not in self.RETRYABLE_STATUS_CODES:
+                    response.raise_for_status()
+                    return response, latency, attempt
+                retry_after = self._retry_after_seconds(response)
+                error = requests.exceptions.HTTPError(f"{response.status_code} response from upstream",
+                                                      response=response)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                error = e
+
+            if attempt >= self.max_retries:
+                raise error
+            time.sleep(self._backoff_delay(attempt, retry_after))
+            attempt += 1
+
+    def _fresh_entry(self, url):
+        entry = self.response_cache.lookup(url) if self.response_cache is not None else None
+        if entry is not None and time.time() - entry['fetchedAt'] < self.min_refetch_seconds and \
+                os.path.exists(entry['blobPath']):
+            return entry
+        return None
+
+    def _claim_url(self, url):
+        """(owned, event): owned is False if another downloader is already fetching this URL."""
+        key = TileResponseCache.cache_key(url)
+        with TileDownloadService._in_flight_lock:
+            event = TileDownloadService._in_flight.get(key)
+            if event is not None:
+                return False, event
+            event = TileDownloadService._in_flight[key] = threading.Event()
+            return True, event
+
+    @staticmethod
+    def _release_url(url, event):
+        with TileDownloadService._in_flight_lock:
+            TileDownloadService._in_flight.pop(TileResponseCache.cache_key(url), None)
+        event.set()
+
+    def _record(self, area, ok, num_bytes=0, latency=None, retries=0, cache_outcome=None, bytes_saved=0):
+        self.stats.record(ok, num_bytes, latency, retries, cache_outcome=cache_outcome, bytes_saved=bytes_saved)
+        TILE_DOWNLOADS.inc(area=area, outcome=(cache_outcome or 'miss') if ok else 'failed')
+        if num_bytes:
+            DOWNLOAD_BYTES.inc(num_bytes, area=area)
+
+    def _download_one(self, job):
+        url = job['url']
+        area = job.get('area_config_id', '')
+        result = dict(job, ok=False, error=None, bytes=0)
+        claimed = None
+        try:
+            # Imagery this recent cannot have changed upstream; don't spend a request on it
+            entry = self._fresh_entry(url)
+            cache_outcome = 'hit'
+            if entry is None and self.min_refetch_seconds > 0 and self.response_cache is not None:
+                owned, event = self._claim_url(url)
+                if owned:
+                    claimed = event
+                else:
+                    with Metrics.stage('shared_wait', area):
+                        event.wait(self.timeout * (self.max_retries + 1))
+                    entry = self._fresh_entry(url)
+                    cache_outcome = 'shared'
+            if entry is not None:
+                result.update(ok=True, capture_time=datetime.utcnow(), content_hash=entry['contentHash'],
+                              file_path=entry['blobPath'])
+                self._record(area, True, cache_outcome=cache_outcome, bytes_saved=os.path.getsize(entry['blobPath']))
+                return result
+
+            entry = self.response_cache.lookup(url) if self.response_cache is not None else None
+            if entry is not None and not os.path.exists(entry['blobPath']):
+                entry = None  # Blob removed since; a 304 would leave nothing to serve
+            headers = TileResponseCache.conditional_headers(entry) if entry is not None else None
+            with Metrics.stage('http_fetch', area):
+                response, latency, retries = self.fetch(url, headers=headers)
+            capture_time = datetime.utcnow()
+
+            if response.status_code == 304:
+                if entry is not None:
+                    self.response_cache.mark_revalidated(url, response.headers)
+                    result.update(ok=True, capture_time=capture_time, content_hash=entry['contentHash'],
+                                  file_path=entry['blobPath'])
+                    self._record(area, True, 0, latency, retries, cache_outcome='revalidated',
+                                 bytes_saved=os.path.getsize(entry['blobPath']))
+                    return result
+                # A 304 with no cached copy to stand for (e.g. from an intermediate cache) has no
+                # body to store; fetch the image unconditionally instead
+                with Metrics.stage('http_fetch', area):
+                    response, latency, more_retries = self.fetch(url, headers={'Cache-Control': 'no-cache'})
+                retries += more_retries
+                capture_time = datetime.utcnow()
+                if response.status_code == 304:
+                    raise requests.exceptions.HTTPError("304 response without a cached copy of the tile",
+                                                        response=response)
+
+            content = response.content
+            with Metrics.stage('file_write', area):
+                content_hash, blob_path = TileStorageService.store_blob(content, self.app_config)
+            if self.response_cache is not None:
+                self.response_cache.store(url, response.headers, content_hash)
+            result.update(ok=True, bytes=len(content), capture_time=capture_time,
+                          content_hash=content_hash, file_path=blob_path)
+            self._record(area, True, len(content), latency, retries,
+                         cache_outcome='miss' if self.response_cache is not None else None)
+        except Exception as e:
+            result['error'] = str(e)
+            self._record(area, False)
+        finally:
+            if claimed is not None:
+                self._release_url(url, claimed)
+        return result
+
+    def iter_downloads(self, jobs, max_pending=None):
+        """
+        Downloads every job concurrently and yields result dicts as they complete.
+        Each job needs a 'url'; any other keys are passed through to the result. Successful
+        results carry the blob 'file_path' and 'content_hash' of the stored image.
+        At most max_pending jobs (default 4x the worker count) are in flight or waiting to be
+        consumed, so a slow consumer holds back the downloads instead of buffering every tile.
+        """
+        max_pending = max_pending or self.max_workers * 4
+        jobs = iter(jobs)
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='tile-download') as executor:
+            pending = {executor.submit(self._download_one, job) for job in itertools.islice(jobs, max_pending)}
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield future.result()
+                for job in itertools.islice(jobs, max_pending - len(pending)):
+                    pending.add(executor.submit(self._download_one, job))
+        self.stats.finish()
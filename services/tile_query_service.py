@@ -0,0 +1,127 @@
+from datetime import datetime
+from itertools import groupby
+
+from sqlalchemy import func, select, or_, and_
+
+from extensions import db  # Import db from extensions
+from entities.models import ImageTile
+
+
+class TileQueryService:
+    # Public (to_dict) field name -> column, for sparse field selection in listings
+    TILE_FIELDS = {
+        'id': ImageTile.id,
+        'areaConfigId': ImageTile.area_config_id,
+        'uniqueKey': ImageTile.unique_key,
+        'latitude': ImageTile.latitude,
+        'longitude': ImageTile.longitude,
+        'captureTime': ImageTile.capture_time,
+        'imagePath': ImageTile.image_path,
+        'status': ImageTile.status,
+        'lastComparisonTime': ImageTile.last_comparison_time,
+        'changeDetected': ImageTile.change_detected,
+        'contentHash': ImageTile.content_hash,
+        'lastSeenTime': ImageTile.last_seen_time,
+    }
+
+    # Columns the in-memory tile state index keeps per capture
+    STATE_COLUMNS = (ImageTile.id, ImageTile.unique_key, ImageTile.capture_time, ImageTile.last_seen_time,
+                     ImageTile.content_hash, ImageTile.image_path, ImageTile.change_detected,
+                     ImageTile.needs_comparison)
+
+    @staticmethod
+    def _ranked_captures(area_config_id, unique_keys=None):
+        row_number = func.row_number().over(
+            partition_by=ImageTile.unique_key,
+            order_by=(ImageTile.capture_time.desc(), ImageTile.id.desc())
+        ).label('row_number')
+
+        ranked = db.session.query(ImageTile.id.label('id'), row_number).filter(
+            ImageTile.area_config_id == area_config_id)
+        if unique_keys is not None:
+            ranked = ranked.filter(ImageTile.unique_key.in_(unique_keys))
+        return ranked.subquery()
+
+    @staticmethod
+    def latest_capture_ids(area_config_id, depth=2, unique_keys=None):
+        """Ids of the `depth` most recent captures of each unique_key, e.g. rows retention must keep."""
+        ranked = TileQueryService._ranked_captures(area_config_id, unique_keys)
+        return {row[0] for row in db.session.query(ranked.c.id).filter(ranked.c.row_number <= depth)}
+
+    @staticmethod
+    def latest_capture_hashes(content_hashes):
+        """The given content hashes that are the latest capture of some key, in any area."""
+        row_number = func.row_number().over(
+            partition_by=(ImageTile.area_config_id, ImageTile.unique_key),
+            order_by=(ImageTile.capture_time.desc(), ImageTile.id.desc())
+        ).label('row_number')
+        keys_with_hash = select(ImageTile.unique_key).where(ImageTile.content_hash.in_(content_hashes))
+        ranked = select(ImageTile.content_hash.label('content_hash'), row_number).where(
+            ImageTile.unique_key.in_(keys_with_hash)).subquery()
+        return {row[0] for row in db.session.query(ranked.c.content_hash).filter(
+            ranked.c.row_number == 1, ranked.c.content_hash.in_(content_hashes))}
+
+    @staticmethod
+    def latest_captures(area_config_id, depth=2, unique_keys=None):
+        """
+        Returns the `depth` most recent ImageTile rows per unique_key for an area, ordered by
+        unique_key and newest first. Uses ROW_NUMBER() over each unique_key so only the rows
+        we need leave the database, however long the capture history gets.
+        """
+        ranked = TileQueryService._ranked_captures(area_config_id, unique_keys)
+        return db.session.query(ImageTile).join(ranked, ImageTile.id == ranked.c.id).filter(
+            ranked.c.row_number <= depth).order_by(
+            ImageTile.unique_key, ImageTile.capture_time.desc(), ImageTile.id.desc()).all()
+
+    @staticmethod
+    def latest_capture_rows(area_config_id, depth=2, unique_keys=None):
+        """Same selection as latest_captures, as plain STATE_COLUMNS rows instead of ORM objects."""
+        ranked = TileQueryService._ranked_captures(area_config_id, unique_keys)
+        return db.session.query(*TileQueryService.STATE_COLUMNS).join(ranked, ImageTile.id == ranked.c.id).filter(
+            ranked.c.row_number <= depth).order_by(
+            ImageTile.unique_key, ImageTile.capture_time.desc(), ImageTile.id.desc()).all()
+
+    @staticmethod
+    def latest_captures_by_key(area_config_id, depth=2, unique_keys=None):
+        """Same as latest_captures, grouped into {unique_key: [newest, ..., oldest]}."""
+        tiles = TileQueryService.latest_captures(area_config_id, depth, unique_keys)
+        return {unique_key: list(group) for unique_key, group in groupby(tiles, key=lambda tile: tile.unique_key)}
+
+    @staticmethod
+    def _latest_capture_ids(area_config_id):
+        ranked = TileQueryService._ranked_captures(area_config_id)
+        return select(ranked.c.id).where(ranked.c.row_number == 1)
+
+    @staticmethod
+    def tile_listing_select(area_config_id, fields, latest_only=False, changed_only=False, since=None, until=None,
+                            after=None):
+        """
+        Column-only SELECT for an area's tiles, newest first, keyset-paginated on
+        (capture_time, id). `fields` are public field names; id and captureTime are always
+        selected because the cursor is built from them. `after` is a decoded cursor.
+        """
+        selected = ['id', 'captureTime'] + [field for field in fields if field not in ('id', 'captureTime')]
+        stmt = select(*[TileQueryService.TILE_FIELDS[field].label(field) for field in selected]).where(
+            ImageTile.area_config_id == area_config_id)
+
+        if latest_only:
+            stmt = stmt.where(ImageTile.id.in_(TileQueryService._latest_capture_ids(area_config_id)))
+        if changed_only:
+            stmt = stmt.where(ImageTile.change_detected.is_(True))
+        if since is not None:
+            stmt = stmt.where(ImageTile.capture_time >= since)
+        if until is not None:
+            stmt = stmt.where(ImageTile.capture_time < until)
+        if after is not None:
+            after_time, after_id = after
+            stmt = stmt.where(or_(ImageTile.capture_time < after_time,
+                                  and_(ImageTile.capture_time == after_time, ImageTile.id < after_id)))
+        return stmt.order_by(ImageTile.capture_time.desc(), ImageTile.id.desc())
+
+    @staticmethod
+    def serialize_tile_row(row, fields):
+        item = {}
+        for field in fields:
+            value = row._mapping[field]
+            item[field] = value.isoformat() if isinstance(value, datetime) else value
+        return item
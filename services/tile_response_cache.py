@@ -0,0 +1,108 @@
+import json
+import os
+import threading
+import time
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+
+from services.tile_storage_service import TileStorageService
+
+
+class TileResponseCache:
+    """
+    Local cache of Static Maps responses, keyed by the request URL with the API key removed.
+
+    Each entry remembers the validators the upstream sent (ETag / Last-Modified), when the
+    tile was last fetched and the content hash of the blob holding the body. The body itself
+    is never duplicated: it is the content-addressed blob from TileStorageService. The index
+    is kept in memory and persisted to IMAGE_STORAGE_DIRECTORY/http_cache.json after a run.
+    """
+
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    def __init__(self, index_path, app_config):
+        self.index_path = index_path
+        self.app_config = app_config
+        self._entries = {}
+        self._lock = threading.Lock()
+        self._dirty = False
+        self._load()
+
+    @classmethod
+    def instance(cls, app_config):
+        with cls._instance_lock:
+            if cls._instance is None:
+                cls._instance = cls(os.path.join(app_config['IMAGE_STORAGE_DIRECTORY'], 'http_cache.json'),
+                                    app_config)
+            return cls._instance
+
+    @staticmethod
+    def cache_key(url):
+        parts = urlsplit(url)
+        query = sorted((name, value) for name, value in parse_qsl(parts.query) if name != 'key')
+        return urlunsplit((parts.scheme, parts.netloc, parts.path, urlencode(query), ''))
+
+    def _load(self):
+        try:
+            with open(self.index_path) as f:
+                self._entries = json.load(f)
+        except (OSError, ValueError):
+            self._entries = {}
+
+    def save(self):
+        with self._lock:
+            if not self._dirty:
+                return
+            snapshot = dict(self._entries)
+            self._dirty = False
+        try:
+            os.makedirs(os.path.dirname(self.index_path) or '.', exist_ok=True)
+            temp_path = f"{self.index_path}.{os.getpid()}.tmp"
+            with open(temp_path, 'w') as f:
+                json.dump(snapshot, f)
+            os.replace(temp_path, self.index_path)
+        except OSError as e:
+            print(f"Could not save tile response cache index {self.index_path}: {e}")
+
+    def lookup(self, url):
+        """Returns the cached entry for the URL if its blob is still on disk, else None."""
+        with self._lock:
+            entry = self._entries.get(self.cache_key(url))
+        if entry is None:
+            return None
+        blob_path = TileStorageService.blob_path(entry['contentHash'], self.app_config)
+        if not os.path.exists(blob_path):
+            return None
+        return dict(entry, blobPath=blob_path)
+
+    @staticmethod
+    def conditional_headers(entry):
+        headers = {}
+        if entry.get('etag'):
+            headers['If-None-Match'] = entry['etag']
+        if entry.get('lastModified'):
+            headers['If-Modified-Since'] = entry['lastModified']
+        return headers
+
+    def store(self, url, response_headers, content_hash):
+        entry = {
+            'etag': response_headers.get('ETag'),
+            'lastModified': response_headers.get('Last-Modified'),
+            'fetchedAt': time.time(),
+            'contentHash': content_hash,
+        }
+        with self._lock:
+            self._entries[self.cache_key(url)] = entry
+            self._dirty = True
+
+    def mark_revalidated(self, url, response_headers):
+        """Records a 304: the cached body is still current as of now."""
+        key = self.cache_key(url)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return
+            entry['fetchedAt'] = time.time()
+            entry['etag'] = response_headers.get('ETag', entry.get('etag'))
+            entry['lastModified'] = response_headers.get('Last-Modified', entry.get('lastModified'))
+            self._dirty = True
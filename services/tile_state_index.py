@@ -0,0 +1,258 @@
+import threading
+from itertools import groupby
+
+import numpy as np
+from sqlalchemy import event
+
+from extensions import db  # Import db from extensions
+from entities.models import AreaConfig
+from services.image_capture_service import ImageCaptureService
+from services.tile_query_service import TileQueryService
+
+
+class AreaTileState:
+    """
+    Latest and previous capture of every grid cell of one area, held in parallel NumPy arrays
+    indexed by the cell's position in ImageCaptureService.area_unique_keys. Memory is
+    O(grid cells) whatever the length of the capture history. Id 0 means "no capture".
+    All access goes through the instance lock.
+    """
+
+    __slots__ = ('area_config_id', 'unique_keys', 'key_index', 'center_lats', 'center_lons',
+                 'latest_id', 'previous_id', 'latest_time', 'previous_time', 'last_seen_time',
+                 'latest_hash', 'previous_hash', 'latest_path', 'previous_path',
+                 'change_detected', 'needs_comparison', 'lock')
+
+    def __init__(self, area_config_id, unique_keys, center_lats, center_lons):
+        size = len(unique_keys)
+        self.area_config_id = area_config_id
+        self.unique_keys = unique_keys
+        self.key_index = {unique_key: index for index, unique_key in enumerate(unique_keys)}
+        self.center_lats = center_lats
+        self.center_lons = center_lons
+        self.latest_id = np.zeros(size, dtype=np.int64)
+        self.previous_id = np.zeros(size, dtype=np.int64)
+        self.latest_time = np.full(size, np.datetime64('NaT'), dtype='datetime64[us]')
+        self.previous_time = np.full(size, np.datetime64('NaT'), dtype='datetime64[us]')
+        self.last_seen_time = np.full(size, np.datetime64('NaT'), dtype='datetime64[us]')
+        self.latest_hash = np.zeros(size, dtype='S40')  # SHA-1 hex; b'' for legacy rows without one
+        self.previous_hash = np.zeros(size, dtype='S40')
+        self.latest_path = np.empty(size, dtype=object)
+        self.previous_path = np.empty(size, dtype=object)
+        self.change_detected = np.zeros(size, dtype=bool)
+        self.needs_comparison = np.zeros(size, dtype=bool)
+        self.lock = threading.Lock()
+
+    def _clear_cell(self, index):
+        self.latest_id[index] = self.previous_id[index] = 0
+        self.latest_time[index] = self.previous_time[index] = self.last_seen_time[index] = np.datetime64('NaT')
+        self.latest_hash[index] = self.previous_hash[index] = b''
+        self.latest_path[index] = self.previous_path[index] = None
+        self.change_detected[index] = self.needs_comparison[index] = False
+
+    def load_rows(self, rows):
+        """Applies TileQueryService.latest_capture_rows output (newest first per key, depth <= 2)."""
+        with self.lock:
+            for unique_key, key_rows in groupby(rows, key=lambda row: row.unique_key):
+                index = self.key_index.get(unique_key)
+                if index is None:
+                    continue  # Capture from an older grid geometry
+                key_rows = list(key_rows)
+                self._clear_cell(index)
+                latest = key_rows[0]
+                self.latest_id[index] = latest.id
+                self.latest_time[index] = latest.capture_time
+                self.last_seen_time[index] = latest.last_seen_time or latest.capture_time
+                self.latest_hash[index] = (latest.content_hash or '').encode('ascii')
+                self.latest_path[index] = latest.image_path
+                self.change_detected[index] = bool(latest.change_detected)
+                self.needs_comparison[index] = bool(latest.needs_comparison)
+                if len(key_rows) > 1:
+                    previous = key_rows[1]
+                    self.previous_id[index] = previous.id
+                    self.previous_time[index] = previous.capture_time
+                    self.previous_hash[index] = (previous.content_hash or '').encode('ascii')
+                    self.previous_path[index] = previous.image_path
+
+    # --- Incremental updates ---
+
+    def record_seen(self, unique_key, seen_time):
+        """A capture identical to the latest one only moves last_seen_time."""
+        index = self.key_index.get(unique_key)
+        if index is not None:
+            with self.lock:
+                self.last_seen_time[index] = seen_time
+
+    def record_comparison(self, unique_key, changed, needs_comparison=False):
+        index = self.key_index.get(unique_key)
+        if index is not None:
+            with self.lock:
+                self.change_detected[index] = changed
+                self.needs_comparison[index] = needs_comparison
+
+    def clear_dirty(self, unique_keys):
+        """Keys a comparison run has dealt with, whether or not there was a pair to compare."""
+        with self.lock:
+            for unique_key in unique_keys:
+                index = self.key_index.get(unique_key)
+                if index is not None:
+                    self.needs_comparison[index] = False
+
+    # --- Lookups ---
+
+    def latest(self, unique_key):
+        """(tile_id, content_hash, image_path) of the key's latest capture, or None."""
+        index = self.key_index.get(unique_key)
+        with self.lock:
+            if index is None or not self.latest_id[index]:
+                return None
+            return int(self.latest_id[index]), self.latest_hash[index].decode('ascii') or None, self.latest_path[index]
+
+    def cell(self, unique_key):
+        """Everything held for one key, as plain Python values; None for keys outside the grid."""
+        index = self.key_index.get(unique_key)
+        if index is None:
+            return None
+        with self.lock:
+            return {
+                'latestId': int(self.latest_id[index]) or None,
+                'previousId': int(self.previous_id[index]) or None,
+                'latestPath': self.latest_path[index],
+                'previousPath': self.previous_path[index],
+                'changeDetected': bool(self.change_detected[index]),
+                'needsComparison': bool(self.needs_comparison[index]),
+            }
+
+    def dirty_keys(self):
+        """Keys whose latest capture has not been compared yet."""
+        with self.lock:
+            return [self.unique_keys[index] for index in np.flatnonzero(self.needs_comparison).tolist()]
+
+    def latest_tiles(self, changed_only=False):
+        """Latest capture of every captured cell, in grid order, in ImageTile.to_dict field names."""
+        return self.tiles_at(np.arange(len(self.unique_keys)), changed_only=changed_only)
+
+    def tiles_at(self, indexes, changed_only=False, captured_since=None, limit=None):
+        """latest_tiles restricted to the given cell indexes (e.g. from SpatialIndex)."""
+        with self.lock:
+            indexes = np.asarray(indexes, dtype=np.int64)
+            mask = self.latest_id[indexes] > 0
+            if changed_only:
+                mask &= self.change_detected[indexes]
+            if captured_since is not None:
+                mask &= self.latest_time[indexes] >= np.datetime64(captured_since, 'us')
+            indexes = indexes[mask][:limit]
+            return [{
+                'id': tile_id,
+                'areaConfigId': self.area_config_id,
+                'uniqueKey': self.unique_keys[index],
+                'latitude': latitude,
+                'longitude': longitude,
+                'captureTime': capture_time.isoformat(),
+                'lastSeenTime': last_seen.isoformat() if last_seen else None,
+                'imagePath': self.latest_path[index],
+                'contentHash': content_hash.decode('ascii') or None,
+                'changeDetected': changed,
+                'previousId': previous_id or None,
+            } for index, tile_id, latitude, longitude, capture_time, last_seen, content_hash, changed, previous_id in zip(
+                indexes.tolist(), self.latest_id[indexes].tolist(), self.center_lats[indexes].tolist(),
+                self.center_lons[indexes].tolist(), self.latest_time[indexes].tolist(),
+                self.last_seen_time[indexes].tolist(), self.latest_hash[indexes].tolist(),
+                self.change_detected[indexes].tolist(), self.previous_id[indexes].tolist())]
+
+    def summary(self):
+        with self.lock:
+            captured = self.latest_id > 0
+            latest_capture = self.latest_time[captured].max() if captured.any() else None
+            return {
+                'areaConfigId': self.area_config_id,
+                'cells': len(self.unique_keys),
+                'capturedCells': int(captured.sum()),
+                'comparableCells': int((self.previous_id > 0).sum()),
+                'changedCells': int(self.change_detected.sum()),
+                'pendingComparison': int(self.needs_comparison.sum()),
+                'latestCaptureTime': latest_capture.item().isoformat() if latest_capture is not None else None,
+                'indexBytes': self.nbytes(),
+            }
+
+    def nbytes(self):
+        return int(sum(getattr(self, name).nbytes for name in (
+            'latest_id', 'previous_id', 'latest_time', 'previous_time', 'last_seen_time',
+            'latest_hash', 'previous_hash', 'latest_path', 'previous_path', 'change_detected',
+            'needs_comparison')))
+
+
+class TileStateIndex:
+    """
+    Process-wide registry of AreaTileState, one per AreaConfig.
+
+    Each area is loaded from the database once (at startup through warm_all, or lazily on
+    first use) and then kept current by the capture and comparison paths: refresh_keys
+    after new captures are committed, AreaTileState.record_seen for unchanged re-captures and
+    AreaTileState.record_comparison after comparison results are committed. The state is
+    rebuilt automatically when an area's grid geometry changes. Anything that rewrites
+    ImageTile rows behind those paths (compaction, retention) calls invalidate(), as does any
+    update or delete of the AreaConfig itself.
+    """
+
+    _areas = {}  # area_config_id -> AreaTileState
+    _lock = threading.Lock()
+
+    @staticmethod
+    def _load(area_config):
+        grid = ImageCaptureService.area_tile_grid(area_config)
+        state = AreaTileState(area_config.id, ImageCaptureService.area_unique_keys(area_config),
+                              grid['centerLats'], grid['centerLons'])
+        state.load_rows(TileQueryService.latest_capture_rows(area_config.id, depth=2))
+        return state
+
+    @staticmethod
+    def for_area(area_config):
+        """The area's state, loading it if it isn't in memory or its grid has changed."""
+        unique_keys = ImageCaptureService.area_unique_keys(area_config)
+        with TileStateIndex._lock:
+            state = TileStateIndex._areas.get(area_config.id)
+        if state is not None and (state.unique_keys is unique_keys or state.unique_keys == unique_keys):
+            return state
+
+        state = TileStateIndex._load(area_config)
+        with TileStateIndex._lock:
+            TileStateIndex._areas[area_config.id] = state
+        return state
+
+    @staticmethod
+    def for_area_id(area_config_id):
+        area_config = db.session.get(AreaConfig, area_config_id)
+        return TileStateIndex.for_area(area_config) if area_config else None
+
+    @staticmethod
+    def refresh_keys(area_config, unique_keys):
+        """Reloads the given keys' latest two captures, e.g. after new captures were committed."""
+        if not unique_keys:
+            return
+        state = TileStateIndex.for_area(area_config)
+        state.load_rows(TileQueryService.latest_capture_rows(area_config.id, depth=2, unique_keys=list(unique_keys)))
+
+    @staticmethod
+    def loaded(area_config_id):
+        """The area's state if it is already in memory, without touching the database."""
+        with TileStateIndex._lock:
+            return TileStateIndex._areas.get(area_config_id)
+
+    @staticmethod
+    def invalidate(area_config_id):
+        with TileStateIndex._lock:
+            TileStateIndex._areas.pop(area_config_id, None)
+
+    @staticmethod
+    def warm_all():
+        """Loads every area; call inside an app context at startup."""
+        for area_config in db.session.query(AreaConfig).order_by(AreaConfig.id).all():
+            state = TileStateIndex.for_area(area_config)
+            print(f"Tile state index warmed for AreaConfig ID {area_config.id}: {state.summary()}")
+
+
+@event.listens_for(AreaConfig, 'after_update')
+@event.listens_for(AreaConfig, 'after_delete')
+def _invalidate_area_config(mapper, connection, area_config):
+    TileStateIndex.invalidate(area_config.id)
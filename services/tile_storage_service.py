@@ -0,0 +1,194 @@
+import glob
+import hashlib
+import os
+import threading
+import time
+
+from sqlalchemy import or_
+
+from extensions import db  # Import db from extensions
+from entities.models import ImageTile, AlertSession, AlertDetail
+
+
+class TileStorageService:
+    """
+    Content-addressed storage for tile images.
+
+    Every distinct image is stored once under IMAGE_STORAGE_DIRECTORY/blobs/<h[:2]>/<h>.png,
+    where h is the SHA-1 of the downloaded bytes. ImageTile.image_path points at the blob
+    and ImageTile.content_hash records h, so any number of captures can share one file.
+
+    store_blob records when it reuses a blob while holding blob_lock, and retention only removes
+    blobs under the same lock once they were neither written nor reused within its grace period,
+    so a capture whose row hasn't committed yet never loses its file. Blob mtimes are left alone:
+    DecodedImageCache keys decoded images and their sidecars by them.
+    """
+
+    BLOB_DIRECTORY_NAME = 'blobs'
+    blob_lock = threading.Lock()  # Orders blob reuse against retention's removal
+    _reused_at = {}  # blob path -> time.time() of its last reuse in this process; guarded by blob_lock
+    _reuse_pruned_at = 0.0
+
+    @staticmethod
+    def content_hash(content):
+        return hashlib.sha1(content).hexdigest()
+
+    @staticmethod
+    def blob_directory(app_config):
+        return os.path.join(app_config['IMAGE_STORAGE_DIRECTORY'], TileStorageService.BLOB_DIRECTORY_NAME)
+
+    @staticmethod
+    def blob_path(content_hash, app_config):
+        return os.path.join(TileStorageService.blob_directory(app_config), content_hash[:2], f"{content_hash}.png")
+
+    @staticmethod
+    def store_blob(content, app_config):
+        """Writes the bytes once per unique hash. Returns (content_hash, blob_path)."""
+        content_hash = TileStorageService.content_hash(content)
+        path = TileStorageService.blob_path(content_hash, app_config)
+        with TileStorageService.blob_lock:
+            if os.path.exists(path):
+                TileStorageService._mark_reused(path, app_config)
+                return content_hash, path
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp_path = f"{path}.{os.getpid()}.{id(content)}.tmp"
+        with open(temp_path, 'wb') as f:
+            f.write(content)
+        os.replace(temp_path, path)  # Atomic, so concurrent writers of the same blob are harmless
+        return content_hash, path
+
+    @staticmethod
+    def _mark_reused(path, app_config):
+        """Records a reuse of the blob for retention's grace period. The caller holds blob_lock."""
+        now = time.time()
+        TileStorageService._reused_at[path] = now
+        grace_seconds = float(app_config.get('RETENTION_BLOB_GRACE_SECONDS', 3600))
+        if now - TileStorageService._reuse_pruned_at >= grace_seconds:  # Keeps the map to one grace period
+            TileStorageService._reused_at = {reused_path: reused_at for reused_path, reused_at
+                                             in TileStorageService._reused_at.items()
+                                             if reused_at >= now - grace_seconds}
+            TileStorageService._reuse_pruned_at = now
+
+    @staticmethod
+    def used_since(path, cutoff):
+        """Whether the blob was written or reused at or after cutoff (a time.time()). The caller holds blob_lock."""
+        if TileStorageService._reused_at.get(path, 0.0) >= cutoff:
+            return True
+        try:
+            return os.path.getmtime(path) >= cutoff
+        except OSError:
+            return False
+
+    @staticmethod
+    def _remove_file(path):
+        """Removes a legacy image and any decoded-image sidecars. Returns bytes freed."""
+        freed = 0
+        for candidate in [path] + glob.glob(f"{glob.escape(path)}.*.npy"):
+            try:
+                freed += os.path.getsize(candidate)
+                os.remove(candidate)
+            except OSError:
+                pass
+        return freed
+
+    @staticmethod
+    def _repoint_alert_details(area_config_id, legacy_paths, moved_paths):
+        """Points the area's AlertDetails at the blobs the given legacy files moved to. Doesn't commit."""
+        details = db.session.query(AlertDetail).join(
+            AlertSession, AlertDetail.alert_session_id == AlertSession.id).filter(
+            AlertSession.area_config_id == area_config_id,
+            or_(AlertDetail.previous_image_path.in_(legacy_paths), AlertDetail.current_image_path.in_(legacy_paths))
+        ).all()
+        for detail in details:
+            detail.previous_image_path = moved_paths.get(detail.previous_image_path, detail.previous_image_path)
+            detail.current_image_path = moved_paths.get(detail.current_image_path, detail.current_image_path)
+
+    @staticmethod
+    def compact_area(area_config_id, app_config, batch_size=500):
+        """
+        Migrates an area's legacy captured_images/<area_id>/*.png files into blob storage and
+        removes duplicate capture rows.
+
+        Pass 1 moves each file into its blob and repoints ImageTile and AlertDetail paths in one
+        commit per batch; legacy files are deleted only after that commit. Pass 2 collapses runs
+        of consecutive captures of the same unique_key with identical content into the first row
+        of the run, whose last_seen_time is bumped to the last duplicate. Rows referenced by an
+        AlertDetail are always kept.
+        """
+        stats = {'filesMigrated': 0, 'filesMissing': 0, 'rowsRemoved': 0, 'bytesReclaimed': 0}
+        blob_root = os.path.abspath(TileStorageService.blob_directory(app_config))
+        moved_paths = {}  # legacy path -> blob path
+        moved_hashes = {}  # legacy path -> content hash of its blob
+
+        # --- Pass 1: move files into blob storage ---
+        last_id = 0
+        while True:
+            tiles = db.session.query(ImageTile).filter(
+                ImageTile.area_config_id == area_config_id, ImageTile.id > last_id).order_by(
+                ImageTile.id).limit(batch_size).all()
+            if not tiles:
+                break
+            legacy_files = []
+            for tile in tiles:
+                last_id = tile.id
+                if os.path.abspath(tile.image_path).startswith(blob_root + os.sep):
+                    continue
+                if tile.image_path in moved_paths:  # Shared with a row moved earlier in this pass
+                    tile.content_hash = moved_hashes[tile.image_path]
+                    tile.image_path = moved_paths[tile.image_path]
+                    tile.last_seen_time = tile.last_seen_time or tile.capture_time
+                    continue
+                try:
+                    with open(tile.image_path, 'rb') as f:
+                        content = f.read()
+                except OSError:
+                    stats['filesMissing'] += 1
+                    continue
+                content_hash, blob_path = TileStorageService.store_blob(content, app_config)
+                moved_paths[tile.image_path] = blob_path
+                moved_hashes[tile.image_path] = content_hash
+                legacy_files.append(tile.image_path)
+                tile.image_path = blob_path
+                tile.content_hash = content_hash
+                tile.last_seen_time = tile.last_seen_time or tile.capture_time
+                stats['filesMigrated'] += 1
+            if legacy_files:
+                TileStorageService._repoint_alert_details(area_config_id, legacy_files, moved_paths)
+            db.session.commit()  # Tiles and alert details are repointed in the same transaction
+            # Only delete once every row pointing at the files points at the blobs instead
+            for legacy_file in legacy_files:
+                stats['bytesReclaimed'] += TileStorageService._remove_file(legacy_file)
+
+        # --- Pass 2: collapse consecutive duplicate captures ---
+        alerted_tile_ids = {row[0] for row in db.session.query(AlertDetail.image_tile_id).join(
+            ImageTile, AlertDetail.image_tile_id == ImageTile.id).filter(
+            ImageTile.area_config_id == area_config_id)}
+        rows = db.session.query(ImageTile.id, ImageTile.unique_key, ImageTile.capture_time,
+                                ImageTile.content_hash).filter(
+            ImageTile.area_config_id == area_config_id).order_by(
+            ImageTile.unique_key, ImageTile.capture_time, ImageTile.id).all()
+
+        ids_to_delete = []
+        last_seen_updates = {}  # kept tile id -> last duplicate capture_time
+        anchor = None
+        for tile_id, unique_key, capture_time, content_hash in rows:
+            is_duplicate = (anchor is not None and anchor[1] == unique_key and content_hash is not None
+                            and anchor[2] == content_hash and tile_id not in alerted_tile_ids)
+            if is_duplicate:
+                ids_to_delete.append(tile_id)
+                last_seen_updates[anchor[0]] = capture_time
+            else:
+                anchor = (tile_id, unique_key, content_hash)
+
+        for tile_id, last_seen_time in last_seen_updates.items():
+            db.session.query(ImageTile).filter(ImageTile.id == tile_id).update(
+                {'last_seen_time': last_seen_time}, synchronize_session=False)
+        for start in range(0, len(ids_to_delete), batch_size):
+            db.session.query(ImageTile).filter(ImageTile.id.in_(ids_to_delete[start:start + batch_size])).delete(
+                synchronize_session=False)
+        db.session.commit()
+        stats['rowsRemoved'] = len(ids_to_delete)
+
+        from services.tile_state_index import TileStateIndex  # Imported here: the index builds on this service
+        TileStateIndex.invalidate(area_config_id)  # Paths and ids changed behind the index
+        return stats
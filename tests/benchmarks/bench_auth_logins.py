@@ -0,0 +1,77 @@
+# Throughput and p50/p99 latency of N concurrent logins through /api/auth/login, on SQLite.
+# Usage, from the repository root: python3 -m tests.benchmarks.bench_auth_logins [logins] [bcrypt rounds]
+import sys
+import tempfile
+import threading
+import time
+
+from entities.models import User
+from extensions import bcrypt, db
+from routes.auth_routes import auth_bp
+from services.password_hashing_service import PasswordHashingService
+from tests.benchmarks.harness import sqlite_app
+
+SETTINGS = [
+    # (label, AUTH_HASH_MAX_WORKERS, AUTH_HASH_MAX_QUEUE)
+    ('one hash per request thread', None, 0),
+    ('2 workers, queue of 32', 2, 32),
+    ('2 workers, queue of 8', 2, 8),
+]
+
+
+def _percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def concurrent_logins(app, count):
+    """Starts count logins at once; returns (wall seconds, latencies of the 200s, status counts)."""
+    start = threading.Barrier(count + 1)
+    latencies, statuses = [], {}
+    lock = threading.Lock()
+
+    def login(index):
+        client = app.test_client()
+        start.wait()
+        started = time.perf_counter()
+        response = client.post('/api/auth/login', json={'email': f'user{index}@example.com', 'password': 'password'})
+        elapsed = time.perf_counter() - started
+        with lock:
+            statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+            if response.status_code == 200:
+                latencies.append(elapsed)
+
+    threads = [threading.Thread(target=login, args=(index,)) for index in range(count)]
+    for thread in threads:
+        thread.start()
+    start.wait()
+    started = time.perf_counter()
+    for thread in threads:
+        thread.join()
+    return time.perf_counter() - started, latencies, statuses
+
+
+def main(count, log_rounds):
+    with tempfile.TemporaryDirectory() as directory:
+        app = sqlite_app(directory, BCRYPT_LOG_ROUNDS=log_rounds)
+        bcrypt.init_app(app)
+        app.register_blueprint(auth_bp)
+        with app.app_context():
+            password_hash = bcrypt.generate_password_hash('password', log_rounds).decode('utf-8')
+            db.session.add_all([User(email=f'user{index}@example.com', profile='', password_hash=password_hash)
+                                for index in range(count)])
+            db.session.commit()
+
+        print(f"{count} concurrent logins, bcrypt cost {log_rounds}, SQLite")
+        print(f"  {'':<30} {'wall':>9} {'logins/s':>9} {'p50':>9} {'p99':>9}  statuses")
+        for label, max_workers, max_queue in SETTINGS:
+            app.config.update(AUTH_HASH_MAX_WORKERS=max_workers or count, AUTH_HASH_MAX_QUEUE=max_queue)
+            seconds, latencies, statuses = concurrent_logins(app, count)
+            p50, p99 = (_percentile(latencies, 0.5), _percentile(latencies, 0.99)) if latencies else (0.0, 0.0)
+            print(f"  {label:<30} {seconds * 1000:7.0f}ms {len(latencies) / seconds:9.1f} "
+                  f"{p50 * 1000:7.0f}ms {p99 * 1000:7.0f}ms  {dict(sorted(statuses.items()))}")
+        print(f"  hashing: {PasswordHashingService.stats()}")
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 64, int(sys.argv[2]) if len(sys.argv) > 2 else 10)
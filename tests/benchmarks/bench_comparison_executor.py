@@ -0,0 +1,42 @@
+# Comparison throughput of the ComparisonExecutor process pool against the serial path, on a
+# synthetic area of 1,000 tile pairs. The speed-up is bounded by the machine's core count.
+# Usage, from the repository root: python3 -m tests.benchmarks.bench_comparison_executor [pairs] [workers]
+import os
+import sys
+import tempfile
+from math import ceil
+
+from config import CONFIG_SETTINGS
+from services.comparison_executor import ComparisonExecutor
+from tests.benchmarks.harness import best_of, report
+from tests.image_pairs import VARIANTS, write_pair_corpus
+
+
+def synthetic_area(directory, count):
+    """count (previous_path, latest_path) pairs mixing unchanged, noisy and changed tiles."""
+    corpus = write_pair_corpus(directory, seeds=range(ceil(count / len(VARIANTS))))
+    return [(previous_path, latest_path) for _, _, previous_path, latest_path in corpus[:count]]
+
+
+def main(count, workers):
+    # No decoded-image cache or memo, so every run decodes and compares every pair
+    config = dict(CONFIG_SETTINGS, IMAGE_CACHE_BUDGET_MB=0, COMPARISON_MEMO_SIZE=0)
+    with tempfile.TemporaryDirectory() as directory:
+        pairs = synthetic_area(directory, count)
+        serial_seconds, serial = best_of(
+            lambda: ComparisonExecutor.compare_pairs(pairs, dict(config, COMPARISON_MAX_WORKERS=1)), repeat=1)
+        pooled_config = dict(config, COMPARISON_MAX_WORKERS=workers)
+        ComparisonExecutor.compare_pairs(pairs[:workers * 2], pooled_config)  # Starts the workers
+        pooled_seconds, pooled = best_of(lambda: ComparisonExecutor.compare_pairs(pairs, pooled_config), repeat=1)
+        ComparisonExecutor.shutdown()
+
+    assert pooled == serial, "pool results differ from the serial path"
+    report(f"Tile pair comparisons, {count} pairs, {os.cpu_count()} CPUs", [
+        ('serial (COMPARISON_MAX_WORKERS=1)', serial_seconds, count),
+        (f'process pool, {workers} workers', pooled_seconds, count),
+    ])
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 1000,
+         int(sys.argv[2]) if len(sys.argv) > 2 else max(2, (os.cpu_count() or 2) - 1))
@@ -0,0 +1,53 @@
+# Tile grid generation for a 100 km² area: the original per-cell loop against GeoUtils' vectorised grid.
+# Usage, from the repository root: python3 -m tests.benchmarks.bench_geo_utils [half_side_km]
+import sys
+from math import ceil
+
+from services.image_capture_service import ImageCaptureService
+from tests.benchmarks.harness import best_of, report
+from utils.geo_utils import GeoUtils
+
+TILE_SIZE_METERS = ImageCaptureService.TILE_SIZE_METERS
+
+
+def per_cell_loop(area_id, center_lat, center_lon, north_km, south_km, east_km, west_km):
+    """The original nested loop: one meters_to_*_degrees call pair and one key string per cell."""
+    bbox = GeoUtils.calculate_bounding_box(center_lat, center_lon, north_km, south_km, east_km, west_km)
+    num_rows = ceil((north_km + south_km) * 1000 / TILE_SIZE_METERS)
+    num_cols = ceil((east_km + west_km) * 1000 / TILE_SIZE_METERS)
+    cells = []
+    for i in range(int(num_rows)):
+        for j in range(int(num_cols)):
+            lat = bbox['minLat'] + GeoUtils.meters_to_latitude_degrees(i * TILE_SIZE_METERS + TILE_SIZE_METERS / 2.0)
+            lon = bbox['minLon'] + GeoUtils.meters_to_longitude_degrees(
+                j * TILE_SIZE_METERS + TILE_SIZE_METERS / 2.0, lat)
+            cells.append((lat, lon, f"{area_id}_{lat:.6f}_{lon:.6f}".replace('.', '_')))
+    return cells
+
+
+def vectorised(area_id, *area):
+    """GeoUtils.tile_grid without its memo, plus the unique_key strings."""
+    grid = GeoUtils.tile_grid.__wrapped__(*area, TILE_SIZE_METERS)
+    return [f"{area_id}_{lat:.6f}_{lon:.6f}".replace('.', '_')
+            for lat, lon in zip(grid['centerLats'].tolist(), grid['centerLons'].tolist())]
+
+
+def main(half_side_km):
+    area = (25.35, 74.63, half_side_km, half_side_km, half_side_km, half_side_km)
+    cells = len(per_cell_loop(7, *area))
+    assert vectorised(7, *area) == [cell[2] for cell in per_cell_loop(7, *area)]
+
+    GeoUtils.tile_grid(*area, TILE_SIZE_METERS)  # Fills the memo
+    report(f"Tile grid, {(2 * half_side_km) ** 2:g} km², {cells} cells", [
+        ('per-cell loop', best_of(lambda: per_cell_loop(7, *area), repeat=5)[0], cells),
+        ('vectorised grid + keys', best_of(lambda: vectorised(7, *area), repeat=5)[0], cells),
+        ('vectorised grid only', best_of(lambda: GeoUtils.tile_grid.__wrapped__(*area, TILE_SIZE_METERS),
+                                         repeat=5)[0], cells),
+        ('memoised grid', best_of(lambda: GeoUtils.tile_grid(*area, TILE_SIZE_METERS), repeat=5)[0], cells),
+        ('memoised keys (area_unique_keys)', best_of(lambda: ImageCaptureService._unique_keys(7, *area),
+                                                     repeat=5)[0], cells),
+    ])
+
+
+if __name__ == '__main__':
+    main(float(sys.argv[1]) if len(sys.argv) > 1 else 5.0)
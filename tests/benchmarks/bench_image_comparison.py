@@ -0,0 +1,49 @@
+# Per-pair cost of the comparison kernels: the legacy colour/contour pipeline against the fast
+# grayscale/connected-components kernel, at full and reduced decode resolution.
+# Usage, from the repository root: python3 -m tests.benchmarks.bench_image_comparison [seeds]
+import sys
+import tempfile
+
+from config import CONFIG_SETTINGS
+from services.decoded_image_cache import DecodedImageCache
+from services.image_comparison_service import ImageComparisonService
+from tests.benchmarks.harness import best_of, report
+from tests.image_pairs import write_pair_corpus
+
+KERNELS = [
+    ('legacy (BGR diff, contour loop)', {'COMPARISON_KERNEL': 'legacy'}),
+    ('fast (gray, components)', {'COMPARISON_KERNEL': 'fast', 'COMPARISON_DECODE_REDUCTION': 1}),
+    ('fast, 1/2 resolution decode', {'COMPARISON_KERNEL': 'fast', 'COMPARISON_DECODE_REDUCTION': 2}),
+]
+
+
+def compare_all(pairs, config, cold=True):
+    if cold:
+        DecodedImageCache._instance = None  # Each run decodes every image, as a first comparison would
+    return [ImageComparisonService.compare_with_kernel(previous_path, latest_path, config)
+            for previous_path, latest_path in pairs]
+
+
+def main(seeds):
+    with tempfile.TemporaryDirectory() as directory:
+        corpus = write_pair_corpus(directory, seeds=range(seeds))
+        pairs = [(previous_path, latest_path) for _, _, previous_path, latest_path in corpus]
+        cold_rows, warm_rows, decisions = [], [], {}
+        for label, overrides in KERNELS:
+            config = dict(CONFIG_SETTINGS, **overrides)
+            seconds, results = best_of(lambda: compare_all(pairs, config))
+            cold_rows.append((label, seconds, len(pairs)))
+            decisions[label] = [result['changed'] for result in results]
+            # Decoded images already cached: the diff, blur, threshold and region pass alone
+            warm_rows.append((label, best_of(lambda: compare_all(pairs, config, cold=False))[0], len(pairs)))
+
+    legacy = decisions[KERNELS[0][0]]
+    report(f"Comparison kernels, {len(pairs)} pairs, decoding included", cold_rows)
+    report(f"Comparison kernels, {len(pairs)} pairs, decoded images cached", warm_rows)
+    for label, changed in decisions.items():
+        disagreements = sum(a != b for a, b in zip(changed, legacy))
+        print(f"  {label:<34} {disagreements} change decision(s) differ from legacy")
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 20)
@@ -0,0 +1,73 @@
+# Rows/sec of the batched ImageTileWriter against one commit per row, on SQLite.
+# Usage, from the repository root: python3 -m tests.benchmarks.bench_image_tile_writer [rows]
+import sys
+import tempfile
+from datetime import datetime
+
+from entities.models import AreaConfig, ImageTile
+from extensions import db
+from services.image_tile_writer import ImageTileWriter
+from tests.benchmarks.harness import sqlite_app, best_of, report
+
+CAPTURED_AT = datetime(2026, 1, 1)
+
+
+def _rows(area_config_id, count):
+    return [(area_config_id, f'key_{index}', 25.0 + index * 1e-4, 74.0, CAPTURED_AT,
+             f'blobs/{index:040x}.png', f'{index:040x}') for index in range(count)]
+
+
+def commit_per_row(rows):
+    """The original capture path: add and commit every tile on its own."""
+    for area_config_id, unique_key, lat, lon, capture_time, image_path, content_hash in rows:
+        db.session.add(ImageTile(area_config_id=area_config_id, unique_key=unique_key, latitude=lat, longitude=lon,
+                                 capture_time=capture_time, image_path=image_path, content_hash=content_hash,
+                                 last_seen_time=capture_time, needs_comparison=True, status='CAPTURED'))
+        db.session.commit()
+
+
+def writer_fallback(rows, app_config):
+    """The writer's per-row fallback (a SAVEPOINT per row) inside one area commit."""
+    writer = ImageTileWriter(app_config)
+    writer._insert_rows_individually([
+        {'area_config_id': row[0], 'unique_key': row[1], 'latitude': row[2], 'longitude': row[3],
+         'capture_time': row[4], 'image_path': row[5], 'content_hash': row[6], 'last_seen_time': row[4],
+         'needs_comparison': True, 'status': 'CAPTURED'} for row in rows])
+    db.session.commit()
+
+
+def writer_bulk(rows, app_config):
+    writer = ImageTileWriter(app_config)
+    for row in rows:
+        writer.add(*row)
+    writer.commit()
+
+
+def main(count):
+    with tempfile.TemporaryDirectory() as directory:
+        app = sqlite_app(directory)
+        with app.app_context():
+            area_config = AreaConfig(name='benchmark', center_lat=25.35, center_lon=74.63, north_km=1, south_km=1,
+                                     east_km=1, west_km=1)
+            db.session.add(area_config)
+            db.session.commit()
+            rows = _rows(area_config.id, count)
+
+            def timed(write):
+                def run():
+                    write(rows)
+                    written = db.session.query(ImageTile).count()
+                    db.session.query(ImageTile).delete()
+                    db.session.commit()
+                    assert written == count
+                return best_of(run)[0]
+
+            report(f"ImageTile inserts, {count} rows, SQLite", [
+                ('commit per row', timed(commit_per_row), count),
+                ('per-row fallback, one commit', timed(lambda rows: writer_fallback(rows, app.config)), count),
+                ('ImageTileWriter bulk insert', timed(lambda rows: writer_bulk(rows, app.config)), count),
+            ])
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 2000)
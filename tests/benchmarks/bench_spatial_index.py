@@ -0,0 +1,83 @@
+# Point and box lookups over an area of ~100k captured tiles: SpatialIndex against a SQL range scan, on SQLite.
+# Usage, from the repository root: python3 -m tests.benchmarks.bench_spatial_index [half_km] [queries]
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+from entities.models import AreaConfig, ImageTile
+from extensions import db
+from services.image_capture_service import ImageCaptureService
+from services.spatial_index import SpatialIndex
+from services.tile_state_index import TileStateIndex
+from tests.benchmarks.harness import sqlite_app
+
+CAPTURED_AT = datetime(2026, 1, 1)
+BOX_DEGREES = 0.009  # About 1 km a side
+
+
+def sql_range_scan(min_lat, min_lon, max_lat, max_lon):
+    """Tiles whose centre lies within a tile's reach of the box, straight from image_tiles."""
+    reach = ImageCaptureService.TILE_SIZE_METERS / 2 / 111195 * 1.2
+    return db.session.query(ImageTile.id).filter(ImageTile.latitude.between(min_lat - reach, max_lat + reach),
+                                                 ImageTile.longitude.between(min_lon - reach, max_lon + reach)).all()
+
+
+def _timed_queries(lookup, boxes):
+    """Per-query seconds for each box, and the total number of tiles found."""
+    seconds, found = [], 0
+    for box in boxes:
+        started = time.perf_counter()
+        result = lookup(*box)
+        seconds.append(time.perf_counter() - started)
+        found += len(result)
+    return seconds, found
+
+
+def main(half_km, queries):
+    with tempfile.TemporaryDirectory() as directory:
+        app = sqlite_app(directory)
+        with app.app_context():
+            area_config = AreaConfig(name='benchmark', center_lat=25.35, center_lon=74.63, north_km=half_km,
+                                     south_km=half_km, east_km=half_km, west_km=half_km)
+            db.session.add(area_config)
+            db.session.commit()
+            grid = ImageCaptureService.area_tile_grid(area_config)
+            unique_keys = ImageCaptureService.area_unique_keys(area_config)
+            db.session.bulk_insert_mappings(ImageTile, [
+                {'area_config_id': area_config.id, 'unique_key': unique_key, 'latitude': lat, 'longitude': lon,
+                 'capture_time': CAPTURED_AT, 'image_path': f'{unique_key}.png', 'status': 'CAPTURED',
+                 'needs_comparison': False}
+                for unique_key, lat, lon in zip(unique_keys, grid['centerLats'].tolist(), grid['centerLons'].tolist())])
+            db.session.commit()
+
+            started = time.perf_counter()
+            SpatialIndex.mark_dirty()
+            SpatialIndex.snapshot()
+            TileStateIndex.for_area(area_config)
+            build_seconds = time.perf_counter() - started
+
+            bbox = grid['bbox']
+            rng = random.Random(1)
+            points = [(lat, lon, lat, lon) for lat, lon in (
+                (rng.uniform(bbox['minLat'], bbox['maxLat']), rng.uniform(bbox['minLon'], bbox['maxLon']))
+                for _ in range(queries))]
+            boxes = [(lat, lon, lat + BOX_DEGREES, lon + BOX_DEGREES) for lat, lon, _, _ in points]
+
+            print(f"{len(unique_keys)} captured tiles, {queries} queries each, SQLite")
+            print(f"  index build (areas + tile state)  {build_seconds * 1000:10.1f} ms")
+            for label, lookup, query_boxes in (
+                    ('point, SQL range scan', sql_range_scan, points),
+                    ('point, SpatialIndex', lambda *box: SpatialIndex.tiles_in_bbox(*box)[0], points),
+                    ('1 km box, SQL range scan', sql_range_scan, boxes),
+                    ('1 km box, SpatialIndex', lambda *box: SpatialIndex.tiles_in_bbox(*box)[0], boxes)):
+                seconds, found = _timed_queries(lookup, query_boxes)
+                seconds.sort()
+                print(f"  {label:<34} p50 {statistics.median(seconds) * 1000:8.3f} ms  "
+                      f"p99 {seconds[int(0.99 * (len(seconds) - 1))] * 1000:8.3f} ms  {found / queries:6.1f} tiles/query")
+
+
+if __name__ == '__main__':
+    main(float(sys.argv[1]) if len(sys.argv) > 1 else 37.4, int(sys.argv[2]) if len(sys.argv) > 2 else 500)
@@ -0,0 +1,39 @@
+import os
+import time
+
+from flask import Flask
+
+from config import CONFIG_SETTINGS
+from extensions import db
+
+
+def sqlite_app(directory, **overrides):
+    """An app on a fresh SQLite database under directory, with every table created."""
+    app = Flask('bhuprahari_benchmarks')
+    app.config.update(CONFIG_SETTINGS)
+    app.config.update(SQLALCHEMY_DATABASE_URI=f"sqlite:///{os.path.join(directory, 'benchmark.sqlite')}",
+                      IMAGE_STORAGE_DIRECTORY=os.path.join(directory, 'images'))
+    app.config.update(overrides)
+    db.init_app(app)
+    with app.app_context():
+        db.create_all()
+    return app
+
+
+def best_of(function, repeat=3):
+    """Fastest of `repeat` timed calls, in seconds, and the last call's return value."""
+    best, result = None, None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = function()
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def report(title, rows):
+    """Prints (label, seconds, items) rows with throughput and speed-up against the first row."""
+    print(title)
+    baseline = rows[0][1]
+    for label, seconds, items in rows:
+        print(f"  {label:<34} {seconds * 1000:10.1f} ms  {items / seconds:12.0f} /s  {baseline / seconds:6.1f}x")
@@ -0,0 +1,155 @@
+import contextlib
+import io
+
+import pytest
+from flask import Flask
+from sqlalchemy import event
+
+from config import CONFIG_SETTINGS
+from extensions import db, bcrypt
+from entities.models import AreaConfig, User
+from services.comparison_executor import ComparisonExecutor
+from services.decoded_image_cache import DecodedImageCache
+from services.image_capture_service import ImageCaptureService
+from services.monitoring_pipeline import MonitoringPipeline
+from services.spatial_index import SpatialIndex
+from services.tile_download_service import TileDownloadService
+from services.tile_response_cache import TileResponseCache
+from services.tile_state_index import TileStateIndex
+from services.tile_storage_service import TileStorageService
+from tests.image_pairs import write_pair_corpus
+from tests.stub_tile_server import StubTileServer
+from utils.jwt_utils import generate_jwt_token
+from utils.metrics import Metrics
+from utils.principal_cache import PrincipalCache
+
+
+@pytest.fixture
+def tile_server():
+    server = StubTileServer().start()
+    yield server
+    server.stop()
+
+
+def _reset_process_state():
+    """Process-wide caches and registries that would otherwise leak between tests."""
+    TileStateIndex._areas.clear()
+    TileDownloadService._in_flight.clear()
+    TileDownloadService._rate_limiters.clear()
+    TileDownloadService._host_semaphores.clear()
+    TileStorageService._reused_at.clear()
+    TileResponseCache._instance = None
+    DecodedImageCache._instance = None
+    with ComparisonExecutor._memo_lock:
+        ComparisonExecutor._memo.clear()
+    PrincipalCache._entries.clear()
+    SpatialIndex.mark_dirty()
+    MonitoringPipeline.last_run_timings.clear()
+    ImageCaptureService.TILE_GRID_MODE = 'area'
+    Metrics.configure(CONFIG_SETTINGS)
+
+
+def _transactional_sqlite(engine):
+    """
+    Makes pysqlite begin transactions itself, as MySQL does. Left to its own devices the
+    driver emits no BEGIN before a SAVEPOINT, so releasing a begin_nested() block commits.
+    """
+    @event.listens_for(engine, 'connect')
+    def _disable_driver_transactions(dbapi_connection, connection_record):
+        dbapi_connection.isolation_level = None
+
+    @event.listens_for(engine, 'begin')
+    def _begin(connection):
+        connection.exec_driver_sql('BEGIN')
+
+
+@pytest.fixture
+def make_app(tmp_path, tile_server):
+    """Builds an app on a fresh SQLite database and image directory, with config overrides."""
+    apps = []
+
+    def build(**overrides):
+        _reset_process_state()
+        app = Flask('bhuprahari_tests')
+        app.config.update(CONFIG_SETTINGS)
+        app.config.update(
+            TESTING=True,
+            SQLALCHEMY_DATABASE_URI=f"sqlite:///{tmp_path / 'test.sqlite'}",
+            IMAGE_STORAGE_DIRECTORY=str(tmp_path / 'images'),
+            Maps_STATIC_URL=tile_server.url,
+            CAPTURE_RATE_LIMIT_PER_SEC=0,
+            CAPTURE_BACKOFF_BASE_SECONDS=0.01,
+            COMPARISON_MAX_WORKERS=1,  # In-process; the pool has its own tests
+            BCRYPT_LOG_ROUNDS=4,
+        )
+        app.config.update(overrides)
+        ImageCaptureService.TILE_GRID_MODE = app.config['TILE_GRID_MODE']
+        Metrics.configure(app.config)
+        db.init_app(app)
+        bcrypt.init_app(app)
+
+        from routes.alert_routes import alert_bp
+        from routes.area_config_routes import area_config_bp
+        from routes.auth_routes import auth_bp
+        from routes.image_tiles import image_tiles_bp
+        from routes.metrics_routes import metrics_bp
+        from routes.monitor_routes import monitor_bp
+        from routes.mosaic_routes import mosaic_bp
+        from routes.spatial_routes import spatial_bp
+        for blueprint in (alert_bp, area_config_bp, auth_bp, image_tiles_bp, metrics_bp, monitor_bp, mosaic_bp,
+                          spatial_bp):
+            app.register_blueprint(blueprint)
+
+        with app.app_context():
+            _transactional_sqlite(db.engine)
+            db.create_all()
+        apps.append(app)
+        return app
+
+    yield build
+    for app in apps:
+        with app.app_context():
+            db.session.remove()
+            db.drop_all()
+    _reset_process_state()
+
+
+@pytest.fixture
+def app(make_app):
+    app = make_app()
+    with app.app_context():
+        yield app
+
+
+@pytest.fixture
+def make_area():
+    """Adds an AreaConfig; the default is a 3x3 grid of tiles."""
+    def build(name='area', center_lat=25.35, center_lon=74.63, half_km=0.3, **columns):
+        area_config = AreaConfig(name=name, center_lat=center_lat, center_lon=center_lon, north_km=half_km,
+                                 south_km=half_km, east_km=half_km, west_km=half_km, **columns)
+        db.session.add(area_config)
+        db.session.commit()
+        return area_config
+
+    return build
+
+
+@pytest.fixture
+def auth_headers(app):
+    user = User(email='tester@example.com', profile='')
+    user.set_password('password')
+    db.session.add(user)
+    db.session.commit()
+    return {'Authorization': f"Bearer {generate_jwt_token(user.id, 'access', app.config, user.password_version())}"}
+
+
+@pytest.fixture
+def quiet():
+    """Silences the services' progress prints inside a `with quiet():` block."""
+    return lambda: contextlib.redirect_stdout(io.StringIO())
+
+
+@pytest.fixture(scope='session')
+def pair_corpus(tmp_path_factory):
+    """Labelled (name, expected_changed, previous_path, latest_path) image pairs; see tests/image_pairs.py."""
+    return write_pair_corpus(str(tmp_path_factory.mktemp('pair_corpus')))
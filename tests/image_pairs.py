@@ -0,0 +1,58 @@
+import os
+
+import cv2
+import numpy as np
+
+from tests.stub_tile_server import tile_png
+
+
+def _base(seed, size=400):
+    return cv2.imdecode(np.frombuffer(tile_png(f'corpus-{seed}', size=size), np.uint8), cv2.IMREAD_COLOR)
+
+
+def _block(image, size, value=255, at=60):
+    changed = image.copy()
+    cv2.rectangle(changed, (at, at), (at + size - 1, at + size - 1), (value, value, value), -1)
+    return changed
+
+
+def _noise(image, sigma, seed):
+    noise = np.random.default_rng(seed).normal(0, sigma, image.shape)
+    return np.clip(image.astype(np.float64) + noise, 0, 255).astype(np.uint8)
+
+
+def _shifted_brightness(image, amount):
+    return cv2.add(image, np.full(image.shape, amount, dtype=np.uint8))
+
+
+# name -> (whether the legacy kernel reports the pair changed, edit applied to the latest image)
+VARIANTS = {
+    'identical': (False, lambda image, seed: image.copy()),
+    'sensor_noise': (False, lambda image, seed: _noise(image, 2.0, seed)),
+    'brightness_shift': (False, lambda image, seed: _shifted_brightness(image, 6)),
+    'jpeg_recompressed': (False, lambda image, seed: cv2.imdecode(
+        cv2.imencode('.jpg', image, [cv2.IMWRITE_JPEG_QUALITY, 85])[1], cv2.IMREAD_COLOR)),
+    'speck': (False, lambda image, seed: _block(image, 6)),
+    'small_building': (True, lambda image, seed: _block(image, 20)),
+    'new_building': (True, lambda image, seed: _block(image, 80)),
+    'cleared_plot': (True, lambda image, seed: _block(image, 150, value=0, at=120)),
+    'different_scene': (True, lambda image, seed: _base(seed + 1000)),
+}
+
+
+def write_pair_corpus(directory, seeds=(1, 2, 3)):
+    """
+    Writes (previous, latest) PNG pairs covering unchanged, noisy and changed tiles.
+    Returns [(name, expected_changed, previous_path, latest_path)].
+    """
+    os.makedirs(directory, exist_ok=True)
+    corpus = []
+    for seed in seeds:
+        base = _base(seed)
+        previous_path = os.path.join(directory, f'{seed}_previous.png')
+        cv2.imwrite(previous_path, base)
+        for name, (expected, edit) in VARIANTS.items():
+            latest_path = os.path.join(directory, f'{seed}_{name}.png')
+            cv2.imwrite(latest_path, edit(base, seed))
+            corpus.append((f'{name}_{seed}', expected, previous_path, latest_path))
+    return corpus
@@ -0,0 +1,123 @@
+import hashlib
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlsplit, parse_qs
+
+import cv2
+import numpy as np
+
+
+def tile_png(center, version=0, changed=False, size=400):
+    """Deterministic textured PNG for a tile centre; `changed` paints a white block onto it."""
+    seed = int.from_bytes(hashlib.sha1(center.encode('utf-8')).digest()[:4], 'big')
+    image = np.random.default_rng(seed).integers(0, 255, (size, size, 3), dtype=np.uint8)
+    image = cv2.GaussianBlur(image, (21, 21), 0)
+    image = cv2.normalize(image, None, 0, 255, cv2.NORM_MINMAX)  # Blurring leaves little contrast
+    if changed:
+        offset = 40 + 20 * (version % 5)
+        cv2.rectangle(image, (offset, offset), (offset + 120, offset + 120), (255, 255, 255), -1)
+    return cv2.imencode('.png', image)[1].tobytes()
+
+
+class StubTileServer:
+    """
+    Local stand-in for the Static Maps API, for pointing Maps_STATIC_URL at in tests.
+
+    Serves a deterministic PNG per `center` query parameter with an ETag, and answers
+    If-None-Match with 304. change(center) alters what a centre returns from then on.
+    fail_next(n, status) makes the next n requests fail with that status, and
+    unsolicited_304(n) answers the next n unconditional requests with a bare 304, as a
+    misbehaving intermediate cache would. Requests are counted by response status.
+    """
+
+    def __init__(self):
+        self.version = 0
+        self.changed_centers = set()
+        self.requests = []  # (center, status)
+        self._failures = []  # Statuses for the next requests
+        self._unsolicited_304 = 0
+        self._bodies = {}
+        self._lock = threading.Lock()
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                server._handle(self)
+
+        self._httpd = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+
+    @property
+    def url(self):
+        return f'http://127.0.0.1:{self._httpd.server_port}/staticmap'
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def change(self, center):
+        with self._lock:
+            self.version += 1
+            self.changed_centers.add(center)
+            self._bodies.pop(center, None)
+
+    def fail_next(self, count, status=503):
+        with self._lock:
+            self._failures.extend([status] * count)
+
+    def unsolicited_304(self, count=1):
+        with self._lock:
+            self._unsolicited_304 += count
+
+    def count(self, status=None):
+        with self._lock:
+            return sum(1 for _, code in self.requests if status is None or code == status)
+
+    def body(self, center):
+        with self._lock:
+            body = self._bodies.get(center)
+            if body is None:
+                body = self._bodies[center] = tile_png(center, self.version, center in self.changed_centers)
+            return body
+
+    def _handle(self, handler):
+        center = parse_qs(urlsplit(handler.path).query).get('center', [''])[0]
+        with self._lock:
+            failure = self._failures.pop(0) if self._failures else None
+            conditional = handler.headers.get('If-None-Match') is not None
+            bare_304 = self._unsolicited_304 > 0 and not conditional and \
+                'no-cache' not in (handler.headers.get('Cache-Control') or '')
+            if bare_304:
+                self._unsolicited_304 -= 1
+        if failure is not None:
+            self._respond(handler, center, failure)
+            return
+        if bare_304:
+            self._respond(handler, center, 304)
+            return
+
+        body = self.body(center)
+        etag = '"' + hashlib.sha1(body).hexdigest() + '"'
+        if handler.headers.get('If-None-Match') == etag:
+            self._respond(handler, center, 304, {'ETag': etag})
+            return
+        self._respond(handler, center, 200, {'ETag': etag, 'Content-Type': 'image/png'}, body)
+
+    def _respond(self, handler, center, status, headers=None, body=b''):
+        with self._lock:
+            self.requests.append((center, status))
+        handler.send_response(status)
+        for name, value in (headers or {}).items():
+            handler.send_header(name, value)
+        if status != 304:
+            handler.send_header('Content-Length', str(len(body)))
+        handler.end_headers()
+        if body:
+            handler.wfile.write(body)
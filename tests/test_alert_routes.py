@@ -0,0 +1,97 @@
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import event
+
+from entities.models import AlertSession, AlertDetail, ImageTile
+from extensions import db
+
+STARTED = datetime(2026, 3, 1)
+
+
+@contextmanager
+def count_queries():
+    """Collects the SELECT statements run while the block executes."""
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith('SELECT'):  # Not the BEGINs the test engine issues
+            statements.append(statement)
+
+    event.listen(db.engine, 'before_cursor_execute', record)
+    try:
+        yield statements
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', record)
+
+
+def _alert_session(area_config, detail_count, start_time=STARTED):
+    alert_session = AlertSession(area_config_id=area_config.id, status='COMPLETED_CHANGES_DETECTED',
+                                 start_time=start_time, total_changes_detected=detail_count)
+    db.session.add(alert_session)
+    for index in range(detail_count):
+        tile = ImageTile(area_config_id=area_config.id, unique_key=f'key_{index}', latitude=0.0, longitude=0.0,
+                         image_path=f'latest_{index}.png', status='CHANGED', capture_time=start_time,
+                         change_detected=True)
+        db.session.add(AlertDetail(alert_session=alert_session, image_tile=tile,
+                                   previous_image_path=f'previous_{index}.png', current_image_path=tile.image_path,
+                                   change_log={'changed': True, 'change_percent': 1.5}))
+    db.session.commit()
+    return alert_session.id
+
+
+def test_session_details_take_the_same_queries_however_many_tiles_changed(app, make_area, auth_headers):
+    area_config = make_area()
+    small, large = _alert_session(area_config, 2), _alert_session(area_config, 40)
+    client = app.test_client()
+    client.get('/api/alerts/sessions', headers=auth_headers)  # Caches the principal, so only the endpoint's queries count
+    db.session.remove()
+
+    counts, bodies = [], []
+    for session_id in (small, large):
+        with count_queries() as statements:
+            response = client.get(f'/api/alerts/sessions/{session_id}/details', headers=auth_headers)
+        assert response.status_code == 200
+        counts.append(len(statements))
+        bodies.append(response.get_json())
+
+    assert counts == [2, 2]  # The session, then its details joined to their tiles
+    assert len(bodies[1]['alert_details']) == 40
+    detail = bodies[1]['alert_details'][0]
+    assert detail['changeLog'] == {'changed': True, 'change_percent': 1.5}
+    assert detail['current_tile_info']['id'] == detail['imageTileId']
+
+
+def test_unknown_session_is_a_404(app, auth_headers):
+    response = app.test_client().get('/api/alerts/sessions/999/details', headers=auth_headers)
+
+    assert response.status_code == 404 and response.get_json() == {'message': 'Alert session not found'}
+
+
+def test_sessions_are_a_bare_array_unless_a_page_is_requested(app, make_area, auth_headers):
+    area_config = make_area()
+    session_ids = [_alert_session(area_config, 0, STARTED + timedelta(hours=index // 2)) for index in range(7)]
+    client = app.test_client()
+    everything = client.get('/api/alerts/sessions', headers=auth_headers).get_json()
+
+    pages, cursor = [], None
+    while True:
+        query = {'limit': 3, **({'cursor': cursor} if cursor else {})}
+        body = client.get('/api/alerts/sessions', headers=auth_headers, query_string=query).get_json()
+        pages.append([alert_session['id'] for alert_session in body['sessions']])
+        cursor = body['nextCursor']
+        if cursor is None:
+            break
+
+    assert [alert_session['id'] for alert_session in everything] == sorted(
+        session_ids, key=lambda session_id: ((session_id - 1) // 2, session_id), reverse=True)
+    assert [session_id for page in pages for session_id in page] == [alert_session['id'] for alert_session in everything]
+    assert [len(page) for page in pages] == [3, 3, 1]
+
+
+@pytest.mark.parametrize('params', [{'cursor': 'bogus'}, {'area_config_id': 'x'}])
+def test_bad_session_parameters_are_rejected(app, auth_headers, params):
+    response = app.test_client().get('/api/alerts/sessions', headers=auth_headers, query_string=params)
+
+    assert response.status_code == 400
@@ -0,0 +1,171 @@
+import threading
+import time
+from datetime import datetime, timedelta
+
+import pytest
+
+import mschedule
+from services.area_job_queue import AreaJobQueue
+
+
+@pytest.fixture
+def job_queue():
+    """A started queue whose jobs block until released, recording the areas they ran for."""
+    release = threading.Event()
+    ran = []
+
+    def handler(area_config_id):
+        ran.append(area_config_id)
+        release.wait(timeout=5)
+
+    queue = AreaJobQueue(handler, max_workers=2, max_queue_size=3)
+    queue.start()
+    yield queue, release, ran
+    release.set()
+    queue.stop()
+
+
+def _wait_until(condition, timeout=5.0):
+    deadline = time.time() + timeout
+    while not condition():
+        assert time.time() < deadline, 'timed out'
+        time.sleep(0.01)
+
+
+def test_an_area_is_not_queued_again_while_queued_or_running(job_queue):
+    queue, release, ran = job_queue
+    assert queue.enqueue(1)
+    _wait_until(lambda: '1' in queue.metrics()['running'])
+
+    assert not queue.enqueue(1)  # Running
+    assert queue.enqueue(2, delay_seconds=60)
+    assert not queue.enqueue(2)  # Queued
+    assert not queue.enqueue(1, handler=lambda area_config_id: None)  # Manual runs are held to the same rule
+
+    release.set()
+    _wait_until(lambda: queue.metrics()['completed'] == 1)
+    assert queue.enqueue(1)
+    _wait_until(lambda: queue.metrics()['completed'] == 2)
+
+    metrics = queue.metrics()
+    assert ran == [1, 1]
+    assert metrics['enqueued'] == 3 and metrics['skippedOverlap'] == 3
+    assert metrics['queueDepth'] == 1  # Area 2 still waiting for its not-before time
+
+
+def test_a_full_queue_rejects_new_areas():
+    queue = AreaJobQueue(lambda area_config_id: None, max_queue_size=2)  # Not started, so nothing is taken off
+    assert queue.enqueue(1) and queue.enqueue(2)
+    assert not queue.enqueue(3)
+    assert queue.metrics()['rejectedFull'] == 1 and queue.metrics()['queueDepth'] == 2
+
+
+def test_jobs_do_not_start_before_their_delay(job_queue):
+    queue, release, ran = job_queue
+    release.set()
+    queue.enqueue(1, delay_seconds=0.3)
+    time.sleep(0.15)
+    assert ran == []
+    _wait_until(lambda: ran == [1])
+    assert queue.metrics()['lastLagSeconds'] < 0.2
+
+
+@pytest.fixture
+def sweep_queue(monkeypatch):
+    """An unstarted queue for the scheduler sweep, so its jobs stay queued for inspection."""
+    queue = AreaJobQueue(lambda area_config_id: None)
+    monkeypatch.setattr(mschedule, 'area_job_queue', queue)
+    monkeypatch.setattr(mschedule, 'last_dispatch_times', {})
+    return queue
+
+
+def _queued_offsets(queue):
+    """Area id -> seconds after the first queued job that it may start."""
+    first = min(not_before for not_before, *_ in queue._heap)
+    return {area_config_id: not_before - first for not_before, _, area_config_id, _ in queue._heap}
+
+
+def test_sweep_staggers_area_starts_across_the_window(make_app, make_area, sweep_queue, quiet):
+    app = make_app(AREA_STAGGER_WINDOW_SECONDS=120)
+    with app.app_context():
+        area_ids = [make_area(name=f'area {index}').id for index in range(4)]
+    with quiet():
+        mschedule.scheduled_image_monitoring(app)
+
+    offsets = _queued_offsets(sweep_queue)
+    assert offsets == {area_id: pytest.approx(30.0 * index, abs=0.5) for index, area_id in enumerate(area_ids)}
+
+    with quiet():
+        mschedule.scheduled_image_monitoring(app)  # Every area is still queued
+    assert sweep_queue.metrics()['enqueued'] == 4 and sweep_queue.metrics()['skippedOverlap'] == 4
+
+
+def test_sweep_skips_areas_whose_interval_has_not_passed(make_app, make_area, sweep_queue, quiet):
+    app = make_app(AREA_STAGGER_WINDOW_SECONDS=0)
+    with app.app_context():
+        hourly_id = make_area(name='hourly', monitor_interval_minutes=60).id
+        every_sweep_id = make_area(name='every sweep').id
+    with quiet():
+        mschedule.scheduled_image_monitoring(app)
+    sweep_queue._heap.clear()
+    sweep_queue._queued.clear()
+
+    with quiet():
+        mschedule.scheduled_image_monitoring(app)
+    assert [area_config_id for *_, area_config_id, _ in sweep_queue._heap] == [every_sweep_id]
+    assert hourly_id in mschedule.last_dispatch_times
+
+
+def _fire_times(cron_expression, start, count=3):
+    trigger = mschedule.cron_trigger_from_expression(cron_expression)
+    fire_times, previous = [], None
+    now = start.replace(tzinfo=trigger.timezone)
+    for _ in range(count):
+        previous = trigger.get_next_fire_time(previous, now)
+        fire_times.append(previous.replace(tzinfo=None))
+        now = previous + timedelta(seconds=1)
+    return fire_times
+
+
+@pytest.mark.parametrize('cron_expression, start, expected', [
+    # config.py's SCHEDULING_CRON_EXPRESSION, at second 0 of every fifth minute
+    ('0 */5 * * * ?', datetime(2026, 3, 1, 12, 1, 30),
+     [datetime(2026, 3, 1, 12, 5), datetime(2026, 3, 1, 12, 10), datetime(2026, 3, 1, 12, 15)]),
+    # The fortnightly alternative noted next to it: midnight on days 1, 16 and 31
+    ('0 0 0 */15 * ?', datetime(2026, 3, 2),
+     [datetime(2026, 3, 16), datetime(2026, 3, 31), datetime(2026, 4, 1)]),
+    # Quartz numbers days from 1 = Sunday, so 2-6 is Monday to Friday
+    ('0 30 9 ? * 2-6', datetime(2026, 3, 6, 10),  # A Friday
+     [datetime(2026, 3, 9, 9, 30), datetime(2026, 3, 10, 9, 30), datetime(2026, 3, 11, 9, 30)]),
+    ('0 0 6 ? * 1 2026', datetime(2026, 12, 20, 7),
+     [datetime(2026, 12, 27, 6)]),
+    # Standard 5-field crontabs are passed through
+    ('*/5 * * * *', datetime(2026, 3, 1, 12, 1, 30),
+     [datetime(2026, 3, 1, 12, 5), datetime(2026, 3, 1, 12, 10), datetime(2026, 3, 1, 12, 15)]),
+])
+def test_cron_expressions_fire_when_quartz_would(cron_expression, start, expected):
+    assert _fire_times(cron_expression, start, len(expected)) == expected
+
+
+def test_unsupported_cron_expressions_are_rejected():
+    with pytest.raises(ValueError):
+        mschedule.cron_trigger_from_expression('0 */5 * *')
+
+
+@pytest.mark.parametrize('cron_expression, field', [
+    ('0 0 0 L * ?', 'day-of-month'),  # Last day of the month
+    ('0 0 0 L-3 * ?', 'day-of-month'),
+    ('0 0 0 LW * ?', 'day-of-month'),  # Last weekday of the month
+    ('0 0 0 15W * ?', 'day-of-month'),  # Weekday nearest the 15th
+    ('0 0 0 ? * 6L', 'day-of-week'),  # Last Friday of the month
+    ('0 0 0 ? * 6#3', 'day-of-week'),  # Third Friday of the month
+    ('0 0 0 ? * FRI#3 2027', 'day-of-week'),
+])
+def test_quartz_day_fields_without_an_equivalent_are_rejected(cron_expression, field):
+    with pytest.raises(ValueError, match=f'not supported in the {field} field'):
+        mschedule.cron_trigger_from_expression(cron_expression)
+
+
+def test_quartz_day_names_are_not_mistaken_for_unsupported_syntax():
+    assert _fire_times('0 0 9 ? * WED,sat', datetime(2026, 1, 1), 2) == [datetime(2026, 1, 3, 9),
+                                                                         datetime(2026, 1, 7, 9)]
@@ -0,0 +1,84 @@
+import threading
+import time
+
+import pytest
+
+from entities.models import User
+from extensions import db
+from services.password_hashing_service import PasswordHashingService
+from utils.jwt_utils import decode_jwt_token
+
+
+@pytest.fixture
+def make_user(app):
+    def build(email='tester@example.com', password='password', log_rounds=4):
+        user = User(email=email, profile='')
+        user.set_password(password, log_rounds)
+        db.session.add(user)
+        db.session.commit()
+        return user.id
+
+    return build
+
+
+def _login(app, email='tester@example.com', password='password'):
+    return app.test_client().post('/api/auth/login', json={'email': email, 'password': password})
+
+
+def test_login_returns_tokens_for_the_right_password(app, make_user):
+    user_id = make_user()
+
+    response = _login(app)
+    assert response.status_code == 200
+    body = response.get_json()
+    assert body['user']['id'] == user_id
+    assert decode_jwt_token(body['access_token'], app.config)['type'] == 'access'
+    assert decode_jwt_token(body['refresh_token'], app.config)['type'] == 'refresh'
+
+    assert _login(app, password='wrong').status_code == 401
+    assert _login(app, email='nobody@example.com').status_code == 401
+
+
+def test_login_rehashes_with_the_configured_cost(make_app, make_user):
+    app = make_app(BCRYPT_LOG_ROUNDS=5)
+    with app.app_context():
+        user_id = make_user(log_rounds=4)
+        assert db.session.get(User, user_id).password_hash.startswith('$2b$04$')
+
+        assert _login(app).status_code == 200
+        db.session.expire_all()
+        password_hash = db.session.get(User, user_id).password_hash
+        assert password_hash.startswith('$2b$05$')
+
+        assert _login(app).status_code == 200  # Verified against the new hash, which is kept
+        db.session.expire_all()
+        assert db.session.get(User, user_id).password_hash == password_hash
+
+
+def test_logins_beyond_the_hashing_capacity_get_429_with_retry_after(make_app, make_user):
+    app = make_app(AUTH_HASH_MAX_WORKERS=1, AUTH_HASH_MAX_QUEUE=1)
+    release = threading.Event()
+    # Two hashes that hold the only worker and the only queue slot until released
+    holders = [threading.Thread(target=PasswordHashingService._run, args=(release.wait, app.config, 5))
+               for _ in range(2)]
+    with app.app_context():
+        make_user()
+        for holder in holders:
+            holder.start()
+        deadline = time.time() + 5
+        while PasswordHashingService.stats()['inFlight'] < 2:
+            assert time.time() < deadline, 'timed out'
+            time.sleep(0.01)
+
+        try:
+            rejected_before = PasswordHashingService.stats()['rejected']
+            response = _login(app)
+            assert response.status_code == 429
+            assert int(response.headers['Retry-After']) >= 1
+            assert PasswordHashingService.stats()['rejected'] == rejected_before + 1
+        finally:
+            release.set()
+            for holder in holders:
+                holder.join()
+
+        assert _login(app).status_code == 200  # Admitted again once the backlog drains
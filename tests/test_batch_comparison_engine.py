@@ -0,0 +1,53 @@
+import pytest
+
+from config import CONFIG_SETTINGS
+from services.batch_comparison_engine import BatchComparisonEngine
+from services.decoded_image_cache import DecodedImageCache
+from services.image_comparison_service import ImageComparisonService
+
+CONFIGS = {
+    'legacy': {},
+    'fast': {'COMPARISON_KERNEL': 'fast'},
+    'fast_reduced': {'COMPARISON_KERNEL': 'fast', 'COMPARISON_DECODE_REDUCTION': 2},
+    'memmap': {'COMPARISON_BATCH_MEMMAP': True},
+    'dhash_gate': {'COMPARISON_DHASH_MAX_DISTANCE': 2},
+    'no_prefilter': {'COMPARISON_PREFILTER_ENABLED': False, 'COMPARISON_DHASH_MAX_DISTANCE': 2},
+    'strict_area': {'COMPARISON_PIXEL_THRESHOLD': 15, 'COMPARISON_MIN_REGION_AREA': 20,
+                    'COMPARISON_CHANGE_PERCENT_THRESHOLD': 0.01},
+}
+
+
+@pytest.fixture(autouse=True)
+def fresh_image_cache():
+    DecodedImageCache._instance = None
+    yield
+    DecodedImageCache._instance = None
+
+
+def _per_tile(previous_path, latest_path, config):
+    """What a comparison worker returns for one pair (services.comparison_executor._compare_pair)."""
+    if config.get('COMPARISON_PREFILTER_ENABLED', True):
+        return ImageComparisonService.compare_images_tiered(previous_path, latest_path, config)
+    return ImageComparisonService.compare_with_kernel(previous_path, latest_path, config)
+
+
+@pytest.mark.parametrize('name', list(CONFIGS))
+def test_batch_engine_matches_the_per_tile_path(tmp_path, pair_corpus, name, quiet):
+    config = dict(CONFIG_SETTINGS, COMPARISON_BATCH_SIZE=5, **CONFIGS[name])  # Batches end mid-corpus
+    pairs = [(previous_path, latest_path) for _, _, previous_path, latest_path in pair_corpus]
+    pairs.insert(3, (pairs[0][0], str(tmp_path / 'missing.png')))
+
+    with quiet():
+        expected = [_per_tile(previous_path, latest_path, config) for previous_path, latest_path in pairs]
+        batched = BatchComparisonEngine.compare_pairs(pairs, config)
+
+    for pair, batch_result, tile_result in zip(pairs, batched, expected):
+        assert {key: value for key, value in batch_result.items() if key != 'tier'} == \
+            {key: value for key, value in tile_result.items() if key != 'tier'}, pair
+        if 'tier' in tile_result:
+            assert batch_result['tier'] == tile_result['tier'], pair
+    assert len(batched) == len(pairs)
+
+
+def test_empty_input():
+    assert BatchComparisonEngine.compare_pairs([], dict(CONFIG_SETTINGS)) == []
@@ -0,0 +1,91 @@
+import multiprocessing
+import os
+
+import pytest
+
+from config import CONFIG_SETTINGS
+from services import comparison_executor
+from services.comparison_executor import ComparisonExecutor
+
+
+def _config(**overrides):
+    return dict(CONFIG_SETTINGS, **overrides)
+
+
+@pytest.fixture(autouse=True)
+def fresh_executor():
+    ComparisonExecutor.shutdown()
+    with ComparisonExecutor._memo_lock:
+        ComparisonExecutor._memo.clear()
+    yield
+    ComparisonExecutor.shutdown()
+
+
+def _pairs(pair_corpus):
+    return [(previous_path, latest_path) for _, _, previous_path, latest_path in pair_corpus]
+
+
+def test_pool_results_match_the_serial_path(pair_corpus):
+    serial = ComparisonExecutor.compare_pairs(_pairs(pair_corpus), _config(COMPARISON_MAX_WORKERS=1,
+                                                                           COMPARISON_MEMO_SIZE=0))
+    pooled = ComparisonExecutor.compare_pairs(_pairs(pair_corpus), _config(COMPARISON_MAX_WORKERS=2,
+                                                                           COMPARISON_CHUNK_SIZE=4,
+                                                                           COMPARISON_MEMO_SIZE=0))
+
+    assert pooled == serial
+    assert [result['changed'] for result in serial] == [expected for _, expected, _, _ in pair_corpus]
+    assert any(pid != os.getpid() for pid in ComparisonExecutor._cache_stats_by_pid)
+
+
+def test_submitted_pairs_match_the_serial_path(pair_corpus):
+    serial = ComparisonExecutor.compare_pairs(_pairs(pair_corpus), _config(COMPARISON_MAX_WORKERS=1,
+                                                                           COMPARISON_MEMO_SIZE=0))
+    config = _config(COMPARISON_MAX_WORKERS=2, COMPARISON_MEMO_SIZE=0)
+    futures = [ComparisonExecutor.submit_pair(pair, config) for pair in _pairs(pair_corpus)]
+
+    assert [ComparisonExecutor.result_of(future) for future in futures] == serial
+
+
+def test_memo_serves_repeated_pairs_with_the_same_result(pair_corpus):
+    config = _config(COMPARISON_MAX_WORKERS=1)
+    pairs = _pairs(pair_corpus)
+    first = ComparisonExecutor.compare_pairs(pairs, config)
+    before = ComparisonExecutor.memo_stats()
+    second = ComparisonExecutor.compare_pairs(pairs, config)
+    reused = ComparisonExecutor.submit_pair(pairs[0], config)
+
+    assert second == first
+    assert ComparisonExecutor.result_of(reused) == first[0] and reused.reused
+    assert ComparisonExecutor.memo_stats()['hits'] - before['hits'] == len(pairs) + 1
+
+
+def test_memo_is_keyed_by_comparison_config(pair_corpus):
+    pair = _pairs(pair_corpus)[0]
+    ComparisonExecutor.compare_pairs([pair], _config(COMPARISON_MAX_WORKERS=1))
+    future = ComparisonExecutor.submit_pair(pair, _config(COMPARISON_MAX_WORKERS=1, COMPARISON_KERNEL='fast'))
+
+    assert not future.reused
+
+
+def test_failed_comparisons_are_not_memoized(tmp_path, pair_corpus, quiet):
+    config = _config(COMPARISON_MAX_WORKERS=1)
+    pair = (_pairs(pair_corpus)[0][0], str(tmp_path / 'missing.png'))
+    with quiet():
+        [result] = ComparisonExecutor.compare_pairs([pair], config)
+
+    assert result['error']
+    assert ComparisonExecutor.memo_stats()['entries'] == 0
+
+
+def test_workers_are_spawned_where_there_is_no_fork_server(monkeypatch):
+    get_context = multiprocessing.get_context
+
+    def no_forkserver(method=None):
+        if method == 'forkserver':
+            raise ValueError("cannot find context for 'forkserver'")
+        return get_context(method)
+
+    monkeypatch.setattr(comparison_executor, '_MP_CONTEXT', None)
+    monkeypatch.setattr(multiprocessing, 'get_context', no_forkserver)
+
+    assert comparison_executor._mp_context().get_start_method() == 'spawn'
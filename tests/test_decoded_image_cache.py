@@ -0,0 +1,92 @@
+import os
+
+import cv2
+import numpy as np
+import pytest
+
+from config import CONFIG_SETTINGS
+from services import comparison_executor
+from services.decoded_image_cache import DecodedImageCache
+
+SIZE = (64, 64)
+
+
+@pytest.fixture
+def images(tmp_path):
+    """Four distinct 64x64 PNGs."""
+    paths = []
+    for index in range(4):
+        image = np.full((SIZE[1], SIZE[0], 3), index * 60, dtype=np.uint8)
+        path = str(tmp_path / f'tile_{index}.png')
+        cv2.imwrite(path, image)
+        paths.append(path)
+    return paths
+
+
+def test_counters_track_hits_and_misses(images):
+    cache = DecodedImageCache(budget_mb=1)
+    first = cache.get(images[0], SIZE)
+    assert cache.get(images[0], SIZE) is first  # The same read-only array
+    assert not first.flags.writeable
+    cache.get(images[0], SIZE, grayscale=True)  # Another mode is another entry
+    cache.get(images[1], SIZE)
+    assert cache.get(str(images[0]) + '.missing', SIZE) is None
+
+    stats = cache.stats()
+    assert (stats['hits'], stats['misses'], stats['evictions'], stats['entries']) == (1, 3, 0, 3)
+    assert stats['bytes'] == 2 * first.nbytes + first.nbytes // 3
+
+
+def test_least_recently_used_entries_are_evicted_over_budget(images):
+    image_bytes = SIZE[0] * SIZE[1] * 3
+    cache = DecodedImageCache(budget_mb=2.5 * image_bytes / (1024 * 1024))  # Room for two images
+    cache.get(images[0], SIZE)
+    cache.get(images[1], SIZE)
+    cache.get(images[0], SIZE)  # Now the most recently used
+    cache.get(images[2], SIZE)  # Evicts images[1]
+
+    assert cache.stats()['evictions'] == 1 and cache.stats()['bytes'] == 2 * image_bytes
+    cache.get(images[0], SIZE)
+    assert cache.stats()['hits'] == 2
+    cache.get(images[1], SIZE)
+    assert cache.stats()['misses'] == 4 and cache.stats()['evictions'] == 2
+
+    tiny = DecodedImageCache(budget_mb=image_bytes / 2 / (1024 * 1024))
+    tiny.get(images[0], SIZE)
+    assert tiny.stats()['entries'] == 0 and tiny.stats()['evictions'] == 0  # Larger than the budget: not kept
+
+
+def test_rewritten_files_are_decoded_again(images):
+    cache = DecodedImageCache()
+    before = cache.get(images[0], SIZE)
+    cv2.imwrite(images[0], np.full((SIZE[1], SIZE[0], 3), 255, dtype=np.uint8))
+    os.utime(images[0], ns=(os.stat(images[0]).st_mtime_ns + 10 ** 9,) * 2)
+
+    after = cache.get(images[0], SIZE)
+    assert after is not before and after.min() == 255
+    assert cache.stats()['misses'] == 2
+
+
+def test_sidecars_are_shared_with_other_caches(images):
+    writer = DecodedImageCache(sidecar_enabled=True)
+    decoded = writer.get(images[0], SIZE, grayscale=True, reduction=2)
+    sidecar = DecodedImageCache.sidecar_path(images[0], SIZE, True, 2)
+    assert os.path.exists(sidecar) and writer.stats()['sidecarHits'] == 0
+
+    reader = DecodedImageCache(sidecar_enabled=True)  # E.g. another worker process
+    mapped = reader.get(images[0], SIZE, grayscale=True, reduction=2)
+    assert isinstance(mapped, np.memmap) and np.array_equal(mapped, decoded)
+    assert reader.stats()['sidecarHits'] == 1 and reader.stats()['misses'] == 1
+
+    os.utime(images[0], ns=(os.stat(sidecar).st_mtime_ns + 10 ** 9,) * 2)  # Image newer than its sidecar
+    assert not isinstance(DecodedImageCache(sidecar_enabled=True).get(images[0], SIZE, True, 2), np.memmap)
+
+    DecodedImageCache().get(images[1], SIZE)
+    assert not os.path.exists(DecodedImageCache.sidecar_path(images[1], SIZE, False))
+
+
+@pytest.mark.parametrize('configured, workers, expected', [
+    (None, 1, False), (None, 4, True), (False, 4, False), (True, 1, True)])
+def test_sidecars_default_to_on_for_the_worker_pool(configured, workers, expected):
+    config = dict(CONFIG_SETTINGS, IMAGE_CACHE_NPY_SIDECAR=configured, COMPARISON_MAX_WORKERS=workers)
+    assert comparison_executor._worker_config(config)['IMAGE_CACHE_NPY_SIDECAR'] is expected
@@ -0,0 +1,75 @@
+from math import ceil
+
+import numpy as np
+import pytest
+
+from utils.geo_utils import GeoUtils
+
+TILE_SIZE_METERS = 236.0
+
+AREAS = [
+    # center_lat, center_lon, north_km, south_km, east_km, west_km
+    (25.35, 74.63, 0.3, 0.3, 0.3, 0.3),
+    (25.35, 74.63, 1.7, 0.4, 2.25, 0.05),  # Lopsided, not a whole number of tiles
+    (-33.9, 151.2, 3.0, 3.0, 3.0, 3.0),
+    (64.1, -21.9, 2.0, 2.0, 5.0, 5.0),  # Longitude degrees shrink quickly this far north
+    (25.35, 74.63, 5.0, 5.0, 5.0, 5.0),  # 100 km², the size the grid benchmark uses
+]
+
+
+def _per_cell_loop(area_id, center_lat, center_lon, north_km, south_km, east_km, west_km):
+    """The original nested loop: one meters_to_*_degrees call pair per cell."""
+    bbox = GeoUtils.calculate_bounding_box(center_lat, center_lon, north_km, south_km, east_km, west_km)
+    num_rows = ceil((north_km + south_km) * 1000 / TILE_SIZE_METERS)
+    num_cols = ceil((east_km + west_km) * 1000 / TILE_SIZE_METERS)
+    cells = []
+    for i in range(int(num_rows)):
+        for j in range(int(num_cols)):
+            lat = bbox['minLat'] + GeoUtils.meters_to_latitude_degrees(i * TILE_SIZE_METERS + TILE_SIZE_METERS / 2.0)
+            lon = bbox['minLon'] + GeoUtils.meters_to_longitude_degrees(
+                j * TILE_SIZE_METERS + TILE_SIZE_METERS / 2.0, lat)
+            cells.append((i, j, lat, lon, f"{area_id}_{lat:.6f}_{lon:.6f}".replace('.', '_')))
+    return num_rows, num_cols, cells
+
+
+@pytest.mark.parametrize('area', AREAS)
+def test_tile_grid_matches_the_per_cell_loop(area):
+    num_rows, num_cols, cells = _per_cell_loop(7, *area)
+    grid = GeoUtils.tile_grid(*area, TILE_SIZE_METERS)
+
+    assert (grid['rows'], grid['cols']) == (num_rows, num_cols)
+    assert grid['rowIndex'].tolist() == [cell[0] for cell in cells]
+    assert grid['colIndex'].tolist() == [cell[1] for cell in cells]
+    np.testing.assert_allclose(grid['centerLats'], [cell[2] for cell in cells], rtol=0, atol=1e-9)
+    np.testing.assert_allclose(grid['centerLons'], [cell[3] for cell in cells], rtol=0, atol=1e-9)
+    keys = [f"7_{lat:.6f}_{lon:.6f}".replace('.', '_')
+            for lat, lon in zip(grid['centerLats'].tolist(), grid['centerLons'].tolist())]
+    assert keys == [cell[4] for cell in cells]
+
+
+@pytest.mark.parametrize('area', AREAS)
+def test_bounds_are_one_tile_around_each_centre(area):
+    grid = GeoUtils.tile_grid(*area, TILE_SIZE_METERS)
+    min_lat, min_lon, max_lat, max_lon = grid['bounds'].T
+
+    np.testing.assert_allclose((min_lat + max_lat) / 2, grid['centerLats'])
+    np.testing.assert_allclose((min_lon + max_lon) / 2, grid['centerLons'])
+    np.testing.assert_allclose(max_lat - min_lat, GeoUtils.meters_to_latitude_degrees(TILE_SIZE_METERS))
+
+
+def test_chunked_grid_is_the_whole_grid_in_bands():
+    area = AREAS[2]
+    grid = GeoUtils.tile_grid(*area, TILE_SIZE_METERS)
+    chunks = list(GeoUtils.iter_tile_grid_chunks(*area, TILE_SIZE_METERS, chunk_rows=5))
+
+    assert len(chunks) == ceil(grid['rows'] / 5)
+    for name in ('rowIndex', 'colIndex', 'centerLats', 'centerLons', 'bounds'):
+        np.testing.assert_array_equal(np.concatenate([chunk[name] for chunk in chunks]), grid[name])
+
+
+def test_grid_is_memoised_and_read_only():
+    grid = GeoUtils.tile_grid(*AREAS[0], TILE_SIZE_METERS)
+
+    assert GeoUtils.tile_grid(*AREAS[0], TILE_SIZE_METERS) is grid
+    with pytest.raises(ValueError):
+        grid['centerLats'][0] = 0.0
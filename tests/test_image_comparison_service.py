@@ -0,0 +1,191 @@
+from types import SimpleNamespace
+from urllib.parse import urlsplit, parse_qs
+
+import cv2
+import pytest
+
+from config import CONFIG_SETTINGS
+from entities.models import AlertSession, ImageTile
+from extensions import db
+from services import comparison_executor
+from services.comparison_executor import ComparisonExecutor
+from services.decoded_image_cache import DecodedImageCache
+from services.image_capture_service import ImageCaptureService
+from services.image_comparison_service import ImageComparisonService
+from services.tile_state_index import TileStateIndex
+
+
+def _config(**overrides):
+    return dict(CONFIG_SETTINGS, COMPARISON_MAX_WORKERS=1, **overrides)
+
+
+@pytest.fixture(autouse=True)
+def fresh_caches():
+    DecodedImageCache._instance = None
+    with ComparisonExecutor._memo_lock:
+        ComparisonExecutor._memo.clear()
+    yield
+    DecodedImageCache._instance = None
+
+
+@pytest.fixture(scope='module')
+def legacy_results(pair_corpus):
+    """The original cv2 pipeline's verdict on every corpus pair, which the gates and kernels must agree with."""
+    return {name: ImageComparisonService.compare_images(previous_path, latest_path, _config())
+            for name, _, previous_path, latest_path in pair_corpus}
+
+
+def _dhash_distance(previous_path, latest_path):
+    return bin(ImageComparisonService.difference_hash(cv2.imread(previous_path)) ^
+               ImageComparisonService.difference_hash(cv2.imread(latest_path))).count('1')
+
+
+def test_corpus_labels_match_the_legacy_pipeline(pair_corpus, legacy_results):
+    assert {name: legacy_results[name]['changed'] for name, _, _, _ in pair_corpus} == \
+        {name: expected for name, expected, _, _ in pair_corpus}
+
+
+def test_tiered_comparison_without_the_dhash_gate_is_the_legacy_pipeline(pair_corpus, legacy_results):
+    config = _config(COMPARISON_DHASH_MAX_DISTANCE=None)
+    for name, _, previous_path, latest_path in pair_corpus:
+        assert ImageComparisonService.compare_images_tiered(previous_path, latest_path, config) == \
+            dict(legacy_results[name], tier='full')
+
+
+def test_dhash_gate_only_decides_pairs_within_the_cut_off(pair_corpus, legacy_results):
+    config = _config(COMPARISON_DHASH_MAX_DISTANCE=2)
+    for name, expected, previous_path, latest_path in pair_corpus:
+        result = ImageComparisonService.compare_images_tiered(previous_path, latest_path, config)
+        within_cut_off = _dhash_distance(previous_path, latest_path) <= 2
+        if result['tier'] == 'perceptual_hash':
+            assert within_cut_off and not result['changed'], name
+        else:
+            assert not within_cut_off and result == dict(legacy_results[name], tier='full'), name
+        if not expected and within_cut_off:
+            assert result['tier'] == 'perceptual_hash', name  # The unchanged pairs it exists to skip
+        if name.startswith(('new_building', 'cleared_plot', 'different_scene')):
+            assert result['tier'] == 'full' and result['changed'], name
+
+
+def test_dhash_gate_misses_changes_below_the_hash_resolution(pair_corpus, legacy_results):
+    # Why COMPARISON_DHASH_MAX_DISTANCE defaults to None: a 20 px block barely moves an 8x8 hash
+    config = _config(COMPARISON_DHASH_MAX_DISTANCE=2)
+    missed = [name for name, _, previous_path, latest_path in pair_corpus
+              if legacy_results[name]['changed'] and
+              not ImageComparisonService.compare_images_tiered(previous_path, latest_path, config)['changed']]
+
+    assert missed and all(name.startswith('small_building') for name in missed)
+
+
+def test_content_hash_gate_skips_only_byte_identical_pairs(pair_corpus, legacy_results, quiet):
+    tile_pairs, expected = [], []
+    for name, _, previous_path, latest_path in pair_corpus:
+        identical = name.startswith('identical')
+        previous_tile = SimpleNamespace(image_path=previous_path, content_hash=f'{name}_previous')
+        latest_tile = SimpleNamespace(image_path=latest_path,
+                                      content_hash=previous_tile.content_hash if identical else f'{name}_latest')
+        tile_pairs.append((latest_tile, previous_tile))
+        expected.append('content_hash' if identical else 'full')
+
+    with quiet():
+        results = ImageComparisonService.compare_tile_pairs(tile_pairs, _config())
+
+    assert [result['tier'] for result in results] == expected
+    assert [result['changed'] for result in results] == [legacy_results[name]['changed']
+                                                         for name, _, _, _ in pair_corpus]
+
+
+@pytest.mark.parametrize('reduction', [1, 2])
+def test_fast_kernel_agrees_with_the_legacy_pipeline(pair_corpus, legacy_results, reduction):
+    config = _config(COMPARISON_KERNEL='fast', COMPARISON_DECODE_REDUCTION=reduction)
+    for name, _, previous_path, latest_path in pair_corpus:
+        legacy = legacy_results[name]
+        fast = ImageComparisonService.compare_with_kernel(previous_path, latest_path, config)
+
+        assert fast['changed'] == legacy['changed'], name
+        if not name.startswith('different_scene'):  # Colour vs grey-level diffs only diverge on busy masks
+            # Region edges are quantised to the decode resolution, so reduced decodes drift a little more
+            assert fast['change_percent'] == pytest.approx(legacy['change_percent'], rel=0.05 * reduction,
+                                                           abs=0.05 * reduction), name
+
+
+def test_area_thresholds_override_the_configured_ones(pair_corpus):
+    [(_, _, previous_path, latest_path)] = [pair for pair in pair_corpus if pair[0] == 'new_building_1']
+    area_config = SimpleNamespace(change_pixel_threshold=None, change_min_region_area=None,
+                                  change_percent_threshold=5.0)
+    config = ImageComparisonService.area_comparison_config(area_config, _config())
+
+    assert config['COMPARISON_CHANGE_PERCENT_THRESHOLD'] == 5.0
+    assert config['COMPARISON_PIXEL_THRESHOLD'] == CONFIG_SETTINGS['COMPARISON_PIXEL_THRESHOLD']
+    for kernel in ('legacy', 'fast'):
+        assert not ImageComparisonService.compare_with_kernel(previous_path, latest_path,
+                                                              dict(config, COMPARISON_KERNEL=kernel))['changed']
+
+
+@pytest.fixture
+def compared_pairs(monkeypatch):
+    """Every (previous_path, latest_path) pair actually handed to the comparison kernels."""
+    pairs = []
+    compare_pair = comparison_executor._compare_pair
+    monkeypatch.setattr(comparison_executor, '_compare_pair',
+                        lambda pair, app_config: pairs.append(pair) or compare_pair(pair, app_config))
+    return pairs
+
+
+def test_compare_only_processes_keys_captured_since_the_last_comparison(app, make_area, auth_headers, tile_server,
+                                                                        compared_pairs, quiet):
+    area_config = make_area()
+    area_config_id = area_config.id
+    jobs = ImageCaptureService.plan_tile_jobs(area_config, app.config)
+    client = app.test_client()
+
+    def capture_and_compare():
+        with quiet():
+            assert client.post(f'/api/monitor/capture/{area_config_id}', headers=auth_headers).status_code == 200
+            assert client.post(f'/api/monitor/compare/{area_config_id}', headers=auth_headers).status_code == 200
+
+    def compare_again():
+        sessions_before = db.session.query(AlertSession).count()
+        with quiet():
+            assert client.post(f'/api/monitor/compare/{area_config_id}', headers=auth_headers).status_code == 200
+        assert db.session.query(AlertSession).count() == sessions_before  # Returned before starting a session
+
+    capture_and_compare()  # First captures: nothing to compare against yet
+    assert compared_pairs == []
+    compare_again()
+
+    tile_server.change(parse_qs(urlsplit(jobs[2]['url']).query)['center'][0])
+    capture_and_compare()  # Only the changed tile is a new capture
+    [(_, latest_path)] = compared_pairs
+    changed_tile = db.session.query(ImageTile).filter_by(unique_key=jobs[2]['unique_key']).order_by(
+        ImageTile.id.desc()).first()
+    assert latest_path == changed_tile.image_path and changed_tile.change_detected
+    compare_again()
+    assert len(compared_pairs) == 1
+    assert db.session.query(ImageTile).filter_by(needs_comparison=True).count() == 0
+
+
+def test_keys_dirty_only_in_a_stale_index_are_cleared_not_compared(app, make_area, tile_server, compared_pairs,
+                                                                   quiet):
+    area_config = make_area()
+    area_config_id = area_config.id
+    with quiet():
+        ImageCaptureService.capture_images_for_area(area_config, app.config)
+        ImageComparisonService.run_comparison_for_area(area_config_id, app.config)
+    unique_keys = ImageCaptureService.area_unique_keys(area_config)
+    # As left by another process comparing these keys, and by retention removing a key's rows
+    tile_state = TileStateIndex.for_area(area_config)
+    for unique_key in unique_keys[:3]:
+        tile_state.record_comparison(unique_key, True, needs_comparison=True)
+    db.session.query(ImageTile).filter_by(unique_key=unique_keys[2]).delete()
+    db.session.commit()
+
+    with quiet():
+        ImageComparisonService.run_comparison_for_area(area_config_id, app.config)
+
+    assert compared_pairs == [] and tile_state.dirty_keys() == []
+    assert [tile_state.cell(unique_key)['changeDetected'] for unique_key in unique_keys[:2]] == [False, False]
+    sessions = db.session.query(AlertSession).count()
+    with quiet():
+        ImageComparisonService.run_comparison_for_area(area_config_id, app.config)
+    assert db.session.query(AlertSession).count() == sessions  # Nothing left to do
@@ -0,0 +1,70 @@
+from datetime import datetime, timedelta
+
+from entities.models import ImageTile
+from extensions import db
+from services.image_tile_writer import ImageTileWriter
+
+CAPTURED_AT = datetime(2026, 1, 1)
+
+
+def _add(writer, area_config, index, image_path='tile.png'):
+    writer.add(area_config.id, f'key_{index}', 25.0 + index, 74.0, CAPTURED_AT, image_path, f'hash_{index}')
+
+
+def test_rows_are_flushed_in_batches_and_committed_together(app, make_area, quiet):
+    area_config = make_area()
+    writer = ImageTileWriter({'CAPTURE_DB_BATCH_SIZE': 4, 'CAPTURE_DB_FLUSH_SECONDS': 3600}, area_config.id)
+    with quiet():
+        for index in range(10):
+            _add(writer, area_config, index)
+        assert writer.stats()['batchesFlushed'] == 2  # 8 rows flushed; 2 still pending
+        writer.commit()
+
+    assert writer.stats() == {'rowsWritten': 10, 'rowsFailed': 0, 'rowsTouched': 0, 'batchesFlushed': 3,
+                              'fallbackBatches': 0}
+    rows = db.session.query(ImageTile).filter_by(area_config_id=area_config.id).all()
+    assert sorted(row.unique_key for row in rows) == sorted(f'key_{index}' for index in range(10))
+    assert all(row.needs_comparison and row.last_seen_time == CAPTURED_AT for row in rows)
+
+
+def test_nothing_is_visible_before_commit(app, make_area):
+    area_config = make_area()
+    writer = ImageTileWriter({'CAPTURE_DB_BATCH_SIZE': 2}, area_config.id)
+    for index in range(4):
+        _add(writer, area_config, index)
+    db.session.rollback()
+
+    assert db.session.query(ImageTile).count() == 0
+
+
+def test_failed_batch_falls_back_to_per_row_inserts(app, make_area, quiet):
+    area_config = make_area()
+    writer = ImageTileWriter({'CAPTURE_DB_BATCH_SIZE': 5}, area_config.id)
+    with quiet():
+        for index in range(5):
+            _add(writer, area_config, index, image_path=None if index == 2 else 'tile.png')  # image_path is NOT NULL
+        writer.commit()
+
+    assert writer.stats()['fallbackBatches'] == 1
+    assert writer.stats()['rowsWritten'] == 4 and writer.stats()['rowsFailed'] == 1
+    assert writer.failed_keys == {'key_2'}
+    assert db.session.query(ImageTile).count() == 4
+
+
+def test_touches_are_applied_with_one_update_per_row_time(app, make_area):
+    area_config = make_area()
+    writer = ImageTileWriter({}, area_config.id)
+    for index in range(3):
+        _add(writer, area_config, index)
+    writer.commit()
+    ids = [tile_id for tile_id, in db.session.query(ImageTile.id).order_by(ImageTile.id)]
+
+    seen = {tile_id: CAPTURED_AT + timedelta(hours=offset + 1) for offset, tile_id in enumerate(ids[:2])}
+    for tile_id, seen_time in seen.items():
+        writer.touch(tile_id, seen_time)
+    writer.commit()
+    db.session.expire_all()
+
+    assert writer.stats()['rowsTouched'] == 2
+    last_seen = dict(db.session.query(ImageTile.id, ImageTile.last_seen_time))
+    assert last_seen == {ids[0]: seen[ids[0]], ids[1]: seen[ids[1]], ids[2]: CAPTURED_AT}
@@ -0,0 +1,103 @@
+import json
+from datetime import datetime, timedelta
+
+import pytest
+
+from entities.models import ImageTile
+from extensions import db
+
+STARTED = datetime(2026, 3, 1)
+
+
+@pytest.fixture
+def tiles(app, make_area):
+    """30 captures of 10 keys over 6 distinct times, so pages have to break ties on id."""
+    area_config = make_area()
+    for index in range(30):
+        db.session.add(ImageTile(area_config_id=area_config.id, unique_key=f'key_{index % 10}', latitude=0.0,
+                                 longitude=0.0, image_path=f'tile_{index}.png', status='COMPARED',
+                                 capture_time=STARTED + timedelta(hours=index // 5),
+                                 change_detected=index % 4 == 0))
+    db.session.commit()
+    return area_config
+
+
+def _walk(client, url, headers, **params):
+    """Follows nextCursor to the end; returns every page's tiles."""
+    pages, cursor = [], None
+    while True:
+        query = dict(params, **({'cursor': cursor} if cursor else {}))
+        response = client.get(url, headers=headers, query_string=query)
+        assert response.status_code == 200, response.get_json()
+        body = response.get_json()
+        pages.append(body['tiles'])
+        cursor = body['nextCursor']
+        if cursor is None:
+            return pages
+
+
+@pytest.mark.parametrize('prefix', ['/api/image-tiles', '/api/monitor/image-tiles'])
+def test_cursor_pages_cover_the_bare_listing_exactly_once(app, tiles, auth_headers, prefix):
+    client = app.test_client()
+    url = f'{prefix}/area/{tiles.id}'
+    everything = client.get(url, headers=auth_headers).get_json()
+    pages = _walk(client, url, auth_headers, limit=7)
+
+    assert isinstance(everything, list) and len(everything) == 30
+    assert [len(page) for page in pages] == [7, 7, 7, 7, 2]
+    assert [tile for page in pages for tile in page] == everything
+    assert everything == sorted(everything, key=lambda tile: (tile['captureTime'], tile['id']), reverse=True)
+
+
+def test_rows_added_while_paging_do_not_shift_later_pages(app, tiles, auth_headers):
+    client = app.test_client()
+    url = f'/api/image-tiles/area/{tiles.id}'
+    first = client.get(url, headers=auth_headers, query_string={'limit': 10}).get_json()
+    db.session.add(ImageTile(area_config_id=tiles.id, unique_key='key_new', latitude=0.0, longitude=0.0,
+                             image_path='new.png', status='CAPTURED', capture_time=STARTED + timedelta(days=1)))
+    db.session.commit()
+    rest = _walk(client, url, auth_headers, limit=10, cursor=first['nextCursor'])
+
+    seen = [tile['id'] for tile in first['tiles']] + [tile['id'] for page in rest for tile in page]
+    assert len(seen) == len(set(seen)) == 30
+
+
+def test_filters_and_fields_apply_to_every_page(app, tiles, auth_headers):
+    client = app.test_client()
+    url = f'/api/image-tiles/area/{tiles.id}'
+    params = {'changed_only': 'true', 'since': (STARTED + timedelta(hours=1)).isoformat(),
+              'until': (STARTED + timedelta(hours=5)).isoformat(), 'fields': 'uniqueKey,changeDetected'}
+    everything = client.get(url, headers=auth_headers, query_string=params).get_json()
+    pages = _walk(client, url, auth_headers, limit=2, **params)
+
+    expected = [index for index in range(5, 25) if index % 4 == 0]
+    assert len(everything) == len(expected)
+    assert [tile for page in pages for tile in page] == everything
+    assert all(set(tile) == {'uniqueKey', 'changeDetected'} and tile['changeDetected']
+               for tile in everything)
+
+
+def test_latest_only_lists_one_capture_per_key(app, tiles, auth_headers):
+    everything = app.test_client().get(f'/api/image-tiles/area/{tiles.id}', headers=auth_headers,
+                                       query_string={'latest_only': 'true'}).get_json()
+
+    assert sorted(tile['uniqueKey'] for tile in everything) == sorted(f'key_{index}' for index in range(10))
+    assert {tile['captureTime'] for tile in everything} == {(STARTED + timedelta(hours=index)).isoformat()
+                                                            for index in (4, 5)}
+
+
+def test_ndjson_export_streams_every_row(app, tiles, auth_headers):
+    response = app.test_client().get(f'/api/image-tiles/area/{tiles.id}', headers=auth_headers,
+                                     query_string={'format': 'ndjson', 'fields': 'uniqueKey'})
+
+    assert response.mimetype == 'application/x-ndjson'
+    assert len([json.loads(line) for line in response.get_data(as_text=True).splitlines()]) == 30
+
+
+@pytest.mark.parametrize('params', [{'cursor': 'not-a-cursor'}, {'limit': '0'}, {'limit': 'ten'},
+                                    {'fields': 'id,password'}, {'since': 'yesterday'}])
+def test_bad_parameters_are_rejected(app, tiles, auth_headers, params):
+    response = app.test_client().get(f'/api/image-tiles/area/{tiles.id}', headers=auth_headers,
+                                     query_string=params)
+
+    assert response.status_code == 400 and 'message' in response.get_json()
@@ -0,0 +1,102 @@
+import json
+import os
+from urllib.parse import urlsplit, parse_qs
+
+import pytest
+
+from entities.models import AlertSession
+from extensions import db
+from services.image_capture_service import ImageCaptureService
+from services.monitoring_pipeline import MonitoringPipeline
+from utils.metrics import Metrics
+
+
+def _sample(text, name, **labels):
+    """Value of one series in a Prometheus text exposition, 0 if it hasn't been created yet."""
+    wanted = {label: str(value) for label, value in labels.items()}
+    for line in text.splitlines():
+        series, _, value = line.rpartition(' ')
+        series_name, _, label_text = series.partition('{')
+        found = dict(pair.split('=', 1) for pair in label_text.rstrip('}').split(',') if pair)
+        if series_name == name and {label: quoted.strip('"') for label, quoted in found.items()} == wanted:
+            return float(value)
+    return 0.0
+
+
+def _scrape(client, headers=None):
+    response = client.get('/metrics', headers=headers or {})
+    assert response.status_code == 200
+    return response.get_data(as_text=True)
+
+
+def test_pipeline_runs_against_the_stub_server_show_up_in_metrics(make_app, tile_server, make_area, tmp_path, quiet):
+    app = make_app(METRICS_TRACE_DIRECTORY=str(tmp_path / 'traces'))
+    with app.app_context():
+        area_config = make_area()
+        area = str(area_config.id)
+        client = app.test_client()
+        jobs = ImageCaptureService.plan_tile_jobs(area_config, app.config)
+        before = _scrape(client)
+
+        with quiet():
+            first = MonitoringPipeline.run_for_area(area_config, app.config)
+            tile_server.change(parse_qs(urlsplit(jobs[0]['url']).query)['center'][0])
+            second = MonitoringPipeline.run_for_area(area_config, app.config)
+        after = _scrape(client)
+
+        def delta(name, **labels):
+            return _sample(after, name, area=area, **labels) - _sample(before, name, area=area, **labels)
+
+        assert first['tilesPlanned'] == len(jobs) and first['changesDetected'] == 0
+        assert second['changesDetected'] == 1 and second['download']['cacheRevalidated'] == len(jobs) - 1
+        assert db.session.query(AlertSession).filter(
+            AlertSession.status == 'COMPLETED_CHANGES_DETECTED').one().total_changes_detected == 1
+
+        assert delta('bhuprahari_tile_downloads_total', outcome='miss') == len(jobs) + 1
+        assert delta('bhuprahari_tile_downloads_total', outcome='revalidated') == len(jobs) - 1
+        assert delta('bhuprahari_comparisons_total', tier='content_hash') == len(jobs) - 1
+        assert delta('bhuprahari_changes_detected_total') == 1
+        assert delta('bhuprahari_download_bytes_total') == \
+            first['download']['bytesDownloaded'] + second['download']['bytesDownloaded'] > 0
+        assert delta('bhuprahari_pipeline_run_seconds_count') == 2
+        for stage in ('http_fetch', 'file_write', 'db_commit', 'diff'):
+            assert delta('bhuprahari_stage_seconds_count', stage=stage) > 0, stage
+
+        assert {'http_fetch', 'db_commit', 'diff'} <= set(second['stages'])
+        traces = sorted(os.listdir(tmp_path / 'traces'))
+        assert len(traces) == 2
+        with open(tmp_path / 'traces' / traces[-1]) as f:
+            trace = json.load(f)
+        assert trace['areaConfigId'] == area_config.id and trace['run']['changesDetected'] == 1
+
+
+def test_metrics_token_is_required_when_configured(make_app):
+    client = make_app(METRICS_AUTH_TOKEN='scrape-secret').test_client()
+
+    assert client.get('/metrics').status_code == 401
+    assert client.get('/metrics', headers={'Authorization': 'Bearer wrong'}).status_code == 401
+    assert 'bhuprahari_stage_seconds' in _scrape(client, {'Authorization': 'Bearer scrape-secret'})
+
+
+def test_disabled_metrics_record_nothing(make_app):
+    client = make_app(METRICS_ENABLED=False).test_client()
+    with Metrics.stage('diff', 'disabled-area'):
+        pass
+
+    assert client.get('/metrics').status_code == 404
+    Metrics.enabled = True
+    assert 'disabled-area' not in _scrape(client)
+
+
+def test_histogram_buckets_are_cumulative(make_app):
+    client = make_app().test_client()
+    for seconds in (0.0005, 0.003, 0.003, 7.0):
+        Metrics.observe_stage('dhash', seconds, 'histogram-area')
+    text = _scrape(client)
+
+    def bucket(le):
+        return _sample(text, 'bhuprahari_stage_seconds_bucket', stage='dhash', area='histogram-area', le=le)
+
+    assert [bucket('0.001'), bucket('0.005'), bucket('5.0'), bucket('+Inf')] == [1, 3, 3, 4]
+    assert _sample(text, 'bhuprahari_stage_seconds_sum', stage='dhash', area='histogram-area') == \
+        pytest.approx(7.0065)
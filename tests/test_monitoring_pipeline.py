@@ -0,0 +1,102 @@
+from urllib.parse import urlsplit, parse_qs
+
+import pytest
+
+from entities.models import AlertSession, ImageTile
+from extensions import db
+from services.batch_comparison_engine import BatchComparisonEngine
+from services.comparison_executor import ComparisonExecutor
+from services.image_capture_service import ImageCaptureService
+from services.image_tile_writer import ImageTileWriter
+from services.monitoring_pipeline import MonitoringPipeline
+from services.tile_state_index import TileStateIndex
+
+
+def _failing_commit(self):
+    raise RuntimeError('database went away')
+
+
+def _sessions(area_config):
+    return db.session.query(AlertSession).filter(AlertSession.area_config_id == area_config.id).order_by(
+        AlertSession.id).all()
+
+
+def test_runs_without_changes_record_a_session(app, make_area, quiet):
+    area_config = make_area()
+
+    with quiet():
+        MonitoringPipeline.run_for_area(area_config, app.config)
+        MonitoringPipeline.run_for_area(area_config, app.config)
+
+    sessions = _sessions(area_config)
+    assert [session.status for session in sessions] == ['COMPLETED_NO_CHANGES'] * 2
+    assert all(session.end_time is not None and session.total_changes_detected == 0 for session in sessions)
+
+
+def test_failed_runs_record_an_error_session(app, make_area, quiet, monkeypatch):
+    area_config = make_area()
+
+    monkeypatch.setattr(ImageTileWriter, 'commit', _failing_commit)
+    with quiet():
+        MonitoringPipeline.run_for_area(area_config, app.config)  # The error is logged, not raised
+
+    [session] = _sessions(area_config)
+    assert session.status == 'COMPLETED_ERROR' and session.end_time is not None
+
+
+@pytest.mark.parametrize('fails, status', [(False, 'COMPLETED_NO_CHANGES'), (True, 'COMPLETED_ERROR')])
+def test_recorded_runs_can_be_filtered_by_status(app, make_area, auth_headers, quiet, monkeypatch, fails, status):
+    area_config = make_area()
+    if fails:
+        monkeypatch.setattr(ImageTileWriter, 'commit', _failing_commit)
+    with quiet():
+        MonitoringPipeline.run_for_area(area_config, app.config)
+
+    response = app.test_client().get(f"/api/alerts/sessions?status={status}", headers=auth_headers)
+
+    assert response.status_code == 200
+    assert [session['status'] for session in response.get_json()] == [status]
+
+
+@pytest.mark.parametrize('engine', ['pairwise', 'batch'])
+def test_pipeline_comparisons_use_the_configured_engine(make_app, tile_server, make_area, quiet, monkeypatch, engine):
+    app = make_app(COMPARISON_ENGINE=engine, COMPARISON_BATCH_SIZE=1)  # A batch per pair, compared mid-run
+    with app.app_context():
+        area_config = make_area()
+        batches, submitted = [], []
+        compare_pairs, submit_pair = BatchComparisonEngine.compare_pairs, ComparisonExecutor.submit_pair
+        monkeypatch.setattr(BatchComparisonEngine, 'compare_pairs',
+                            staticmethod(lambda pairs, config: batches.append(pairs) or compare_pairs(pairs, config)))
+        monkeypatch.setattr(ComparisonExecutor, 'submit_pair', classmethod(
+            lambda cls, pair, *args: submitted.append(pair) or submit_pair(pair, *args)))
+        jobs = ImageCaptureService.plan_tile_jobs(area_config, app.config)
+
+        with quiet():
+            MonitoringPipeline.run_for_area(area_config, app.config)
+            for job in jobs[:2]:
+                tile_server.change(parse_qs(urlsplit(job['url']).query)['center'][0])
+            timings = MonitoringPipeline.run_for_area(area_config, app.config)
+
+        assert timings['tilesCompared'] == 2 and timings['changesDetected'] == 2
+        if engine == 'batch':
+            assert len(batches) == 2 and all(len(pairs) == 1 for pairs in batches) and submitted == []
+        else:
+            assert batches == [] and len(submitted) == 2
+
+
+def test_runs_clear_keys_dirty_only_in_a_stale_index(app, make_area, quiet):
+    area_config = make_area()
+    with quiet():
+        MonitoringPipeline.run_for_area(area_config, app.config)
+    tile_state = TileStateIndex.for_area(area_config)
+    unique_keys = ImageCaptureService.area_unique_keys(area_config)
+    for unique_key in unique_keys[:2]:
+        tile_state.record_comparison(unique_key, False, needs_comparison=True)  # Compared by another process
+    db.session.query(ImageTile).filter_by(unique_key=unique_keys[1]).delete()  # Then its rows removed
+    db.session.commit()
+
+    for _ in range(2):
+        with quiet():
+            timings = MonitoringPipeline.run_for_area(area_config, app.config)
+        assert timings['tilesCompared'] == 0
+    assert tile_state.dirty_keys() == []
@@ -0,0 +1,135 @@
+import os
+from urllib.parse import urlsplit, parse_qs
+
+import cv2
+import pytest
+
+from services.image_capture_service import ImageCaptureService
+from services.monitoring_pipeline import MonitoringPipeline
+from services.mosaic_service import MosaicService
+
+TILE_PX = 32
+
+
+@pytest.fixture
+def mosaic_app(make_app):
+    app = make_app(MOSAIC_TILE_SIZE=TILE_PX)
+    with app.app_context():
+        yield app
+
+
+def _tile_files(app, area_config_id):
+    """(layer, z, x, y) -> mtime_ns of every tile written for the area."""
+    root = MosaicService.area_directory(area_config_id, app.config)
+    files = {}
+    for directory, _, names in os.walk(root):
+        for name in names:
+            if name.endswith('.png'):
+                layer, z, x = os.path.relpath(directory, root).split(os.sep)
+                files[(layer, int(z), int(x), int(name[:-4]))] = os.stat(os.path.join(directory, name)).st_mtime_ns
+    return files
+
+
+def _age_tiles(app, area_config_id):
+    root = MosaicService.area_directory(area_config_id, app.config)
+    for directory, _, names in os.walk(root):
+        for name in names:
+            os.utime(os.path.join(directory, name), ns=(1_000_000_000, 1_000_000_000))
+
+
+def _changed_run(app, area_config, tile_server, job):
+    tile_server.change(parse_qs(urlsplit(job['url']).query)['center'][0])
+    MonitoringPipeline.run_for_area(area_config, app.config)
+
+
+def test_first_build_writes_every_level(mosaic_app, make_area, quiet):
+    area_config = make_area()  # 3x3 cells, so zoom levels 0 to 2
+    with quiet():
+        MonitoringPipeline.run_for_area(area_config, mosaic_app.config)
+        stats = MosaicService.build_for_area(area_config, mosaic_app.config)
+
+    assert (stats['cellsRendered'], stats['parentTilesMerged']) == (9, 5)
+    imagery = {(z, x, y) for layer, z, x, y in _tile_files(mosaic_app, area_config.id) if layer == 'imagery'}
+    assert imagery == {(2, x, y) for x in range(3) for y in range(3)} | \
+        {(1, x, y) for x in range(2) for y in range(2)} | {(0, 0, 0)}
+    assert not any(layer == 'changes' for layer, *_ in _tile_files(mosaic_app, area_config.id))
+
+    corner = cv2.imread(MosaicService.tile_path(area_config.id, 'imagery', 1, 1, 1, mosaic_app.config),
+                        cv2.IMREAD_UNCHANGED)
+    assert corner.shape == (TILE_PX, TILE_PX, 4)
+    assert corner[:TILE_PX // 2, :TILE_PX // 2, 3].min() == 255  # Covered by cell (2, 2) at z=2
+    assert corner[TILE_PX // 2:, :, 3].max() == 0 and corner[:, TILE_PX // 2:, 3].max() == 0  # Past the grid
+
+    manifest = MosaicService.load_manifest(area_config.id, mosaic_app.config)
+    assert (manifest['rows'], manifest['cols'], manifest['maxZoom']) == (3, 3, 2) and len(manifest['cells']) == 9
+
+
+def test_rebuild_renders_only_the_changed_cell_and_its_ancestors(mosaic_app, make_area, tile_server, quiet):
+    area_config = make_area()
+    jobs = ImageCaptureService.plan_tile_jobs(area_config, mosaic_app.config)
+    with quiet():
+        MonitoringPipeline.run_for_area(area_config, mosaic_app.config)
+        MosaicService.build_for_area(area_config, mosaic_app.config)
+        assert MosaicService.build_for_area(area_config, mosaic_app.config)['cellsRendered'] == 0  # Up to date
+
+        _age_tiles(mosaic_app, area_config.id)
+        before = _tile_files(mosaic_app, area_config.id)
+        _changed_run(mosaic_app, area_config, tile_server, jobs[0])  # Row 0 (south), column 0: x=0, y=2
+        stats = MosaicService.build_for_area(area_config, mosaic_app.config, full=False)
+
+    assert (stats['cellsRendered'], stats['cellsRemoved'], stats['parentTilesMerged']) == (1, 0, 2)
+    after = _tile_files(mosaic_app, area_config.id)
+    rewritten = {tile for tile, mtime in after.items() if before.get(tile) != mtime}
+    path = [(2, 0, 2), (1, 0, 1), (0, 0, 0)]
+    assert rewritten == {(layer, *tile) for layer in MosaicService.LAYERS for tile in path}
+
+
+def test_changes_layer_is_a_heatmap_of_changed_cells(mosaic_app, make_area, tile_server, quiet):
+    area_config = make_area()
+    jobs = ImageCaptureService.plan_tile_jobs(area_config, mosaic_app.config)
+    with quiet():
+        MonitoringPipeline.run_for_area(area_config, mosaic_app.config)
+        _changed_run(mosaic_app, area_config, tile_server, jobs[4])  # The centre cell: x=1, y=1
+        MosaicService.build_for_area(area_config, mosaic_app.config)
+
+    changes = {(z, x, y) for layer, z, x, y in _tile_files(mosaic_app, area_config.id) if layer == 'changes'}
+    assert changes == {(2, 1, 1), (1, 0, 0), (0, 0, 0)}
+
+    cell = cv2.imread(MosaicService.tile_path(area_config.id, 'changes', 2, 1, 1, mosaic_app.config),
+                      cv2.IMREAD_UNCHANGED)
+    parent = cv2.imread(MosaicService.tile_path(area_config.id, 'changes', 1, 0, 0, mosaic_app.config),
+                        cv2.IMREAD_UNCHANGED)
+    assert 0 < (cell[:, :, 3] > 0).mean() < 1  # Only where the white block was painted
+    assert cell[:, :, 3].max() > 200
+    # Halved into the parent's bottom-right quarter, with its density averaged
+    assert parent[:TILE_PX // 2, :, 3].max() == 0 and parent[:, :TILE_PX // 2, 3].max() == 0
+    assert parent[TILE_PX // 2:, TILE_PX // 2:, 3].sum() == pytest.approx(cell[:, :, 3].sum() / 4, rel=0.05)
+
+
+def test_tile_route_serves_cacheable_tiles(app, make_area, auth_headers, quiet):
+    area_config = make_area()
+    client = app.test_client()
+    url = f'/api/mosaics/area/{area_config.id}'
+
+    assert client.get(url, headers=auth_headers).status_code == 404  # Not built yet
+    assert client.post('/api/mosaics/area/999/build', headers=auth_headers).status_code == 404
+    with quiet():
+        MonitoringPipeline.run_for_area(area_config, app.config)
+        response = client.post(f'{url}/build', headers=auth_headers)
+    assert response.status_code == 200 and response.get_json()['cellsRendered'] == 9
+    info = client.get(url, headers=auth_headers).get_json()
+    assert info['maxZoom'] == 2 and 'cells' not in info
+
+    response = client.get(f'{url}/imagery/0/0/0.png', headers=auth_headers)
+    assert response.status_code == 200 and response.mimetype == 'image/png'
+    assert response.cache_control.private and response.cache_control.max_age == 300
+    assert not response.cache_control.public
+    etag = response.headers['ETag']
+
+    revalidated = client.get(f'{url}/imagery/0/0/0.png', headers={**auth_headers, 'If-None-Match': etag})
+    assert revalidated.status_code == 304
+
+    assert client.get(f'{url}/imagery/2/5/5.png', headers=auth_headers).status_code == 404
+    assert client.get(f'{url}/changes/0/0/0.png', headers=auth_headers).status_code == 404  # No changes yet
+    assert client.get(f'{url}/satellite/0/0/0.png', headers=auth_headers).status_code == 400
+    assert client.get(f'{url}/imagery/0/0/0.png').status_code == 401
@@ -0,0 +1,150 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from entities.models import AlertSession, DeviceToken, NotificationOutbox, User
+from extensions import db
+from services.notification_outbox_service import NotificationOutboxService
+
+
+class StubSender:
+    """Stands in for FirebaseService.send_multicast; outcomes maps token -> error codes for successive sends."""
+
+    def __init__(self, outcomes=None):
+        self.outcomes = {token: list(codes) for token, codes in (outcomes or {}).items()}
+        self.calls = []
+
+    def __call__(self, tokens, title, body, data_payload):
+        self.calls.append((list(tokens), title, body, data_payload))
+        results = []
+        for token in tokens:
+            codes = self.outcomes.get(token)
+            error_code = codes.pop(0) if codes else None
+            results.append((token, error_code is None, error_code))
+        return results
+
+
+@pytest.fixture
+def outbox_config(app):
+    return dict(app.config, NOTIFICATION_COALESCE_SECONDS=0, NOTIFICATION_BACKOFF_BASE_SECONDS=0,
+                NOTIFICATION_MAX_ATTEMPTS=3, FCM_DEFAULT_DEVICE_TOKEN=None)
+
+
+@pytest.fixture
+def area_with_devices(app, make_area):
+    area_config = make_area()
+    user = User(email='devices@example.com', profile='', password_hash='x')
+    db.session.add(user)
+    db.session.flush()
+    for token, area_config_id in (('phone', area_config.id), ('tablet', area_config.id), ('everywhere', None)):
+        db.session.add(DeviceToken(user_id=user.id, token=token, area_config_id=area_config_id))
+    db.session.commit()
+    return area_config
+
+
+def _finished_session(area_config, changes):
+    alert_session = AlertSession(area_config_id=area_config.id, status='COMPLETED_CHANGES_DETECTED',
+                                 total_changes_detected=changes)
+    db.session.add(alert_session)
+    db.session.commit()
+    return alert_session
+
+
+def test_notification_is_sent_to_every_subscribed_device(area_with_devices, outbox_config, quiet):
+    alert_session = _finished_session(area_with_devices, 3)
+    sender = StubSender()
+    with quiet():
+        NotificationOutboxService.enqueue(alert_session, outbox_config)
+        stats = NotificationOutboxService.dispatch_due(outbox_config, sender)
+
+    [(tokens, title, body, data_payload)] = sender.calls
+    assert sorted(tokens) == ['everywhere', 'phone', 'tablet']
+    assert data_payload['alert_session_id'] == str(alert_session.id) and data_payload['changes_count'] == '3'
+    assert stats['sent'] == 1 and stats['deliveries'] == 3
+    notification = db.session.query(NotificationOutbox).one()
+    assert notification.status == 'SENT' and notification.delivered_count == 3
+    assert db.session.get(AlertSession, alert_session.id).notification_sent
+
+
+def test_sessions_within_the_window_share_one_notification(area_with_devices, outbox_config, quiet):
+    config = dict(outbox_config, NOTIFICATION_COALESCE_SECONDS=60)
+    with quiet():
+        for changes in (2, 5):
+            NotificationOutboxService.enqueue(_finished_session(area_with_devices, changes), config)
+        assert NotificationOutboxService.dispatch_due(config, StubSender())['notifications'] == 0  # Held back
+
+        notification = db.session.query(NotificationOutbox).one()
+        notification.next_attempt_time = datetime.utcnow() - timedelta(seconds=1)
+        db.session.commit()
+        sender = StubSender()
+        NotificationOutboxService.dispatch_due(config, sender)
+
+    assert len(notification.alert_session_ids) == 2 and notification.changes_count == 7
+    assert len(sender.calls) == 1 and 'across 2 monitoring runs' in sender.calls[0][2]
+
+
+def test_unregistered_tokens_are_pruned(area_with_devices, outbox_config, quiet):
+    sender = StubSender({'tablet': ['UNREGISTERED']})
+    with quiet():
+        NotificationOutboxService.enqueue(_finished_session(area_with_devices, 1), outbox_config)
+        stats = NotificationOutboxService.dispatch_due(outbox_config, sender)
+
+    assert stats['tokensPruned'] == 1
+    assert sorted(token for token, in db.session.query(DeviceToken.token)) == ['everywhere', 'phone']
+    assert db.session.query(NotificationOutbox).one().status == 'SENT'
+
+
+def test_only_transiently_failed_tokens_are_retried(area_with_devices, outbox_config, quiet):
+    sender = StubSender({'phone': ['UNAVAILABLE']})
+    with quiet():
+        NotificationOutboxService.enqueue(_finished_session(area_with_devices, 1), outbox_config)
+        first = NotificationOutboxService.dispatch_due(outbox_config, sender)
+        notification = db.session.query(NotificationOutbox).one()
+        assert first['retrying'] == 1 and notification.status == 'PENDING'
+        assert notification.retry_tokens == ['phone']
+        NotificationOutboxService.dispatch_due(outbox_config, sender)
+
+    assert [tokens for tokens, _, _, _ in sender.calls][1] == ['phone']
+    assert notification.status == 'SENT' and notification.delivered_count == 3 and notification.attempts == 2
+
+
+def test_gives_up_after_max_attempts(area_with_devices, outbox_config, quiet):
+    sender = StubSender({token: ['UNAVAILABLE'] * 5 for token in ('phone', 'tablet', 'everywhere')})
+    with quiet():
+        NotificationOutboxService.enqueue(_finished_session(area_with_devices, 1), outbox_config)
+        for _ in range(5):
+            NotificationOutboxService.dispatch_due(outbox_config, sender)
+
+    notification = db.session.query(NotificationOutbox).one()
+    assert len(sender.calls) == 3
+    assert notification.status == 'FAILED' and notification.attempts == 3
+    assert notification.last_error == 'UNAVAILABLE: 3'
+
+
+def test_a_sender_exception_counts_as_a_transient_failure(area_with_devices, outbox_config, quiet):
+    def broken_sender(tokens, title, body, data_payload):
+        raise ConnectionError('FCM unreachable')
+
+    with quiet():
+        NotificationOutboxService.enqueue(_finished_session(area_with_devices, 1), outbox_config)
+        NotificationOutboxService.dispatch_due(outbox_config, broken_sender)
+
+    notification = db.session.query(NotificationOutbox).one()
+    assert notification.status == 'PENDING' and len(notification.retry_tokens) == 3
+
+
+def test_area_without_devices_fails_without_sending(app, make_area, outbox_config, quiet):
+    sender = StubSender()
+    with quiet():
+        NotificationOutboxService.enqueue(_finished_session(make_area(), 1), outbox_config)
+        NotificationOutboxService.dispatch_due(outbox_config, sender)
+
+    assert not sender.calls
+    assert db.session.query(NotificationOutbox).one().status == 'FAILED'
+
+
+def test_sessions_without_changes_are_not_queued(area_with_devices, outbox_config, quiet):
+    with quiet():
+        assert NotificationOutboxService.enqueue(_finished_session(area_with_devices, 0), outbox_config) is None
+
+    assert db.session.query(NotificationOutbox).count() == 0
@@ -0,0 +1,138 @@
+import time
+from contextlib import contextmanager
+
+import pytest
+from sqlalchemy import event, text
+
+from entities.models import User
+from extensions import db
+from utils.jwt_utils import generate_jwt_token
+from utils.principal_cache import PrincipalCache
+
+PROTECTED_URL = '/api/monitor/pipeline/timings'  # jwt_required and no queries of its own
+
+
+@contextmanager
+def count_user_queries():
+    """Collects the statements that read the users table while the block executes."""
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith('SELECT') and 'FROM users' in statement:
+            statements.append(statement)
+
+    event.listen(db.engine, 'before_cursor_execute', record)
+    try:
+        yield statements
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', record)
+
+
+@pytest.fixture
+def user_id(app):
+    user = User(email='tester@example.com', profile='')
+    user.set_password('password', 4)
+    db.session.add(user)
+    db.session.commit()
+    return user.id
+
+
+def _tokens(app, user_id):
+    user = db.session.get(User, user_id)
+    return (generate_jwt_token(user.id, 'access', app.config, user.password_version()),
+            generate_jwt_token(user.id, 'refresh', app.config, user.password_version()))
+
+
+def _get(app, token):
+    response = app.test_client().get(PROTECTED_URL, headers={'Authorization': f'Bearer {token}'})
+    db.session.remove()  # Each request in its own session, as in production
+    return response
+
+
+def test_cached_principals_skip_the_user_query(app, user_id):
+    access_token, _ = _tokens(app, user_id)
+    db.session.remove()
+
+    counts = []
+    for _ in range(3):
+        with count_user_queries() as statements:
+            assert _get(app, access_token).status_code == 200
+        counts.append(len(statements))
+
+    assert counts == [1, 0, 0]
+    assert PrincipalCache.stats()['entries'] == 1
+
+
+def test_password_changes_and_deleted_users_revoke_old_tokens(app, user_id):
+    access_token, refresh_token = _tokens(app, user_id)
+    assert _get(app, access_token).status_code == 200  # Now cached
+
+    user = db.session.get(User, user_id)
+    user.set_password('changed', 4)
+    db.session.commit()
+    response = _get(app, access_token)
+    assert response.status_code == 401 and response.get_json()['message'] == 'Token has been revoked'
+    refreshed = app.test_client().post('/api/auth/refresh', json={'refresh_token': refresh_token})
+    assert refreshed.status_code == 401
+
+    new_token, _ = _tokens(app, user_id)
+    assert _get(app, new_token).status_code == 200
+
+    db.session.delete(db.session.get(User, user_id))
+    db.session.commit()
+    response = _get(app, new_token)
+    assert response.status_code == 401 and response.get_json()['message'] == 'User not found!'
+
+
+def test_cached_principals_expire_after_their_ttl(make_app):
+    app = make_app(AUTH_PRINCIPAL_CACHE_TTL_SECONDS=0.2)
+    with app.app_context():
+        user = User(email='tester@example.com', profile='')
+        user.set_password('password', 4)
+        db.session.add(user)
+        db.session.commit()
+        access_token, _ = _tokens(app, user.id)
+        assert _get(app, access_token).status_code == 200
+
+        # Changed behind the ORM, as another process would, so no listener drops the entry
+        db.session.execute(text("UPDATE users SET password_hash = 'changed elsewhere'"))
+        db.session.commit()
+        assert _get(app, access_token).status_code == 200  # Served from the cache until it expires
+
+        time.sleep(0.25)
+        with count_user_queries() as statements:
+            assert _get(app, access_token).status_code == 401
+        assert len(statements) == 1
+
+
+def test_refresh_issues_a_working_access_token(app, user_id):
+    access_token, refresh_token = _tokens(app, user_id)
+    client = app.test_client()
+
+    response = client.post('/api/auth/refresh', json={'refresh_token': refresh_token})
+    assert response.status_code == 200
+    assert _get(app, response.get_json()['access_token']).status_code == 200
+
+    assert client.post('/api/auth/refresh', json={'refresh_token': access_token}).status_code == 401
+    assert client.post('/api/auth/refresh', json={}).status_code == 400
+    assert _get(app, refresh_token).status_code == 401  # Refresh tokens don't open the API
+
+
+def test_trusted_claims_skip_the_user_lookup_but_refresh_does_not(make_app):
+    app = make_app(AUTH_TRUST_TOKEN_CLAIMS=True, AUTH_PRINCIPAL_CACHE_TTL_SECONDS=0)
+    with app.app_context():
+        user = User(email='tester@example.com', profile='')
+        user.set_password('password', 4)
+        db.session.add(user)
+        db.session.commit()
+        user_id = user.id
+        access_token, refresh_token = _tokens(app, user_id)
+
+        with count_user_queries() as statements:
+            assert _get(app, access_token).status_code == 200
+        assert statements == []
+
+        db.session.delete(db.session.get(User, user_id))
+        db.session.commit()
+        assert _get(app, access_token).status_code == 200  # Trusted until the token must be refreshed
+        assert app.test_client().post('/api/auth/refresh', json={'refresh_token': refresh_token}).status_code == 401
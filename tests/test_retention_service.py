@@ -0,0 +1,249 @@
+import os
+import time
+from datetime import datetime, timedelta
+
+import pytest
+
+from entities.models import AlertSession, AlertDetail, ImageTile
+from extensions import db
+from services.retention_service import RetentionService
+from services.tile_query_service import TileQueryService
+from services.tile_storage_service import TileStorageService
+
+NOW = datetime(2026, 3, 1, 12)
+CONFIG = {'RETENTION_KEEP_ALL_DAYS': 7, 'RETENTION_KEEP_DAILY_DAYS': 90}
+
+
+def _capture(app, area_config, unique_key, capture_time, content, stale=True):
+    """Stores the bytes as a blob and adds the ImageTile row pointing at it."""
+    content_hash, path = TileStorageService.store_blob(content, app.config)
+    if stale:  # Older than the reclaim grace period
+        os.utime(path, (time.time() - 7200, time.time() - 7200))
+    tile = ImageTile(area_config_id=area_config.id, unique_key=unique_key, latitude=0.0, longitude=0.0,
+                     capture_time=capture_time, image_path=path, status='COMPARED', content_hash=content_hash)
+    db.session.add(tile)
+    db.session.commit()
+    return tile
+
+
+def _run(app, area_config, **overrides):
+    return RetentionService.run_for_area(area_config.id, {**app.config, **CONFIG, **overrides}, 5000, NOW)
+
+
+def _archive_files(app):
+    directory = os.path.join(app.config['IMAGE_STORAGE_DIRECTORY'], RetentionService.ARCHIVE_DIRECTORY_NAME)
+    return [name for _, _, names in os.walk(directory) for name in names]
+
+
+def test_plan_keeps_recent_daily_latest_and_alerted_captures(app, make_area):
+    area_config = make_area()
+    days_ago = lambda days, hour=8: NOW - timedelta(days=days) + timedelta(hours=hour - 12)
+    first_of_day = _capture(app, area_config, 'k', days_ago(30), b'a')
+    same_day = _capture(app, area_config, 'k', days_ago(30, hour=20), b'b')
+    next_day = _capture(app, area_config, 'k', days_ago(29), b'c')
+    beyond_window = _capture(app, area_config, 'k', days_ago(200), b'd')
+    alerted = _capture(app, area_config, 'k', days_ago(201), b'e')
+    recent = _capture(app, area_config, 'k', days_ago(3), b'f')
+    _capture(app, area_config, 'k', days_ago(2), b'g')
+    _capture(app, area_config, 'k', days_ago(1), b'h')  # The latest two are always kept
+    old_latest = [_capture(app, area_config, 'old', days_ago(300 + day), bytes([day])) for day in range(2)]
+
+    alert_session = AlertSession(area_config_id=area_config.id, status='COMPLETED_CHANGES_DETECTED')
+    db.session.add(AlertDetail(alert_session=alert_session, image_tile_id=alerted.id,
+                               previous_image_path=alerted.image_path, current_image_path=alerted.image_path))
+    db.session.commit()
+
+    to_archive, to_delete = RetentionService._plan(area_config.id, CONFIG, 5000, NOW)
+
+    assert {row.id for row in to_archive} == {first_of_day.id, next_day.id, alerted.id}
+    assert {row.id for row in to_delete} == {same_day.id, beyond_window.id}
+    assert recent.id not in {row.id for row in to_archive + to_delete}
+    assert not {tile.id for tile in old_latest} & {row.id for row in to_archive + to_delete}
+
+
+def test_plan_stops_at_the_row_limit_oldest_first(app, make_area):
+    area_config = make_area()
+    tiles = [_capture(app, area_config, 'k', NOW - timedelta(days=60 - day, hours=hour), bytes([day, hour]))
+             for day in range(5) for hour in (0, 1)]
+
+    to_archive, to_delete = RetentionService._plan(area_config.id, CONFIG, 3, NOW)
+
+    assert len(to_archive) + len(to_delete) == 3
+    assert min(row.capture_time for row in to_archive + to_delete) == min(tile.capture_time for tile in tiles)
+
+
+def test_run_archives_kept_rows_and_deletes_the_rest(app, make_area, quiet):
+    area_config = make_area()
+    kept = _capture(app, area_config, 'k', NOW - timedelta(days=30), b'kept')
+    dropped = _capture(app, area_config, 'k', NOW - timedelta(days=30) + timedelta(hours=1), b'dropped')
+    kept_id, kept_path = kept.id, kept.image_path
+    dropped_id, dropped_path = dropped.id, dropped.image_path
+    for day in (2, 1):
+        _capture(app, area_config, 'k', NOW - timedelta(days=day), bytes([day]))
+
+    with quiet():
+        stats = _run(app, area_config)
+    db.session.expire_all()
+
+    assert stats['rowsArchived'] == 1 and stats['rowsDeleted'] == 1
+    assert stats['filesArchived'] == 1 and stats['filesDeleted'] == 2
+    archived = db.session.get(ImageTile, kept_id)
+    assert RetentionService.is_archived(archived.image_path)
+    assert RetentionService.read_image_bytes(archived.image_path) == b'kept'
+    assert db.session.get(ImageTile, dropped_id) is None
+    assert not os.path.exists(kept_path) and not os.path.exists(dropped_path)
+
+    with quiet():
+        assert _run(app, area_config)['rowsArchived'] == 0  # Settled rows aren't planned again
+
+
+def test_alert_paths_are_repointed_to_the_archive(app, make_area, quiet):
+    area_config = make_area()
+    previous = _capture(app, area_config, 'k', NOW - timedelta(days=30), b'previous')
+    changed = _capture(app, area_config, 'k', NOW - timedelta(days=30) + timedelta(hours=1), b'changed')
+    for day in (2, 1):
+        _capture(app, area_config, 'k', NOW - timedelta(days=day), bytes([day]))
+    alert_session = AlertSession(area_config_id=area_config.id, status='COMPLETED_CHANGES_DETECTED')
+    detail = AlertDetail(alert_session=alert_session, image_tile_id=changed.id,
+                         previous_image_path=previous.image_path, current_image_path=changed.image_path)
+    db.session.add(detail)
+    db.session.commit()
+    previous_id, previous_path = previous.id, previous.image_path
+
+    with quiet():
+        _run(app, area_config, RETENTION_KEEP_DAILY_DAYS=10)  # Both are past the daily window
+    db.session.expire_all()
+
+    assert db.session.get(ImageTile, previous_id) is None  # Not alerted itself, so deleted
+    assert RetentionService.is_archived(detail.previous_image_path)
+    assert RetentionService.is_archived(detail.current_image_path)
+    assert RetentionService.read_image_bytes(detail.previous_image_path) == b'previous'
+    assert RetentionService.read_image_bytes(detail.current_image_path) == b'changed'
+    assert not os.path.exists(previous_path)
+
+
+def test_failed_commit_removes_the_new_chunk(app, make_area, quiet, monkeypatch):
+    area_config = make_area()
+    kept = _capture(app, area_config, 'k', NOW - timedelta(days=30), b'kept')
+    for day in (2, 1):
+        _capture(app, area_config, 'k', NOW - timedelta(days=day), bytes([day]))
+    kept_id, kept_path = kept.id, kept.image_path
+
+    def failing_commit():
+        raise RuntimeError('database went away')
+
+    monkeypatch.setattr(db.session, 'commit', failing_commit)
+    with quiet(), pytest.raises(RuntimeError):
+        _run(app, area_config)
+    monkeypatch.undo()
+
+    assert _archive_files(app) == []
+    assert db.session.get(ImageTile, kept_id).image_path == kept_path
+    assert os.path.exists(kept_path)
+
+
+def test_recently_used_blobs_are_not_reclaimed(app, make_area, quiet):
+    area_config = make_area()
+    dropped = _capture(app, area_config, 'k', NOW - timedelta(days=30), b'dropped', stale=False)
+    first = _capture(app, area_config, 'k', NOW - timedelta(days=30) + timedelta(hours=-1), b'first')
+    for day in (2, 1):
+        _capture(app, area_config, 'k', NOW - timedelta(days=day), bytes([day]))
+    dropped_id, dropped_path, first_path = dropped.id, dropped.image_path, first.image_path
+
+    with quiet():
+        stats = _run(app, area_config)
+
+    assert db.session.get(ImageTile, dropped_id) is None
+    assert os.path.exists(dropped_path)
+    assert stats['filesDeleted'] == 1 and not os.path.exists(first_path)  # Archived, so its blob goes
+
+
+def test_reused_blobs_are_not_reclaimed_and_keep_their_mtime(app, make_area, quiet):
+    area_config = make_area()
+    dropped = _capture(app, area_config, 'k', NOW - timedelta(days=30), b'dropped')
+    _capture(app, area_config, 'k', NOW - timedelta(days=30) + timedelta(hours=-1), b'first')
+    for day in (2, 1):
+        _capture(app, area_config, 'k', NOW - timedelta(days=day), bytes([day]))
+    dropped_id, dropped_path = dropped.id, dropped.image_path
+    mtime_ns = os.stat(dropped_path).st_mtime_ns
+
+    # A capture that is still committing reuses the blob; DecodedImageCache keys stay valid
+    assert TileStorageService.store_blob(b'dropped', app.config)[1] == dropped_path
+    assert os.stat(dropped_path).st_mtime_ns == mtime_ns
+
+    with quiet():
+        stats = _run(app, area_config)
+
+    assert db.session.get(ImageTile, dropped_id) is None
+    assert stats['filesDeleted'] == 1 and os.path.exists(dropped_path)
+
+
+def test_latest_capture_content_is_not_reclaimed(app, make_area, quiet):
+    area_config, other_area = make_area('a'), make_area('b')
+    first = _capture(app, area_config, 'k', NOW - timedelta(days=30) + timedelta(hours=-1), b'first')
+    dropped = _capture(app, area_config, 'k', NOW - timedelta(days=30), b'shared')
+    for day in (2, 1):
+        _capture(app, area_config, 'k', NOW - timedelta(days=day), bytes([day]))
+    # Another area's latest capture has the same content under a legacy file name
+    db.session.add(ImageTile(area_config_id=other_area.id, unique_key='k', latitude=0.0, longitude=0.0,
+                             capture_time=NOW, image_path='legacy/k.png', status='CAPTURED',
+                             content_hash=dropped.content_hash))
+    db.session.commit()
+    first_path, dropped_path = first.image_path, dropped.image_path
+
+    with quiet():
+        stats = _run(app, area_config)
+
+    assert stats['rowsDeleted'] == 1 and stats['filesDeleted'] == 1
+    assert not os.path.exists(first_path)  # Archived
+    assert os.path.exists(dropped_path)
+
+
+def test_references_committed_during_the_run_keep_the_blob(app, make_area, quiet, monkeypatch):
+    area_config = make_area()
+    dropped = _capture(app, area_config, 'k', NOW - timedelta(days=30), b'dropped')
+    _capture(app, area_config, 'k', NOW - timedelta(days=30) + timedelta(hours=-1), b'first')
+    for day in (2, 1):
+        _capture(app, area_config, 'k', NOW - timedelta(days=day), bytes([day]))
+    dropped_path, dropped_hash = dropped.image_path, dropped.content_hash
+    latest_capture_hashes = TileQueryService.latest_capture_hashes
+
+    def capture_commits_meanwhile(content_hashes):
+        db.session.add(ImageTile(area_config_id=area_config.id, unique_key='other', latitude=0.0, longitude=0.0,
+                                 capture_time=NOW, image_path=dropped_path, status='CAPTURED'))
+        db.session.commit()
+        return latest_capture_hashes(content_hashes) - {dropped_hash}
+
+    monkeypatch.setattr(TileQueryService, 'latest_capture_hashes', staticmethod(capture_commits_meanwhile))
+    with quiet():
+        stats = _run(app, area_config)
+
+    assert stats['rowsDeleted'] == 1
+    assert os.path.exists(dropped_path)
+
+
+def test_run_is_skipped_while_another_pass_holds_the_lock(app, make_area, quiet):
+    make_area()
+    with RetentionService.run_lock, quiet():
+        assert RetentionService.run(app.config) is None
+    with quiet():
+        assert RetentionService.run(app.config)['totals']['rowsDeleted'] == 0
+
+
+def test_manual_run_is_started_in_the_background(app, make_area, auth_headers, quiet):
+    make_area()
+    client = app.test_client()
+
+    with RetentionService.run_lock:
+        assert client.post('/api/monitor/retention/run', headers=auth_headers).status_code == 409
+
+    RetentionService.last_run_stats = {}
+    with quiet():
+        response = client.post('/api/monitor/retention/run', headers=auth_headers)
+        assert response.status_code == 202
+        deadline = time.time() + 10
+        while not RetentionService.last_run_stats and time.time() < deadline:
+            time.sleep(0.05)
+        assert RetentionService.run_lock.acquire(timeout=10)
+    RetentionService.run_lock.release()
+    assert RetentionService.last_run_stats['totals']['rowsArchived'] == 0
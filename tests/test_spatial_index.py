@@ -0,0 +1,159 @@
+import random
+from datetime import datetime, timedelta
+
+import pytest
+
+from entities.models import AreaConfig, ImageTile
+from extensions import db
+from services.image_capture_service import ImageCaptureService
+from services.spatial_index import SpatialIndex
+from utils.geo_utils import GeoUtils
+
+STARTED = datetime(2026, 3, 1)
+
+
+def _capture_all(area_config, capture_time, changed_keys=()):
+    """One capture row for every cell of the area's grid."""
+    grid = ImageCaptureService.area_tile_grid(area_config)
+    db.session.bulk_insert_mappings(ImageTile, [
+        {'area_config_id': area_config.id, 'unique_key': unique_key, 'latitude': lat, 'longitude': lon,
+         'capture_time': capture_time, 'image_path': f'{unique_key}.png', 'status': 'CAPTURED',
+         'change_detected': unique_key in changed_keys, 'needs_comparison': False}
+        for unique_key, lat, lon in zip(ImageCaptureService.area_unique_keys(area_config),
+                                        grid['centerLats'].tolist(), grid['centerLons'].tolist())])
+    db.session.commit()
+
+
+def _latest_ids(area_config):
+    latest = {}
+    for tile in db.session.query(ImageTile).filter_by(area_config_id=area_config.id).order_by(ImageTile.id):
+        latest[tile.unique_key] = tile.id
+    return latest
+
+
+def _cells_touching(area_config, min_lat, min_lon, max_lat, max_lon):
+    """What a scan of every cell's bounds finds under the box."""
+    grid = ImageCaptureService.area_tile_grid(area_config)
+    unique_keys = ImageCaptureService.area_unique_keys(area_config)
+    return {unique_keys[index] for index, (cell_min_lat, cell_min_lon, cell_max_lat, cell_max_lon)
+            in enumerate(grid['bounds'].tolist())
+            if cell_min_lat <= max_lat and cell_max_lat >= min_lat and cell_min_lon <= max_lon and cell_max_lon >= min_lon}
+
+
+@pytest.mark.parametrize('grid_mode', ['area', 'global'])
+def test_point_and_bbox_queries_match_a_scan_of_every_cell(make_app, make_area, grid_mode):
+    app = make_app(TILE_GRID_MODE=grid_mode)
+    with app.app_context():
+        first = make_area(name='first', half_km=1.0)
+        second = make_area(name='second', center_lat=25.36, center_lon=74.64, half_km=0.8)
+        far = make_area(name='far', center_lat=26.9, center_lon=75.8)
+        for area_config in (first, second, far):
+            _capture_all(area_config, STARTED)
+            _capture_all(area_config, STARTED + timedelta(days=1))
+        areas = [first, second, far]
+        latest_ids = {area_config.id: _latest_ids(area_config) for area_config in areas}
+
+        rng = random.Random(3)
+        found = 0
+        for _ in range(40):
+            lat, lon = 25.35 + rng.uniform(-0.015, 0.02), 74.63 + rng.uniform(-0.015, 0.02)
+            box = (lat, lon, lat + rng.uniform(0, 0.006), lon + rng.uniform(0, 0.006))
+            for min_lat, min_lon, max_lat, max_lon in (box, (lat, lon, lat, lon)):
+                tiles, truncated = SpatialIndex.tiles_in_bbox(min_lat, min_lon, max_lat, max_lon, limit=100000)
+                assert not truncated
+                assert {(tile['areaConfigId'], tile['uniqueKey']) for tile in tiles} == \
+                    {(area_config.id, unique_key) for area_config in areas
+                     for unique_key in _cells_touching(area_config, min_lat, min_lon, max_lat, max_lon)}
+                assert all(tile['id'] == latest_ids[tile['areaConfigId']][tile['uniqueKey']] for tile in tiles)
+                found += len(tiles)
+        assert found > 100  # Most boxes land on some area
+
+        assert [area['id'] for area in SpatialIndex.areas_in_bbox(25.35, 74.63, 25.35, 74.63)] == [first.id]
+        assert [area['id'] for area in SpatialIndex.areas_in_bbox(25.355, 74.635, 25.36, 74.64)] == \
+            [first.id, second.id]
+        assert SpatialIndex.areas_in_bbox(0.0, 0.0, 1.0, 1.0) == []
+
+
+def test_the_index_follows_committed_area_changes_only(app, make_area):
+    first = make_area(name='first')
+    assert [area['id'] for area in SpatialIndex.areas_in_bbox(25.35, 74.63, 25.35, 74.63)] == [first.id]
+
+    second = make_area(name='second', center_lat=10.0, center_lon=10.0)
+    assert [area['id'] for area in SpatialIndex.areas_in_bbox(10.0, 10.0, 10.0, 10.0)] == [second.id]
+
+    snapshot = SpatialIndex.snapshot()
+    db.session.add(AreaConfig(name='rolled back', center_lat=20.0, center_lon=20.0, north_km=1, south_km=1,
+                              east_km=1, west_km=1))
+    db.session.flush()
+    db.session.rollback()
+    assert SpatialIndex.snapshot() is snapshot  # Nothing committed, nothing rebuilt
+    assert SpatialIndex.areas_in_bbox(20.0, 20.0, 20.0, 20.0) == []
+
+    second = db.session.get(AreaConfig, second.id)
+    second.center_lat = 11.0
+    db.session.commit()
+    assert SpatialIndex.areas_in_bbox(10.0, 10.0, 10.0, 10.0) == []
+    assert [area['id'] for area in SpatialIndex.areas_in_bbox(11.0, 10.0, 11.0, 10.0)] == [second.id]
+
+    db.session.delete(second)
+    db.session.commit()
+    assert SpatialIndex.areas_in_bbox(11.0, 10.0, 11.0, 10.0) == []
+    assert len(SpatialIndex.snapshot()['areaIds']) == 1
+
+
+@pytest.mark.parametrize('grid_mode', ['area', 'global'])
+def test_overlapping_areas_are_paired_with_their_shared_cells(make_app, make_area, grid_mode):
+    app = make_app(TILE_GRID_MODE=grid_mode)
+    with app.app_context():
+        first = make_area(name='first', half_km=1.0)
+        second = make_area(name='second', center_lat=25.36, center_lon=74.64, half_km=1.0)
+        make_area(name='apart', center_lat=25.5, center_lon=74.63)
+
+        [overlap] = SpatialIndex.overlapping_areas()
+        assert overlap['areaConfigIds'] == [first.id, second.id]
+
+        first_box, second_box = (GeoUtils.calculate_bounding_box(area.center_lat, area.center_lon, 1.0, 1.0, 1.0, 1.0)
+                                 for area in (first, second))
+        assert overlap['bbox'] == {'minLat': second_box['minLat'], 'minLon': second_box['minLon'],
+                                   'maxLat': first_box['maxLat'], 'maxLon': first_box['maxLon']}
+        height_km = 2.0 - 0.01 * 111.195
+        width_km = 2.0 - 0.01 * 111.195 * 0.9037  # cos(25.35 degrees)
+        assert overlap['overlapKm2'] == pytest.approx(height_km * width_km, rel=0.01)
+        assert overlap['tilesInOverlap'][str(first.id)] == len(_cells_touching(first, *overlap['bbox'].values()))
+
+        shared = set(ImageCaptureService.area_unique_keys(first)) & set(ImageCaptureService.area_unique_keys(second))
+        if grid_mode == 'global':
+            assert overlap['sharedTiles'] == len(shared) > 0  # The same world cells
+        else:
+            assert overlap['sharedTiles'] == 0 and not shared  # Each area's grid is offset from the other's
+
+
+def test_spatial_endpoints(app, make_area, auth_headers):
+    area_config = make_area()
+    keys = ImageCaptureService.area_unique_keys(area_config)
+    _capture_all(area_config, STARTED, changed_keys={keys[0], keys[4]})
+    client = app.test_client()
+    box = GeoUtils.calculate_bounding_box(25.35, 74.63, 0.3, 0.3, 0.3, 0.3)
+    bbox = f"{box['minLon']},{box['minLat']},{box['maxLon']},{box['maxLat']}"
+
+    response = client.get('/api/spatial/areas?lat=25.35&lon=74.63', headers=auth_headers)
+    assert response.status_code == 200
+    assert [area['id'] for area in response.get_json()['areas']] == [area_config.id]
+
+    body = client.get(f'/api/spatial/tiles?bbox={bbox}', headers=auth_headers).get_json()
+    assert len(body['tiles']) == 9 and not body['truncated']
+    body = client.get(f'/api/spatial/tiles?bbox={bbox}&limit=4', headers=auth_headers).get_json()
+    assert len(body['tiles']) == 4 and body['truncated']
+
+    changed = {keys[0], keys[4]}
+    for url in (f'/api/spatial/tiles?bbox={bbox}&changed_only=true', f'/api/spatial/changes?bbox={bbox}'):
+        assert {tile['uniqueKey'] for tile in client.get(url, headers=auth_headers).get_json()['tiles']} == changed
+    since = (STARTED + timedelta(hours=1)).isoformat()
+    assert client.get(f'/api/spatial/tiles?bbox={bbox}&since={since}', headers=auth_headers).get_json()['tiles'] == []
+
+    assert client.get('/api/spatial/areas/overlaps', headers=auth_headers).get_json() == {'overlaps': []}
+
+    for url in ('/api/spatial/areas', '/api/spatial/areas?bbox=1,2,3', '/api/spatial/tiles?bbox=3,2,1,1',
+                '/api/spatial/tiles?lat=25.35&lon=74.63&limit=0'):
+        assert client.get(url, headers=auth_headers).status_code == 400
+    assert client.get('/api/spatial/areas?lat=25.35&lon=74.63').status_code == 401
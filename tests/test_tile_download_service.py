@@ -0,0 +1,103 @@
+import os
+import threading
+import time
+
+from entities.models import ImageTile
+from extensions import db
+from services.image_capture_service import ImageCaptureService
+from services.tile_download_service import TileDownloadService
+
+
+def _jobs(tile_server, count):
+    return [{'url': f'{tile_server.url}?center={index},0&zoom=20', 'index': index} for index in range(count)]
+
+
+def test_downloads_every_job_once_and_passes_job_keys_through(app, tile_server):
+    downloader = TileDownloadService(app.config)
+    try:
+        results = list(downloader.iter_downloads(_jobs(tile_server, 20), max_pending=4))
+    finally:
+        downloader.close()
+
+    assert sorted(result['index'] for result in results) == list(range(20))
+    assert all(result['ok'] and os.path.exists(result['file_path']) for result in results)
+    assert tile_server.count() == 20
+    summary = downloader.stats.summary()
+    assert summary['tilesOk'] == 20 and summary['tilesFailed'] == 0
+
+
+def test_retries_retryable_statuses(make_app, tile_server):
+    app = make_app(CAPTURE_MAX_WORKERS=1, CAPTURE_MAX_RETRIES=3)
+    tile_server.fail_next(2, status=503)
+    downloader = TileDownloadService(app.config)
+    try:
+        [result] = downloader.iter_downloads(_jobs(tile_server, 1))
+    finally:
+        downloader.close()
+
+    assert result['ok']
+    assert tile_server.count(503) == 2 and tile_server.count(200) == 1
+    assert downloader.stats.summary()['retries'] == 2
+
+
+def test_gives_up_after_max_retries(make_app, tile_server):
+    app = make_app(CAPTURE_MAX_WORKERS=1, CAPTURE_MAX_RETRIES=1)
+    tile_server.fail_next(5, status=503)
+    downloader = TileDownloadService(app.config)
+    try:
+        [result] = downloader.iter_downloads(_jobs(tile_server, 1))
+    finally:
+        downloader.close()
+
+    assert not result['ok'] and '503' in result['error']
+    assert tile_server.count(503) == 2
+    assert downloader.stats.summary()['tilesFailed'] == 1
+
+
+def test_does_not_retry_client_errors(make_app, tile_server):
+    app = make_app(CAPTURE_MAX_WORKERS=1)
+    tile_server.fail_next(1, status=403)
+    downloader = TileDownloadService(app.config)
+    try:
+        [result] = downloader.iter_downloads(_jobs(tile_server, 1))
+    finally:
+        downloader.close()
+
+    assert not result['ok']
+    assert tile_server.count() == 1
+
+
+def test_concurrent_downloaders_share_one_rate_limit_and_host_limit(make_app, tile_server):
+    app = make_app(CAPTURE_RATE_LIMIT_PER_SEC=40, CAPTURE_RATE_LIMIT_BURST=1, CAPTURE_PER_HOST_CONCURRENCY=2)
+    downloaders = [TileDownloadService(app.config) for _ in range(2)]
+    url = _jobs(tile_server, 1)[0]['url']
+    assert downloaders[0].rate_limiter is downloaders[1].rate_limiter
+    assert downloaders[0]._host_semaphore(url) is downloaders[1]._host_semaphore(url)
+
+    def run(downloader):
+        try:
+            assert all(result['ok'] for result in downloader.iter_downloads(_jobs(tile_server, 20)))
+        finally:
+            downloader.close()
+
+    started = time.monotonic()
+    threads = [threading.Thread(target=run, args=(downloader,)) for downloader in downloaders]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    # 40 requests at 40/s between them; two separate buckets would have let them finish in half that
+    assert time.monotonic() - started >= 0.9
+    assert tile_server.count() == 40
+
+
+def test_capture_stores_one_tile_per_grid_cell(app, tile_server, make_area, quiet):
+    area_config = make_area()
+    with quiet():
+        ImageCaptureService.capture_images_for_area(area_config, app.config)
+
+    rows = db.session.query(ImageTile).filter_by(area_config_id=area_config.id).all()
+    assert sorted(row.unique_key for row in rows) == sorted(ImageCaptureService.area_unique_keys(area_config))
+    assert tile_server.count(200) == len(rows)
+    assert all(os.path.exists(row.image_path) for row in rows)
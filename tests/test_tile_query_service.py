@@ -0,0 +1,89 @@
+import random
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import event
+
+from entities.models import ImageTile
+from extensions import db
+from services.tile_query_service import TileQueryService
+
+
+@pytest.fixture
+def capture_history(app, make_area):
+    """Two areas with uneven capture histories, including keys captured twice at the same time."""
+    rng = random.Random(7)
+    areas = [make_area(name='first'), make_area(name='second')]
+    started = datetime(2026, 1, 1)
+    for area_config in areas:
+        for key_index in range(12):
+            for _ in range(rng.randint(1, 6)):
+                db.session.add(ImageTile(area_config_id=area_config.id, unique_key=f'key_{key_index}',
+                                         latitude=0.0, longitude=0.0, image_path='tile.png', status='CAPTURED',
+                                         capture_time=started + timedelta(hours=rng.randint(0, 4))))
+    db.session.commit()
+    return areas
+
+
+def _naive_latest(area_config_id, depth, unique_keys=None):
+    """What the old per-key query loop selected: newest `depth` rows per key, ties broken by id."""
+    by_key = {}
+    for tile in db.session.query(ImageTile).filter_by(area_config_id=area_config_id):
+        if unique_keys is None or tile.unique_key in unique_keys:
+            by_key.setdefault(tile.unique_key, []).append(tile)
+    return {unique_key: [tile.id for tile in sorted(tiles, key=lambda tile: (tile.capture_time, tile.id),
+                                                    reverse=True)[:depth]]
+            for unique_key, tiles in by_key.items()}
+
+
+@pytest.mark.parametrize('depth', [1, 2, 3])
+def test_latest_captures_match_the_per_key_selection(capture_history, depth):
+    for area_config in capture_history:
+        expected = _naive_latest(area_config.id, depth)
+        by_key = TileQueryService.latest_captures_by_key(area_config.id, depth)
+
+        assert {unique_key: [tile.id for tile in tiles] for unique_key, tiles in by_key.items()} == expected
+        assert TileQueryService.latest_capture_ids(area_config.id, depth) == \
+            {tile_id for ids in expected.values() for tile_id in ids}
+        assert [row.id for row in TileQueryService.latest_capture_rows(area_config.id, depth)] == \
+            [tile.id for tile in TileQueryService.latest_captures(area_config.id, depth)]
+
+
+def test_latest_captures_can_be_limited_to_some_keys(capture_history):
+    area_config = capture_history[0]
+    unique_keys = ['key_1', 'key_4', 'key_missing']
+    by_key = TileQueryService.latest_captures_by_key(area_config.id, 2, unique_keys)
+
+    assert {unique_key: [tile.id for tile in tiles] for unique_key, tiles in by_key.items()} == \
+        _naive_latest(area_config.id, 2, set(unique_keys))
+
+
+def _loaded_tiles(area_config_id):
+    """How many ImageTile rows latest_captures materialises for the area."""
+    loaded = []
+    listener = lambda target, context: loaded.append(target.id)
+    event.listen(ImageTile, 'load', listener)
+    try:
+        tiles = TileQueryService.latest_captures(area_config_id, depth=2)
+    finally:
+        event.remove(ImageTile, 'load', listener)
+    db.session.expunge_all()  # Later calls load their rows again rather than from the identity map
+    return len(loaded), len(tiles)
+
+
+def test_rows_fetched_stay_flat_as_history_grows(app, make_area):
+    area_config_id = make_area().id
+    started = datetime(2026, 1, 1)
+    fetched = {}
+    captures = 0
+    for history in (2, 50):
+        db.session.bulk_insert_mappings(ImageTile, [
+            {'area_config_id': area_config_id, 'unique_key': f'key_{key_index}', 'latitude': 0.0, 'longitude': 0.0,
+             'image_path': 'tile.png', 'status': 'CAPTURED', 'capture_time': started + timedelta(minutes=5 * capture)}
+            for key_index in range(20) for capture in range(captures, history)])
+        db.session.commit()
+        captures = history
+        fetched[history] = _loaded_tiles(area_config_id)
+
+    assert db.session.query(ImageTile).count() == 20 * 50
+    assert fetched[2] == fetched[50] == (40, 40)  # Two rows per key, whatever the history length
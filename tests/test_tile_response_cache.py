@@ -0,0 +1,68 @@
+import os
+
+from services.tile_download_service import TileDownloadService
+from services.tile_response_cache import TileResponseCache
+
+
+def _download(app, url, min_refetch_seconds=0):
+    downloader = TileDownloadService(app.config, response_cache=TileResponseCache.instance(app.config),
+                                     min_refetch_seconds=min_refetch_seconds)
+    try:
+        [result] = downloader.iter_downloads([{'url': url}])
+    finally:
+        downloader.close()
+    return result, downloader.stats.summary()
+
+
+def test_unchanged_tile_is_revalidated_with_a_304(app, tile_server):
+    url = f'{tile_server.url}?center=1,1&key=secret'
+    first, first_stats = _download(app, url)
+    second, second_stats = _download(app, url)
+
+    assert first_stats['cacheMisses'] == 1
+    assert second_stats['cacheRevalidated'] == 1
+    assert tile_server.count(304) == 1
+    assert second['ok'] and second['content_hash'] == first['content_hash']
+
+
+def test_changed_tile_is_downloaded_again(app, tile_server):
+    url = f'{tile_server.url}?center=1,1'
+    first, _ = _download(app, url)
+    tile_server.change('1,1')
+    second, stats = _download(app, url)
+
+    assert stats['cacheMisses'] == 1
+    assert second['content_hash'] != first['content_hash']
+
+
+def test_recent_tile_is_served_without_a_request(app, tile_server):
+    url = f'{tile_server.url}?center=1,1'
+    _download(app, url)
+    result, stats = _download(app, url, min_refetch_seconds=3600)
+
+    assert result['ok'] and stats['cacheHits'] == 1
+    assert tile_server.count() == 1
+
+
+def test_api_key_is_not_part_of_the_cache_key():
+    assert TileResponseCache.cache_key('http://h/s?center=1,1&key=a') == \
+        TileResponseCache.cache_key('http://h/s?key=b&center=1,1')
+
+
+def test_unsolicited_304_without_a_cached_copy_is_refetched(app, tile_server):
+    tile_server.unsolicited_304(1)
+    result, stats = _download(app, f'{tile_server.url}?center=2,2')
+
+    assert result['ok'] and os.path.getsize(result['file_path']) > 0
+    assert tile_server.count(304) == 1 and tile_server.count(200) == 1
+    assert stats['cacheMisses'] == 1
+
+
+def test_304_for_a_removed_blob_is_not_served(app, tile_server):
+    url = f'{tile_server.url}?center=3,3'
+    first, _ = _download(app, url)
+    os.remove(first['file_path'])
+    second, stats = _download(app, url)
+
+    assert second['ok'] and os.path.exists(second['file_path'])
+    assert stats['cacheMisses'] == 1 and tile_server.count(304) == 0
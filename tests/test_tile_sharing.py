@@ -0,0 +1,123 @@
+from urllib.parse import urlsplit, parse_qs
+
+import pytest
+
+from entities.models import AlertSession, User
+from extensions import db
+from services import comparison_executor
+from services.image_capture_service import ImageCaptureService
+from services.monitoring_pipeline import MonitoringPipeline
+from services.tile_response_cache import TileResponseCache
+from utils.geo_utils import GeoUtils
+from utils.jwt_utils import generate_jwt_token
+
+
+def _center(job):
+    return parse_qs(urlsplit(job['url']).query)['center'][0]
+
+
+def _age_cached_responses(app_config, seconds):
+    """Moves every cached tile response back in time, as if the next sweep came that much later."""
+    cache = TileResponseCache.instance(app_config)
+    with cache._lock:
+        for entry in cache._entries.values():
+            entry['fetchedAt'] -= seconds
+
+
+def _inside(bbox, job):
+    return bbox['minLat'] <= job['lat'] <= bbox['maxLat'] and bbox['minLon'] <= job['lon'] <= bbox['maxLon']
+
+
+@pytest.fixture
+def overlapping_areas(make_app, make_area, tile_server, monkeypatch):
+    """
+    Runs two overlapping areas twice on the given grid mode, an hour apart, changing every tile
+    centred in their overlap between the runs. Returns the app, both areas' jobs, the Static Maps requests
+    and image comparisons of each round, and the second round's timings per area.
+    """
+    compared = []
+    compare_pair = comparison_executor._compare_pair
+    monkeypatch.setattr(comparison_executor, '_compare_pair',
+                        lambda pair, app_config: compared.append(pair) or compare_pair(pair, app_config))
+
+    def run(grid_mode):
+        app = make_app(TILE_GRID_MODE=grid_mode)
+        with app.app_context():
+            areas = [make_area(name='first', half_km=0.6),
+                     make_area(name='second', center_lat=25.354, center_lon=74.634, half_km=0.6)]
+            area_ids = [area_config.id for area_config in areas]
+            jobs = {area_config.id: ImageCaptureService.plan_tile_jobs(area_config, app.config)
+                    for area_config in areas}
+            boxes = [GeoUtils.calculate_bounding_box(area_config.center_lat, area_config.center_lon,
+                                                     0.6, 0.6, 0.6, 0.6) for area_config in areas]
+            overlap = {'minLat': boxes[1]['minLat'], 'minLon': boxes[1]['minLon'],
+                       'maxLat': boxes[0]['maxLat'], 'maxLon': boxes[0]['maxLon']}
+
+            rounds, timings = [], {}
+            for round_index in range(2):
+                if round_index:
+                    _age_cached_responses(app.config, 3600)  # Past TILE_SHARE_WINDOW_SECONDS
+                    for center in {_center(job) for area_jobs in jobs.values() for job in area_jobs
+                                   if _inside(overlap, job)}:
+                        tile_server.change(center)
+                requests_before, compared_before = tile_server.count(), len(compared)
+                for area_id in area_ids:
+                    area_config = db.session.get(type(areas[0]), area_id)
+                    timings[area_id] = MonitoringPipeline.run_for_area(area_config, app.config)
+                rounds.append((tile_server.count() - requests_before, len(compared) - compared_before))
+        return app, area_ids, jobs, overlap, rounds, timings
+
+    return run
+
+
+def test_overlapping_areas_download_and_compare_shared_cells_once(overlapping_areas, quiet):
+    with quiet():
+        baseline_app, area_ids, jobs, overlap, baseline_rounds, baseline_timings = overlapping_areas('area')
+        with baseline_app.app_context():  # Both apps use the same database file
+            db.session.remove()
+            db.drop_all()
+        app, _, world_jobs, _, world_rounds, world_timings = overlapping_areas('global')
+
+    # Per-area grids: every area requests and compares its own copy of the overlap
+    planned = sum(len(area_jobs) for area_jobs in jobs.values())
+    changed = {area_id: sum(1 for job in area_jobs if _inside(overlap, job)) for area_id, area_jobs in jobs.items()}
+    assert baseline_rounds[0] == (planned, 0)
+    assert baseline_rounds[1] == (planned, sum(changed.values()))
+
+    # World grid: a cell both areas cover is requested and compared once
+    first_id, second_id = sorted(world_jobs)
+    first_keys, second_keys = ({job['unique_key'] for job in world_jobs[area_id]} for area_id in (first_id, second_id))
+    world_changed = {job['unique_key'] for area_jobs in world_jobs.values() for job in area_jobs
+                     if _inside(overlap, job)}
+    shared_changed = world_changed & first_keys & second_keys
+    assert first_keys & second_keys and shared_changed
+    assert world_rounds[0] == (len(first_keys | second_keys), 0)
+    assert world_rounds[1] == (len(first_keys | second_keys), len(world_changed))
+    assert world_rounds[0][0] < baseline_rounds[0][0] and world_rounds[1][1] < baseline_rounds[1][1]
+
+    # Alerts are still raised per area, for every changed cell the area covers
+    with app.app_context():
+        for area_id, keys in ((first_id, first_keys), (second_id, second_keys)):
+            assert world_timings[area_id]['changesDetected'] == len(world_changed & keys)
+            [session] = db.session.query(AlertSession).filter_by(area_config_id=area_id,
+                                                                 status='COMPLETED_CHANGES_DETECTED').all()
+            assert session.total_changes_detected == len(world_changed & keys)
+    assert all(baseline_timings[area_id]['changesDetected'] == changed[area_id] for area_id in area_ids)
+
+    with app.app_context():
+        user = User(email='tester@example.com', profile='')
+        user.set_password('password')
+        db.session.add(user)
+        db.session.commit()
+        token = generate_jwt_token(user.id, 'access', app.config, user.password_version())
+        response = app.test_client().get('/api/monitor/sharing', headers={'Authorization': f'Bearer {token}'})
+    assert response.status_code == 200
+    body = response.get_json()
+    assert body['tileGridMode'] == 'global'
+    first, second = body['areas'][str(first_id)], body['areas'][str(second_id)]
+    assert first['requests'] == len(first_keys) and first['reusedCaptures'] == 0
+    assert second['requests'] == len(second_keys - first_keys)
+    assert second['reusedCaptures'] == len(first_keys & second_keys)
+    assert second['tilesCompared'] == len(world_changed & second_keys)
+    assert second['comparisonsReused'] == len(shared_changed)
+    assert body['comparisonMemo']['hits'] >= len(shared_changed)
@@ -0,0 +1,128 @@
+import random
+from datetime import datetime, timedelta
+from urllib.parse import urlsplit, parse_qs
+
+from entities.models import AreaConfig, ImageTile
+from extensions import db
+from services.image_capture_service import ImageCaptureService
+from services.monitoring_pipeline import MonitoringPipeline
+from services.tile_state_index import TileStateIndex
+
+STARTED = datetime(2026, 1, 1)
+
+
+def _add_history(area_config, rng, max_captures):
+    """Between 0 and max_captures captures per cell, with random change and comparison flags."""
+    rows = []
+    for unique_key in ImageCaptureService.area_unique_keys(area_config):
+        for capture in range(rng.randint(0, max_captures)):
+            rows.append({'area_config_id': area_config.id, 'unique_key': unique_key, 'latitude': 0.0,
+                         'longitude': 0.0, 'capture_time': STARTED + timedelta(hours=capture),
+                         'image_path': f'{unique_key}_{capture}.png', 'content_hash': f'{capture:040x}',
+                         'status': 'COMPARED', 'change_detected': rng.random() < 0.3,
+                         'needs_comparison': rng.random() < 0.3})
+    db.session.bulk_insert_mappings(ImageTile, rows)
+    db.session.commit()
+
+
+def _cells_from_db(area_config):
+    """What AreaTileState.cell should say for each key, read straight from image_tiles."""
+    by_key = {}
+    for tile in db.session.query(ImageTile).filter_by(area_config_id=area_config.id).order_by(
+            ImageTile.capture_time.desc(), ImageTile.id.desc()):
+        by_key.setdefault(tile.unique_key, []).append(tile)
+    cells = {}
+    for unique_key in ImageCaptureService.area_unique_keys(area_config):
+        latest, previous = (by_key.get(unique_key, []) + [None, None])[:2]
+        cells[unique_key] = {
+            'latestId': latest.id if latest else None,
+            'previousId': previous.id if previous else None,
+            'latestPath': latest.image_path if latest else None,
+            'previousPath': previous.image_path if previous else None,
+            'changeDetected': bool(latest and latest.change_detected),
+            'needsComparison': bool(latest and latest.needs_comparison),
+        }
+    return cells
+
+
+def _cells_in_index(area_config):
+    state = TileStateIndex.for_area(area_config)
+    return {unique_key: state.cell(unique_key) for unique_key in ImageCaptureService.area_unique_keys(area_config)}
+
+
+def test_warm_all_loads_the_latest_two_captures_of_every_cell(app, make_area, quiet):
+    rng = random.Random(5)
+    areas = [make_area(name='first'), make_area(name='second', half_km=0.5)]
+    for area_config in areas:
+        _add_history(area_config, rng, max_captures=4)
+
+    with quiet():
+        TileStateIndex.warm_all()
+
+    for area_config in areas:
+        assert TileStateIndex.loaded(area_config.id) is not None
+        assert _cells_in_index(area_config) == _cells_from_db(area_config)
+        state = TileStateIndex.loaded(area_config.id)
+        assert sorted(state.dirty_keys()) == sorted(
+            unique_key for unique_key, cell in _cells_from_db(area_config).items() if cell['needsComparison'])
+
+
+def test_capture_and_comparison_keep_the_index_in_step_with_the_db(app, make_area, tile_server, quiet):
+    area_config = make_area()
+    jobs = ImageCaptureService.plan_tile_jobs(area_config, app.config)
+    changed_key = jobs[3]['unique_key']
+
+    with quiet():
+        MonitoringPipeline.run_for_area(area_config, app.config)
+    assert _cells_in_index(area_config) == _cells_from_db(area_config)
+    assert all(cell['latestId'] and cell['previousId'] is None for cell in _cells_in_index(area_config).values())
+
+    with quiet():
+        MonitoringPipeline.run_for_area(area_config, app.config)  # Same images: only last_seen_time moves
+    assert _cells_in_index(area_config) == _cells_from_db(area_config)
+    assert all(cell['previousId'] is None for cell in _cells_in_index(area_config).values())
+
+    tile_server.change(parse_qs(urlsplit(jobs[3]['url']).query)['center'][0])
+    with quiet():
+        MonitoringPipeline.run_for_area(area_config, app.config)
+    cells = _cells_in_index(area_config)
+    assert cells == _cells_from_db(area_config)
+    assert {unique_key for unique_key, cell in cells.items() if cell['changeDetected']} == {changed_key}
+    assert {unique_key for unique_key, cell in cells.items() if cell['previousId']} == {changed_key}
+    assert not any(cell['needsComparison'] for cell in cells.values())
+
+
+def test_area_updates_and_deletes_drop_its_state(app, make_area):
+    area_config = make_area()
+    _add_history(area_config, random.Random(1), max_captures=2)
+    state = TileStateIndex.for_area(area_config)
+    assert TileStateIndex.loaded(area_config.id) is state
+
+    area_config.name = 'renamed'
+    db.session.commit()
+    assert TileStateIndex.loaded(area_config.id) is None
+    assert TileStateIndex.for_area(area_config) is not state  # Reloaded on next use
+
+    area_config.north_km = 0.6  # New geometry, new grid
+    db.session.commit()
+    state = TileStateIndex.for_area(area_config)
+    assert len(state.unique_keys) == len(ImageCaptureService.area_unique_keys(area_config)) == 12
+
+    area_config_id = area_config.id
+    db.session.query(ImageTile).delete()
+    db.session.delete(db.session.get(AreaConfig, area_config_id))
+    db.session.commit()
+    assert TileStateIndex.loaded(area_config_id) is None
+    assert TileStateIndex.for_area_id(area_config_id) is None
+
+
+def test_memory_does_not_grow_with_history(app, make_area):
+    sizes = {}
+    for max_captures in (1, 40):
+        area_config = make_area(name=f'{max_captures} captures')
+        _add_history(area_config, random.Random(2), max_captures=max_captures)
+        state = TileStateIndex.for_area(area_config)
+        sizes[max_captures] = state.nbytes(), state.summary()['cells']
+
+    assert db.session.query(ImageTile).count() > 100
+    assert sizes[1] == sizes[40]
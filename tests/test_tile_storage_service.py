@@ -0,0 +1,38 @@
+import os
+from datetime import datetime, timedelta
+
+from entities.models import ImageTile
+from extensions import db
+from services.tile_storage_service import TileStorageService
+
+
+def _legacy_file(app, area_config, name, content):
+    directory = os.path.join(app.config['IMAGE_STORAGE_DIRECTORY'], str(area_config.id))
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, name)
+    with open(path, 'wb') as f:
+        f.write(content)
+    return path
+
+
+def test_compaction_moves_rows_sharing_a_legacy_file_with_their_hash(app, make_area, quiet):
+    area_config = make_area()
+    shared_path = _legacy_file(app, area_config, 'shared.png', b'shared')
+    other_path = _legacy_file(app, area_config, 'other.png', b'other')
+    started = datetime(2026, 3, 1)
+    for index, (unique_key, path) in enumerate([('a', shared_path), ('b', shared_path), ('a', other_path)]):
+        db.session.add(ImageTile(area_config_id=area_config.id, unique_key=unique_key, latitude=0.0, longitude=0.0,
+                                 capture_time=started + timedelta(hours=index), image_path=path, status='COMPARED'))
+    db.session.commit()
+
+    with quiet():
+        stats = TileStorageService.compact_area(area_config.id, app.config)
+    db.session.expire_all()
+
+    assert stats['filesMigrated'] == 2 and stats['filesMissing'] == 0
+    tiles = db.session.query(ImageTile).order_by(ImageTile.id).all()
+    shared_hash = TileStorageService.content_hash(b'shared')
+    assert [(tile.image_path, tile.content_hash) for tile in tiles[:2]] == \
+        [(TileStorageService.blob_path(shared_hash, app.config), shared_hash)] * 2
+    assert all(tile.last_seen_time == tile.capture_time for tile in tiles)
+    assert not os.path.exists(shared_path) and not os.path.exists(other_path)
@@ -0,0 +1,44 @@
+from sqlalchemy import create_engine, inspect, text
+
+from scripts.upgrade_schema import upgrade
+
+# The tables as the first release created them
+BASELINE_DDL = [
+    """CREATE TABLE area_configs (
+        id INTEGER PRIMARY KEY, name VARCHAR(255) NOT NULL, center_lat FLOAT NOT NULL, center_lon FLOAT NOT NULL,
+        north_km FLOAT NOT NULL, south_km FLOAT NOT NULL, east_km FLOAT NOT NULL, west_km FLOAT NOT NULL,
+        created_at DATETIME)""",
+    """CREATE TABLE image_tiles (
+        id INTEGER PRIMARY KEY, area_config_id INTEGER NOT NULL REFERENCES area_configs (id),
+        unique_key VARCHAR(255) NOT NULL, latitude FLOAT NOT NULL, longitude FLOAT NOT NULL,
+        capture_time DATETIME NOT NULL, image_path VARCHAR(255) NOT NULL, status VARCHAR(50) NOT NULL,
+        last_comparison_time DATETIME, change_detected BOOLEAN)""",
+    "CREATE INDEX idx_area_config_unique_key ON image_tiles (area_config_id, unique_key)",
+    "CREATE INDEX idx_unique_key_capture_time ON image_tiles (unique_key, capture_time)",
+    "INSERT INTO area_configs (id, name, center_lat, center_lon, north_km, south_km, east_km, west_km) "
+    "VALUES (1, 'area', 0, 0, 1, 1, 1, 1)",
+    "INSERT INTO image_tiles (area_config_id, unique_key, latitude, longitude, capture_time, image_path, status) "
+    "VALUES (1, 'k', 0, 0, '2025-01-01 00:00:00', 'captured_images/1/k.png', 'COMPARED')",
+]
+
+
+def test_upgrade_adds_missing_columns_and_indexes_once(tmp_path, quiet):
+    engine = create_engine(f"sqlite:///{tmp_path / 'old.sqlite'}")
+    with engine.begin() as connection:
+        for statement in BASELINE_DDL:
+            connection.execute(text(statement))
+
+    with quiet():
+        statements = upgrade(engine)
+        assert upgrade(engine) == []  # Nothing left to do the second time
+
+    inspector = inspect(engine)
+    tile_columns = {column['name'] for column in inspector.get_columns('image_tiles')}
+    assert {'content_hash', 'last_seen_time', 'needs_comparison'} <= tile_columns
+    assert {'min_refetch_seconds', 'monitor_interval_minutes', 'change_pixel_threshold', 'change_min_region_area',
+            'change_percent_threshold'} <= {column['name'] for column in inspector.get_columns('area_configs')}
+    assert {'idx_area_key_capture_time', 'idx_area_needs_comparison'} <= {
+        index['name'] for index in inspector.get_indexes('image_tiles')}
+    assert len(statements) == 10
+    with engine.connect() as connection:  # Existing rows aren't waiting for a comparison
+        assert connection.execute(text("SELECT needs_comparison FROM image_tiles")).scalar_one() == 0
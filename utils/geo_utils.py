@@ -1,4 +1,5 @@
-from math import radians, cos
+from functools import lru_cache
+from math import radians, cos, ceil
 import numpy as np
 
 class GeoUtils:
@@ -26,3 +27,130 @@ class GeoUtils:
         max_lon = center_lon + GeoUtils.meters_to_longitude_degrees(east_meters, center_lat)
 
         return {'minLat': min_lat, 'maxLat': max_lat, 'minLon': min_lon, 'maxLon': max_lon}
+
+    # --- Tile grids ---
+
+    @staticmethod
+    def grid_shape(north_km, south_km, east_km, west_km, tile_size_meters):
+        num_rows = int(ceil((north_km + south_km) * 1000 / tile_size_meters))
+        num_cols = int(ceil((east_km + west_km) * 1000 / tile_size_meters))
+        return num_rows, num_cols
+
+    @staticmethod
+    def _grid_rows(bbox, num_cols, tile_size_meters, row_start, row_stop):
+        """
+        Vectorised tile centres and bounds for grid rows [row_start, row_stop), flattened row-major.
+        Uses the same formulas as the per-cell meters_to_*_degrees calls, so centres match them.
+        """
+        half_tile = tile_size_meters / 2.0
+        rows = np.arange(row_start, row_stop, dtype=np.int64)
+        cols = np.arange(num_cols, dtype=np.int64)
+
+        row_lats = bbox['minLat'] + (rows * tile_size_meters + half_tile) / (
+                GeoUtils.EARTH_RADIUS_METERS * (np.pi / 180.0))
+        lon_scale = GeoUtils.EARTH_RADIUS_METERS * np.cos(np.radians(row_lats)) * (np.pi / 180.0)  # Per row
+        center_lons = bbox['minLon'] + (cols * tile_size_meters + half_tile)[np.newaxis, :] / lon_scale[:, np.newaxis]
+
+        half_lat = half_tile / (GeoUtils.EARTH_RADIUS_METERS * (np.pi / 180.0))
+        half_lons = np.repeat(half_tile / lon_scale, num_cols)
+        center_lats = np.repeat(row_lats, num_cols)
+        center_lons = center_lons.ravel()
+
+        return {
+            'rowIndex': np.repeat(rows, num_cols),
+            'colIndex': np.tile(cols, len(rows)),
+            'centerLats': center_lats,
+            'centerLons': center_lons,
+            # [minLat, minLon, maxLat, maxLon] per tile
+            'bounds': np.column_stack((center_lats - half_lat, center_lons - half_lons,
+                                       center_lats + half_lat, center_lons + half_lons)),
+        }
+
+    @staticmethod
+    @lru_cache(maxsize=256)
+    def tile_grid(center_lat, center_lon, north_km, south_km, east_km, west_km, tile_size_meters):
+        """
+        Whole tile grid for an area in one call. Memoised on the geometry, since the grid never
+        changes while the AreaConfig doesn't; the returned arrays are read-only and shared.
+        """
+        bbox = GeoUtils.calculate_bounding_box(center_lat, center_lon, north_km, south_km, east_km, west_km)
+        num_rows, num_cols = GeoUtils.grid_shape(north_km, south_km, east_km, west_km, tile_size_meters)
+        grid = GeoUtils._grid_rows(bbox, num_cols, tile_size_meters, 0, num_rows)
+        grid['rowFirstCols'] = np.zeros(num_rows, dtype=np.int64)
+        for array in grid.values():
+            array.setflags(write=False)
+        grid.update(rows=num_rows, cols=num_cols, bbox=bbox,
+                    origin={'lat': bbox['minLat'], 'lon': bbox['minLon'], 'firstRow': 0})
+        return grid
+
+    @staticmethod
+    @lru_cache(maxsize=256)
+    def world_tile_grid(center_lat, center_lon, north_km, south_km, east_km, west_km, tile_size_meters):
+        """
+        The cells of one fixed, area-independent world grid that touch an area's bounding box.
+
+        World rows are tile_size_meters tall from the South Pole; each row is cut into columns
+        tile_size_meters wide at the row's centre latitude, from the antimeridian. A cell's
+        centre therefore depends only on its (globalRow, globalCol), so every area covering it
+        gets the very same centre. rowIndex is relative to the area's first row and colIndex to
+        each row's first column (rowFirstCols), as in tile_grid; rows can differ in length by a
+        cell, since column width varies with latitude. 'origin' and rowFirstCols hold what
+        SpatialIndex needs to locate cells arithmetically.
+        """
+        bbox = GeoUtils.calculate_bounding_box(center_lat, center_lon, north_km, south_km, east_km, west_km)
+        degree_meters = GeoUtils.EARTH_RADIUS_METERS * (np.pi / 180.0)
+        lat_step = tile_size_meters / degree_meters
+        lat0, lon0 = -90.0, -180.0
+
+        first_row = int(np.floor((bbox['minLat'] - lat0) / lat_step))
+        last_row = int(np.floor((bbox['maxLat'] - lat0) / lat_step))
+        rows = np.arange(first_row, last_row + 1, dtype=np.int64)
+        row_lats = lat0 + (rows + 0.5) * lat_step
+        lon_scale = degree_meters * np.cos(np.radians(row_lats))  # Metres per degree of longitude, per row
+        first_cols = np.floor((bbox['minLon'] - lon0) * lon_scale / tile_size_meters).astype(np.int64)
+        last_cols = np.floor((bbox['maxLon'] - lon0) * lon_scale / tile_size_meters).astype(np.int64)
+
+        counts = last_cols - first_cols + 1
+        row_of_cell = np.repeat(np.arange(len(rows)), counts)
+        global_rows = rows[row_of_cell]
+        global_cols = np.repeat(first_cols, counts) + (np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts,
+                                                                                           counts))
+        center_lats = row_lats[row_of_cell]
+        cell_lon_scale = lon_scale[row_of_cell]
+        center_lons = lon0 + (global_cols + 0.5) * tile_size_meters / cell_lon_scale
+        half_lat = lat_step / 2.0
+        half_lons = tile_size_meters / 2.0 / cell_lon_scale
+
+        grid = {
+            'rowIndex': global_rows - first_row,
+            'colIndex': global_cols - np.repeat(first_cols, counts),  # Per row, so columns line up with longitude
+            'globalRow': global_rows,
+            'globalCol': global_cols,
+            'centerLats': center_lats,
+            'centerLons': center_lons,
+            'bounds': np.column_stack((center_lats - half_lat, center_lons - half_lons,
+                                       center_lats + half_lat, center_lons + half_lons)),
+        }
+        grid['rowFirstCols'] = first_cols
+        for array in grid.values():
+            array.setflags(write=False)
+        grid.update(rows=len(rows), cols=int(counts.max()), bbox=bbox,
+                    origin={'lat': lat0, 'lon': lon0, 'firstRow': first_row})
+        return grid
+
+    @staticmethod
+    def iter_tile_grid_chunks(center_lat, center_lon, north_km, south_km, east_km, west_km, tile_size_meters,
+                              chunk_rows=64):
+        """Streams the grid in bands of chunk_rows rows so very large areas never sit in memory at once."""
+        bbox = GeoUtils.calculate_bounding_box(center_lat, center_lon, north_km, south_km, east_km, west_km)
+        num_rows, num_cols = GeoUtils.grid_shape(north_km, south_km, east_km, west_km, tile_size_meters)
+        for row_start in range(0, num_rows, chunk_rows):
+            yield GeoUtils._grid_rows(bbox, num_cols, tile_size_meters, row_start, min(num_rows, row_start + chunk_rows))
+
+    @staticmethod
+    def area_tile_grid(area_config, tile_size_meters, mode='area'):
+        """The area's cells: its own grid anchored at its bbox ('area') or the world grid ('global')."""
+        build = GeoUtils.world_tile_grid if mode == 'global' else GeoUtils.tile_grid
+        return build(area_config.center_lat, area_config.center_lon,
+                     area_config.north_km, area_config.south_km,
+                     area_config.east_km, area_config.west_km, tile_size_meters)
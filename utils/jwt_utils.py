@@ -1,20 +1,28 @@
+import time
+import uuid
 from datetime import datetime, timedelta
 import jwt
 from functools import wraps
 from flask import request, jsonify, current_app  # Keep current_app for request context
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session, object_session
 
 # Import User model from entities
 from entities.models import User
+from utils.principal_cache import AuthenticatedUser, PrincipalCache
 
 
 # Pass app_config to this function
-def generate_jwt_token(user_id, token_type='access', app_config=None):
+def generate_jwt_token(user_id, token_type='access', app_config=None, password_version=None):
     if app_config is None:
         # Fallback to current_app.config if not explicitly passed (e.g., in request context)
         app_config = current_app.config
 
     if token_type == 'access':
         expires_delta = timedelta(days=app_config['JWT_ACCESS_TOKEN_EXPIRES_DAYS'])
+        if app_config.get('AUTH_TRUST_TOKEN_CLAIMS'):
+            # Trusted tokens are never checked against the user, so keep them short-lived
+            expires_delta = min(expires_delta, timedelta(seconds=app_config.get('AUTH_TRUSTED_TOKEN_MAX_SECONDS', 900)))
     elif token_type == 'refresh':
         expires_delta = timedelta(days=app_config['JWT_REFRESH_TOKEN_EXPIRES_DAYS'])
     else:
@@ -24,8 +32,11 @@ def generate_jwt_token(user_id, token_type='access', app_config=None):
         'user_id': user_id,
         'exp': datetime.utcnow() + expires_delta,
         'iat': datetime.utcnow(),
-        'type': token_type
+        'type': token_type,
+        'jti': uuid.uuid4().hex
     }
+    if password_version is not None:
+        payload['pv'] = password_version  # See User.password_version
     return jwt.encode(payload, app_config['JWT_SECRET_KEY'], algorithm='HS256')
 
 
@@ -44,12 +55,48 @@ def decode_jwt_token(token, app_config=None):
         return {'error': 'Invalid token'}
 
 
+def verify_token_user(payload, app_config, from_database=False):
+    """
+    Resolves a decoded token to an AuthenticatedUser. Returns (user, None) or (None, error message).
+
+    With AUTH_TRUST_TOKEN_CLAIMS the signed claims of a token issued within the last
+    AUTH_TRUSTED_TOKEN_MAX_SECONDS are trusted as they are, without the database: the user's
+    email is then None, and a deleted user or changed password is only noticed once the token
+    must be refreshed (generate_jwt_token caps access tokens to that age in this mode).
+    Older tokens, and every token otherwise, get the user from PrincipalCache or, on a miss,
+    the database. from_database skips both shortcuts.
+    """
+    from extensions import db  # Local import for db access
+
+    user_id = payload.get('user_id')
+    if app_config.get('AUTH_TRUST_TOKEN_CLAIMS') and not from_database and \
+            time.time() - payload.get('iat', 0) <= float(app_config.get('AUTH_TRUSTED_TOKEN_MAX_SECONDS', 900)):
+        return AuthenticatedUser(user_id, None, payload.get('pv')), None
+
+    ttl_seconds = float(app_config.get('AUTH_PRINCIPAL_CACHE_TTL_SECONDS', 60))
+    principal = PrincipalCache.get(user_id) if ttl_seconds > 0 and not from_database else None
+    if principal is None:
+        user = db.session.get(User, user_id)
+        if not user:
+            return None, 'User not found!'
+        principal = AuthenticatedUser.from_user(user)
+        if ttl_seconds > 0:
+            PrincipalCache.put(principal, ttl_seconds, int(app_config.get('AUTH_PRINCIPAL_CACHE_MAX_ENTRIES', 10000)))
+
+    # Tokens issued before the last password change are revoked (tokens without the claim predate it)
+    if payload.get('pv') is not None and payload['pv'] != principal.password_version:
+        return None, 'Token has been revoked'
+    return principal, None
+
+
 def jwt_required(f):
+    """
+    Rejects requests without a valid access token. On success request.current_user is the
+    caller as a utils.principal_cache.AuthenticatedUser (id, email, password_version), not an
+    ORM User: load the User from the database if the route needs more than that.
+    """
     @wraps(f)
     def decorated_function(*args, **kwargs):
-        # Ensure db is accessible within the current app context for queries
-        from extensions import db  # Local import for db access
-
         auth_header = request.headers.get('Authorization')
         if not auth_header:
             return jsonify({'message': 'Authorization token is missing!'}), 401
@@ -61,13 +108,14 @@ def jwt_required(f):
             if 'error' in payload:
                 return jsonify({'message': payload['error']}), 401
 
-            user_id = payload.get('user_id')
-            # Use db.session.query for database operations
-            user = db.session.query(User).get(user_id)
-            if not user:
-                return jsonify({'message': 'User not found!'}), 401
+            if payload.get('type', 'access') != 'access':
+                return jsonify({'message': 'Refresh tokens cannot be used to access the API'}), 401
 
-            request.current_user = user  # Attach user object to request
+            user, error = verify_token_user(payload, current_app.config)
+            if error:
+                return jsonify({'message': error}), 401
+
+            request.current_user = user  # Attach the verified user to the request
         except IndexError:
             return jsonify({'message': 'Token format is invalid!'}), 401
         except Exception as e:
@@ -76,3 +124,29 @@ def jwt_required(f):
         return f(*args, **kwargs)
 
     return decorated_function
+
+
+# --- Principal cache invalidation ---
+@event.listens_for(User, 'after_update')
+def _invalidate_on_password_change(mapper, connection, target):
+    if inspect(target).attrs.password_hash.history.has_changes():
+        PrincipalCache.invalidate(target.id)
+        # Again once committed, in case a request re-cached the old row in between
+        object_session(target).info.setdefault('invalidated_user_ids', set()).add(target.id)
+
+
+@event.listens_for(User, 'after_delete')
+def _invalidate_on_user_delete(mapper, connection, target):
+    PrincipalCache.invalidate(target.id)
+    object_session(target).info.setdefault('invalidated_user_ids', set()).add(target.id)
+
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate_committed_users(session):
+    for user_id in session.info.pop('invalidated_user_ids', ()):
+        PrincipalCache.invalidate(user_id)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _forget_rolled_back_users(session):
+    session.info.pop('invalidated_user_ids', None)
@@ -0,0 +1,256 @@
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from datetime import datetime
+
+# Histogram upper bounds in seconds: a cached decode (~1 ms) up to a whole area run
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0)
+
+# Per-thread list of (stage, seconds) while a comparison collects its own stage timings
+_stage_collector = threading.local()
+
+
+def _label_text(label_names, label_values):
+    if not label_names:
+        return ''
+    escaped = (value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for value in label_values)
+    return '{' + ','.join(f'{name}="{value}"' for name, value in zip(label_names, escaped)) + '}'
+
+
+class Counter:
+    """Monotonic counter with one series per combination of label values."""
+
+    def __init__(self, name, description, label_names=()):
+        self.name = name
+        self.description = description
+        self.label_names = tuple(label_names)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        if not Metrics.enabled:
+            return
+        key = tuple(str(labels.get(name, '')) for name in self.label_names)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.description}', f'# TYPE {self.name} counter']
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f'{self.name}{_label_text(self.label_names, key)} {value}')
+        return lines
+
+
+class Histogram:
+    """Bucketed distribution (Prometheus histogram) with one series per combination of label values."""
+
+    def __init__(self, name, description, label_names=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.description = description
+        self.label_names = tuple(label_names)
+        self.buckets = tuple(buckets)
+        self._series = {}  # label values -> [per-bucket counts (last is +Inf), sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        if Metrics.enabled:
+            self.observe_key(value, tuple(str(labels.get(name, '')) for name in self.label_names))
+
+    def observe_key(self, value, key):
+        """observe() with the label values already given as a tuple of strings, in label order."""
+        bucket = bisect_left(self.buckets, value)  # First bound >= value, as Prometheus' le is inclusive
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][bucket] += 1
+            series[1] += value
+            series[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.description}', f'# TYPE {self.name} histogram']
+        label_names = self.label_names + ('le',)
+        with self._lock:
+            for key, (bucket_counts, total, count) in sorted(self._series.items()):
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets + (float('inf'),), bucket_counts):
+                    cumulative += bucket_count
+                    le = '+Inf' if bound == float('inf') else repr(bound)
+                    lines.append(f'{self.name}_bucket{_label_text(label_names, key + (le,))} {cumulative}')
+                lines.append(f'{self.name}_sum{_label_text(self.label_names, key)} {total}')
+                lines.append(f'{self.name}_count{_label_text(self.label_names, key)} {count}')
+        return lines
+
+
+class Metrics:
+    """
+    Process-wide registry of counters and histograms, rendered in the Prometheus text format
+    by GET /metrics.
+
+    Hot stages are timed with Metrics.stage(); each observation is a perf_counter pair, a
+    bisect and a short lock, so instrumentation stays on in production (METRICS_ENABLED turns
+    it off). Comparison stages run in worker processes, whose registries nobody scrapes:
+    there collect_stages() gathers the timings, which travel back with the result and are
+    recorded by the parent under the area's label. While an area's pipeline run is in
+    progress its stage timings are also summed into a per-run trace, which is added to the
+    run's timings and, with METRICS_TRACE_DIRECTORY set, written there as JSON.
+    """
+
+    enabled = True
+    trace_directory = None
+    _registry = []  # Metrics in definition order
+    _traces = {}  # area label -> {stage: [count, total seconds, max seconds]} of the run in progress
+    _traces_lock = threading.Lock()
+
+    @staticmethod
+    def configure(app_config):
+        Metrics.enabled = bool(app_config.get('METRICS_ENABLED', True))
+        Metrics.trace_directory = app_config.get('METRICS_TRACE_DIRECTORY')
+
+    @staticmethod
+    def counter(name, description, label_names=()):
+        metric = Counter(name, description, label_names)
+        Metrics._registry.append(metric)
+        return metric
+
+    @staticmethod
+    def histogram(name, description, label_names=(), buckets=DEFAULT_BUCKETS):
+        metric = Histogram(name, description, label_names, buckets)
+        Metrics._registry.append(metric)
+        return metric
+
+    @staticmethod
+    def render():
+        lines = []
+        for metric in Metrics._registry:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+    # --- Stage timing ---
+
+    @staticmethod
+    def stage(stage, area=''):
+        """Context manager timing the block as one observation of the stage, for the given area."""
+        return StageTimer(stage, area)
+
+    @staticmethod
+    def observe_stage(stage, seconds, area=''):
+        area = str(area)
+        STAGE_SECONDS.observe_key(seconds, (stage, area))
+        trace = Metrics._traces.get(area)
+        if trace is not None:
+            with Metrics._traces_lock:
+                entry = trace.setdefault(stage, [0, 0.0, 0.0])
+                entry[0] += 1
+                entry[1] += seconds
+                entry[2] = max(entry[2], seconds)
+
+    @staticmethod
+    @contextmanager
+    def collect_stages():
+        """Gathers this thread's stage timings in a list instead of recording them."""
+        previous = getattr(_stage_collector, 'stages', None)
+        _stage_collector.stages = collected = []
+        try:
+            yield collected
+        finally:
+            _stage_collector.stages = previous
+
+    @staticmethod
+    def record_stages(stages, area=''):
+        """Records (stage, seconds) timings gathered by collect_stages, e.g. in a worker process."""
+        for stage, seconds in stages or ():
+            Metrics.observe_stage(stage, seconds, area)
+
+    # --- Per-run traces ---
+
+    @staticmethod
+    def start_trace(area):
+        if Metrics.enabled:
+            with Metrics._traces_lock:
+                Metrics._traces[str(area)] = {}
+
+    @staticmethod
+    def finish_trace(area, run_summary=None):
+        """
+        Ends the area's trace and returns {stage: {count, totalSeconds, maxSeconds}}. With
+        METRICS_TRACE_DIRECTORY set the trace and run_summary are also written there as JSON.
+        """
+        with Metrics._traces_lock:
+            trace = Metrics._traces.pop(str(area), None)
+        if trace is None:
+            return {}
+        stages = {stage: {'count': count, 'totalSeconds': round(total, 4), 'maxSeconds': round(longest, 4)}
+                  for stage, (count, total, longest) in sorted(trace.items())}
+        if Metrics.trace_directory:
+            try:
+                os.makedirs(Metrics.trace_directory, exist_ok=True)
+                finished = datetime.utcnow()
+                path = os.path.join(Metrics.trace_directory, f"area_{area}_{finished.strftime('%Y%m%dT%H%M%S%f')}.json")
+                with open(path, 'w') as f:
+                    json.dump({'areaConfigId': area, 'finishedAt': finished.isoformat(), 'stages': stages,
+                               'run': run_summary}, f, default=str)
+            except OSError as e:
+                print(f"Could not write metrics trace for area {area}: {e}")
+        return stages
+
+
+class StageTimer:
+    """What Metrics.stage returns; a plain class rather than a generator, as it wraps the hottest code."""
+    __slots__ = ('stage', 'area', 'started')
+
+    def __init__(self, stage, area):
+        self.stage = stage
+        self.area = area
+        self.started = None
+
+    def __enter__(self):
+        if Metrics.enabled:
+            self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if self.started is None:
+            return False
+        seconds = time.perf_counter() - self.started
+        collected = getattr(_stage_collector, 'stages', None)
+        if collected is not None:
+            collected.append((self.stage, seconds))
+        else:
+            Metrics.observe_stage(self.stage, seconds, self.area)
+        return False
+
+
+# --- Pipeline metrics ---
+STAGE_SECONDS = Metrics.histogram(
+    'bhuprahari_stage_seconds',
+    'Time spent per call in each hot stage (http_fetch, shared_wait, file_write, db_flush, db_commit, imread, resize, '
+    'dhash, diff, contour, notification_send, scheduler_sweep)',
+    ('stage', 'area'))
+PIPELINE_RUN_SECONDS = Metrics.histogram(
+    'bhuprahari_pipeline_run_seconds', 'Duration of a whole monitoring pipeline run', ('area',))
+TILE_DOWNLOADS = Metrics.counter(
+    'bhuprahari_tile_downloads_total', 'Tile downloads by outcome (miss, revalidated, hit, shared, failed)',
+    ('area', 'outcome'))
+DOWNLOAD_BYTES = Metrics.counter(
+    'bhuprahari_download_bytes_total', 'Tile image bytes downloaded', ('area',))
+COMPARISONS = Metrics.counter(
+    'bhuprahari_comparisons_total', 'Tile comparisons by the tier that decided them', ('area', 'tier'))
+CHANGES_DETECTED = Metrics.counter(
+    'bhuprahari_changes_detected_total', 'Tiles found changed', ('area',))
+NOTIFICATION_DELIVERIES = Metrics.counter(
+    'bhuprahari_notification_deliveries_total',
+    'Notification deliveries per device token by outcome (delivered, invalid_token, retry, failed)',
+    ('area', 'outcome'))
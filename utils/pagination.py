@@ -0,0 +1,47 @@
+import base64
+import json
+from datetime import datetime
+
+
+def encode_cursor(sort_time, row_id):
+    """Opaque keyset cursor for a (time, id) position."""
+    raw = json.dumps([sort_time.isoformat(), row_id]).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii')
+
+
+def decode_cursor(cursor):
+    """Returns (datetime, id); raises ValueError for anything that isn't one of our cursors."""
+    try:
+        sort_time, row_id = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+        return datetime.fromisoformat(sort_time), int(row_id)
+    except Exception:
+        raise ValueError('Invalid cursor')
+
+
+def is_paginated(args):
+    """Whether a page was asked for; without limit or cursor list endpoints keep their original bare array."""
+    return 'limit' in args or 'cursor' in args
+
+
+def parse_limit(args, default=100, maximum=1000):
+    try:
+        limit = int(args.get('limit', default))
+    except ValueError:
+        raise ValueError('limit must be an integer')
+    if limit < 1:
+        raise ValueError('limit must be positive')
+    return min(limit, maximum)
+
+
+def parse_datetime_arg(args, name):
+    value = args.get(name)
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        raise ValueError(f'{name} must be an ISO 8601 datetime')
+
+
+def parse_bool_arg(args, name):
+    return args.get(name, '').lower() in ('1', 'true', 'yes')
@@ -0,0 +1,70 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class AuthenticatedUser:
+    """What jwt_required attaches as request.current_user: the verified caller, not an ORM row."""
+    __slots__ = ('id', 'email', 'password_version')
+
+    def __init__(self, id, email, password_version):
+        self.id = id
+        self.email = email
+        self.password_version = password_version
+
+    @classmethod
+    def from_user(cls, user):
+        return cls(user.id, user.email, user.password_version())
+
+
+class PrincipalCache:
+    """
+    Size-bounded LRU of verified users by user id, each entry valid for a TTL.
+
+    Entries are dropped explicitly when a user's password changes or the user is deleted
+    (see the listeners in utils/jwt_utils.py); in other processes the TTL bounds how long a
+    stale entry can be served.
+    """
+
+    _entries = OrderedDict()  # user_id -> (expires_at, AuthenticatedUser)
+    _lock = threading.Lock()
+    hits = 0
+    misses = 0
+
+    @staticmethod
+    def get(user_id):
+        now = time.monotonic()
+        with PrincipalCache._lock:
+            entry = PrincipalCache._entries.get(user_id)
+            if entry is None or entry[0] <= now:
+                if entry is not None:
+                    del PrincipalCache._entries[user_id]
+                PrincipalCache.misses += 1
+                return None
+            PrincipalCache._entries.move_to_end(user_id)
+            PrincipalCache.hits += 1
+            return entry[1]
+
+    @staticmethod
+    def put(principal, ttl_seconds, max_entries):
+        with PrincipalCache._lock:
+            PrincipalCache._entries[principal.id] = (time.monotonic() + ttl_seconds, principal)
+            PrincipalCache._entries.move_to_end(principal.id)
+            while len(PrincipalCache._entries) > max_entries:
+                PrincipalCache._entries.popitem(last=False)
+
+    @staticmethod
+    def invalidate(user_id):
+        with PrincipalCache._lock:
+            PrincipalCache._entries.pop(user_id, None)
+
+    @staticmethod
+    def clear():
+        with PrincipalCache._lock:
+            PrincipalCache._entries.clear()
+
+    @staticmethod
+    def stats():
+        with PrincipalCache._lock:
+            return {'entries': len(PrincipalCache._entries), 'hits': PrincipalCache.hits,
+                    'misses': PrincipalCache.misses}